@@ -202,6 +202,33 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = 2000
 EXCEL_UPLOAD_MAX_SIZE_MB = max(1, int(os.getenv('EXCEL_UPLOAD_MAX_SIZE_MB', '10')))
 EXCEL_UPLOAD_MAX_SIZE = EXCEL_UPLOAD_MAX_SIZE_MB * 1024 * 1024
 
+# Background jobs: imports, card/work-in-progress PDFs and CSV exports of more
+# crates (rows) than this threshold are queued and processed by `manage.py run_jobs`.
+ULOHY_PRAH_BEDEN = max(0, int(os.getenv('ULOHY_PRAH_BEDEN', '200')))
+
+# PDF rendering pool (per application process): at most PDF_RENDER_PROCESU documents
+# are rendered concurrently by long-lived WeasyPrint worker processes, at most
+# PDF_RENDER_FRONTA requests wait for a worker (each up to PDF_RENDER_CEKANI seconds)
+# and a render running longer than PDF_RENDER_TIMEOUT seconds is killed.
+# PDF_RENDER_PROCESU=0 renders in the calling thread.
+PDF_RENDER_PROCESU = max(0, int(os.getenv('PDF_RENDER_PROCESU', '2')))
+PDF_RENDER_FRONTA = max(0, int(os.getenv('PDF_RENDER_FRONTA', '20')))
+PDF_RENDER_CEKANI = max(1, int(os.getenv('PDF_RENDER_CEKANI', '60')))
+PDF_RENDER_TIMEOUT = max(1, int(os.getenv('PDF_RENDER_TIMEOUT', '120')))
+PDF_RENDER_MAX_ULOH = max(0, int(os.getenv('PDF_RENDER_MAX_ULOH', '100')))
+# Crate cards are rendered in documents of PDF_KARTY_DAVKA crates and merged afterwards.
+PDF_KARTY_DAVKA = max(1, int(os.getenv('PDF_KARTY_DAVKA', '50')))
+
+# Local-disk cache of truck documents (delivery notes, proformas, dispatch protocols).
+# Least recently used PDFs are evicted once the cache exceeds PDF_CACHE_MAX_MB.
+PDF_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', BASE_DIR / 'pdf_cache'))
+PDF_CACHE_MAX_MB = max(0, int(os.getenv('PDF_CACHE_MAX_MB', '200')))
+
+# Local-disk store of generated crate barcodes shared by all workers.
+# BARCODE_FORMAT selects inline SVG or pre-rasterized PNG codes in print templates.
+BARCODE_CACHE_DIR = Path(os.getenv('BARCODE_CACHE_DIR', BASE_DIR / 'barcode_cache'))
+BARCODE_FORMAT = 'png' if os.getenv('BARCODE_FORMAT', 'svg').lower() == 'png' else 'svg'
+
 # Logging
 if DEBUG:
     LOGGING = {
@@ -19,10 +19,8 @@ import csv
 import datetime
 import uuid
 from decimal import Decimal, ROUND_HALF_UP
-from weasyprint import HTML
-from weasyprint import CSS
 
-from .models import Zakazka, Bedna, Kamion, Zakaznik, Pozice, PoziceZakazkaOrder, Rozpracovanost, Cena, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna
+from .models import Zakazka, Bedna, Kamion, Zakaznik, Pozice, PoziceZakazkaOrder, Rozpracovanost, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna
 from .utils import (
     utilita_tisk_dokumentace,
     utilita_tisk_dokumentace_sablony,
@@ -31,6 +29,7 @@ from .utils import (
     utilita_kontrola_zakazek,
     utilita_tisk_dl_a_proforma_faktury,
     utilita_export_beden_zinkovani_csv,
+    utilita_zarad_ulohu,
     sanitize_csv_row,
     validate_bedny_pripraveny_k_expedici,
 )
@@ -40,6 +39,13 @@ from .services.expedice_service import (
     expedice_zakazek_do_noveho_kamionu,
 )
 from .services.exceptions import ServiceValidationError
+from .services.cenik_service import cenik_scope
+from .services.fakturace_service import build_fakturace_kamionu
+from .services.souhrny_service import oznac_zmenu_souhrnu
+from .services.souhrny_vyroby_service import odlozene_souhrny_vyroby
+from .services.navezeni_service import odlozene_poradi_navezeni, oznac_zmenu_navezeni
+from .services.ulohy_service import prekracuje_prah
+from .services.pdf_render_service import vyrendruj_pdf
 from .services.sarze_print_service import (
     build_tisk_pruvodky_vruty_response,
     get_tisk_pruvodky_vruty_krok,
@@ -52,6 +58,7 @@ from .choices import (
     RovnaniChoice,
     TryskaniChoice,
     TypZarizeniChoice,
+    TypUlohyChoice,
     ZinkovaniChoice,
     PrioritaChoice,
     StavSarzeChoice,
@@ -164,7 +171,7 @@ def _create_sarzekrok_and_copy_rows(
     action_token=None,
 ):
     try:
-        with transaction.atomic():
+        with transaction.atomic(), odlozene_souhrny_vyroby():
             target_krok = SarzeKrok.objects.create(
                 sarze=source_krok.sarze,
                 action_token=action_token,
@@ -263,8 +270,9 @@ def _abort_if_kamiony_maji_pozastavene_bedny(modeladmin, request, queryset, acti
 def _validate_proforma_pricing(kamion):
     """Vrátí seznam chybových hlášek pro zakázky, které nemají požadované ceny pro tisk proformy."""
     errors = []
-    zakazky = kamion.zakazky_vydej.select_related('kamion_prijem__zakaznik').all()
-    for zakazka in zakazky:
+    fakturace = build_fakturace_kamionu(kamion)
+    for fakturace_zakazky in fakturace.zakazky:
+        zakazka = fakturace_zakazky.zakazka
         label = f"{zakazka.artikl or zakazka.pk}"
         kamion_prijem = getattr(zakazka, 'kamion_prijem', None)
         zakaznik_prijem = getattr(kamion_prijem, 'zakaznik', None) if kamion_prijem else None
@@ -278,33 +286,21 @@ def _validate_proforma_pricing(kamion):
             errors.append(f"Zakázka {label}: chybí předpis nebo délka pro výpočet ceny.")
             continue
 
-        try:
-            cena_obj = Cena.objects.get(
-                predpis=predpis,
-                delka_min__lte=delka,
-                delka_max__gt=delka,
-                zakaznik=zakaznik_prijem
-            )
-        except Cena.DoesNotExist:
+        if fakturace_zakazky.pocet_cen == 0:
             errors.append(f"Zakázka {label}: nenalezena cena pro předpis {predpis} a délku {delka}.")
             continue
-        except Cena.MultipleObjectsReturned:
+        if fakturace_zakazky.pocet_cen > 1:
             errors.append(f"Zakázka {label}: nalezeno více cen pro předpis {predpis} a délku {delka}. Opravte ceník.")
             continue
 
-        cena_za_kg = cena_obj.cena_za_kg
-        if cena_za_kg is None or cena_za_kg <= 0:
+        if fakturace_zakazky.cena_za_kg <= 0:
             errors.append(f"Zakázka {label}: cena za kg musí být větší než 0.")
 
-        if zakaznik_prijem.fakturovat_rovnani:
-            cena_rovnani = cena_obj.cena_rovnani_za_kg
-            if cena_rovnani is None or cena_rovnani <= 0:
-                errors.append(f"Zakázka {label}: cena rovnání za kg musí být větší než 0.")
+        if zakaznik_prijem.fakturovat_rovnani and fakturace_zakazky.cena_rovnani_za_kg <= 0:
+            errors.append(f"Zakázka {label}: cena rovnání za kg musí být větší než 0.")
 
-        if zakaznik_prijem.fakturovat_tryskani:
-            cena_tryskani = cena_obj.cena_tryskani_za_kg
-            if cena_tryskani is None or cena_tryskani <= 0:
-                errors.append(f"Zakázka {label}: cena tryskání za kg musí být větší než 0.")
+        if zakaznik_prijem.fakturovat_tryskani and fakturace_zakazky.cena_tryskani_za_kg <= 0:
+            errors.append(f"Zakázka {label}: cena tryskání za kg musí být větší než 0.")
 
     return errors
 
@@ -613,19 +609,53 @@ def export_bedny_to_csv_customer_action(modeladmin, request, queryset):
     
     zakaznik_zkratka = queryset.values_list('zakazka__kamion_prijem__zakaznik__zkratka', flat=True).first()
 
-    queryset = queryset.select_related(
-        'zakazka',
-        'zakazka__kamion_prijem',
-    ).order_by('cislo_bedny')
-
     is_rovnani_export = request.GET.get('rovnani', '') == 'k_vyrovnani'
-    filename_suffix = 'rovnani' if is_rovnani_export else 'expedice'
+    filename = nazev_csv_beden_pro_zakaznika(zakaznik_zkratka, is_rovnani_export)
+
+    pocet_beden = queryset.count()
+    if prekracuje_prah(pocet_beden):
+        return utilita_zarad_ulohu(
+            modeladmin,
+            request,
+            TypUlohyChoice.CSV_ZAKAZNIK,
+            {
+                'bedny': list(queryset.values_list('pk', flat=True)),
+                'zakaznik_zkratka': zakaznik_zkratka,
+                'rovnani': is_rovnani_export,
+                'nazev_souboru': filename,
+            },
+            f"{filename} ({pocet_beden} beden)",
+            celkem=pocet_beden,
+        )
 
     response = HttpResponse(content_type='text/csv; charset=utf-8')
-    filename = f"bedny_zakaznik_{zakaznik_zkratka}_{filename_suffix}_{timezone.now().strftime('%Y%m%d')}.csv"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+    pocet = zapis_csv_beden_pro_zakaznika(response, queryset, zakaznik_zkratka, is_rovnani_export)
+
+    logger.info(
+        f"Uživatel {getattr(request, 'user', None)} vyexportoval {pocet} beden pro schválení zákazníkem do CSV.",
+    )
+    return response
+
+
+def nazev_csv_beden_pro_zakaznika(zakaznik_zkratka, is_rovnani_export):
+    filename_suffix = 'rovnani' if is_rovnani_export else 'expedice'
+    return f"bedny_zakaznik_{zakaznik_zkratka}_{filename_suffix}_{timezone.now().strftime('%Y%m%d')}.csv"
+
+
+def zapis_csv_beden_pro_zakaznika(vystup, queryset, zakaznik_zkratka, is_rovnani_export, prubeh=None):
+    """
+    Zapíše CSV beden pro zákazníka (viz export_bedny_to_csv_customer_action) do souborového objektu
+    `vystup` – HttpResponse nebo soubor výsledku úlohy na pozadí. Vrací počet zapsaných beden,
+    `prubeh(zapsano)` se volá po každých 100 bednách.
+    """
+    bedny = queryset.select_related(
+        'zakazka',
+        'zakazka__kamion_prijem',
+    ).order_by('cislo_bedny')
+
+    vystup.write('\ufeff')
+    writer = csv.writer(vystup, delimiter=';', quoting=csv.QUOTE_MINIMAL)
 
     if is_rovnani_export:
         if zakaznik_zkratka == 'ROT':
@@ -655,7 +685,8 @@ def export_bedny_to_csv_customer_action(modeladmin, request, queryset):
     }
     doba_vyrovnani_bedny_dni = 7
 
-    for bedna in queryset:
+    poradi = 0
+    for poradi, bedna in enumerate(bedny, start=1):
         zakazka = getattr(bedna, 'zakazka', None)
         behalter_nr = getattr(bedna, 'behalter_nr', '') if bedna else ''
         artikl = getattr(zakazka, 'artikl', '') if zakazka else ''
@@ -697,11 +728,9 @@ def export_bedny_to_csv_customer_action(modeladmin, request, queryset):
         row.extend([cislo_bedny, hmotnost])
 
         writer.writerow(sanitize_csv_row(row))
-
-    logger.info(
-        f"Uživatel {getattr(request, 'user', None)} vyexportoval {queryset.count()} beden pro schválení zákazníkem do CSV.",
-    )
-    return response
+        if prubeh and poradi % 100 == 0:
+            prubeh(poradi)
+    return poradi
 
 
 @admin.action(description="Export vybraných beden do CSV pro vložení do DL")
@@ -725,26 +754,57 @@ def export_bedny_dl_action(modeladmin, request, queryset):
         modeladmin.message_user(request, "Všechny vybrané bedny musí být ve stavu K_EXPEDICI nebo EXPEDOVANO.", level=messages.ERROR)
         return None
 
-    queryset = queryset.select_related(
+    s_hpm = request.GET.get('stav_bedny', '') == StavBednyChoice.K_EXPEDICI
+    filename = f"bedny_{zakaznik_zkratka}_dl_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    pocet_beden = queryset.count()
+    if prekracuje_prah(pocet_beden):
+        return utilita_zarad_ulohu(
+            modeladmin,
+            request,
+            TypUlohyChoice.CSV_DL,
+            {
+                'bedny': list(queryset.values_list('pk', flat=True)),
+                'nazev_souboru': filename,
+                's_hpm': s_hpm,
+            },
+            f"{filename} ({pocet_beden} beden)",
+            celkem=pocet_beden,
+        )
+
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    pocet = zapis_csv_beden_dl(response, queryset, s_hpm)
+
+    logger.info(
+        f"Uživatel {getattr(request, 'user', None)} exportoval {pocet} beden {zakaznik_zkratka} do CSV pro DL.",
+    )
+    return response
+
+
+def zapis_csv_beden_dl(vystup, queryset, s_hpm, prubeh=None):
+    """
+    Zapíše CSV beden pro DL (viz export_bedny_dl_action) do souborového objektu `vystup`,
+    `s_hpm` přidá sloupec HPM-Nr. s číslem bedny. Vrací počet zapsaných beden.
+    """
+    bedny = queryset.select_related(
         'zakazka',
         'zakazka__typ_hlavy',
         'zakazka__kamion_prijem__zakaznik',
     ).order_by('zakazka_id', 'id')
 
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    filename = f"bedny_{zakaznik_zkratka}_dl_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+    vystup.write('\ufeff')
+    writer = csv.writer(vystup, delimiter=';', quoting=csv.QUOTE_MINIMAL)
 
     row = [
         'Vorgang+', 'Artikel-Nr.', 'Materialcharge', '∑', 'Gewicht', 'Abmess.', 'Kopf', 'Bezeichnung',
         'Oberfläche', 'Beschicht.', 'Behälter-Nr.', 'Sonder Zusatzinfo', 'Lief.', 'Fertigungsauftrags Nr.', 'Reinheit'
     ]
-    if request.GET.get('stav_bedny', '') == StavBednyChoice.K_EXPEDICI:
+    if s_hpm:
         row.append('HPM-Nr.')
     writer.writerow(row)
-    for bedna in queryset:
+    poradi = 0
+    for poradi, bedna in enumerate(bedny, start=1):
         zak = getattr(bedna, 'zakazka', None)
         prumer = _format_decimal(getattr(zak, 'prumer', None)) if zak else ''
         delka = _format_decimal(getattr(zak, 'delka', None)) if zak else ''
@@ -774,14 +834,13 @@ def export_bedny_dl_action(modeladmin, request, queryset):
             getattr(bedna, 'vyrobni_zakazka', '') or '',
             'sandgestrahlt' if getattr(bedna, 'tryskat', None) == TryskaniChoice.OTRYSKANA else '--',
         ]
-        if request.GET.get('stav_bedny', '') == StavBednyChoice.K_EXPEDICI:
+        if s_hpm:
             row.append(getattr(bedna, 'cislo_bedny', '') or '')
         writer.writerow(sanitize_csv_row(row))
+        if prubeh and poradi % 100 == 0:
+            prubeh(poradi)
+    return poradi
 
-    logger.info(
-        f"Uživatel {getattr(request, 'user', None)} exportoval {queryset.count()} beden {zakaznik_zkratka} do CSV pro DL.",
-    )
-    return response
 
 @admin.action(description="Vytisknout karty bedny")
 def tisk_karet_beden_action(modeladmin, request, queryset):
@@ -1104,95 +1163,61 @@ def oznacit_k_navezeni_action(modeladmin, request, queryset):
         prekrocena_kapacita = 0
 
         with transaction.atomic():
-            vybrane_ids = [f.cleaned_data["bedna_id"] for f in formset.forms]
-            bedny_map = {
-                b.pk: b for b in Bedna.objects.select_for_update().filter(pk__in=vybrane_ids)
-            }
-            pair_note_map = {}
-
-            for form in formset.forms:
-                bedna_id = form.cleaned_data["bedna_id"]
-                poznamka_k_navezeni = form.cleaned_data["poznamka_k_navezeni"]
-                pozice = form.cleaned_data["pozice"] #co zadal uživatel na tomto řádku
-
-                # pokud uživatel zadal na řádku pozici, stane se aktuální pozicí, jinak se použije poslední zadaná pozice
-                if pozice:
-                    aktualni_pozice = pozice
-                else:
-                    pozice = aktualni_pozice               
-
-                bedna = bedny_map.get(bedna_id)
-                if not bedna:
-                    messages.warning(request, f"Bedna s ID {bedna_id} nebyla nalezena, přeskočena.")
-                    continue
-
-                pid = pozice.pk
-                # Pokud by přiřazení přesáhlo kapacitu, jen poznačíme pro warning
-                if obsazenost[pid] + 1 > kapacita[pid]:
-                    prekrocena_kapacita += 1
-
-                # Přesun + změna stavu (bez ohledu na kapacitu)
-                bedna.pozice = pozice
-                bedna.stav_bedny = StavBednyChoice.K_NAVEZENI
-                bedna.save()
-                pair_key = (pozice.pk, bedna.zakazka_id)
-                note_value = (poznamka_k_navezeni or None)
-                if pair_key not in pair_note_map:
-                    pair_note_map[pair_key] = note_value
-                elif note_value is not None:
-                    pair_note_map[pair_key] = note_value
-
-                obsazenost[pid] += 1
-                uspesne += 1
-
-            for (pozice_id, zakazka_id), note in pair_note_map.items():
-                existing = (
-                    PoziceZakazkaOrder.objects
-                    .select_for_update()
-                    .filter(pozice_id=pozice_id, zakazka_id=zakazka_id)
-                    .first()
-                )
-                if existing:
-                    if existing.poznamka_k_navezeni != note:
-                        existing.poznamka_k_navezeni = note
-                        existing.save(update_fields=['poznamka_k_navezeni'])
-                    continue
-
-                # Soubeh: dve transakce mohou soucasne chtit zalozit stejny zaznam
-                # nebo stejne poradi v pozici. Pri kolizi proto retry.
-                max_attempts = 5
-                for attempt in range(max_attempts):
-                    last_poradi = (
-                        PoziceZakazkaOrder.objects
-                        .select_for_update()
-                        .filter(pozice_id=pozice_id)
-                        .order_by('-poradi')
-                        .values_list('poradi', flat=True)
-                        .first()
-                        or 0
-                    )
-                    try:
-                        PoziceZakazkaOrder.objects.create(
-                            pozice_id=pozice_id,
-                            zakazka_id=zakazka_id,
-                            poradi=last_poradi + 1,
-                            poznamka_k_navezeni=note,
-                        )
-                        break
-                    except IntegrityError:
-                        existing_retry = (
-                            PoziceZakazkaOrder.objects
-                            .select_for_update()
-                            .filter(pozice_id=pozice_id, zakazka_id=zakazka_id)
-                            .first()
-                        )
-                        if existing_retry:
-                            if existing_retry.poznamka_k_navezeni != note:
-                                existing_retry.poznamka_k_navezeni = note
-                                existing_retry.save(update_fields=['poznamka_k_navezeni'])
-                            break
-                        if attempt == max_attempts - 1:
-                            raise
+            # Pořadí zakázek v pozicích se srovná jednou za všechny bedny na konci bloku.
+            with odlozene_poradi_navezeni():
+                vybrane_ids = [f.cleaned_data["bedna_id"] for f in formset.forms]
+                bedny_map = {
+                    b.pk: b for b in Bedna.objects.select_for_update().filter(pk__in=vybrane_ids)
+                }
+                pair_note_map = {}
+
+                for form in formset.forms:
+                    bedna_id = form.cleaned_data["bedna_id"]
+                    poznamka_k_navezeni = form.cleaned_data["poznamka_k_navezeni"]
+                    pozice = form.cleaned_data["pozice"] #co zadal uživatel na tomto řádku
+
+                    # pokud uživatel zadal na řádku pozici, stane se aktuální pozicí, jinak se použije poslední zadaná pozice
+                    if pozice:
+                        aktualni_pozice = pozice
+                    else:
+                        pozice = aktualni_pozice               
+
+                    bedna = bedny_map.get(bedna_id)
+                    if not bedna:
+                        messages.warning(request, f"Bedna s ID {bedna_id} nebyla nalezena, přeskočena.")
+                        continue
+
+                    pid = pozice.pk
+                    # Pokud by přiřazení přesáhlo kapacitu, jen poznačíme pro warning
+                    if obsazenost[pid] + 1 > kapacita[pid]:
+                        prekrocena_kapacita += 1
+
+                    # Přesun + změna stavu (bez ohledu na kapacitu)
+                    bedna.pozice = pozice
+                    bedna.stav_bedny = StavBednyChoice.K_NAVEZENI
+                    bedna.save()
+                    pair_key = (pozice.pk, bedna.zakazka_id)
+                    note_value = (poznamka_k_navezeni or None)
+                    if pair_key not in pair_note_map:
+                        pair_note_map[pair_key] = note_value
+                    elif note_value is not None:
+                        pair_note_map[pair_key] = note_value
+
+                    obsazenost[pid] += 1
+                    uspesne += 1
+
+            # Záznamy pořadí všech dvojic už existují, poznámky se uloží jedním hromadným dotazem.
+            if pair_note_map:
+                zmenene_poradi = []
+                for order in PoziceZakazkaOrder.objects.filter(
+                    pozice_id__in={pozice_id for pozice_id, _ in pair_note_map},
+                    zakazka_id__in={zakazka_id for _, zakazka_id in pair_note_map},
+                ):
+                    pair_key = (order.pozice_id, order.zakazka_id)
+                    if pair_key in pair_note_map and order.poznamka_k_navezeni != pair_note_map[pair_key]:
+                        order.poznamka_k_navezeni = pair_note_map[pair_key]
+                        zmenene_poradi.append(order)
+                PoziceZakazkaOrder.objects.bulk_update(zmenene_poradi, ['poznamka_k_navezeni'])
 
         if uspesne:
             messages.success(request, f"Připraveno k navezení: {uspesne} beden.")
@@ -1394,6 +1419,7 @@ def oznacit_prijato_do_zakaleno_action(modeladmin, request, queryset):
             return None
 
         zmeneno = locked_qs.update(stav_bedny=StavBednyChoice.ZAKALENO)
+        oznac_zmenu_souhrnu(zakazka_ids=locked_qs.values_list('zakazka_id', flat=True))
 
     logger.info(f"Uživatel {request.user} změnil stav z PŘIJATO do ZAKALENO u {zmeneno} beden.")
     messages.success(request, f"Změněno z PŘIJATO do ZAKALENO: {zmeneno} beden.")
@@ -1428,6 +1454,8 @@ def vratit_bedny_ze_stavu_k_navezeni_do_stavu_prijato_action(modeladmin, request
             return None
 
         vraceno = locked_qs.update(stav_bedny=StavBednyChoice.PRIJATO)
+        oznac_zmenu_souhrnu(zakazka_ids=locked_qs.values_list('zakazka_id', flat=True))
+        oznac_zmenu_navezeni(locked_qs.values_list('pozice_id', flat=True))
 
     logger.info(f"Uživatel {request.user} vrátil do stavu PŘIJATO {vraceno} beden.")
     messages.success(request, f"Vráceno do stavu PŘIJATO: {vraceno} beden.")
@@ -1462,6 +1490,7 @@ def vratit_bedny_ze_stavu_navezeno_do_stavu_prijato_action(modeladmin, request,
             return None
 
         vraceno = locked_qs.update(stav_bedny=StavBednyChoice.PRIJATO)
+        oznac_zmenu_souhrnu(zakazka_ids=locked_qs.values_list('zakazka_id', flat=True))
 
     logger.info(f"Uživatel {request.user} vrátil do stavu PŘIJATO {vraceno} beden.")
     modeladmin.message_user(request, f"Vráceno do stavu PŘIJATO: {vraceno} beden.", level=messages.SUCCESS)
@@ -1496,6 +1525,7 @@ def vratit_bedny_z_rozpracovanosti_do_stavu_prijato_action(modeladmin, request,
             return None
 
         vraceno = locked_qs.update(stav_bedny=StavBednyChoice.PRIJATO)
+        oznac_zmenu_souhrnu(zakazka_ids=locked_qs.values_list('zakazka_id', flat=True))
 
     logger.info(f"Uživatel {request.user} vrátil do stavu PŘIJATO {vraceno} beden.")
     modeladmin.message_user(request, f"Vráceno do stavu PŘIJATO: {vraceno} beden.", level=messages.SUCCESS)
@@ -1706,6 +1736,7 @@ def oznacit_k_expedici_action(modeladmin, request, queryset):
             return None
 
         zmeneno = locked_qs.update(stav_bedny=StavBednyChoice.K_EXPEDICI)
+        oznac_zmenu_souhrnu(zakazka_ids=locked_qs.values_list('zakazka_id', flat=True))
 
     modeladmin.message_user(request, f"Změněno na K EXPEDICI: {zmeneno} beden.", level=messages.SUCCESS)
     logger.info(f"Uživatel {request.user} změnil stav na K_EXPEDICI u {zmeneno} beden.")
@@ -2108,15 +2139,15 @@ def oznacit_rovna_se_action(modeladmin, request, queryset):
     html_path = "orders/seznam_beden_k_rovnani.html"
     html_string = render_to_string(html_path, context)
 
-    stylesheets = []
+    css_soubory = []
     css_path = finders.find('orders/css/pdf_shared.css')
     if css_path:
-        stylesheets.append(CSS(filename=css_path))
+        css_soubory.append(css_path)
     else:
         logger.warning("Nepodařilo se najít CSS 'orders/css/pdf_shared.css' pro tisk seznamu beden k rovnání.")
 
     base_url = request.build_absolute_uri('/')
-    pdf_file = HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=stylesheets)
+    pdf_file = vyrendruj_pdf(html_string, base_url=base_url, css_soubory=css_soubory)
 
     filename = "seznam_beden_k_rovnani.pdf"
     response = HttpResponse(pdf_file, content_type="application/pdf")
@@ -2834,6 +2865,7 @@ def vratit_zakazky_z_expedice_action(modeladmin, request, queryset):
                     locked_zakazka.kamion_vydej = None
                     locked_zakazka.save(update_fields=["expedovano", "kamion_vydej"])
                     locked_bedny_qs.update(stav_bedny=StavBednyChoice.K_EXPEDICI)
+                    oznac_zmenu_souhrnu(zakazka_ids=[locked_zakazka.pk])
                     uspely += 1
                     logger.info(
                         f"Uživatel {request.user} úspěšně vrátil zakázku {locked_zakazka} z expedice do původního stavu."
@@ -2846,6 +2878,7 @@ def vratit_zakazky_z_expedice_action(modeladmin, request, queryset):
                     bedna.stav_bedny = StavBednyChoice.K_EXPEDICI
                     bedna.zakazka = puvodni_zakazka
                 Bedna.objects.bulk_update(bedny, ["stav_bedny", "zakazka"])
+                oznac_zmenu_souhrnu(zakazka_ids=[locked_zakazka.pk, puvodni_zakazka.pk])
 
                 if Bedna.objects.filter(zakazka=locked_zakazka).exists():
                     logger.error(
@@ -3338,6 +3371,42 @@ def tisk_rozpracovanost_action(modeladmin, request, queryset):
         modeladmin.message_user(request, "Neplatný výběr pro tisk rozpracovanosti.", level=messages.ERROR)
         return None
 
+    pocet_beden = snapshot.bedny.filter(fakturovat=True).count()
+    if not pocet_beden:
+        modeladmin.message_user(request, "Vybraný záznam rozpracovanosti neobsahuje žádné bedny.", level=messages.WARNING)
+        return None
+
+    if prekracuje_prah(pocet_beden):
+        return utilita_zarad_ulohu(
+            modeladmin,
+            request,
+            TypUlohyChoice.ROZPRACOVANOST,
+            {'rozpracovanost': snapshot.pk, 'base_url': request.build_absolute_uri('/')},
+            f"Rozpracovanost {snapshot.cas_zaznamu:%d.%m.%Y %H:%M} ({pocet_beden} beden)",
+            celkem=pocet_beden,
+        )
+
+    try:
+        pdf_content, filename = vytvor_pdf_rozpracovanosti(
+            snapshot,
+            user=getattr(request, 'user', None),
+            base_url=request.build_absolute_uri('/') if request else None,
+        )
+    except ServiceValidationError as exc:
+        modeladmin.message_user(request, str(exc), level=messages.ERROR)
+        return None
+
+    response = HttpResponse(pdf_content, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
+
+def vytvor_pdf_rozpracovanosti(snapshot, *, user=None, base_url=None):
+    """
+    Sestaví PDF rozpracovanosti (fakturované bedny záznamu rozpracovanosti po zákaznících a zakázkách
+    s cenami) a vrátí dvojici (obsah PDF, název souboru). Používá ho akce tisku i úloha na pozadí.
+    Vyvolá ServiceValidationError, pokud záznam nemá bedny nebo kompletní data.
+    """
     bedny_qs = snapshot.bedny.filter(fakturovat=True).select_related(
         'zakazka',
         'zakazka__predpis',
@@ -3352,8 +3421,7 @@ def tisk_rozpracovanost_action(modeladmin, request, queryset):
 
     bedny = list(bedny_qs)
     if not bedny:
-        modeladmin.message_user(request, "Vybraný záznam rozpracovanosti neobsahuje žádné bedny.", level=messages.WARNING)
-        return None
+        raise ServiceValidationError("Vybraný záznam rozpracovanosti neobsahuje žádné bedny.")
 
     customer_map: dict[int, dict] = {}
     skipped = 0
@@ -3373,115 +3441,112 @@ def tisk_rozpracovanost_action(modeladmin, request, queryset):
             logger.warning("Nepodařilo se převést cenu zakázky na Decimal při tisku rozpracovanosti.", exc_info=True)
             return None
 
-    for bedna in bedny:
-        zakazka = getattr(bedna, 'zakazka', None)
-        kamion_prijem = getattr(zakazka, 'kamion_prijem', None) if zakazka else None
-        zakaznik = getattr(kamion_prijem, 'zakaznik', None) if kamion_prijem else None
-
-        if not zakazka or not zakaznik:
-            skipped += 1
-            continue
+    # Ceny všech zakázek se hledají přes jeden sdílený resolver ceníku.
+    with cenik_scope():
+        for bedna in bedny:
+            zakazka = getattr(bedna, 'zakazka', None)
+            kamion_prijem = getattr(zakazka, 'kamion_prijem', None) if zakazka else None
+            zakaznik = getattr(kamion_prijem, 'zakaznik', None) if kamion_prijem else None
 
-        if zakazka.pk not in warned_zakazky:
-            warning_reasons = []
-            predpis = getattr(zakazka, 'predpis', None)
-            if not predpis or getattr(predpis, 'nazev', None) == 'Neznámý předpis':
-                warning_reasons.append('chybí předpis')
-
-            cena_za_kg = _to_decimal_or_none(getattr(zakazka, 'cena_za_kg', None))
-            if cena_za_kg is None or cena_za_kg <= 0:
-                warning_reasons.append('cena kalení <= 0')
-
-            if zakaznik.fakturovat_rovnani:
-                cena_rovnani = _to_decimal_or_none(getattr(zakazka, 'cena_rovnani_za_kg', None))
-                if cena_rovnani is None or cena_rovnani <= 0:
-                    warning_reasons.append('cena rovnání <= 0')
-
-            if zakaznik.fakturovat_tryskani:
-                cena_tryskani = _to_decimal_or_none(getattr(zakazka, 'cena_tryskani_za_kg', None))
-                if cena_tryskani is None or cena_tryskani <= 0:
-                    warning_reasons.append('cena tryskání <= 0')
-
-            if warning_reasons:
-                pricing_warnings.append(
-                    f"{zakaznik.zkraceny_nazev} / {zakazka.artikl or zakazka.pk}: {', '.join(warning_reasons)}"
-                )
-            warned_zakazky.add(zakazka.pk)
+            if not zakazka or not zakaznik:
+                skipped += 1
+                continue
 
-        customer_entry = customer_map.setdefault(
-            zakaznik.pk,
-            {
-                'zakaznik': zakaznik,
-                'zakazky': {},
-                'sum_hmotnost': Decimal('0.0'),
-                'sum_beden': 0,
-                'sum_cena_netto': Decimal('0.0'),
-                'sum_tryskani_hmotnost': Decimal('0.0'),
-                'sum_tryskani_beden': 0,
-                'sum_tryskani_cena_netto': Decimal('0.0'),
-                'sum_rovnani_hmotnost': Decimal('0.0'),
-                'sum_rovnani_beden': 0,
-                'sum_rovnani_cena_netto': Decimal('0.0'),
-            },
-        )
+            if zakazka.pk not in warned_zakazky:
+                warning_reasons = []
+                predpis = getattr(zakazka, 'predpis', None)
+                if not predpis or getattr(predpis, 'nazev', None) == 'Neznámý předpis':
+                    warning_reasons.append('chybí předpis')
+
+                cena_za_kg = _to_decimal_or_none(getattr(zakazka, 'cena_za_kg', None))
+                if cena_za_kg is None or cena_za_kg <= 0:
+                    warning_reasons.append('cena kalení <= 0')
+
+                if zakaznik.fakturovat_rovnani:
+                    cena_rovnani = _to_decimal_or_none(getattr(zakazka, 'cena_rovnani_za_kg', None))
+                    if cena_rovnani is None or cena_rovnani <= 0:
+                        warning_reasons.append('cena rovnání <= 0')
+
+                if zakaznik.fakturovat_tryskani:
+                    cena_tryskani = _to_decimal_or_none(getattr(zakazka, 'cena_tryskani_za_kg', None))
+                    if cena_tryskani is None or cena_tryskani <= 0:
+                        warning_reasons.append('cena tryskání <= 0')
+
+                if warning_reasons:
+                    pricing_warnings.append(
+                        f"{zakaznik.zkraceny_nazev} / {zakazka.artikl or zakazka.pk}: {', '.join(warning_reasons)}"
+                    )
+                warned_zakazky.add(zakazka.pk)
+
+            customer_entry = customer_map.setdefault(
+                zakaznik.pk,
+                {
+                    'zakaznik': zakaznik,
+                    'zakazky': {},
+                    'sum_hmotnost': Decimal('0.0'),
+                    'sum_beden': 0,
+                    'sum_cena_netto': Decimal('0.0'),
+                    'sum_tryskani_hmotnost': Decimal('0.0'),
+                    'sum_tryskani_beden': 0,
+                    'sum_tryskani_cena_netto': Decimal('0.0'),
+                    'sum_rovnani_hmotnost': Decimal('0.0'),
+                    'sum_rovnani_beden': 0,
+                    'sum_rovnani_cena_netto': Decimal('0.0'),
+                },
+            )
 
-        zakazka_entry = customer_entry['zakazky'].setdefault(
-            zakazka.pk,
-            {
-                'artikl': zakazka.artikl,
-                'datum': kamion_prijem.datum if kamion_prijem else None,
-                'rozmer': _format_rozmer(zakazka),
-                'typ': zakazka.zkraceny_popis,
-                'hlava': str(zakazka.typ_hlavy) if zakazka.typ_hlavy else '',
-                'cena_kg': Decimal(zakazka.cena_za_kg or 0),
-                'cena_tryskani_za_kg': Decimal(zakazka.cena_tryskani_za_kg or 0) if zakaznik.fakturovat_tryskani else Decimal('0.00'),
-                'cena_rovnani_za_kg': Decimal(zakazka.cena_rovnani_za_kg or 0) if zakaznik.fakturovat_rovnani else Decimal('0.00'),
-                'hmotnost': Decimal('0.0'),
-                'tryskani_hmotnost': Decimal('0.0'),
-                'rovnani_hmotnost': Decimal('0.0'),
-                'pocet_beden': 0,
-                'tryskani_pocet_beden': 0,
-                'rovnani_pocet_beden': 0,
-            },
-        )
+            zakazka_entry = customer_entry['zakazky'].setdefault(
+                zakazka.pk,
+                {
+                    'artikl': zakazka.artikl,
+                    'datum': kamion_prijem.datum if kamion_prijem else None,
+                    'rozmer': _format_rozmer(zakazka),
+                    'typ': zakazka.zkraceny_popis,
+                    'hlava': str(zakazka.typ_hlavy) if zakazka.typ_hlavy else '',
+                    'cena_kg': Decimal(zakazka.cena_za_kg or 0),
+                    'cena_tryskani_za_kg': Decimal(zakazka.cena_tryskani_za_kg or 0) if zakaznik.fakturovat_tryskani else Decimal('0.00'),
+                    'cena_rovnani_za_kg': Decimal(zakazka.cena_rovnani_za_kg or 0) if zakaznik.fakturovat_rovnani else Decimal('0.00'),
+                    'hmotnost': Decimal('0.0'),
+                    'tryskani_hmotnost': Decimal('0.0'),
+                    'rovnani_hmotnost': Decimal('0.0'),
+                    'pocet_beden': 0,
+                    'tryskani_pocet_beden': 0,
+                    'rovnani_pocet_beden': 0,
+                },
+            )
 
-        hmotnost = bedna.hmotnost or Decimal('0')
-        if not isinstance(hmotnost, Decimal):
-            try:
-                hmotnost = Decimal(hmotnost)
-            except Exception:
-                logger.warning("Nepodařilo se převést hmotnost bedny na Decimal při exportu zákazníka, používá se 0.", exc_info=True)
-                hmotnost = Decimal('0')
+            hmotnost = bedna.hmotnost or Decimal('0')
+            if not isinstance(hmotnost, Decimal):
+                try:
+                    hmotnost = Decimal(hmotnost)
+                except Exception:
+                    logger.warning("Nepodařilo se převést hmotnost bedny na Decimal při exportu zákazníka, používá se 0.", exc_info=True)
+                    hmotnost = Decimal('0')
 
-        zakazka_entry['hmotnost'] += hmotnost
-        zakazka_entry['pocet_beden'] += 1
+            zakazka_entry['hmotnost'] += hmotnost
+            zakazka_entry['pocet_beden'] += 1
 
-        if zakaznik.fakturovat_tryskani and bedna.tryskat == TryskaniChoice.OTRYSKANA:
-            zakazka_entry['tryskani_hmotnost'] += hmotnost
-            zakazka_entry['tryskani_pocet_beden'] += 1
-            customer_entry['sum_tryskani_hmotnost'] += hmotnost
-            customer_entry['sum_tryskani_beden'] += 1
+            if zakaznik.fakturovat_tryskani and bedna.tryskat == TryskaniChoice.OTRYSKANA:
+                zakazka_entry['tryskani_hmotnost'] += hmotnost
+                zakazka_entry['tryskani_pocet_beden'] += 1
+                customer_entry['sum_tryskani_hmotnost'] += hmotnost
+                customer_entry['sum_tryskani_beden'] += 1
 
-        if zakaznik.fakturovat_rovnani and bedna.rovnat == RovnaniChoice.VYROVNANA:
-            zakazka_entry['rovnani_hmotnost'] += hmotnost
-            zakazka_entry['rovnani_pocet_beden'] += 1
-            customer_entry['sum_rovnani_hmotnost'] += hmotnost
-            customer_entry['sum_rovnani_beden'] += 1
+            if zakaznik.fakturovat_rovnani and bedna.rovnat == RovnaniChoice.VYROVNANA:
+                zakazka_entry['rovnani_hmotnost'] += hmotnost
+                zakazka_entry['rovnani_pocet_beden'] += 1
+                customer_entry['sum_rovnani_hmotnost'] += hmotnost
+                customer_entry['sum_rovnani_beden'] += 1
 
-        customer_entry['sum_hmotnost'] += hmotnost
-        customer_entry['sum_beden'] += 1
+            customer_entry['sum_hmotnost'] += hmotnost
+            customer_entry['sum_beden'] += 1
 
     if not customer_map:
-        modeladmin.message_user(
-            request,
-            "Pro vybraný záznam rozpracovanosti nebyla nalezena kompletní data.",
-            level=messages.ERROR,
-        )
         if skipped:
             logger.warning(
                 f"Rozpracovanost PDF: přeskočeno {skipped} beden bez vazby na zakázku/zákazníka.",
             )
-        return None
+        raise ServiceValidationError("Pro vybraný záznam rozpracovanosti nebyla nalezena kompletní data.")
 
     if pricing_warnings:
         preview_items = pricing_warnings[:8]
@@ -3564,26 +3629,23 @@ def tisk_rozpracovanost_action(modeladmin, request, queryset):
         'sections': sections,
         'pricing_warnings': pricing_warnings,
         'generated_at': timezone.now(),
-        'prepared_by': _resolve_user_name(getattr(request, 'user', None)),
+        'prepared_by': _resolve_user_name(user),
     }
 
     html = render_to_string('orders/rozpracovanost_report.html', context)
-    stylesheets = []
+    css_soubory = []
     css_path = finders.find('orders/css/pdf_shared.css')
     if css_path:
-        stylesheets.append(CSS(filename=css_path))
+        css_soubory.append(css_path)
     else:
         logger.warning("PDF rozpracovanost: CSS 'orders/css/pdf_shared.css' nebylo nalezeno.")
 
-    base_url = request.build_absolute_uri('/') if request else None
-    pdf_content = HTML(string=html, base_url=base_url).write_pdf(stylesheets=stylesheets)
+    pdf_content = vyrendruj_pdf(html, base_url=base_url, css_soubory=css_soubory)
 
     filename = f"rozpracovanost_{snapshot.cas_zaznamu:%Y%m%d_%H%M%S}.pdf"
-    response = HttpResponse(pdf_content, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
 
     logger.info(
-        f"Uživatel {getattr(request, 'user', None)} vygeneroval PDF rozpracovanosti ID {snapshot.pk} (beden: {sum(section['sum_beden'] for section in sections)}, přeskočeno: {skipped})."
+        f"Uživatel {user} vygeneroval PDF rozpracovanosti ID {snapshot.pk} (beden: {sum(section['sum_beden'] for section in sections)}, přeskočeno: {skipped})."
     )
 
-    return response
+    return pdf_content, filename
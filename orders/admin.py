@@ -23,18 +23,17 @@ from simple_history.admin import SimpleHistoryAdmin
 from decimal import Decimal, ROUND_HALF_UP, ROUND_DOWN
 from django.core.files.storage import default_storage
 import uuid
-import pandas as pd
 import re
 from django import forms
 from django.contrib.admin.helpers import ActionForm
 from django.contrib.admin.actions import delete_selected as admin_delete_selected
 from django_user_agents.utils import get_user_agent
 
-from .import_strategies import BaseImportStrategy, EURImportStrategy, SPXImportStrategy
+from .import_strategies import BaseImportStrategy, strategie_importu
 
 from .models import (
     Zakaznik, Kamion, Zakazka, Bedna, Predpis, Odberatel, TypHlavy, Cena, Pozice, Pletivo, PoziceZakazkaOrder, Rozpracovanost,
-    Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Notification, PriorityNotificationRecipient,
+    Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Notification, PriorityNotificationRecipient, Uloha, ulozeny_souhrn,
 )
 from .actions import (
     expedice_zakazek_action, import_kamionu_action, tisk_karet_beden_action, tisk_karet_beden_zakazek_action,
@@ -72,13 +71,30 @@ from .forms import (
 )
 from .choices import (
     StavBednyChoice, StavSarzeChoice, RovnaniChoice, TryskaniChoice, ZinkovaniChoice, PrioritaChoice, KamionChoice, PrijemVydejChoice, SklademZakazkyChoice,
-    BARVA_SKUPINY_TZ, STAV_BEDNY_ROZPRACOVANOST, STAV_BEDNY_SKLADEM, STAV_BEDNY_PRO_NAVEZENI,
-    STAV_BEDNY_KONTROLA_ZMENY_PRIORITY,
+    TypUlohyChoice, BARVA_SKUPINY_TZ, STAV_BEDNY_ROZPRACOVANOST, STAV_BEDNY_SKLADEM, STAV_BEDNY_PRO_NAVEZENI,
+    STAV_BEDNY_KONTROLA_ZMENY_PRIORITY, TypZarizeniChoice,
 )
 from .utils import (
     utilita_validate_excel_upload, build_postup_vyroby_cases, truncate_with_title, parse_sarze_search_term,
-    format_decimal_csv, format_cislo_bedny, format_skupina_TZ, build_fake_skupina_TZ_annotation
+    format_decimal_csv, format_cislo_bedny, format_skupina_TZ, build_fake_skupina_TZ_annotation,
+    utilita_zarad_ulohu,
 )
+from .services.cenik_service import invalidate_cenik
+from .services.souhrny_service import oznac_zmenu_souhrnu
+from .services.souhrny_vyroby_service import odlozene_souhrny_vyroby, prepocitej_ceny_vyroby
+from .services.import_service import (
+    IMPORT_TMP_DIR,
+    ParsovanyImport,
+    hash_souboru,
+    importuj_zakazky,
+    nacti_parsovany_import,
+    smaz_import,
+    uklid_importy,
+    uloz_parsovany_import,
+    vyrad_prosle_importy,
+)
+from .services.ulohy_service import prekracuje_prah
+from .services.vyroba_service import dopln_prodlevy
 
 import logging
 logger = logging.getLogger('orders')
@@ -628,6 +644,11 @@ class SarzeAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
             obj.datum_zalozeni = timezone.localdate()
         super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        """Kroky šarže z inline se uloží s jedním přepočtem souhrnů výroby na konci."""
+        with odlozene_souhrny_vyroby():
+            super().save_related(request, form, formsets, change)
+
     def get_search_results(self, request, queryset, search_term):
         queryset, use_distinct = super().get_search_results(request, queryset, search_term)
 
@@ -652,6 +673,13 @@ class SarzeAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
 
         return super().response_add(request, obj, post_url_continue)
 
+class ProdlevaKrokuChangeList(ChangeList):
+    """Changelist, který krokům na stránce výsledků doplní prodlevu jedním dotazem (vyroba_service.dopln_prodlevy)."""
+    def get_results(self, request):
+        super().get_results(request)
+        dopln_prodlevy(self.model_admin.krok_pro_prodlevu(obj) for obj in self.result_list)
+
+
 @admin.register(SarzeKrok)
 class SarzeKrokAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
     poll_url_name = 'orders_sarzekrok_poll'
@@ -712,6 +740,17 @@ class SarzeKrokAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
     def get_zarizeni(self, obj):
         return obj.zarizeni.zkraceny_nazev_zarizeni if obj.zarizeni else '-'
 
+    def get_changelist(self, request, **kwargs):
+        return ProdlevaKrokuChangeList
+
+    def krok_pro_prodlevu(self, obj):
+        return obj
+
+    def save_related(self, request, form, formsets, change):
+        """Bedny kroku z inline se uloží s jedním přepočtem souhrnů výroby na konci."""
+        with odlozene_souhrny_vyroby():
+            super().save_related(request, form, formsets, change)
+
     @admin.display(description='Prodleva (m)')
     def get_prodleva(self, obj):
         return obj.prodleva
@@ -874,6 +913,12 @@ class SarzeKrokBednaAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
         alarm = obj.krok.alarm if obj.krok else None
         return truncate_with_title(alarm, max_len=10)
 
+    def get_changelist(self, request, **kwargs):
+        return ProdlevaKrokuChangeList
+
+    def krok_pro_prodlevu(self, obj):
+        return obj.krok
+
     @admin.display(description='Prodl. (m)')
     def get_prodleva(self, obj):
         return obj.krok.prodleva if obj.krok else '-'
@@ -899,9 +944,14 @@ class SarzeKrokBednaAdmin(HistoryPollingAdminMixin, SimpleHistoryAdmin):
             return f"{prumer}x{delka}"
         return '-'
 
-    @admin.display(boolean=True, description='1.?')
+    @admin.display(boolean=True, description='1.?', ordering='prvni_pouziti')
     def get_prvni_pouziti(self, obj):
-        return obj.prvni_pouziti
+        # Uložený příznak, zobrazuje se jen u víceúčelových pecí.
+        return bool(
+            obj.prvni_pouziti
+            and obj.krok
+            and obj.krok.zarizeni.typ_zarizeni == TypZarizeniChoice.VICEUCELOVKA
+        )
 
     def get_search_results(self, request, queryset, search_term):
         queryset, use_distinct = super().get_search_results(request, queryset, search_term)
@@ -1125,32 +1175,43 @@ class ZakazkaKamionPrijemInline(admin.TabularInline):
         Pokud je alespoň jedna bedna v zakázce k expedici, vrátí ⏳.
         Pokud není žádná bedna v zakázce k expedici, vrátí ❌.
         '''
-        if not obj.pk or not obj.bedny.exists():
+        if not obj.pk:
             return '➖'
 
-        if all(bedna.stav_bedny in (StavBednyChoice.K_EXPEDICI, StavBednyChoice.EXPEDOVANO) for bedna in obj.bedny.all()):
+        souhrn = ulozeny_souhrn(obj)
+        if souhrn is None:
+            if not obj.bedny.exists():
+                return '➖'
+            if all(bedna.stav_bedny in (StavBednyChoice.K_EXPEDICI, StavBednyChoice.EXPEDOVANO) for bedna in obj.bedny.all()):
+                return "✔️"
+            elif any(bedna.stav_bedny == StavBednyChoice.K_EXPEDICI for bedna in obj.bedny.all()):
+                return "⏳"
+            return "❌"
+
+        if not souhrn.pocet_beden:
+            return '➖'
+        if souhrn.pocet_beden_k_expedici + souhrn.pocet_beden_expedovano == souhrn.pocet_beden:
             return "✔️"
-        elif any(bedna.stav_bedny == StavBednyChoice.K_EXPEDICI for bedna in obj.bedny.all()):
+        elif souhrn.pocet_beden_k_expedici:
             return "⏳"
         return "❌"
     
-    @admin.display(description='Beden')
+    @admin.display(description='Beden', ordering='souhrn__pocet_beden')
     def celkovy_pocet_beden(self, obj):
         """
-        Vrací počet beden v zakázce a umožní třídění podle hlavičky pole.
+        Vrací počet beden v zakázce (z uloženého souhrnu zakázky) a umožní třídění podle hlavičky pole.
         """
         if not obj.pk:
             return 0
-        return obj.bedny.count() if obj.bedny.exists() else 0
-    celkovy_pocet_beden.admin_order_field = 'bedny__count'
+        return obj.pocet_beden
 
     def get_queryset(self, request):
         """
         Přizpůsobení querysetu pro inline zakázek příjmu.
-        Zobrazí pouze zakázky, které nejsou expedované.
+        Zobrazí pouze zakázky, které nejsou expedované, s uloženým souhrnem beden.
         """
         qs = super().get_queryset(request)
-        return qs.filter(expedovano=False)
+        return qs.filter(expedovano=False).select_related('souhrn')
 
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         """
@@ -1201,15 +1262,20 @@ class ZakazkaKamionVydejInline(admin.TabularInline):
         },
     }
 
-    @admin.display(description='Beden', ordering='bedny__count')
+    @admin.display(description='Beden', ordering='souhrn__pocet_beden')
     def celkovy_pocet_beden(self, obj):
         """
-        Vrací počet beden v zakázce a umožní třídění podle hlavičky pole.
+        Vrací počet beden v zakázce (z uloženého souhrnu zakázky) a umožní třídění podle hlavičky pole.
         """
         if not obj.pk:
             return 0
-        return obj.bedny.count() if obj.bedny.exists() else 0
-    celkovy_pocet_beden.admin_order_field = 'bedny__count'    
+        return obj.pocet_beden
+
+    def get_queryset(self, request):
+        """
+        Přizpůsobení querysetu pro inline zakázek výdeje – s uloženým souhrnem beden.
+        """
+        return super().get_queryset(request).select_related('souhrn')
 
 
 @admin.register(Kamion)
@@ -1318,14 +1384,29 @@ class KamionAdmin(SimpleHistoryAdmin):
         if not obj or obj.prijem_vydej not in (KamionChoice.PRIJEM, KamionChoice.VYDEJ):
             return '-'
         if obj.prijem_vydej == KamionChoice.PRIJEM:
-            if not obj.zakazky_prijem.exists():
+            # V changelistu jsou příznaky zakázek anotované z Kamion.objects.with_priznaky() a počty beden
+            # se čtou z uloženého souhrnu kamionu, jinak se dotazují.
+            if hasattr(obj, 'ma_zakazky_ann'):
+                ma_zakazky = obj.ma_zakazky_ann
+                ma_neexpedovane = obj.ma_neexpedovane_zakazky_ann
+            else:
+                ma_zakazky = obj.zakazky_prijem.exists()
+                ma_neexpedovane = obj.zakazky_prijem.filter(expedovano=False).exists()
+            souhrn = self._souhrn(obj)
+            if souhrn is not None:
+                ma_neprijate = souhrn.pocet_beden_neprijatych > 0
+                ma_skladem = souhrn.pocet_beden_skladem > 0
+            else:
+                ma_neprijate = obj.zakazky_prijem.filter(bedny__stav_bedny=StavBednyChoice.NEPRIJATO).exists()
+                ma_skladem = obj.zakazky_prijem.filter(bedny__stav_bedny__in=STAV_BEDNY_SKLADEM).exists()
+
+            if not ma_zakazky:
                 return 'Bez zakázek'
-            elif obj.zakazky_prijem.filter(bedny__stav_bedny=StavBednyChoice.NEPRIJATO).exists():
+            elif ma_neprijate:
                 return 'Nepřijatý'
-            elif (not obj.zakazky_prijem.filter(bedny__stav_bedny=StavBednyChoice.NEPRIJATO).exists() and
-                  obj.zakazky_prijem.filter(bedny__stav_bedny__in=STAV_BEDNY_SKLADEM).exists()):
+            elif ma_skladem:
                 return 'Komplet přijatý'
-            elif not obj.zakazky_prijem.filter(expedovano=False).exists():
+            elif not ma_neexpedovane:
                 return 'Vyexpedovaný'
             else:
                 return '-'
@@ -1353,13 +1434,33 @@ class KamionAdmin(SimpleHistoryAdmin):
         """
         return f'{obj.poradove_cislo}. kamión {obj.get_prijem_vydej_display().lower()} {obj.datum.strftime("%Y")} {obj.zakaznik.zkratka}'
 
-    @admin.display(description='Netto kg')
+    def get_queryset(self, request):
+        """
+        Načte k kamionům uložený souhrn beden (select_related) a příznaky zakázek z Kamion.objects.with_priznaky(),
+        aby sloupce changelistu (typ kamionu, hmotnosti, počet beden skladem) nevolaly dotazy pro každý řádek.
+        """
+        return super().get_queryset(request).select_related('souhrn').with_priznaky()
+
+    def _souhrn(self, obj):
+        """
+        Vrátí uložený souhrn beden kamionu (v changelistu načtený přes select_related), nebo None,
+        pokud kamion souhrn ještě nemá.
+        """
+        return ulozeny_souhrn(obj)
+
+    def _ma_zakazky(self, obj):
+        """Vrací True, pokud má kamion nějaké zakázky (příjem nebo výdej)."""
+        if hasattr(obj, 'ma_zakazky_ann'):
+            return obj.ma_zakazky_ann
+        return obj.zakazky_prijem.exists() or obj.zakazky_vydej.exists()
+
+    @admin.display(description='Netto kg', ordering='souhrn__hmotnost')
     def get_celkova_hmotnost_netto(self, obj):
         """
         Vrací celkovou hmotnost netto kamionu, pokud existují zakázky.
         Pokud neexistují žádné zakázky, vrátí 0.
         """
-        if not obj.zakazky_prijem.exists() and not obj.zakazky_vydej.exists():
+        if not self._ma_zakazky(obj):
             return 0
         return Decimal(obj.celkova_hmotnost_netto).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
     
@@ -1369,11 +1470,11 @@ class KamionAdmin(SimpleHistoryAdmin):
         Vrací celkovou hmotnost brutto kamionu, pokud existují zakázky.
         Pokud neexistují žádné zakázky, vrátí 0.
         """
-        if not obj.zakazky_prijem.exists() and not obj.zakazky_vydej.exists():
+        if not self._ma_zakazky(obj):
             return 0
         return Decimal(obj.celkova_hmotnost_brutto).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
     
-    @admin.display(description='Beden skladem')
+    @admin.display(description='Beden skladem', ordering='souhrn__pocet_beden_skladem')
     def get_pocet_beden_skladem(self, obj):
         """
         Vrací počet beden skladem v kamionu příjem.
@@ -1823,18 +1924,50 @@ class KamionAdmin(SimpleHistoryAdmin):
         Vrátí strategii importu podle zákazníka (zatím pouze EUR a SPX).
         Pro ostatní zákazníky vrací výchozí strategii, která nemá definovanou logiku.
         """
+        return strategie_importu(kamion)
+
+    def _zarad_import(self, request, kamion, df, tmp_token, parsovany, preview, required_fields):
+        """
+        Zařadí uložení importu jako úlohu na pozadí. Úloha načte rozparsovaný náhled z dočasného
+        úložiště (pokud chybí, uloží se teď) a po dokončení smaže dočasné soubory importu.
+        Záznam importu se ze session odebere, soubory od teď patří úloze.
+        """
+        try:
+            tmp_map = request.session.get('import_tmp_files', {})
+        except Exception:
+            logger.warning("Nepodařilo se načíst mapu dočasných importních souborů ze session.", exc_info=True)
+            tmp_map = {}
+        info = tmp_map.pop(tmp_token, None) or {}
+        file_hash = info.get('hash')
+        if parsovany is None:
+            if not file_hash:
+                with default_storage.open(info['path'], 'rb') as soubor:
+                    file_hash = hash_souboru(soubor)
+            uloz_parsovany_import(ParsovanyImport(
+                token=tmp_token,
+                file_hash=file_hash,
+                df=df,
+                preview=preview,
+                required_fields=list(required_fields),
+            ))
         try:
-            zkratka = getattr(getattr(kamion, 'zakaznik', None), 'zkratka', None)
+            request.session['import_tmp_files'] = tmp_map
+            request.session.modified = True
         except Exception:
-            logger.warning("Nepodařilo se získat zkratku zákazníka pro volbu importní strategie.", exc_info=True)
-            zkratka = None
-        match zkratka:
-            case 'EUR':
-                return EURImportStrategy()
-            case 'SPX':
-                return SPXImportStrategy()
-            case _:
-                return BaseImportStrategy()
+            logger.warning("Nepodařilo se aktualizovat session po zařazení importu na pozadí.", exc_info=True)
+        return utilita_zarad_ulohu(
+            self,
+            request,
+            TypUlohyChoice.IMPORT_ZAKAZEK,
+            {
+                'kamion': kamion.pk,
+                'token': tmp_token,
+                'hash': file_hash,
+                'cesta': info.get('path'),
+            },
+            f"Import {info.get('name') or ''} do kamionu {kamion} ({len(df)} řádků)",
+            celkem=len(df),
+        )
 
     def import_view(self, request):
         """
@@ -1891,11 +2024,23 @@ class KamionAdmin(SimpleHistoryAdmin):
                         tmp_map = {}
                     saved_path = None
                     excel_stream = None
+                    file_hash = None
+                    parsovany = None
+                    df = None
 
                     if file:
+                        # Úklid prošlých náhledů této session i opuštěných souborů v dočasném úložišti
+                        vyrad_prosle_importy(tmp_map)
+                        uklid_importy()
                         token = str(uuid.uuid4())
-                        saved_path = default_storage.save(f"tmp/imports/{token}.xlsx", file)
-                        tmp_map[token] = {'path': saved_path, 'name': file.name}
+                        file_hash = hash_souboru(file)
+                        saved_path = default_storage.save(f"{IMPORT_TMP_DIR}/{token}.xlsx", file)
+                        tmp_map[token] = {
+                            'path': saved_path,
+                            'name': file.name,
+                            'hash': file_hash,
+                            'vytvoreno': timezone.now().isoformat(),
+                        }
                         try:
                             request.session['import_tmp_files'] = tmp_map
                             request.session.modified = True
@@ -1910,31 +2055,57 @@ class KamionAdmin(SimpleHistoryAdmin):
                         if tmp_token and tmp_token in tmp_map:
                             saved_path = tmp_map[tmp_token]['path']
                             tmp_filename = tmp_map[tmp_token]['name']
-                            excel_stream = default_storage.open(saved_path, 'rb')
+                            # Potvrzení použije dataframe rozparsovaný při náhledu, Excel se čte znovu jen bez něj
+                            parsovany = nacti_parsovany_import(tmp_token, tmp_map[tmp_token].get('hash'))
+                            if parsovany is None:
+                                excel_stream = default_storage.open(saved_path, 'rb')
                         else:
                             errors.append("Nebyl poskytnut žádný soubor k importu.")
                             return self._render_import(
                                 request, form, kamion, preview, errors, warnings, tmp_token, tmp_filename
                             )
                         
-                    try:
-                        df, preview, parse_errors, parse_warnings, required_fields = strategy.parse_excel(
-                            excel_stream, request, kamion
-                        )
-                        errors.extend(parse_errors)
-                        warnings.extend(parse_warnings)
-                    except NotImplementedError:
-                        msg = "Strategie importu pro tohoto zákazníka není implementována."
-                        logger.error(msg)
-                        errors.append(msg)
-                    finally:
-                        # zavřít handle, pokud je z uloženého souboru
+                    if parsovany is not None:
+                        df, preview, required_fields = parsovany.df, parsovany.preview, parsovany.required_fields
+                        errors.extend(parsovany.errors)
+                        warnings.extend(parsovany.warnings)
+                        # Předpisy a typy hlavy se mohly od náhledu změnit – ověří se znovu, varování už zobrazil náhled
+                        if not errors and kamion:
+                            errors.extend(strategy.check_reference_data(df, kamion, []))
+                    else:
                         try:
-                            if saved_path and excel_stream:
-                                excel_stream.close()
+                            df, preview, parse_errors, parse_warnings, required_fields = strategy.parse_excel(
+                                excel_stream, request, kamion
+                            )
+                            errors.extend(parse_errors)
+                            warnings.extend(parse_warnings)
+                        except NotImplementedError:
+                            msg = "Strategie importu pro tohoto zákazníka není implementována."
+                            logger.error(msg)
+                            errors.append(msg)
+                        finally:
+                            # zavřít handle, pokud je z uloženého souboru
+                            try:
+                                if saved_path and excel_stream:
+                                    excel_stream.close()
+                            except Exception:
+                                logger.warning("Nepodařilo se zavřít stream importovaného souboru.", exc_info=True)
+                                pass
+
+                    # Rozparsovaný náhled se uloží pro potvrzení, aby se Excel nečetl podruhé
+                    if file and df is not None:
+                        try:
+                            uloz_parsovany_import(ParsovanyImport(
+                                token=tmp_token,
+                                file_hash=file_hash,
+                                df=df,
+                                preview=preview,
+                                errors=list(errors),
+                                warnings=list(warnings),
+                                required_fields=list(required_fields),
+                            ))
                         except Exception:
-                            logger.warning("Nepodařilo se zavřít stream importovaného souboru.", exc_info=True)
-                            pass
+                            logger.warning("Nepodařilo se uložit rozparsovaný náhled importu.", exc_info=True)
 
                     # Pokud jsou chyby po parsování, zobrazit náhled a chyby (bez uložení)
                     if errors:
@@ -1963,32 +2134,19 @@ class KamionAdmin(SimpleHistoryAdmin):
                             request, form, kamion, preview, errors, warnings, tmp_token, tmp_filename
                         )
 
-                    # Uložení záznamů
-                    with transaction.atomic():
-                        zakazky_cache = {}
-                        for _, row in df.iterrows():
-
-                            # Kontrola zda všechna povinná pole jsou vyplněna
-                            if not required_fields:
-                                required_fields = strategy.get_required_fields()
-                            for field in required_fields:
-                                if pd.isna(row[field]):
-                                    logger.error(f"Chyba: Povinné pole '{field}' nesmí být prázdné.")
-                                    raise ValueError(f"Chyba: Povinné pole '{field}' nesmí být prázdné.")
+                    # Velký import se uloží úlohou na pozadí z uloženého rozparsovaného náhledu
+                    if tmp_token and prekracuje_prah(len(df)):
+                        return self._zarad_import(request, kamion, df, tmp_token, parsovany, preview, required_fields)
 
-                            cache_key = strategy.get_cache_key(row)
-
-                            if cache_key not in zakazky_cache:
-                                zakazka_kwargs = strategy.map_row_to_zakazka_kwargs(row, kamion, warnings)
-                                zakazky_cache[cache_key] = Zakazka.objects.create(**zakazka_kwargs)
-
-                            bedna_kwargs = strategy.map_row_to_bedna_kwargs(row)
-                            Bedna.objects.create(
-                                zakazka=zakazky_cache[cache_key],
-                                **bedna_kwargs,
-                            )
+                    # Uložení záznamů – hromadně, v jedné transakci
+                    vysledek = importuj_zakazky(
+                        df, kamion, strategy, warnings, required_fields=required_fields, user=request.user,
+                    )
 
-                    logger.info(f"Uživatel {request.user} úspěšně uložil zakázky a bedny pro kamion {kamion}.")
+                    logger.info(
+                        f"Uživatel {request.user} úspěšně uložil {vysledek.pocet_zakazek} zakázek a "
+                        f"{vysledek.pocet_beden} beden pro kamion {kamion}."
+                    )
                     # pokud se importovalo z dočasného souboru, uklidit
                     if 'tmp_token' in locals() and tmp_token:
                         try:
@@ -1997,12 +2155,8 @@ class KamionAdmin(SimpleHistoryAdmin):
                             logger.warning("Nepodařilo se načíst mapu dočasných importních souborů ze session.", exc_info=True)
                             tmp_map = {}
                         info = tmp_map.pop(tmp_token, None)
-                        if info and info.get('path'):
-                            try:
-                                default_storage.delete(info['path'])
-                            except Exception:
-                                logger.warning("Nepodařilo se smazat dočasný importní soubor po dokončení importu.", exc_info=True)
-                                pass
+                        if info:
+                            smaz_import(tmp_token, info)
                         try:
                             request.session['import_tmp_files'] = tmp_map
                             request.session.modified = True
@@ -2339,7 +2493,7 @@ class ZakazkaAdmin(SimpleHistoryAdmin):
                     'hmotnost_zakazky_k_expedici_brutto', 'pocet_beden_k_expedici', 'celkovy_pocet_beden', 'get_komplet',)
     list_display_links = ('artikl',)
     # list_editable = nastavováno dynamicky v get_list_editable
-    list_select_related = ("kamion_prijem", "kamion_vydej")
+    list_select_related = ("kamion_prijem", "kamion_vydej", "souhrn")
     search_fields = ('artikl',)
     search_help_text = "Dle artiklu"
     list_filter = (ZakaznikZakazkyFilter, SklademZakazkaFilter, OdberatelFilter, KompletZakazkaFilter, PrioritaZakazkyFilter,
@@ -2429,7 +2583,11 @@ class ZakazkaAdmin(SimpleHistoryAdmin):
                         pass
 
         if allowed_ids:
-            super().delete_queryset(request, queryset.filter(pk__in=allowed_ids))
+            povolene_qs = queryset.filter(pk__in=allowed_ids)
+            kamion_ids = {pk for pair in povolene_qs.values_list('kamion_prijem_id', 'kamion_vydej_id') for pk in pair}
+            with transaction.atomic():
+                super().delete_queryset(request, povolene_qs)
+                oznac_zmenu_souhrnu(kamion_ids=kamion_ids)
         # Pokud nic povoleno, jen končí s vypsanými hláškami
 
     def _get_priority_notification_recipients(self, request):
@@ -2595,30 +2753,43 @@ class ZakazkaAdmin(SimpleHistoryAdmin):
         """        
         return format_html('<span title="{}">{}</span>', obj.popis, obj.zkraceny_popis)        
 
-    @admin.display(description='Brutto k exp.')
+    def _souhrn(self, obj):
+        """
+        Vrátí uložený souhrn beden zakázky (načtený přes list_select_related), nebo None,
+        pokud zakázka souhrn ještě nemá.
+        """
+        return ulozeny_souhrn(obj)
+
+    @admin.display(description='Brutto k exp.', ordering='souhrn__hmotnost_k_expedici_brutto')
     def hmotnost_zakazky_k_expedici_brutto(self, obj):
         """
         Vrátí součet brutto hmotnosti (hmotnost + tara) všech beden se stavem 'K expedici' v dané zakázce.
-        Výsledek je zaokrouhlen na 0.1 a umožňuje třídění v Django adminu.
+        Hodnota se čte z uloženého souhrnu zakázky a umožňuje třídění v Django adminu.
         """
+        souhrn = self._souhrn(obj)
+        if souhrn is not None:
+            return souhrn.hmotnost_k_expedici_brutto
         bedny = obj.bedny.filter(stav_bedny=StavBednyChoice.K_EXPEDICI)
         brutto = sum((bedna.hmotnost or 0) + (bedna.tara or 0) for bedna in bedny)
 
         return brutto.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP) if brutto else Decimal('0.0')
 
-    @admin.display(description='Beden')
+    @admin.display(description='Beden', ordering='souhrn__pocet_beden')
     def celkovy_pocet_beden(self, obj):
         """
-        Vrací počet beden v zakázce a umožní třídění podle hlavičky pole.
+        Vrací počet beden v zakázce z uloženého souhrnu a umožní třídění podle hlavičky pole.
         """
-        return obj.bedny.count() if obj.bedny.exists() else 0
+        return obj.pocet_beden
     
-    @admin.display(description='K exp.')
+    @admin.display(description='K exp.', ordering='souhrn__pocet_beden_k_expedici')
     def pocet_beden_k_expedici(self, obj):
         """
-        Vrátí počet beden se stavem 'K expedici' v dané zakázce a umožní třídění podle hlavičky pole.
+        Vrátí počet beden se stavem 'K expedici' v dané zakázce z uloženého souhrnu a umožní třídění podle hlavičky pole.
         """
-        return obj.bedny.filter(stav_bedny=StavBednyChoice.K_EXPEDICI).count() if obj.bedny.exists() else 0
+        souhrn = self._souhrn(obj)
+        if souhrn is not None:
+            return souhrn.pocet_beden_k_expedici
+        return obj.bedny.filter(stav_bedny=StavBednyChoice.K_EXPEDICI).count()
 
     @admin.display(description='Kam. příjem', ordering='kamion_prijem__id', empty_value='-')
     def kamion_prijem_link(self, obj):
@@ -2644,12 +2815,24 @@ class ZakazkaAdmin(SimpleHistoryAdmin):
         Pokud je alespoň jedna bedna v zakázce k expedici, vrátí ⏳.
         Pokud není žádná bedna v zakázce k expedici, vrátí ❌.
         '''
-        if not obj.pk or not obj.bedny.exists():
+        if not obj.pk:
             return '➖'
 
-        if all(bedna.stav_bedny in (StavBednyChoice.K_EXPEDICI, StavBednyChoice.EXPEDOVANO) for bedna in obj.bedny.all()):
+        souhrn = self._souhrn(obj)
+        if souhrn is None:
+            if not obj.bedny.exists():
+                return '➖'
+            if all(bedna.stav_bedny in (StavBednyChoice.K_EXPEDICI, StavBednyChoice.EXPEDOVANO) for bedna in obj.bedny.all()):
+                return "✔️"
+            elif any(bedna.stav_bedny == StavBednyChoice.K_EXPEDICI for bedna in obj.bedny.all()):
+                return "⏳"
+            return "❌"
+
+        if not souhrn.pocet_beden:
+            return '➖'
+        if souhrn.pocet_beden_k_expedici + souhrn.pocet_beden_expedovano == souhrn.pocet_beden:
             return "✔️"
-        elif any(bedna.stav_bedny == StavBednyChoice.K_EXPEDICI for bedna in obj.bedny.all()):
+        elif souhrn.pocet_beden_k_expedici:
             return "⏳"
         return "❌"
 
@@ -4360,7 +4543,11 @@ class BednaAdmin(SimpleHistoryAdmin):
                         pass
 
         if allowed_ids:
-            super().delete_queryset(request, queryset.filter(pk__in=allowed_ids))
+            povolene_qs = queryset.filter(pk__in=allowed_ids)
+            zakazka_ids = set(povolene_qs.values_list('zakazka_id', flat=True))
+            with transaction.atomic():
+                super().delete_queryset(request, povolene_qs)
+                oznac_zmenu_souhrnu(zakazka_ids=zakazka_ids)
         # Pokud nic nepovoleno, jen vrátí – akce skončí s vypsanými hláškami
 
 
@@ -4481,6 +4668,18 @@ class PredpisAdmin(SimpleHistoryAdmin):
         super().save_related(request, form, formsets, change)
         self._copy_cena_relations_on_saveasnew_copy_ceny_deactivate(request, form.instance)
         self._deactivate_source_predpis_on_saveasnew_copy_ceny_deactivate(request, form.instance)
+        invalidate_cenik(form.instance.zakaznik_id)
+        prepocitej_ceny_vyroby(form.instance.zakaznik_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_cenik(obj.zakaznik_id)
+        prepocitej_ceny_vyroby(obj.zakaznik_id)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_cenik()
+        prepocitej_ceny_vyroby()
 
 
 @admin.register(Odberatel)
@@ -4603,6 +4802,7 @@ class CenaAdmin(SimpleHistoryAdmin):
             formset = FormSet(formset_data, request.FILES, queryset=modified_queryset)
             if formset.is_valid():
                 with transaction.atomic():
+                    zmenene_ceniky = set()
                     for form in getattr(formset, 'forms', []):
                         # Pokud formulář neobsahuje změny, přeskočí se (i když je validní),
                         # aby nedocházelo k zbytečným DB operacím.
@@ -4628,6 +4828,10 @@ class CenaAdmin(SimpleHistoryAdmin):
 
                         # Uloží se objekt pouze pro formuláře s reálnými změnami.
                         obj.save()
+                        invalidate_cenik(obj.zakaznik_id)
+                        zmenene_ceniky.add(obj.zakaznik_id)
+                    for zakaznik_id in zmenene_ceniky:
+                        prepocitej_ceny_vyroby(zakaznik_id)
 
             if formset.is_valid():
                 self.message_user(request, 'Uloženy změny')
@@ -4655,6 +4859,28 @@ class CenaAdmin(SimpleHistoryAdmin):
 
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Po uložení ceny včetně vazeb na předpisy zahodí ceník zákazníka načtený v tomto procesu.
+        Při změně zákazníka ceny se zahodí všechny ceníky.
+        """
+        super().save_related(request, form, formsets, change)
+        if 'zakaznik' in form.changed_data:
+            invalidate_cenik()
+            prepocitej_ceny_vyroby()
+        else:
+            invalidate_cenik(form.instance.zakaznik_id)
+            prepocitej_ceny_vyroby(form.instance.zakaznik_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_cenik(obj.zakaznik_id)
+        prepocitej_ceny_vyroby(obj.zakaznik_id)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_cenik()
+        prepocitej_ceny_vyroby()
 
     @admin.display(description='Předpisy', ordering='predpis__nazev', empty_value='-')
     def get_predpisy(self, obj):
@@ -4951,5 +5177,44 @@ class RozpracovanostAdmin(admin.ModelAdmin):
     pocet_beden.short_description = 'Počet beden'
 
 
+@admin.register(Uloha)
+class UlohaAdmin(admin.ModelAdmin):
+    """
+    Přehled úloh na pozadí. Úlohy zakládají akce, zpracovává je `manage.py run_jobs`,
+    v administraci se jen prohlíží a mažou.
+    """
+    list_display = ('pk', 'typ', 'stav', 'popis', 'vytvoril', 'vytvoreno', 'dokonceno', 'get_prubeh', 'get_odkaz')
+    list_display_links = ('pk', 'typ')
+    list_filter = ('stav', 'typ')
+    search_fields = ('popis', 'nazev_souboru', 'vytvoril__username')
+    ordering = ('-vytvoreno',)
+    list_per_page = 50
+    date_hierarchy = 'vytvoreno'
+    list_select_related = ('vytvoril',)
+    readonly_fields = [field.name for field in Uloha._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(vytvoril=request.user)
+
+    @admin.display(description='Průběh')
+    def get_prubeh(self, obj):
+        if obj.celkem:
+            return f"{obj.prubeh} / {obj.celkem}"
+        return '-'
+
+    @admin.display(description='Stránka úlohy')
+    def get_odkaz(self, obj):
+        return format_html('<a href="{}">{}</a>', obj.get_absolute_url(), obj.nazev_souboru or 'detail')
+
+
 # Nastavení atributů AdminSite
 admin.site.index_title = "Správa zakázek"
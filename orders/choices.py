@@ -144,6 +144,19 @@ class TypZarizeniChoice(models.TextChoices):
     NAKLADANI = 'NK', 'Nakládání'
     VYKLADANI = 'VK', 'Vykládání'
 
+class StavUlohyChoice(models.TextChoices):
+    CEKA = 'CE', 'Čeká'
+    BEZI = 'BE', 'Běží'
+    HOTOVO = 'HO', 'Hotovo'
+    CHYBA = 'CH', 'Chyba'
+
+class TypUlohyChoice(models.TextChoices):
+    IMPORT_ZAKAZEK = 'IM', 'Import zakázek'
+    KARTY_BEDEN = 'KA', 'Tisk karet beden'
+    ROZPRACOVANOST = 'RO', 'Tisk rozpracovanosti'
+    CSV_ZAKAZNIK = 'CZ', 'Export beden do CSV pro zákazníka'
+    CSV_DL = 'CD', 'Export beden do CSV pro DL'
+
 # Mapping skupiny TZ na barvy
 BARVA_SKUPINY_TZ = {
     1: {'pozadi': '#f0f0f0', 'text': '#000000'},
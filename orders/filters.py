@@ -1,12 +1,12 @@
 from django.contrib.admin import SimpleListFilter
-from django.db.models import Exists, OuterRef, Sum, Count, F
+from django.db.models import Exists, OuterRef, Sum, F
 from django.db.models import Q
 from django.utils import timezone
 
 from datetime import timedelta
 from decimal import Decimal, InvalidOperation
 
-from .models import Zakazka, Bedna, Zakaznik, Kamion, TypHlavy, Predpis, Odberatel, Zarizeni, Sarze, SarzeKrokBedna, Notification
+from .models import Zakazka, Zakaznik, Kamion, TypHlavy, Predpis, Odberatel, Zarizeni, Sarze, SarzeKrokBedna, Notification
 from .choices import (
     StavBednyChoice, TryskaniChoice, RovnaniChoice, ZinkovaniChoice, PrioritaChoice, PrijemVydejChoice, SklademZakazkyChoice,
     StavSarzeChoice, TypZarizeniChoice, STAV_BEDNY_ROZPRACOVANOST, STAV_BEDNY_SKLADEM,
@@ -628,29 +628,20 @@ class SklademZakazkaFilter(DynamicTitleFilter):
 
     def queryset(self, request, queryset):
         value = self.value()
-        # Subquery pro kontrolu, zda zakázka má nějakou bednu ve stavu NEPRIJATO
-        neprijato_subquery = Bedna.objects.filter(
-            zakazka=OuterRef('pk'),
-            stav_bedny=StavBednyChoice.NEPRIJATO,
-        )
-        # Subquery pro kontrolu, zda zakázka má aspoň jednu bednu s jiným stavem než NEPRIJATO
-        non_neprijato_subquery = Bedna.objects.filter(
-            zakazka=OuterRef('pk'),
-        ).exclude(stav_bedny=StavBednyChoice.NEPRIJATO)
+        # Počty beden se čtou z uloženého souhrnu zakázky (SouhrnZakazky) bez agregace beden.
+        # Zakázka má aspoň jednu bednu s jiným stavem než NEPRIJATO.
+        prijata_bedna = Q(souhrn__pocet_beden__gt=F('souhrn__pocet_beden_neprijatych'))
 
         if value is None:
             # "Vše skladem": neexpedováno AND existuje aspoň jedna bedna, která není NEPRIJATO.
             # Tím se automaticky vyřadí expedované, bez beden i zakázky, kde jsou všechny bedny NEPRIJATO.
-            return queryset.filter(
-                expedovano=False,
-            ).filter(
-                Exists(non_neprijato_subquery)
-            ).distinct()
+            return queryset.filter(prijata_bedna, expedovano=False)
         elif value == SklademZakazkyChoice.NEPRIJATO:
             # Zakázky, které mají aspoň jednu bednu ve stavu NEPRIJATO
-            return queryset.filter(Exists(neprijato_subquery))
+            return queryset.filter(souhrn__pocet_beden_neprijatych__gt=0)
         elif value == SklademZakazkyChoice.BEZ_BEDEN:
-            return queryset.filter(bedny__isnull=True)
+            # Zakázka bez beden nemusí mít souhrn vůbec.
+            return queryset.filter(Q(souhrn__isnull=True) | Q(souhrn__pocet_beden=0))
         elif value == SklademZakazkyChoice.EXPEDOVANO:
             return queryset.filter(expedovano=True)
         elif value == SklademZakazkyChoice.PO_EXSPIRACI:
@@ -658,10 +649,10 @@ class SklademZakazkaFilter(DynamicTitleFilter):
             # Zakázky, které mají alespoň jednu bednu, která není expedována a není ve stavu NEPRIJATO
             # a zároveň datum příjmu kamionu je starší než 28 dní
             return queryset.filter(
-                Exists(non_neprijato_subquery),
+                prijata_bedna,
                 expedovano=False,
                 kamion_prijem__datum__lt=expiration_date
-            ).distinct()
+            )
         return queryset
       
 
@@ -685,21 +676,15 @@ class KompletZakazkaFilter(DynamicTitleFilter):
     def queryset(self, request, queryset):
         value = self.value()
         if value == 'kompletni':
-            # Zakázky, které mají aspoň jednu bednu a všechny bedny jsou ve stavu K_EXPEDICI nebo EXPEDOVANO.
-            return queryset.annotate(
-                _bedny_total=Count('bedny', distinct=True),
-                _bedny_ok=Count(
-                    'bedny',
-                    filter=Q(bedny__stav_bedny__in=(StavBednyChoice.K_EXPEDICI, StavBednyChoice.EXPEDOVANO)),
-                    distinct=True,
-                ),
-            ).filter(
-                _bedny_total__gt=0,
-                _bedny_total=F('_bedny_ok'),
+            # Zakázky, které mají aspoň jednu bednu a všechny bedny jsou ve stavu K_EXPEDICI nebo EXPEDOVANO
+            # (počty z uloženého souhrnu zakázky).
+            return queryset.filter(
+                souhrn__pocet_beden__gt=0,
+                souhrn__pocet_beden=F('souhrn__pocet_beden_k_expedici') + F('souhrn__pocet_beden_expedovano'),
             )
         elif value == 'k_expedici':
             # Vrátí zakázky, které mají alespoň jednu bednu ve stavu K expedici
-            queryset = queryset.filter(bedny__stav_bedny=StavBednyChoice.K_EXPEDICI).distinct()
+            queryset = queryset.filter(souhrn__pocet_beden_k_expedici__gt=0)
         return queryset
     
 
@@ -851,13 +836,12 @@ class PrijemVydejFilter(DynamicTitleFilter):
             return queryset.filter(prijem_vydej='P', zakazky_prijem__isnull=True)
         # PN Nepřijatý - kamion, který obsahuje bedny, ale aspoň jedna bedna je ve stavu StavBednyChoices.NEPRIJATO
         elif value == PrijemVydejChoice.PRIJEM_NEPRIJATY:
-            return queryset.filter(prijem_vydej='P', zakazky_prijem__bedny__stav_bedny=StavBednyChoice.NEPRIJATO).distinct()
+            return queryset.filter(prijem_vydej='P', souhrn__pocet_beden_neprijatych__gt=0)
         # PK Komplet přijatý - kamion, který neobsahuje ani jednu bednu ve stavu StavBednyChoices.NEPRIJATO
     # a alespoň jedna bedna je ve stavu uvedeném ve STAV_BEDNY_SKLADEM.
+        # Počty beden se čtou z uloženého souhrnu kamionu (SouhrnKamionu).
         elif value == PrijemVydejChoice.PRIJEM_KOMPLET_PRIJATY:
-            return queryset.filter(prijem_vydej='P', zakazky_prijem__isnull=False
-            ).exclude(zakazky_prijem__bedny__stav_bedny=StavBednyChoice.NEPRIJATO
-            ).filter(zakazky_prijem__bedny__stav_bedny__in=STAV_BEDNY_SKLADEM).distinct()  
+            return queryset.filter(prijem_vydej='P', souhrn__pocet_beden_neprijatych=0, souhrn__pocet_beden_skladem__gt=0)
         # PV Vyexpedovaný - kamion, který má všechny zakázky ve stavu expedovano=True      
         elif value == PrijemVydejChoice.PRIJEM_VYEXPEDOVANY:
             return queryset.filter(prijem_vydej='P', zakazky_prijem__isnull=False
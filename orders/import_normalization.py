@@ -0,0 +1,348 @@
+"""
+Sloupcová normalizace dat importu zakázek z Excelu.
+
+Funkce pracují nad celými sloupci (pandas .str/regex accessory, NumPy masky a np.where) místo řádkových
+`df.apply(..., axis=1)` a dávají stejné hodnoty jako původní řádkové funkce strategií.
+Po prvcích zůstávají jen kroky, které vektorově nejdou:
+- Decimal nemá vektorový převod ani zaokrouhlení – texty předem rozparsované .str accessory se na Decimal
+  převádějí (a zaokrouhlují) po prvcích, jednou pro každý unikátní text (`_decimaly`);
+- dělení Decimal a textových hodnot v `mnozstvi_v_bedne` (přes float by se výsledek lišil, např. 0.3 / 0.1);
+- určení typu hodnot ve smíšeném object sloupci čísel beden (texty i čísla z Excelu).
+Funkce vracející chyby vracejí jednu chybu za každý chybný řádek, ve stejném pořadí jako řádky.
+"""
+import logging
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+
+from .choices import PrioritaChoice
+
+logger = logging.getLogger('orders')
+
+ERROR_VALUES = '!!!!!!'
+
+CHYBA_ROZMER_EUR = "Chyba: Sloupec 'Abmessung' musí obsahovat hodnoty ve formátu 'prumer x delka'."
+CHYBA_ROZMER_SPX_PRAZDNY = "Chyba: Sloupec s rozměrem je prázdný."
+CHYBA_ROZMER_SPX_FORMAT = "Chyba: Sloupec s rozměrem musí být ve formátu 'prumer*delka' nebo 'prefix prumer*delka'."
+CHYBA_ROZMER_SPX_CISLO = "Chyba: Nelze převést hodnoty průměru nebo délky na číslo."
+CHYBA_MNOZSTVI_SPX = "Chyba: Nelze přečíst množství (mnozstvi)."
+CHYBA_TARA_SPX = "Chyba: Nelze spočítat taru, chybí brutto nebo hmotnost."
+
+ROZMER_SPX_PATTERN = re.compile(r"^(?:(?P<prefix>.*?)\s+)?(?P<prumer>[0-9]+[.,]?[0-9]*)\*(?P<delka>[0-9]+[.,]?[0-9]*)")
+JEDNA_DESETINA = Decimal('0.0')
+
+
+def _objekty(series: pd.Series) -> pd.Series:
+    """Sloupec jako object dtype, aby šel použít .str accessor i na prázdné nebo číselné sloupce."""
+    return series.astype(object)
+
+
+def _je_none(series: pd.Series) -> np.ndarray:
+    """Maska hodnot None (na rozdíl od isna() nezahrnuje NaN ani Decimal('NaN'))."""
+    return np.equal(series.to_numpy(dtype=object), None)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Ekvivalent `str(hodnota or '')` pro celý sloupec (None, 0, False a '' dají prázdný text, NaN dá 'nan')."""
+    hodnoty = _objekty(series)
+    # Nepravdivé hodnoty z Excelu: None, nuly (0 == 0.0 == False == Decimal('0')) a prázdný text.
+    nepravdive = hodnoty.isin([0, '']).to_numpy(dtype=bool) | _je_none(hodnoty)
+    return hodnoty.where(~nepravdive, '').astype(str)
+
+
+def _obsahuje(series: pd.Series, vyraz: str) -> pd.Series:
+    """Maska řádků, jejichž text (malými písmeny) obsahuje výraz. Prázdné a netextové hodnoty jsou False."""
+    return _objekty(series).str.lower().str.contains(vyraz, regex=False, na=False).astype(bool)
+
+
+def _po_unikatnich(series: pd.Series, funkce) -> pd.Series:
+    """Použije funkci na každou unikátní hodnotu sloupce jen jednou (data v souboru se většinou opakují)."""
+    hodnoty = _objekty(series)
+    try:
+        kody, unikatni = pd.factorize(hodnoty, use_na_sentinel=False)
+    except TypeError:
+        return pd.Series([funkce(h) for h in hodnoty], index=series.index, dtype=object)
+    prevod = np.empty(len(unikatni), dtype=object)
+    prevod[:] = [funkce(h) for h in unikatni]
+    return pd.Series(prevod[kody], index=series.index, dtype=object)
+
+
+def _decimaly(texty: pd.Series, kvantum=None) -> pd.Series:
+    """
+    Decimal z textů sloupce, s `kvantum` zaokrouhlené ROUND_HALF_UP. Chybějící (netextové) hodnoty
+    a texty, které nejdou převést, dají None.
+    """
+    def preved(text):
+        if not isinstance(text, str):
+            return None
+        try:
+            hodnota = Decimal(text)
+            return hodnota if kvantum is None else hodnota.quantize(kvantum, rounding=ROUND_HALF_UP)
+        except Exception:
+            return None
+    return _po_unikatnich(texty, preved)
+
+
+def _chyby(zpravy: np.ndarray) -> list:
+    """Chyby řádků v pořadí řádků – `zpravy` má zprávu u chybných řádků a None u ostatních."""
+    return [zprava for zprava in zpravy if zprava is not None]
+
+
+def _serie(hodnoty, index) -> pd.Series:
+    """Sloupec ze seznamu hodnot se stejnou inferencí typu jako výsledek Series.apply."""
+    return pd.Series(list(hodnoty), index=index, dtype=object).infer_objects()
+
+
+# --- EUR ---
+
+def rozdel_rozmer_eur(rozmer: pd.Series):
+    """
+    Rozdělí rozměr 'prumer x delka' (oddělovač x, X nebo ×, desetinná čárka) na Decimal průměr a délku.
+    Vrací (prumer, delka, chybne), kde `chybne` je maska řádků, které nešly rozdělit (průměr i délka None).
+    """
+    text = _text(rozmer).str.replace('×', 'x', regex=False).str.replace('X', 'x', regex=False)
+    casti = text.str.replace(',', '.', regex=False).str.split('x', regex=False)
+    dve_casti = (casti.str.len() == 2).to_numpy(dtype=bool)
+    prumer = _decimaly(_objekty(casti.str[0]).str.strip().where(dve_casti))
+    delka = _decimaly(_objekty(casti.str[1]).str.strip().where(dve_casti))
+    chybne = _je_none(prumer) | _je_none(delka)
+    return (
+        prumer.where(~chybne, None),
+        delka.where(~chybne, None),
+        pd.Series(chybne, index=rozmer.index, dtype=bool),
+    )
+
+
+def priorita(dodatecne_info: pd.Series) -> pd.Series:
+    """Priorita podle dodatečných informací: 'sehr eilig' → vysoká, 'eilig' → střední, jinak nízká."""
+    vysledek = np.select(
+        [_obsahuje(dodatecne_info, 'sehr eilig'), _obsahuje(dodatecne_info, 'eilig')],
+        [PrioritaChoice.VYSOKA.value, PrioritaChoice.STREDNI.value],
+        default=PrioritaChoice.NIZKA.value,
+    )
+    return pd.Series(vysledek, index=dodatecne_info.index, dtype=object)
+
+
+def celozavit(popis: pd.Series) -> pd.Series:
+    """Celozávit podle popisu ('konstrux')."""
+    return _obsahuje(popis, 'konstrux')
+
+
+def odfosfatovat(dodatecne_info: pd.Series) -> pd.Series:
+    """Odfosfátovat podle dodatečných informací ('muss entphosphatiert werden')."""
+    return _obsahuje(dodatecne_info, 'muss entphosphatiert werden')
+
+
+def _mnozstvi_v_bedne(hmotnost, hmotnost_ks):
+    try:
+        if pd.isna(hmotnost) or pd.isna(hmotnost_ks) or hmotnost_ks == 0:
+            return 1
+        return max(int(hmotnost / hmotnost_ks), 1)
+    except Exception:
+        return 1
+
+
+def mnozstvi_v_bedne(hmotnost: pd.Series, hmotnost_ks: pd.Series) -> pd.Series:
+    """
+    Množství kusů v bedně jako celá část hmotnost / hmotnost_ks, nejméně 1 (i pro prázdné a nulové hodnoty).
+    Číselné sloupce (i object sloupce jen s čísly a prázdnými hodnotami) se počítají maskami nad NumPy poli,
+    sloupce s Decimal nebo textem po prvcích – přes float by se výsledek lišil (Decimal 0.3 / 0.1 je 3).
+    """
+    hmotnost, hmotnost_ks = hmotnost.infer_objects(), hmotnost_ks.infer_objects()
+    ciselne = all(
+        pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+        for s in (hmotnost, hmotnost_ks)
+    )
+    if ciselne:
+        h = hmotnost.to_numpy(dtype=float, na_value=np.nan)
+        hk = hmotnost_ks.to_numpy(dtype=float, na_value=np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            podil = np.trunc(h / hk)
+        platne = np.isfinite(podil) & (hk != 0)
+        # Mimo rozsah přesných celých čísel float64 by se výsledek lišil od int() – spočítá se po prvcích.
+        if not (np.abs(podil[platne]) < 2 ** 53).all():
+            ciselne = False
+        else:
+            vysledek = np.where(platne, np.maximum(np.where(platne, podil, 1), 1), 1).astype('int64')
+            return pd.Series(vysledek, index=hmotnost.index)
+    return _serie(
+        (_mnozstvi_v_bedne(h, hk) for h, hk in zip(hmotnost, hmotnost_ks)), hmotnost.index,
+    )
+
+
+def normalizuj_behalter(behalter_nr: pd.Series) -> pd.Series:
+    """
+    Číslo bedny zákazníka jako text: celá čísla bez '.0', ostatní text oříznutý, '12.000' → '12', prázdné → None.
+    Desetinná čísla (float) mají vlastní zápis; ve smíšeném object sloupci se float hodnoty poznají jen po prvcích
+    podle typu, čistě číselné a čistě textové sloupce se zpracují celé najednou.
+    """
+    hodnoty = _objekty(behalter_nr)
+    prazdne = hodnoty.isna().to_numpy()
+    druh = pd.api.types.infer_dtype(hodnoty, skipna=True)
+    if druh == 'floating':
+        floaty = ~prazdne
+    elif druh in ('mixed', 'mixed-integer', 'mixed-integer-float'):
+        floaty = np.fromiter((isinstance(v, float) for v in hodnoty), dtype=bool, count=len(hodnoty)) & ~prazdne
+    else:
+        floaty = np.zeros(len(hodnoty), dtype=bool)
+
+    # Celá čísla (int) dají textovou cestou stejný výsledek jako str(hodnota).
+    vysledek = hodnoty.astype(str).str.strip().str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+    if floaty.any():
+        cisla = hodnoty[floaty].astype(float)
+        pole = cisla.to_numpy()
+        cele = np.isfinite(pole) & (np.trunc(pole) == pole)
+        # '%.0f' celého floatu je stejný zápis jako str(int(hodnota)); + 0.0 převede -0.0 na 0.
+        vysledek[floaty] = np.where(
+            cele,
+            np.char.mod('%.0f', np.where(cele, pole, 0.0) + 0.0),
+            cisla.astype(str).str.rstrip('0').str.rstrip('.').to_numpy(dtype=str),
+        )
+    return vysledek.astype(object).where(~prazdne, None)
+
+
+def rozdel_behalter(behalter_nr: pd.Series):
+    """Rozdělí normalizované číslo bedny na číselnou část (Int64) a textovou příponu pro třídění."""
+    text = _objekty(behalter_nr).str.strip()
+    casti = text.str.extract(r'^(\d+)(.*)$')
+    shoda = casti[0].notna()
+    cislo = pd.to_numeric(casti[0], errors='coerce').astype('Int64')
+    pripona = casti[1].str.strip().where(shoda, text)
+    return cislo, pripona.fillna('').astype(str)
+
+
+def format_datum(datum: pd.Series) -> pd.Series:
+    """Datum jako 'dd.mm.YYYY' pro náhled, nepřevoditelné hodnoty jako ERROR_VALUES."""
+    def formatuj(hodnota):
+        if pd.isna(hodnota):
+            return ERROR_VALUES
+        try:
+            if hasattr(hodnota, 'strftime'):
+                return hodnota.strftime('%d.%m.%Y')
+            prevedeno = pd.to_datetime(hodnota, errors='coerce')
+            if pd.notna(prevedeno):
+                return prevedeno.strftime('%d.%m.%Y')
+        except Exception:
+            logger.warning("Nelze převést datum pro preview při importu.", exc_info=True)
+        return ERROR_VALUES
+    return _po_unikatnich(datum, formatuj)
+
+
+def format_cele_cislo(series: pd.Series) -> pd.Series:
+    """Hodnota převedená na int pro náhled, prázdné a nepřevoditelné hodnoty jako ERROR_VALUES."""
+    def formatuj(hodnota):
+        if pd.isna(hodnota):
+            return ERROR_VALUES
+        try:
+            return int(hodnota)
+        except Exception:
+            logger.warning("Nelze převést hodnotu na číslo pro preview při importu.", exc_info=True)
+            return ERROR_VALUES
+    return _po_unikatnich(series, formatuj)
+
+
+def hodnota_nebo_chyba(series: pd.Series) -> pd.Series:
+    """Hodnota pro náhled, prázdné hodnoty jako ERROR_VALUES."""
+    hodnoty = _objekty(series)
+    return hodnoty.where(hodnoty.notna(), ERROR_VALUES)
+
+
+def text_nebo_chyba(series: pd.Series) -> pd.Series:
+    """Oříznutý text pro náhled, prázdné hodnoty jako ERROR_VALUES."""
+    hodnoty = _objekty(series)
+    return hodnoty.astype(str).str.strip().where(hodnoty.notna(), ERROR_VALUES)
+
+
+def nahled(df: pd.DataFrame, sloupce: dict) -> list[dict]:
+    """Sestaví řádky náhledu – `sloupce` mapuje klíč náhledu na funkci sloupce (chybějící sloupec je prázdný)."""
+    data = {}
+    for klic, funkce in sloupce.items():
+        zdroj = df[klic] if klic in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+        data[klic] = funkce(zdroj)
+    return pd.DataFrame(data, index=df.index).to_dict('records')
+
+
+# --- SPX ---
+
+def cele_cislo_spx(series: pd.Series):
+    """Celé číslo ze všech číslic textu (např. '1.000 ST' → 1000). Vrací (hodnoty, chyby)."""
+    cislice = _text(series).str.strip().str.replace(r'\D', '', regex=True)
+    hodnoty = [int(c) if c else None for c in cislice]
+    chyby = [CHYBA_MNOZSTVI_SPX for c in cislice if not c]
+    return _serie(hodnoty, series.index), chyby
+
+
+def desetinne_cislo_spx(series: pd.Series, label: str):
+    """První číslo v textu zaokrouhlené na 0.1 (desetinná čárka i tečka). Vrací (hodnoty, chyby)."""
+    text = _text(series).str.replace(',', '.', regex=False).str.strip()
+    cisla = text.str.extract(r'([0-9]+(?:\.[0-9]+)?)', expand=False)
+    hodnoty = _decimaly(cisla, JEDNA_DESETINA)
+    bez_cisla = cisla.isna().to_numpy()
+    neprevedene = _je_none(hodnoty) & ~bez_cisla
+    if neprevedene.any():
+        logger.warning(f"Nelze převést desetinnou hodnotu při importu SPX ({neprevedene.sum()} řádků).")
+    zpravy = np.select(
+        [bez_cisla, neprevedene],
+        [f"Chyba: Nelze přečíst hodnotu ve sloupci {label}.", f"Chyba: Nelze převést hodnotu ve sloupci {label} na číslo."],
+        default=None,
+    )
+    return _serie(hodnoty, series.index), _chyby(zpravy)
+
+
+def tara_spx(brutto: pd.Series, hmotnost: pd.Series):
+    """
+    Tára jako brutto - hmotnost (obě s 1 desetinným místem). Vrací (hodnoty, chyby).
+    Platné řádky určí masky, rozdíl Decimal se odečte po sloupcích a zaokrouhlí po prvcích.
+    """
+    b = _objekty(brutto).reset_index(drop=True)
+    h = _objekty(hmotnost).reset_index(drop=True)
+    platne = ~(_je_none(b) | _je_none(h))
+    platne[platne] = ((h[platne] != 0) & (b[platne] != 0) & (b[platne] > h[platne])).to_numpy(dtype=bool)
+
+    def zaokrouhli(rozdil):
+        try:
+            return rozdil.quantize(JEDNA_DESETINA, rounding=ROUND_HALF_UP)
+        except Exception:
+            logger.warning("Nelze spočítat taru při importu SPX.", exc_info=True)
+            return None
+
+    hodnoty = pd.Series([None] * len(b), dtype=object)
+    hodnoty[platne] = (b[platne] - h[platne]).map(zaokrouhli)
+    neprevedene = platne & _je_none(hodnoty)
+    zpravy = np.select([~platne, neprevedene], [CHYBA_TARA_SPX, "Chyba: Nelze spočítat taru."], default=None)
+    return _serie(hodnoty, brutto.index), _chyby(zpravy)
+
+
+def rozdel_rozmer_spx(rozmer: pd.Series):
+    """
+    Rozparsuje rozměr 'TG 6,0*160,00' nebo '6,0*160,00' na prefix, průměr a délku (Decimal na 0.1).
+    Vrací (prefix, prumer, delka, chyby).
+    """
+    text = _text(rozmer).str.replace('×', '*', regex=False).str.replace('X', '*', regex=False).str.strip()
+    casti = text.str.extract(ROZMER_SPX_PATTERN)
+    prazdne = (text == '').to_numpy(dtype=bool)
+    shoda = ~prazdne & casti['prumer'].notna().to_numpy(dtype=bool)
+    prumer = _decimaly(casti['prumer'].str.replace(',', '.', regex=False).where(shoda), JEDNA_DESETINA)
+    delka = _decimaly(casti['delka'].str.replace(',', '.', regex=False).where(shoda), JEDNA_DESETINA)
+    neprevedene = shoda & (_je_none(prumer) | _je_none(delka))
+    if neprevedene.any():
+        logger.warning(f"Nelze převést průměr/délku při importu SPX ({neprevedene.sum()} řádků).")
+    zpravy = np.select(
+        [prazdne, ~shoda, neprevedene],
+        [CHYBA_ROZMER_SPX_PRAZDNY, CHYBA_ROZMER_SPX_FORMAT, CHYBA_ROZMER_SPX_CISLO],
+        default=None,
+    )
+    prefix = _objekty(casti['prefix'].fillna('')).str.strip().where(shoda, None)
+    prevedene = shoda & ~neprevedene
+    return prefix, prumer.where(prevedene, None), delka.where(prevedene, None), _chyby(zpravy)
+
+
+def popis_s_prefixem(popis: pd.Series, prefix: pd.Series) -> pd.Series:
+    """Připojí neprázdný prefix z rozměru na konec oříznutého popisu."""
+    popis_text = _objekty(popis).str.strip()
+    prefix_text = _objekty(prefix).astype(str).str.strip()
+    ma_prefix = (prefix.notna() & (prefix_text != '')).to_numpy(dtype=bool)
+    spojeno = (popis_text + ' ' + prefix_text).str.strip()
+    return popis_text.where(~ma_prefix, spojeno)
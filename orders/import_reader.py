@@ -0,0 +1,138 @@
+"""
+Proudové čtení Excelu pro import zakázek.
+
+List se čte přes openpyxl v režimu read_only po řádcích a vrací se po dávkách dataframů,
+takže v paměti je najednou jen jedna dávka surových buněk bez ohledu na délku souboru.
+Převod buněk a odvození typů sloupců odpovídá `pd.read_excel(engine="openpyxl")`
+(stejný převod buněk jako pandas a stejný TextParser), index dávek navazuje přes celý list.
+"""
+import logging
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+logger = logging.getLogger('orders')
+
+# Sudý počet řádků, aby dvojice řádků SPX (horní a spodní řádek bedny) nebyly rozdělené mezi dávky.
+DAVKA_CTENI = 1000
+
+
+def _hodnota_bunky(cell):
+    """Převod buňky stejně jako pandas OpenpyxlReader – prázdná buňka je '', celá čísla jako int."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        cele = int(cell.value)
+        if cele == cell.value:
+            return cele
+        return float(cell.value)
+    return cell.value
+
+
+def _radek(cells):
+    """Převedený řádek bez prázdných buněk na konci."""
+    radek = [_hodnota_bunky(cell) for cell in cells]
+    while radek and radek[-1] == "":
+        radek.pop()
+    return radek
+
+
+def _dataframe(hlavicka, radky, start, dtype, keep_default_na):
+    """Dataframe jedné dávky – hlavička a řádky se doplní na stejnou šířku a projdou TextParserem pandas."""
+    sirka = max([len(hlavicka)] + [len(radek) for radek in radky])
+    data = [radek + [""] * (sirka - len(radek)) for radek in [hlavicka] + radky]
+    df = TextParser(
+        data,
+        header=0,
+        dtype=dtype,
+        keep_default_na=keep_default_na,
+        skip_blank_lines=False,
+    ).read()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def cti_excel_po_davkach(
+    excel_stream,
+    *,
+    skiprows: int = 0,
+    dtype: Optional[dict] = None,
+    keep_default_na: bool = True,
+    do_prazdneho_radku: bool = True,
+    velikost_davky: int = DAVKA_CTENI,
+    prubeh: Optional[Callable[[int], None]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Čte první list Excelu po dávkách `velikost_davky` řádků a vrací je jako dataframy
+    se sloupci podle hlavičky (řádek po `skiprows` přeskočených řádcích).
+
+    - `do_prazdneho_radku`: čtení skončí na prvním prázdném řádku listu nebo na řádku, jehož hodnoty
+      jsou po převodu všechny prázdné (NaN). Řádky za ním se ani nečtou – listy bývají naformátované
+      až do posledního řádku Excelu.
+    - Jinak se prázdné řádky na konci listu vynechají stejně jako v pd.read_excel.
+    - `prubeh(nacteno_radku)` se zavolá po každé dávce.
+    Vždy vrátí alespoň jeden (případně prázdný) dataframe.
+    """
+    wb = load_workbook(excel_stream, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        radky_listu = ws.iter_rows()
+
+        hlavicka = None
+        for cislo, cells in enumerate(radky_listu):
+            if cislo >= skiprows:
+                hlavicka = _radek(cells)
+                break
+        if hlavicka is None:
+            yield pd.DataFrame()
+            return
+
+        nacteno = 0
+        davka = []
+        prazdne = 0  # prázdné řádky se přidají až s dalším neprázdným řádkem (kvůli konci listu)
+        konec_listu = False
+        while True:
+            if not konec_listu and len(davka) < velikost_davky:
+                for cells in radky_listu:
+                    radek = _radek(cells)
+                    if not radek:
+                        if do_prazdneho_radku:
+                            konec_listu = True
+                            break
+                        prazdne += 1
+                        continue
+                    if prazdne:
+                        davka.extend([] for _ in range(prazdne))
+                        prazdne = 0
+                    davka.append(radek)
+                    if len(davka) >= velikost_davky:
+                        break
+                else:
+                    konec_listu = True
+            if not davka and nacteno:
+                break
+
+            df = _dataframe(hlavicka, davka[:velikost_davky], nacteno, dtype, keep_default_na)
+            davka = davka[velikost_davky:]
+            konec = konec_listu and not davka
+            if do_prazdneho_radku:
+                prazdne_radky = df.isnull().all(axis=1)
+                if prazdne_radky.any():
+                    df = df.loc[:prazdne_radky.idxmax() - 1]
+                    konec = True
+            nacteno += len(df)
+            logger.debug(f"Import - načteno {nacteno} řádků Excelu.")
+            if prubeh:
+                prubeh(nacteno)
+            yield df
+            if konec:
+                break
+    finally:
+        wb.close()
@@ -1,16 +1,77 @@
 import logging
-import re
-from decimal import Decimal, ROUND_HALF_UP
 from typing import List, Tuple, Any
 
 import pandas as pd
 from django.contrib import messages
+from . import import_normalization as normalizace
 from .choices import PrioritaChoice
+from . import import_reader
 from .models import Predpis, Zakaznik, TypHlavy
 
 logger = logging.getLogger('orders')
 
 
+NEZNAMY_PREDPIS = 'Neznámý předpis'
+
+
+class ReferencniData:
+    """
+    Snímek referenčních dat pro jeden import – aktivní předpisy zákazníka podle názvu a typy hlavy
+    podle názvu se načtou jednou, takže počet dotazů neroste s počtem řádků.
+    Nenalezené klíče si pamatuje, aby je šlo nahlásit najednou v náhledu a varování se neopakovala.
+    """
+
+    def __init__(self, zakaznik):
+        self.zakaznik = zakaznik
+        self.predpisy = {}
+        for predpis in Predpis.objects.filter(zakaznik=zakaznik, aktivni=True).order_by('-pk'):
+            self.predpisy[predpis.nazev] = predpis  # při duplicitě vyhrává nejstarší
+        self.typy_hlavy = {typ.nazev: typ for typ in TypHlavy.objects.all()}
+        self.nenalezene_predpisy: list[str] = []
+        self.nenalezene_typy_hlavy: list[str] = []
+        self._neznamy_predpis = None
+
+    def predpis(self, nazev_predpis, warnings: List[str]):
+        """Vrátí předpis podle názvu, jinak 'Neznámý předpis' a při prvním výskytu názvu přidá varování."""
+        predpis = self.predpisy.get(nazev_predpis)
+        if predpis:
+            return predpis
+        if nazev_predpis not in self.nenalezene_predpisy:
+            self.nenalezene_predpisy.append(nazev_predpis)
+            warnings.append(
+                f"Varování: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
+            )
+            logger.warning(
+                f"Varování při importu: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
+            )
+        return self.neznamy_predpis()
+
+    def neznamy_predpis(self):
+        """Záložní předpis 'Neznámý předpis' (zákazník EUR) – založí se nebo aktivuje až při prvním použití."""
+        if self._neznamy_predpis is None:
+            eurotec = Zakaznik.objects.filter(zkratka='EUR').only('id').first()
+            predpis, created = Predpis.objects.get_or_create(
+                nazev=NEZNAMY_PREDPIS,
+                zakaznik=eurotec,
+                defaults={'aktivni': True},
+            )
+            if not created and not predpis.aktivni:
+                predpis.aktivni = True
+                predpis.save()
+            self._neznamy_predpis = predpis
+        return self._neznamy_predpis
+
+    def typ_hlavy(self, nazev_typu):
+        """Vrátí typ hlavy podle názvu, jinak vyvolá ValueError."""
+        typ_hlavy = self.typy_hlavy.get(nazev_typu)
+        if not typ_hlavy:
+            if nazev_typu not in self.nenalezene_typy_hlavy:
+                self.nenalezene_typy_hlavy.append(nazev_typu)
+            logger.error(f"Typ hlavy „{nazev_typu}“ neexistuje.")
+            raise ValueError(f"Typ hlavy „{nazev_typu}“ neexistuje.")
+        return typ_hlavy
+
+
 class BaseImportStrategy:
     """
     Rozhraní pro import zakázek z Excelu. Konkrétní strategie převede Excel
@@ -39,6 +100,56 @@ class BaseImportStrategy:
     def map_row_to_bedna_kwargs(self, row: Any):
         raise NotImplementedError
 
+    def get_reference_keys(self, row: Any) -> Tuple[str, str]:
+        """Vrátí (název předpisu, název typu hlavy) pro řádek, případně vyvolá ValueError."""
+        raise NotImplementedError
+
+    def referencni_data(self, kamion) -> ReferencniData:
+        """Snímek referenčních dat zákazníka kamionu – načte se jednou pro celou instanci strategie."""
+        zakaznik = kamion.zakaznik
+        reference = getattr(self, '_referencni_data', None)
+        if reference is None or reference.zakaznik.pk != zakaznik.pk:
+            reference = ReferencniData(zakaznik)
+            self._referencni_data = reference
+        return reference
+
+    def check_reference_data(self, df: pd.DataFrame, kamion, warnings: List[str]) -> List[str]:
+        """
+        Ověří předpisy a typy hlavy pro všechny budoucí zakázky najednou (jeden řádek za zakázku)
+        a vrátí chyby pro náhled. Nenalezené předpisy se přidají do varování, protože import
+        použije 'Neznámý předpis', nenalezené typy hlavy a nepřevoditelné řádky jsou chyby.
+        """
+        reference = self.referencni_data(kamion)
+        errors: List[str] = []
+        chybne_predpisy: List[str] = []
+        seen = set()
+        for row in df.to_dict('records'):
+            cache_key = self.get_cache_key(row)
+            if cache_key in seen:
+                continue
+            seen.add(cache_key)
+            try:
+                nazev_predpis, nazev_typu = self.get_reference_keys(row)
+            except ValueError as e:
+                if str(e) not in errors:
+                    errors.append(str(e))
+                continue
+            if nazev_predpis not in reference.predpisy and nazev_predpis not in reference.nenalezene_predpisy:
+                reference.nenalezene_predpisy.append(nazev_predpis)
+                chybne_predpisy.append(nazev_predpis)
+            if nazev_typu not in reference.typy_hlavy and nazev_typu not in reference.nenalezene_typy_hlavy:
+                reference.nenalezene_typy_hlavy.append(nazev_typu)
+
+        if chybne_predpisy:
+            warnings.append(
+                f"Varování: Předpisy neexistují, bude použit předpis 'Neznámý předpis': {', '.join(chybne_predpisy)}."
+            )
+            logger.warning(f"Varování při importu: Neexistující předpisy: {', '.join(chybne_predpisy)}.")
+        if reference.nenalezene_typy_hlavy:
+            errors.append(f"Chyba: Typy hlavy neexistují: {', '.join(reference.nenalezene_typy_hlavy)}.")
+            logger.error(f"Chyba při importu: Neexistující typy hlavy: {', '.join(reference.nenalezene_typy_hlavy)}.")
+        return errors
+
 
 class EURImportStrategy(BaseImportStrategy):
     name = "EUR"
@@ -47,71 +158,80 @@ class EURImportStrategy(BaseImportStrategy):
         'behalter_nr', 'hmotnost', 'tara', 'mnozstvi', 'datum',
     ]
 
-    def parse_excel(self, excel_stream, request, kamion):
+    # Jednorázové mapování zdrojových názvů na interní názvy
+    column_mapping = {
+        'Unnamed: 6': 'typ_hlavy',
+        'Unnamed: 7': 'rozmer',
+        'Abhol- datum': 'datum',
+        'Material- charge': 'sarze',
+        'Artikel- nummer': 'artikl',
+        'Be-schich-tung': 'vrstva',
+        'Bezeichnung': 'popis',
+        'n. Zg. / \nas drg': 'predpis',
+        'Material': 'material',
+        'Ober- fläche': 'povrch',
+        'Gewicht in kg': 'hmotnost',
+        'Tara kg': 'tara',
+        'Behälter-Nr.:': 'behalter_nr',
+        'Sonder / Zusatzinfo': 'dodatecne_info',
+        'Lief.': 'dodavatel_materialu',
+        'Fertigungs- auftrags Nr.': 'vyrobni_zakazka',
+        'Vorgang+': 'prubeh',
+        'Menge       ': 'mnozstvi',
+        'Gew.': 'hmotnost_ks',
+    }
+    # Povinné zdrojové sloupce dle specifikace
+    required_src = [
+        'sarze', 'popis', 'rozmer', 'artikl', 'predpis', 'typ_hlavy', 'material', 'behalter_nr',
+        'hmotnost', 'tara', 'hmotnost_ks', 'datum', 'dodatecne_info'
+    ]
+    # Sloupce Excelu, které normalizace dávky přepíše (nemažou se jako prázdné)
+    odvozene_sloupce = ['mnozstvi']
+
+    def parse_excel(self, excel_stream, request, kamion, prubeh=None):
         errors: List[str] = []
         warnings: List[str] = []
 
-        df = pd.read_excel(
+        # Excel se čte proudově po dávkách bez limitu řádků až do prvního úplně prázdného řádku,
+        # každá dávka se hned znormalizuje a surová data dávky se zahodí.
+        davky = []
+        sloupce_excelu, neprazdne = set(), set()
+        chybne_rozmery = 0
+        for davka in import_reader.cti_excel_po_davkach(
             excel_stream,
-            nrows=200,
-            engine="openpyxl",
             dtype={
                 'Artikel- nummer': str,
                 'Vorgang+': str,
                 'Material- charge': str,
             },
-        )
-
-        # Najde první úplně prázdný řádek
-        first_empty_index = df[df.isnull().all(axis=1)].index.min()
-        if pd.notna(first_empty_index):
-            df = df.loc[:first_empty_index - 1]
+            prubeh=prubeh,
+        ):
+            davka.rename(columns=self.column_mapping, inplace=True)
+            sloupce_excelu.update(davka.columns)
+            neprazdne.update(davka.columns[davka.notna().any()])
+            if any(c not in davka.columns for c in self.required_src):
+                davky = [davka]
+                break
+            chybne_rozmery += self._normalizuj_davku(davka)
+            davky.append(davka)
+        df = pd.concat([d for d in davky if not d.empty] or davky[:1])
 
         # Odstraní prázdné sloupce
-        df.dropna(axis=1, how='all', inplace=True)
+        df.drop(
+            columns=[c for c in sloupce_excelu if c not in neprazdne and c not in self.odvozene_sloupce],
+            inplace=True, errors='ignore',
+        )
 
         # Pro debug vytisknout názvy sloupců a první řádek dat
         logger.debug(f"Import - názvy sloupců: {df.columns.tolist()}")
         if not df.empty:
             logger.debug(f"Import - první řádek dat: {df.iloc[0].tolist()}")
 
-        # Jednorázové mapování zdrojových názvů na interní názvy
-        column_mapping = {
-            'Unnamed: 6': 'typ_hlavy',
-            'Unnamed: 7': 'rozmer',
-            'Abhol- datum': 'datum',
-            'Material- charge': 'sarze',
-            'Artikel- nummer': 'artikl',
-            'Be-schich-tung': 'vrstva',
-            'Bezeichnung': 'popis',
-            'n. Zg. / \nas drg': 'predpis',
-            'Material': 'material',
-            'Ober- fläche': 'povrch',
-            'Gewicht in kg': 'hmotnost',
-            'Tara kg': 'tara',
-            'Behälter-Nr.:': 'behalter_nr',
-            'Sonder / Zusatzinfo': 'dodatecne_info',
-            'Lief.': 'dodavatel_materialu',
-            'Fertigungs- auftrags Nr.': 'vyrobni_zakazka',
-            'Vorgang+': 'prubeh',
-            'Menge       ': 'mnozstvi',
-            'Gew.': 'hmotnost_ks',
-        }
-        df.rename(columns=column_mapping, inplace=True)
-
-        # Očistí sloupec sarze od mezer a převede na string
-        if 'sarze' in df.columns:
-            df['sarze'] = df['sarze'].fillna('').astype(str).str.strip()
-
-        # Povinné zdrojové sloupce dle specifikace
-        required_src = [
-            'sarze', 'popis', 'rozmer', 'artikl', 'predpis', 'typ_hlavy', 'material', 'behalter_nr',
-            'hmotnost', 'tara', 'hmotnost_ks', 'datum', 'dodatecne_info'
-        ]
-        missing = [c for c in required_src if c not in df.columns]
+        missing = [c for c in self.required_src if c not in neprazdne]
         if missing:
             errors.append(f"Chyba: V Excelu chybí povinné sloupce: {', '.join(missing)}")
             return df, [], errors, warnings, []
+        logger.info(f"Import EUR: načteno {len(df)} řádků v {len(davky)} dávkách.")
 
         # Zkontroluje datumy ve sloupci 'datum' – při různosti pouze varování
         if 'datum' in df.columns and not df['datum'].isnull().all():
@@ -126,59 +246,62 @@ class EURImportStrategy(BaseImportStrategy):
                         f"neodpovídá datumu kamionu ({kamion.datum.strftime('%d.%m.%Y')}). Import pokračuje."
                     )
 
-        # Přidání prumer a delka rozdělením sloupce rozmer
-        def rozdel_rozmer(row):
-            try:
-                text = str(row.get('rozmer', '') or '')
-                text = text.replace('×', 'x').replace('X', 'x')
-                prumer_str, delka_str = text.replace(',', '.').split('x')
-                return Decimal(prumer_str.strip()), Decimal(delka_str.strip())
-            except Exception:
-                logger.warning("Nelze rozdělit sloupec rozměr při importu EUR.", exc_info=True)
-                messages.info(request, "Chyba: Sloupec 'Abmessung' musí obsahovat hodnoty ve formátu 'prumer x delka'.")
-                errors.append("Chyba: Sloupec 'Abmessung' musí obsahovat hodnoty ve formátu 'prumer x delka'.")
-                return None, None
-
-        df[['prumer', 'delka']] = df.apply(
-            lambda row: pd.Series(rozdel_rozmer(row)), axis=1
+        if chybne_rozmery:
+            logger.warning(f"Nelze rozdělit sloupec rozměr při importu EUR ({chybne_rozmery} řádků).")
+            messages.info(request, normalizace.CHYBA_ROZMER_EUR)
+            errors.extend([normalizace.CHYBA_ROZMER_EUR] * chybne_rozmery)
+
+        df.sort_values(
+            by=['prumer', 'delka', 'predpis', 'artikl', 'sarze', 'behalter_nr_num', 'behalter_nr_suffix'],
+            inplace=True,
         )
+        df.drop(columns=['behalter_nr_num', 'behalter_nr_suffix'], inplace=True)
+        logger.info(f"Uživatel {request.user} úspěšně načetl data z Excel souboru pro import zakázek.")
 
-        # Vytvoří se nový sloupec 'priorita' podle textu v dodatecne_info
-        def priorita(row):
-            if pd.notna(row['dodatecne_info']) and 'sehr eilig' in row['dodatecne_info'].lower():
-                return PrioritaChoice.VYSOKA
-            elif pd.notna(row['dodatecne_info']) and 'eilig' in row['dodatecne_info'].lower():
-                return PrioritaChoice.STREDNI
-            return PrioritaChoice.NIZKA
-        df['priorita'] = df.apply(priorita, axis=1)
-
-        # Celozávit dle popisu
-        def celozavit(row):
-            if pd.notna(row['popis']) and 'konstrux' in row['popis'].lower():
-                return True
-            return False
-        df['celozavit'] = df.apply(celozavit, axis=1)
-
-        # Odfosfatovat dle dodatečných informací
-        def odfosfatovat(row):
-            if pd.notna(row['dodatecne_info']) and 'muss entphosphatiert werden' in row['dodatecne_info'].lower():
-                return True
-            return False
-        df['odfosfatovat'] = df.apply(odfosfatovat, axis=1)
+        # Připravení náhledu
+        preview = normalizace.nahled(df, {
+            'datum': normalizace.format_datum,
+            'behalter_nr': normalizace.text_nebo_chyba,
+            'artikl': normalizace.text_nebo_chyba,
+            'prumer': normalizace.hodnota_nebo_chyba,
+            'delka': normalizace.hodnota_nebo_chyba,
+            'predpis': normalizace.format_cele_cislo,
+            'vyrobni_zakazka': normalizace.hodnota_nebo_chyba,
+            'typ_hlavy': normalizace.hodnota_nebo_chyba,
+            'popis': normalizace.hodnota_nebo_chyba,
+            'material': normalizace.hodnota_nebo_chyba,
+            'sarze': normalizace.text_nebo_chyba,
+            'vrstva': normalizace.text_nebo_chyba,
+            'povrch': normalizace.text_nebo_chyba,
+            'hmotnost': normalizace.hodnota_nebo_chyba,
+            'mnozstvi': normalizace.hodnota_nebo_chyba,
+            'tara': normalizace.hodnota_nebo_chyba,
+        })
+
+        # Předpisy a typy hlavy celého souboru se ověří najednou proti snímku referenčních dat
+        if not errors and kamion:
+            errors.extend(self.check_reference_data(df, kamion, warnings))
+
+        return df, preview, errors, warnings, list(self.required_fields)
+
+    def _normalizuj_davku(self, df: pd.DataFrame) -> int:
+        """
+        Znormalizuje jednu dávku řádků na místě (vše jsou řádkové převody, dávky jsou na sobě nezávislé)
+        a vrátí počet řádků s nerozdělitelným rozměrem.
+        """
+        # Očistí sloupec sarze od mezer a převede na string
+        df['sarze'] = df['sarze'].fillna('').astype(str).str.strip()
+
+        # Přidání prumer a delka rozdělením sloupce rozmer
+        df['prumer'], df['delka'], chybne_rozmery = normalizace.rozdel_rozmer_eur(df['rozmer'])
+
+        # Priorita, celozávit a odfosfátování podle textu v dodatecne_info a popisu
+        df['priorita'] = normalizace.priorita(df['dodatecne_info'])
+        df['celozavit'] = normalizace.celozavit(df['popis'])
+        df['odfosfatovat'] = normalizace.odfosfatovat(df['dodatecne_info'])
 
         # Výpočet množství v bedně dle hmotnost / hmotnost_ks
-        def vypocet_mnozstvi_v_bedne(row):
-            try:
-                hmotnost = row.get('hmotnost')
-                hmotnost_ks = row.get('hmotnost_ks')
-                if pd.isna(hmotnost) or pd.isna(hmotnost_ks) or hmotnost_ks == 0:
-                    return 1
-                mnozstvi = int(hmotnost / hmotnost_ks)
-                return max(mnozstvi, 1)
-            except Exception:
-                logger.warning("Nelze spočítat množství v bedně při importu EUR.", exc_info=True)
-                return 1
-        df['mnozstvi'] = df.apply(vypocet_mnozstvi_v_bedne, axis=1)
+        df['mnozstvi'] = normalizace.mnozstvi_v_bedne(df['hmotnost'], df['hmotnost_ks'])
 
         # Odstranění nepotřebných sloupců
         df.drop(columns=[
@@ -187,85 +310,9 @@ class EURImportStrategy(BaseImportStrategy):
             'vom Galvanik nach Eurotec',
         ], inplace=True, errors='ignore')
 
-        def _split_behalter(val):
-            if pd.isna(val):
-                return (pd.NA, '')
-            s = str(val).strip()
-            match = re.match(r'^(\d+)(.*)$', s)
-            if match:
-                return (int(match.group(1)), match.group(2).strip())
-            return (pd.NA, s)
-
-        def _normalize_behalter(value):
-            if pd.isna(value):
-                return None
-            if isinstance(value, (int,)):
-                return str(value)
-            if isinstance(value, float):
-                if value.is_integer():
-                    return str(int(value))
-                return str(value).rstrip('0').rstrip('.')
-            text = str(value).strip()
-            match = re.match(r'^(\d+)\.0+$', text)
-            if match:
-                return match.group(1)
-            return text
-
-        df['behalter_nr'] = df['behalter_nr'].apply(_normalize_behalter)
-        df[['behalter_nr_num', 'behalter_nr_suffix']] = df['behalter_nr'].apply(_split_behalter).apply(pd.Series)
-        df['behalter_nr_num'] = pd.to_numeric(df['behalter_nr_num'], errors='coerce').astype('Int64')
-        df['behalter_nr_suffix'] = df['behalter_nr_suffix'].fillna('').astype(str)
-        df.sort_values(
-            by=['prumer', 'delka', 'predpis', 'artikl', 'sarze', 'behalter_nr_num', 'behalter_nr_suffix'],
-            inplace=True,
-        )
-        df.drop(columns=['behalter_nr_num', 'behalter_nr_suffix'], inplace=True)
-        logger.info(f"Uživatel {request.user} úspěšně načetl data z Excel souboru pro import zakázek.")
-
-        # Připravení náhledu
-        error_values = '!!!!!!'
-        preview = []
-        for _, r in df.iterrows():
-            raw_datum = r.get('datum')
-            datum_fmt = error_values
-            if pd.notna(raw_datum):
-                try:
-                    if hasattr(raw_datum, 'strftime'):
-                        datum_fmt = raw_datum.strftime('%d.%m.%Y')
-                    else:
-                        dconv = pd.to_datetime(raw_datum, errors='coerce')
-                        if pd.notna(dconv):
-                            datum_fmt = dconv.strftime('%d.%m.%Y')
-                except Exception:
-                    logger.warning("Nelze převést datum pro preview při importu EUR.", exc_info=True)
-                    datum_fmt = error_values
-            beh_raw = r.get('behalter_nr')
-            beh_nr = str(beh_raw).strip() if pd.notna(beh_raw) else error_values
-            try:
-                predpis_val = int(r.get('predpis')) if pd.notna(r.get('predpis')) else error_values
-            except Exception:
-                logger.warning("Nelze převést předpis na číslo pro preview při importu EUR.", exc_info=True)
-                predpis_val = error_values
-            preview.append({
-                'datum': datum_fmt,
-                'behalter_nr': beh_nr,
-                'artikl': str(r.get('artikl')).strip() if pd.notna(r.get('artikl')) else error_values,
-                'prumer': r.get('prumer') if pd.notna(r.get('prumer')) else error_values,
-                'delka': r.get('delka') if pd.notna(r.get('delka')) else error_values,
-                'predpis': predpis_val,
-                'vyrobni_zakazka': r.get('vyrobni_zakazka') if pd.notna(r.get('vyrobni_zakazka')) else error_values,
-                'typ_hlavy': r.get('typ_hlavy') if pd.notna(r.get('typ_hlavy')) else error_values,
-                'popis': r.get('popis') if pd.notna(r.get('popis')) else error_values,
-                'material': r.get('material') if pd.notna(r.get('material')) else error_values,
-                'sarze': str(r.get('sarze')).strip() if pd.notna(r.get('sarze')) else error_values,
-                'vrstva': str(r.get('vrstva')).strip() if pd.notna(r.get('vrstva')) else error_values,
-                'povrch': str(r.get('povrch')).strip() if pd.notna(r.get('povrch')) else error_values,
-                'hmotnost': r.get('hmotnost') if pd.notna(r.get('hmotnost')) else error_values,
-                'mnozstvi': r.get('mnozstvi') if pd.notna(r.get('mnozstvi')) else error_values,
-                'tara': r.get('tara') if pd.notna(r.get('tara')) else error_values,
-            })
-
-        return df, preview, errors, warnings, list(self.required_fields)
+        df['behalter_nr'] = normalizace.normalizuj_behalter(df['behalter_nr'])
+        df['behalter_nr_num'], df['behalter_nr_suffix'] = normalizace.rozdel_behalter(df['behalter_nr'])
+        return int(chybne_rozmery.sum())
 
     # --- Hooky pro ukládání ---
     def get_required_fields(self) -> List[str]:
@@ -282,7 +329,7 @@ class EURImportStrategy(BaseImportStrategy):
         vrstva_key = str(vrstva_raw).strip() if pd.notna(vrstva_raw) else None
         return (artikl_key, sarze_key, povrch_key, vrstva_key)
 
-    def map_row_to_zakazka_kwargs(self, row: Any, kamion, warnings: List[str]):
+    def get_reference_keys(self, row: Any):
         prumer = row.get('prumer')
         if prumer == prumer.to_integral():
             retezec_prumer = str(int(prumer))
@@ -295,39 +342,22 @@ class EURImportStrategy(BaseImportStrategy):
         except (ValueError, TypeError):
             nazev_predpis = f"{row['predpis']}_Ø{retezec_prumer}"
 
-        predpis = Predpis.objects.filter(nazev=nazev_predpis, aktivni=True).first()
-        if not predpis:
-            eurotec = Zakaznik.objects.filter(zkratka='EUR').only('id').first()
-            predpis, created = Predpis.objects.get_or_create(
-                nazev='Neznámý předpis',
-                zakaznik=eurotec,
-                defaults={'aktivni': True},
-            )
-            if not created and not predpis.aktivni:
-                predpis.aktivni = True
-                predpis.save()
-            warnings.append(
-                f"Varování: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
-            )
-            logger.warning(
-                f"Varování při importu: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
-            )
-
         typ_hlavy_excel = row.get('typ_hlavy', None)
         if pd.isna(typ_hlavy_excel) or not str(typ_hlavy_excel).strip():
             logger.error("Chyba: Sloupec s typem hlavy nesmí být prázdný.")
             raise ValueError("Chyba: Sloupec s typem hlavy nesmí být prázdný.")
-        typ_hlavy_excel = str(typ_hlavy_excel).strip()
-        typ_hlavy_qs = TypHlavy.objects.filter(nazev=typ_hlavy_excel)
-        typ_hlavy = typ_hlavy_qs.first() if typ_hlavy_qs.exists() else None
-        if not typ_hlavy:
-            logger.error(f"Typ hlavy „{typ_hlavy_excel}“ neexistuje.")
-            raise ValueError(f"Typ hlavy „{typ_hlavy_excel}“ neexistuje.")
+        return nazev_predpis, str(typ_hlavy_excel).strip()
+
+    def map_row_to_zakazka_kwargs(self, row: Any, kamion, warnings: List[str]):
+        reference = self.referencni_data(kamion)
+        nazev_predpis, typ_hlavy_excel = self.get_reference_keys(row)
+        predpis = reference.predpis(nazev_predpis, warnings)
+        typ_hlavy = reference.typ_hlavy(typ_hlavy_excel)
 
         return {
             'kamion_prijem': kamion,
             'artikl': row['artikl'],
-            'prumer': prumer,
+            'prumer': row.get('prumer'),
             'delka': row.get('delka'),
             'predpis': predpis,
             'typ_hlavy': typ_hlavy,
@@ -359,178 +389,131 @@ class SPXImportStrategy(BaseImportStrategy):
         'vyrobni_zakazka', 'artikl', 'popis', 'mnozstvi', 'hmotnost', 'tara', 'sarze', 'prumer', 'delka',
     ] 
 
-    def parse_excel(self, excel_stream, request, kamion):
+    # Jednorázové mapování zdrojových názvů na interní názvy
+    column_mapping = {
+        'Bestellnr.': 'vyrobni_zakazka',
+        'Material': 'artikl',
+        'Kurztext': 'popis',
+        'Menge': 'mnozstvi',
+        'ME Gewicht': 'hmotnost',
+        'GE': 'brutto',
+    }
+    # Povinné zdrojové sloupce dle specifikace
+    required_src = [
+        'vyrobni_zakazka', 'artikl', 'popis', 'mnozstvi', 'hmotnost', 'brutto', 'sarze', 'rozmer',
+    ]
+    # Sloupce, které normalizace dávky přepíše (nemažou se jako prázdné)
+    odvozene_sloupce = ['mnozstvi', 'hmotnost', 'popis', 'sarze', 'artikl']
+
+    def parse_excel(self, excel_stream, request, kamion, prubeh=None):
         errors: List[str] = []
         warnings: List[str] = []
 
-        df = pd.read_excel(
+        # Excel se čte proudově po dávkách bez limitu řádků. Dávka má sudý počet řádků, takže se dvojice
+        # řádků jedné bedny spojí a znormalizují už v rámci dávky a surová data dávky se zahodí.
+        davky = []
+        sloupce_excelu, neprazdne = set(), set()
+        pocet_radku = 0
+        chyby = {'mnozstvi': [], 'hmotnost': [], 'brutto': [], 'tara': [], 'rozmer': []}
+        for davka in import_reader.cti_excel_po_davkach(
             excel_stream,
-            engine="openpyxl",
-            skiprows=range(5), 
-            nrows=300,
-            header=0,
+            skiprows=5,
             dtype={
                 'Bestellnr.': str,
                 'Material': str,
             },
             keep_default_na=False,
-        )
-
-        # Najde první úplně prázdný řádek
-        first_empty_index = df[df.isnull().all(axis=1)].index.min()
-        if pd.notna(first_empty_index):
-            df = df.loc[:first_empty_index - 1]
-
-        # Odstraní prázdné sloupce
-        df.dropna(axis=1, how='all', inplace=True)
-
-        # Pro debug vytisknout názvy sloupců a první dva řádky dat
-        logger.debug(f"Import - názvy sloupců: {df.columns.tolist()}")
-        if not df.empty:
-            logger.debug(f"Import - první dva řádky dat: {df.head(2).to_dict(orient='records')}")
-
-        # Jednorázové mapování zdrojových názvů na interní názvy
-        column_mapping = {
-            'Bestellnr.': 'vyrobni_zakazka',
-            'Material': 'artikl',
-            'Kurztext': 'popis',
-            'Menge': 'mnozstvi',
-            'ME Gewicht': 'hmotnost',
-            'GE': 'brutto',
-        }
-        df.rename(columns=column_mapping, inplace=True)
+            prubeh=prubeh,
+        ):
+            davka.rename(columns=self.column_mapping, inplace=True)
+            sloupce_excelu.update(davka.columns)
+            neprazdne.update(davka.columns[davka.notna().any()])
+            pocet_radku += len(davka)
+            if pocet_radku % 2 != 0:
+                davky.append(davka)
+                continue
+
+            # Rozdělení na dvojice řádků - top a bottom, které se spojí dohromady - obsahují různé informace o jedné bedně
+            top_rows = davka.iloc[::2].reset_index(drop=True)
+            bottom_rows = davka.iloc[1::2].reset_index(drop=True)
+            if len(bottom_rows.columns) > 2:
+                top_rows['sarze'] = bottom_rows.iloc[:, 0]
+                top_rows['rozmer'] = bottom_rows.iloc[:, 2]
+                neprazdne.update(['sarze', 'rozmer'])
+            if all(c in top_rows.columns for c in self.required_src):
+                self._normalizuj_davku(top_rows, chyby)
+            davky.append(top_rows)
 
         # Kontrola sudého počtu řádků
-        if len(df) % 2 != 0:
+        if pocet_radku % 2 != 0:
             errors.append("Chyba: Počet řádků v Excelu musí být sudý, každý pár řádků tvoří jednu bednu.")
-            return df, [], errors, warnings, []
-        
-        # Rozdělení na dvojice řádků - top a bottom, které se spojí dohromady - obsahují různé informace o jedné bedně
-        top_rows = df.iloc[::2].reset_index(drop=True)
-        bottom_rows = df.iloc[1::2].reset_index(drop=True)
+            return davky[-1], [], errors, warnings, []
 
-        top_rows['sarze'] = bottom_rows.iloc[:, 0]
-        top_rows['rozmer'] = bottom_rows.iloc[:, 2]
-        df = top_rows
+        df = pd.concat([d for d in davky if not d.empty] or davky[:1], ignore_index=True)
 
-        # Povinné zdrojové sloupce dle specifikace
-        required_src = [
-        'vyrobni_zakazka', 'artikl', 'popis', 'mnozstvi', 'hmotnost', 'brutto', 'sarze', 'rozmer',
-        ] 
-        missing = [c for c in required_src if c not in df.columns]
+        # Odstraní prázdné sloupce
+        df.drop(
+            columns=[c for c in sloupce_excelu if c not in neprazdne and c not in self.odvozene_sloupce],
+            inplace=True, errors='ignore',
+        )
+        logger.debug(f"Import - názvy sloupců: {df.columns.tolist()}")
+
+        missing = [c for c in self.required_src if c not in neprazdne]
         if missing:
             errors.append(f"Chyba: V Excelu chybí povinné sloupce: {', '.join(missing)}")
             return df, [], errors, warnings, []
+        logger.info(f"Import SPX: načteno {pocet_radku} řádků v {len(davky)} dávkách.")
 
-        # Vyčistí množství/hmotnosti
-        def parse_int_mnozstvi(value):
-            text = str(value or "").strip()
-            digits = re.sub(r"\D", "", text)
-            if not digits:
-                errors.append("Chyba: Nelze přečíst množství (mnozstvi).")
-                return None
-            return int(digits)
-
-        def parse_decimal_one(value, label):
-            text = str(value or "").replace(',', '.').strip()
-            match = re.search(r"([0-9]+(?:\.[0-9]+)?)", text)
-            if not match:
-                errors.append(f"Chyba: Nelze přečíst hodnotu ve sloupci {label}.")
-                return None
-            try:
-                return Decimal(match.group(1)).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
-            except Exception:
-                logger.warning("Nelze převést desetinnou hodnotu při importu SPX.", exc_info=True)
-                errors.append(f"Chyba: Nelze převést hodnotu ve sloupci {label} na číslo.")
-                return None
-
-        df['mnozstvi'] = df['mnozstvi'].apply(parse_int_mnozstvi)
-        df['hmotnost'] = df['hmotnost'].apply(lambda v: parse_decimal_one(v, 'hmotnost'))
-        df['brutto'] = df['brutto'].apply(lambda v: parse_decimal_one(v, 'brutto'))
+        for chyby_sloupce in chyby.values():
+            errors.extend(chyby_sloupce)
 
-        # Vypočti tara = brutto - hmotnost (obě s 1 desetinným místem)
-        def compute_tara(row):
-            brutto_val = row.get('brutto')
-            hmotnost_val = row.get('hmotnost')
-            if brutto_val is None or hmotnost_val is None or hmotnost_val == 0 or brutto_val == 0 or brutto_val <= hmotnost_val:
-                errors.append("Chyba: Nelze spočítat taru, chybí brutto nebo hmotnost.")
-                return None
-            try:
-                return (brutto_val - hmotnost_val).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
-            except Exception:
-                logger.warning("Nelze spočítat taru při importu SPX.", exc_info=True)
-                errors.append("Chyba: Nelze spočítat taru.")
-                return None
+        logger.debug(f"Import - sloučené a upravené řádky dat: {df.head(2).to_dict(orient='records')}")
 
-        df['tara'] = df.apply(compute_tara, axis=1)
+        # Setřídění podle sloupce prumer, delka, artikl a sarze
+        df.sort_values(by=['prumer', 'delka', 'artikl', 'sarze'], inplace=True)
+        logger.info(f"Uživatel {request.user} úspěšně načetl data z Excel souboru pro import zakázek.")
 
-        # Rozparsuje sloupec rozmer: např. "TG 6,0*160,00" nebo "6,0*160,00" -> prefix (pokud je) přidá k popisu, čísla do prumer/delka
-        rozmer_pattern = re.compile(r"^(?:(?P<prefix>.*?)\s+)?(?P<prumer>[0-9]+[.,]?[0-9]*)\*(?P<delka>[0-9]+[.,]?[0-9]*)")
+        # Připravení náhledu
+        preview = normalizace.nahled(df, {
+            klic: normalizace.hodnota_nebo_chyba
+            for klic in ('artikl', 'prumer', 'delka', 'popis', 'vyrobni_zakazka', 'sarze', 'hmotnost', 'mnozstvi', 'tara')
+        })
 
-        def rozdel_rozmer(row):
-            text = str(row.get('rozmer', '') or '').replace('×', '*').replace('X', '*').strip()
-            if not text:
-                errors.append("Chyba: Sloupec s rozměrem je prázdný.")
-                return None, None, None
+        # Předpisy a typy hlavy celého souboru se ověří najednou proti snímku referenčních dat
+        if not errors and kamion:
+            errors.extend(self.check_reference_data(df, kamion, warnings))
 
-            match = rozmer_pattern.match(text)
-            if not match:
-                errors.append("Chyba: Sloupec s rozměrem musí být ve formátu 'prumer*delka' nebo 'prefix prumer*delka'.")
-                return None, None, None
+        return df, preview, errors, warnings, list(self.required_fields)
 
-            prefix_raw = match.group('prefix') or ''
-            prefix = prefix_raw.strip()
-            try:
-                prumer_val = Decimal(match.group('prumer').replace(',', '.')).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
-                delka_val = Decimal(match.group('delka').replace(',', '.')).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
-            except Exception:
-                logger.warning("Nelze převést průměr/délku při importu SPX.", exc_info=True)
-                errors.append("Chyba: Nelze převést hodnoty průměru nebo délky na číslo.")
-                return prefix, None, None
+    def _normalizuj_davku(self, df: pd.DataFrame, chyby: dict) -> None:
+        """
+        Znormalizuje jednu dávku spojených řádků na místě. Chyby se sbírají po sloupcích přes všechny
+        dávky, aby jejich pořadí odpovídalo zpracování celého souboru najednou.
+        """
+        # Vyčistí množství/hmotnosti
+        df['mnozstvi'], chyby_sloupce = normalizace.cele_cislo_spx(df['mnozstvi'])
+        chyby['mnozstvi'].extend(chyby_sloupce)
+        df['hmotnost'], chyby_sloupce = normalizace.desetinne_cislo_spx(df['hmotnost'], 'hmotnost')
+        chyby['hmotnost'].extend(chyby_sloupce)
+        df['brutto'], chyby_sloupce = normalizace.desetinne_cislo_spx(df['brutto'], 'brutto')
+        chyby['brutto'].extend(chyby_sloupce)
 
-            return prefix, prumer_val, delka_val
+        # Vypočti tara = brutto - hmotnost (obě s 1 desetinným místem)
+        df['tara'], chyby_sloupce = normalizace.tara_spx(df['brutto'], df['hmotnost'])
+        chyby['tara'].extend(chyby_sloupce)
 
-        df[['rozmer_prefix', 'prumer', 'delka']] = df.apply(
-            lambda row: pd.Series(rozdel_rozmer(row)), axis=1
-        )
+        # Rozparsuje sloupec rozmer: např. "TG 6,0*160,00" nebo "6,0*160,00" -> prefix (pokud je) přidá k popisu, čísla do prumer/delka
+        df['rozmer_prefix'], df['prumer'], df['delka'], chyby_sloupce = normalizace.rozdel_rozmer_spx(df['rozmer'])
+        chyby['rozmer'].extend(chyby_sloupce)
 
         # Přidej prefix z rozměru na konec popisu, pokud existuje
-        df['popis'] = df.apply(
-            lambda row: f"{row.get('popis', '').strip()} {row['rozmer_prefix']}".strip()
-            if pd.notna(row.get('rozmer_prefix')) and str(row.get('rozmer_prefix')).strip()
-            else row.get('popis', '').strip(),
-            axis=1,
-        )
+        df['popis'] = normalizace.popis_s_prefixem(df['popis'], df['rozmer_prefix'])
 
         df.drop(columns=['rozmer_prefix', 'rozmer', 'brutto'], inplace=True)
 
         df['sarze'] = df['sarze'].fillna('').astype(str).str.strip()
         df['artikl'] = df['artikl'].fillna('').astype(str).str.strip()
 
-        logger.debug(f"Import - sloučené a upravené řádky dat: {df.head(2).to_dict(orient='records')}")     
-
-        # Setřídění podle sloupce prumer, delka, artikl a sarze
-        df.sort_values(by=['prumer', 'delka', 'artikl', 'sarze'], inplace=True)
-        logger.info(f"Uživatel {request.user} úspěšně načetl data z Excel souboru pro import zakázek.")
-
-        # Připravení náhledu
-        error_values = '!!!!!!'
-        preview = []
-        for _, r in df.iterrows():
-            preview.append({
-                'artikl': r.get('artikl') if pd.notna(r.get('artikl')) else error_values,
-                'prumer': r.get('prumer') if pd.notna(r.get('prumer')) else error_values,
-                'delka': r.get('delka') if pd.notna(r.get('delka')) else error_values,
-                'popis': r.get('popis') if pd.notna(r.get('popis')) else error_values,
-                'vyrobni_zakazka': r.get('vyrobni_zakazka') if pd.notna(r.get('vyrobni_zakazka')) else error_values,
-                'sarze': r.get('sarze') if pd.notna(r.get('sarze')) else error_values,
-                'hmotnost': r.get('hmotnost') if pd.notna(r.get('hmotnost')) else error_values,
-                'mnozstvi': r.get('mnozstvi') if pd.notna(r.get('mnozstvi')) else error_values,
-                'tara': r.get('tara') if pd.notna(r.get('tara')) else error_values,
-            })
-
-        return df, preview, errors, warnings, list(self.required_fields)
-
     # --- Hooky pro ukládání ---
     def get_required_fields(self) -> List[str]:
         return list(self.required_fields)
@@ -540,7 +523,7 @@ class SPXImportStrategy(BaseImportStrategy):
         sarze_key = str(row.get('sarze')).strip() if pd.notna(row.get('sarze')) else None
         return (artikl_key, sarze_key)
     
-    def map_row_to_zakazka_kwargs(self, row: Any, kamion, warnings: List[str]):
+    def get_reference_keys(self, row: Any):
         # Určí průměr jako řetězec pro název předpisu
         prumer = row.get('prumer')
         if prumer == prumer.to_integral():
@@ -562,45 +545,26 @@ class SPXImportStrategy(BaseImportStrategy):
         elif has_smk:
             typ_hlavy_str = 'SK'
 
-        typ_hlavy_qs = TypHlavy.objects.filter(nazev=typ_hlavy_str)
-        typ_hlavy = typ_hlavy_qs.first() if typ_hlavy_qs.exists() else None
-        if not typ_hlavy:
-            logger.error(f"Typ hlavy „{typ_hlavy_str}“ neexistuje.")
-            raise ValueError(f"Typ hlavy „{typ_hlavy_str}“ neexistuje.")
-        
         # Určí typ vrutu na základě popisu - pokud obsahuje 'SPAX-3' -> typ_vrutu = 'SPAX-3', jinak chyba
         # Až bude více typů vrutů, bude potřeba získat popis vrutu automaticky ze začátku popisu
-        popis = row.get('popis', None)
-        if 'SPAX-3' in popis.upper():
+        if 'SPAX-3' in popis_text:
             typ_vrutu_str = 'SPAX-3'
         else: 
             raise ValueError("Chyba: Typ vrutu není 'SPAX-3', pro jiný typ vrutu zatím nebyl definován předpis.")
 
         # Sestaví název předpisu
-        nazev_predpis = f"{typ_vrutu_str} Ø{prumer_str}_{typ_hlavy_str}"
+        return f"{typ_vrutu_str} Ø{prumer_str}_{typ_hlavy_str}", typ_hlavy_str
 
-        predpis = Predpis.objects.filter(nazev=nazev_predpis, aktivni=True).first()
-        if not predpis:
-            eurotec = Zakaznik.objects.filter(zkratka='EUR').only('id').first()
-            predpis, created = Predpis.objects.get_or_create(
-                nazev='Neznámý předpis',
-                zakaznik=eurotec,
-                defaults={'aktivni': True},
-            )
-            if not created and not predpis.aktivni:
-                predpis.aktivni = True
-                predpis.save()
-            warnings.append(
-                f"Varování: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
-            )
-            logger.warning(
-                f"Varování při importu: Předpis „{nazev_predpis}“ neexistuje. Použit předpis 'Neznámý předpis'."
-            )
+    def map_row_to_zakazka_kwargs(self, row: Any, kamion, warnings: List[str]):
+        reference = self.referencni_data(kamion)
+        nazev_predpis, typ_hlavy_str = self.get_reference_keys(row)
+        typ_hlavy = reference.typ_hlavy(typ_hlavy_str)
+        predpis = reference.predpis(nazev_predpis, warnings)
 
         return {
             'kamion_prijem': kamion,
             'artikl': row.get('artikl'),
-            'prumer': prumer,
+            'prumer': row.get('prumer'),
             'delka': row.get('delka'),
             'popis': row.get('popis'),
             'typ_hlavy': typ_hlavy,
@@ -615,3 +579,22 @@ class SPXImportStrategy(BaseImportStrategy):
             'vyrobni_zakazka': row.get('vyrobni_zakazka'),
             'sarze': row.get('sarze'),
         }
+
+
+def strategie_importu(kamion) -> BaseImportStrategy:
+    """
+    Vrátí strategii importu podle zákazníka kamionu (zatím pouze EUR a SPX).
+    Pro ostatní zákazníky vrací výchozí strategii, která nemá definovanou logiku.
+    """
+    try:
+        zkratka = getattr(getattr(kamion, 'zakaznik', None), 'zkratka', None)
+    except Exception:
+        logger.warning("Nepodařilo se získat zkratku zákazníka pro volbu importní strategie.", exc_info=True)
+        zkratka = None
+    match zkratka:
+        case 'EUR':
+            return EURImportStrategy()
+        case 'SPX':
+            return SPXImportStrategy()
+        case _:
+            return BaseImportStrategy()
@@ -0,0 +1,39 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from orders.choices import StavBednyChoice
+from orders.models import Bedna
+from orders.services.barcode_service import PNG, SVG, format_tisku, predgeneruj_kody_beden
+
+
+logger = logging.getLogger('orders')
+
+
+class Command(BaseCommand):
+    help = (
+        "Předgeneruje chybějící čárové kódy beden do úložiště kódů, aby je tisk karet jen načítal. "
+        "Standardně pro bedny, které ještě nejsou expedované."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vsechny",
+            action="store_true",
+            help="Předgeneruje kódy i pro expedované bedny.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=[SVG, PNG],
+            help="Formát kódů (výchozí podle nastavení BARCODE_FORMAT).",
+        )
+
+    def handle(self, *args, **options):
+        bedny = Bedna.objects.all()
+        if not options["vsechny"]:
+            bedny = bedny.exclude(stav_bedny=StavBednyChoice.EXPEDOVANO)
+        format = options["format"] or format_tisku()
+
+        cisla = bedny.values_list('cislo_bedny', flat=True).iterator(chunk_size=2000)
+        vygenerovano = predgeneruj_kody_beden(cisla, format=format)
+        self.stdout.write(f"Předgenerováno {vygenerovano} chybějících kódů beden ({format}).")
@@ -0,0 +1,48 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from orders.services.prvni_pouziti_service import prestav_prvni_pouziti, zkontroluj_prvni_pouziti
+
+
+logger = logging.getLogger('orders')
+
+
+class Command(BaseCommand):
+    help = (
+        "Ověří uložený příznak prvního použití beden v krocích šarží. "
+        "S --opravit přepočítá bedny s rozdílem, s --vse přestaví příznak všech beden."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--opravit",
+            action="store_true",
+            help="Přepočítá příznaky beden, u kterých se uložená hodnota liší od spočítané.",
+        )
+        parser.add_argument(
+            "--vse",
+            action="store_true",
+            help="Přestaví příznaky všech beden bez předchozí kontroly (naplnění po importu dat).",
+        )
+
+    def handle(self, *args, **options):
+        if options["vse"]:
+            pocet = prestav_prvni_pouziti()
+            self.stdout.write(f"Přestaven příznak prvního použití pro {pocet} beden.")
+            return
+
+        bedna_ids = zkontroluj_prvni_pouziti()
+        if not bedna_ids:
+            self.stdout.write("Všechny příznaky prvního použití jsou aktuální.")
+            return
+
+        self.stdout.write(f"Neaktuální příznak prvního použití: {len(bedna_ids)} beden.")
+        self.stdout.write(f"Bedny (id): {', '.join(str(pk) for pk in bedna_ids[:50])}")
+
+        if not options["opravit"]:
+            logger.warning(f"Kontrola prvního použití našla {len(bedna_ids)} beden s neaktuálním příznakem.")
+            return
+
+        prestav_prvni_pouziti(bedna_ids)
+        self.stdout.write("Neaktuální příznaky byly přepočítány.")
@@ -0,0 +1,59 @@
+import logging
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.services.souhrny_vyroby_service import prestav_souhrny_vyroby, zkontroluj_souhrny_vyroby
+
+
+logger = logging.getLogger('orders')
+
+
+def _datum(hodnota):
+    try:
+        return date.fromisoformat(hodnota)
+    except ValueError:
+        raise CommandError(f"Neplatné datum '{hodnota}', použijte formát RRRR-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Přestaví denní souhrny výroby (po zařízeních, zákaznících a směnách) z kroků šarží. "
+        "S --kontrola je jen ověří, s --kontrola --opravit přestaví jen dny s rozdílem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--od", type=_datum, help="První přestavovaný den (RRRR-MM-DD).")
+        parser.add_argument("--do", type=_datum, help="Poslední přestavovaný den (RRRR-MM-DD).")
+        parser.add_argument(
+            "--kontrola",
+            action="store_true",
+            help="Jen porovná uložené souhrny s hodnotami spočítanými z kroků šarží.",
+        )
+        parser.add_argument(
+            "--opravit",
+            action="store_true",
+            help="S --kontrola přestaví dny, jejichž souhrny se liší.",
+        )
+
+    def handle(self, *args, **options):
+        od, do = options["od"], options["do"]
+        if not options["kontrola"]:
+            pocet = prestav_souhrny_vyroby(od=od, do=do)
+            self.stdout.write(f"Přestavěny souhrny výroby za {pocet} dní.")
+            return
+
+        dny = zkontroluj_souhrny_vyroby(od=od, do=do)
+        if not dny:
+            self.stdout.write("Všechny souhrny výroby jsou aktuální.")
+            return
+
+        self.stdout.write(f"Neaktuální souhrny výroby: {len(dny)} dní.")
+        self.stdout.write(f"Dny: {', '.join(den.isoformat() for den in dny[:50])}")
+
+        if not options["opravit"]:
+            logger.warning(f"Kontrola souhrnů výroby našla {len(dny)} dní s neaktuálním souhrnem.")
+            return
+
+        prestav_souhrny_vyroby(dny)
+        self.stdout.write("Neaktuální souhrny výroby byly přestavěny.")
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.services.ulohy_service import (
+    nazev_workeru,
+    oznac_prerusene_ulohy,
+    uklid_ulohy,
+    zpracuj_dalsi_ulohu,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker úloh na pozadí – postupně zpracovává čekající úlohy (importy zakázek, tisk karet "
+        "a rozpracovanosti, CSV exporty). Bez --once běží, dokud není ukončen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Zpracuje čekající úlohy a skončí, když je fronta prázdná.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Pauza v sekundách mezi dotazy na frontu, když je prázdná (výchozí 2).",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            type=int,
+            default=None,
+            help="Po zpracování tohoto počtu úloh worker skončí (např. kvůli uvolnění paměti).",
+        )
+
+    def handle(self, *args, **options):
+        # Registrace obsluh úloh (importuje PDF a exportní logiku adminu).
+        import orders.ulohy  # noqa: F401
+
+        worker = nazev_workeru()
+        zpracovano = 0
+        oznac_prerusene_ulohy()
+        uklid_ulohy()
+        self.stdout.write(f"Worker úloh {worker} spuštěn.")
+        try:
+            while options["max_jobs"] is None or zpracovano < options["max_jobs"]:
+                uloha = zpracuj_dalsi_ulohu(worker)
+                if uloha is not None:
+                    zpracovano += 1
+                    self.stdout.write(f"Úloha {uloha.pk} ({uloha.get_typ_display()}): {uloha.get_stav_display()}.")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker úloh ukončen.")
+        self.stdout.write(f"Zpracováno {zpracovano} úloh.")
@@ -0,0 +1,55 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from orders.services.souhrny_service import prestav_souhrny, zkontroluj_souhrny
+
+
+logger = logging.getLogger('orders')
+
+
+class Command(BaseCommand):
+    help = (
+        "Ověří uložené souhrny beden zakázek a kamionů proti bednám. "
+        "S --opravit přepočítá neaktuální souhrny, s --vse přestaví všechny."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--opravit",
+            action="store_true",
+            help="Přepočítá souhrny, které se liší od hodnot spočítaných z beden.",
+        )
+        parser.add_argument(
+            "--vse",
+            action="store_true",
+            help="Přestaví souhrny všech zakázek a kamionů bez předchozí kontroly.",
+        )
+
+    def handle(self, *args, **options):
+        if options["vse"]:
+            pocet_zakazek, pocet_kamionu = prestav_souhrny()
+            self.stdout.write(f"Přestavěny souhrny {pocet_zakazek} zakázek a {pocet_kamionu} kamionů.")
+            return
+
+        kontrola = zkontroluj_souhrny()
+        if kontrola.v_poradku:
+            self.stdout.write("Všechny souhrny beden jsou aktuální.")
+            return
+
+        self.stdout.write(
+            f"Neaktuální souhrny: {len(kontrola.zakazky)} zakázek, {len(kontrola.kamiony)} kamionů."
+        )
+        if kontrola.zakazky:
+            self.stdout.write(f"Zakázky: {', '.join(str(pk) for pk in kontrola.zakazky[:50])}")
+        if kontrola.kamiony:
+            self.stdout.write(f"Kamiony: {', '.join(str(pk) for pk in kontrola.kamiony[:50])}")
+
+        if not options["opravit"]:
+            logger.warning(
+                f"Kontrola souhrnů beden našla {len(kontrola.zakazky)} neaktuálních zakázek a {len(kontrola.kamiony)} kamionů."
+            )
+            return
+
+        prestav_souhrny(zakazka_ids=kontrola.zakazky, kamion_ids=kontrola.kamiony)
+        self.stdout.write("Neaktuální souhrny byly přepočítány.")
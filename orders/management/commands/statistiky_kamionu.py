@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.services.statistiky_kamionu_service import (
+    ODKLAD_ULOZENI_DNU,
+    dopln_statistiky_kamionu,
+    prestav_statistiky_kamionu,
+    rozsah_let,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Spočítá a uloží měsíční statistiky kamionů uzavřených měsíců pro dashboard kamionů. "
+        f"S --doplnit uloží jen chybějící měsíce uzavřené déle než {ODKLAD_ULOZENI_DNU} dní (pro pravidelné "
+        "spouštění), s --rok přestaví jeden rok, s --vse všechny roky s kamiony."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--doplnit",
+            action="store_true",
+            help="Uloží uzavřené měsíce, které ještě uložené nejsou; uložené nepřepočítává.",
+        )
+        parser.add_argument("--rok", type=int, help="Rok, jehož uzavřené měsíce se přestaví.")
+        parser.add_argument(
+            "--vse",
+            action="store_true",
+            help="Přestaví uzavřené měsíce všech let s kamiony.",
+        )
+
+    def handle(self, *args, **options):
+        if [options["doplnit"], options["vse"], options["rok"] is not None].count(True) != 1:
+            raise CommandError("Zadejte právě jedno z --doplnit, --rok RRRR nebo --vse.")
+        if options["doplnit"]:
+            pocet = dopln_statistiky_kamionu()
+            self.stdout.write(f"Doplněny statistiky kamionů za {pocet} měsíců.")
+            return
+        povolene_roky = rozsah_let()
+        if options["rok"] is not None and options["rok"] not in povolene_roky:
+            raise CommandError(f"Rok musí být v rozsahu {povolene_roky[0]}–{povolene_roky[-1]}.")
+        pocet = prestav_statistiky_kamionu(rok=options["rok"])
+        self.stdout.write(f"Přestavěny statistiky kamionů za {pocet} měsíců.")
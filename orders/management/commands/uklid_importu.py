@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from orders.services.import_service import IMPORT_TTL, uklid_importy
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Smaže dočasné soubory importu zakázek (nahrané Excely a rozparsované náhledy) "
+        "starší než platnost náhledu importu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hodin",
+            type=float,
+            default=None,
+            help=f"Maximální stáří souborů v hodinách (výchozí {IMPORT_TTL.total_seconds() / 3600:g}).",
+        )
+
+    def handle(self, *args, **options):
+        max_stari = timedelta(hours=options["hodin"]) if options["hodin"] is not None else None
+        smazano = uklid_importy(max_stari=max_stari)
+        self.stdout.write(f"Smazáno {smazano} dočasných importních souborů.")
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.17 on 2026-10-17 02:19
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+# Stavy beden skladem v době migrace (všechny kromě NEPRIJATO a EXPEDOVANO).
+STAV_BEDNY_SKLADEM = ['PR', 'KN', 'NA', 'DZ', 'ZA', 'ZK', 'KE']
+
+
+def _agregace_beden():
+    k_expedici = models.Q(stav_bedny='KE')
+    nula = models.Value(Decimal('0.0'))
+    brutto = models.DecimalField(max_digits=12, decimal_places=1)
+    return {
+        'pocet_beden_ann': models.Count('pk'),
+        'pocet_beden_fakturovanych_ann': models.Count('pk', filter=models.Q(fakturovat=True)),
+        'pocet_beden_neprijatych_ann': models.Count('pk', filter=models.Q(stav_bedny='NE')),
+        'pocet_beden_skladem_ann': models.Count('pk', filter=models.Q(stav_bedny__in=STAV_BEDNY_SKLADEM)),
+        'pocet_beden_k_expedici_ann': models.Count('pk', filter=k_expedici),
+        'pocet_beden_expedovano_ann': models.Count('pk', filter=models.Q(stav_bedny='EX')),
+        'hmotnost_ann': models.functions.Coalesce(models.Sum('hmotnost'), nula, output_field=brutto),
+        'hmotnost_fakturovanych_ann': models.functions.Coalesce(models.Sum('hmotnost', filter=models.Q(fakturovat=True)), nula, output_field=brutto),
+        'tara_ann': models.functions.Coalesce(models.Sum('tara'), nula, output_field=brutto),
+        'hmotnost_k_expedici_brutto_ann': models.functions.Coalesce(
+            models.Sum(
+                models.functions.Coalesce('hmotnost', nula, output_field=brutto) + models.functions.Coalesce('tara', nula, output_field=brutto),
+                filter=k_expedici,
+                output_field=brutto,
+            ),
+            nula,
+            output_field=brutto,
+        ),
+    }
+
+
+def _hodnoty(radek):
+    return {pole.removesuffix('_ann'): radek[pole] for pole in _agregace_beden()}
+
+
+def naplnit_souhrny(apps, schema_editor):
+    database_alias = schema_editor.connection.alias
+    Bedna = apps.get_model('orders', 'Bedna')
+    Zakazka = apps.get_model('orders', 'Zakazka')
+    Kamion = apps.get_model('orders', 'Kamion')
+    SouhrnZakazky = apps.get_model('orders', 'SouhrnZakazky')
+    SouhrnKamionu = apps.get_model('orders', 'SouhrnKamionu')
+    bedny = Bedna.objects.using(database_alias).order_by()
+
+    souhrny_zakazek = {pk: SouhrnZakazky(zakazka_id=pk) for pk in Zakazka.objects.using(database_alias).values_list('pk', flat=True)}
+    for radek in bedny.values('zakazka_id').annotate(**_agregace_beden()):
+        souhrny_zakazek[radek['zakazka_id']] = SouhrnZakazky(zakazka_id=radek['zakazka_id'], **_hodnoty(radek))
+    SouhrnZakazky.objects.using(database_alias).bulk_create(souhrny_zakazek.values(), batch_size=500)
+
+    souhrny_kamionu = {pk: SouhrnKamionu(kamion_id=pk) for pk in Kamion.objects.using(database_alias).values_list('pk', flat=True)}
+    prijem_ids = Kamion.objects.using(database_alias).filter(prijem_vydej='P').values('pk')
+    vydej_ids = Kamion.objects.using(database_alias).filter(prijem_vydej='V').values('pk')
+    for cesta, kamion_ids in (('zakazka__kamion_prijem_id', prijem_ids), ('zakazka__kamion_vydej_id', vydej_ids)):
+        for radek in bedny.filter(**{f'{cesta}__in': kamion_ids}).values(cesta).annotate(**_agregace_beden()):
+            souhrny_kamionu[radek[cesta]] = SouhrnKamionu(kamion_id=radek[cesta], **_hodnoty(radek))
+    SouhrnKamionu.objects.using(database_alias).bulk_create(souhrny_kamionu.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0218_sarzekrok_datum_konce'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SouhrnKamionu',
+            fields=[
+                ('pocet_beden', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden')),
+                ('pocet_beden_fakturovanych', models.PositiveIntegerField(default=0, verbose_name='Beden fakturovaných')),
+                ('pocet_beden_neprijatych', models.PositiveIntegerField(default=0, verbose_name='Beden nepřijatých')),
+                ('pocet_beden_skladem', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden skladem')),
+                ('pocet_beden_k_expedici', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden k expedici')),
+                ('pocet_beden_expedovano', models.PositiveIntegerField(default=0, verbose_name='Beden expedovaných')),
+                ('hmotnost', models.DecimalField(db_index=True, decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg')),
+                ('hmotnost_fakturovanych', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto fakturovaných kg')),
+                ('tara', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Tára kg')),
+                ('hmotnost_k_expedici_brutto', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Brutto k expedici kg')),
+                ('aktualizovano', models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')),
+                ('kamion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='souhrn', serialize=False, to='orders.kamion', verbose_name='Kamión')),
+            ],
+            options={
+                'verbose_name': 'Souhrn kamionu',
+                'verbose_name_plural': 'souhrny kamionů',
+            },
+        ),
+        migrations.CreateModel(
+            name='SouhrnZakazky',
+            fields=[
+                ('pocet_beden', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden')),
+                ('pocet_beden_fakturovanych', models.PositiveIntegerField(default=0, verbose_name='Beden fakturovaných')),
+                ('pocet_beden_neprijatych', models.PositiveIntegerField(default=0, verbose_name='Beden nepřijatých')),
+                ('pocet_beden_skladem', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden skladem')),
+                ('pocet_beden_k_expedici', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Beden k expedici')),
+                ('pocet_beden_expedovano', models.PositiveIntegerField(default=0, verbose_name='Beden expedovaných')),
+                ('hmotnost', models.DecimalField(db_index=True, decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg')),
+                ('hmotnost_fakturovanych', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto fakturovaných kg')),
+                ('tara', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Tára kg')),
+                ('hmotnost_k_expedici_brutto', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Brutto k expedici kg')),
+                ('aktualizovano', models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')),
+                ('zakazka', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='souhrn', serialize=False, to='orders.zakazka', verbose_name='Zakázka')),
+            ],
+            options={
+                'verbose_name': 'Souhrn zakázky',
+                'verbose_name_plural': 'souhrny zakázek',
+            },
+        ),
+        migrations.RunPython(naplnit_souhrny, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.17 on 2026-10-17 02:28
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import ExtractYear
+
+
+def naplnit_citace(apps, schema_editor):
+    """Založí čítače číselných řad z nejvyšších čísel v datech."""
+    database_alias = schema_editor.connection.alias
+    Bedna = apps.get_model('orders', 'Bedna')
+    Kamion = apps.get_model('orders', 'Kamion')
+    Sarze = apps.get_model('orders', 'Sarze')
+    SarzeKrok = apps.get_model('orders', 'SarzeKrok')
+    CitacCisel = apps.get_model('orders', 'CitacCisel')
+
+    citace = []
+    bedny = (
+        Bedna.objects.using(database_alias).order_by()
+        .values('zakazka__kamion_prijem__zakaznik_id')
+        .annotate(max_cislo=Max('cislo_bedny'))
+    )
+    for radek in bedny:
+        citace.append(CitacCisel(klic=f"bedna:{radek['zakazka__kamion_prijem__zakaznik_id']}", hodnota=radek['max_cislo']))
+
+    kamiony = (
+        Kamion.objects.using(database_alias).order_by()
+        .annotate(rok=ExtractYear('datum'))
+        .values('zakaznik_id', 'prijem_vydej', 'rok')
+        .annotate(max_cislo=Max('poradove_cislo'))
+    )
+    for radek in kamiony:
+        klic = f"kamion:{radek['zakaznik_id']}:{radek['prijem_vydej']}:{radek['rok']}"
+        citace.append(CitacCisel(klic=klic, hodnota=radek['max_cislo'] or 0))
+
+    max_sarze = Sarze.objects.using(database_alias).aggregate(max_cislo=Max('cislo_sarze'))['max_cislo']
+    if max_sarze:
+        citace.append(CitacCisel(klic="sarze", hodnota=max_sarze))
+
+    kroky = SarzeKrok.objects.using(database_alias).order_by().values('sarze_id').annotate(max_poradi=Max('poradi'))
+    for radek in kroky:
+        citace.append(CitacCisel(klic=f"sarze_krok:{radek['sarze_id']}", hodnota=radek['max_poradi']))
+
+    CitacCisel.objects.using(database_alias).bulk_create(citace, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0219_souhrny_beden'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitacCisel',
+            fields=[
+                ('klic', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Klíč řady')),
+                ('hodnota', models.PositiveBigIntegerField(default=0, verbose_name='Poslední číslo')),
+            ],
+            options={
+                'verbose_name': 'Čítač čísel',
+                'verbose_name_plural': 'čítače čísel',
+            },
+        ),
+        migrations.RunPython(naplnit_citace, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.17 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0220_citac_cisel'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Uloha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('typ', models.CharField(choices=[('IM', 'Import zakázek'), ('KA', 'Tisk karet beden'), ('RO', 'Tisk rozpracovanosti'), ('CZ', 'Export beden do CSV pro zákazníka'), ('CD', 'Export beden do CSV pro DL')], max_length=2, verbose_name='Typ úlohy')),
+                ('stav', models.CharField(choices=[('CE', 'Čeká'), ('BE', 'Běží'), ('HO', 'Hotovo'), ('CH', 'Chyba')], default='CE', max_length=2, verbose_name='Stav úlohy')),
+                ('popis', models.CharField(blank=True, max_length=255, verbose_name='Popis')),
+                ('parametry', models.JSONField(blank=True, default=dict, verbose_name='Parametry')),
+                ('vytvoreno', models.DateTimeField(auto_now_add=True, verbose_name='Vytvořeno')),
+                ('zahajeno', models.DateTimeField(blank=True, null=True, verbose_name='Zahájeno')),
+                ('dokonceno', models.DateTimeField(blank=True, null=True, verbose_name='Dokončeno')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Zpracovatel')),
+                ('prubeh', models.PositiveIntegerField(default=0, verbose_name='Zpracováno')),
+                ('celkem', models.PositiveIntegerField(default=0, verbose_name='Celkem')),
+                ('zprava', models.TextField(blank=True, verbose_name='Zpráva')),
+                ('vysledek', models.FileField(blank=True, upload_to='ulohy/%Y/%m/', verbose_name='Výsledek')),
+                ('nazev_souboru', models.CharField(blank=True, max_length=255, verbose_name='Název souboru')),
+                ('vytvoril', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ulohy', to=settings.AUTH_USER_MODEL, verbose_name='Vytvořil')),
+            ],
+            options={
+                'verbose_name': 'Úloha',
+                'verbose_name_plural': 'úlohy',
+                'ordering': ['-vytvoreno'],
+                'indexes': [models.Index(fields=['stav', 'vytvoreno'], name='uloha_stav_vytvoreno_idx')],
+            },
+        ),
+    ]
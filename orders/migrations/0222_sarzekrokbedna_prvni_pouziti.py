@@ -0,0 +1,63 @@
+# Generated by Django 5.2.17 on 2026-10-17 04:34
+
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import migrations, models
+
+POLE = ('pk', 'bedna_id', 'krok_id', 'patro', 'krok__zarizeni_id', 'krok__datum', 'krok__zacatek', 'krok__poradi')
+
+
+def _prvni_pouziti_bedny(radky):
+    # Stejné pravidlo jako services.prvni_pouziti_service.urci_prvni_pouziti v době migrace.
+    skupiny = defaultdict(list)
+    for radek in radky:
+        if radek['krok__datum'] is not None and radek['krok__zacatek'] is not None:
+            skupiny[radek['krok__zarizeni_id']].append(radek)
+    prvni = []
+    for radky_zarizeni in skupiny.values():
+        poradi_kroku = min((r['krok__datum'], r['krok__zacatek'], r['krok__poradi']) for r in radky_zarizeni)
+        kroky = defaultdict(list)
+        for radek in radky_zarizeni:
+            if (radek['krok__datum'], radek['krok__zacatek'], radek['krok__poradi']) == poradi_kroku:
+                kroky[radek['krok_id']].append(radek)
+        prvni.extend(min(radky_kroku, key=lambda r: (r['patro'], r['pk']))['pk'] for radky_kroku in kroky.values())
+    return prvni
+
+
+def naplnit_prvni_pouziti(apps, schema_editor):
+    database_alias = schema_editor.connection.alias
+    SarzeKrokBedna = apps.get_model('orders', 'SarzeKrokBedna')
+    radky = (
+        SarzeKrokBedna.objects.using(database_alias)
+        .filter(bedna__isnull=False)
+        .order_by('bedna_id')
+        .values(*POLE)
+        .iterator(chunk_size=2000)
+    )
+    prvni = []
+    for _bedna_id, radky_bedny in groupby(radky, key=lambda r: r['bedna_id']):
+        prvni.extend(_prvni_pouziti_bedny(list(radky_bedny)))
+    for zacatek in range(0, len(prvni), 500):
+        SarzeKrokBedna.objects.using(database_alias).filter(pk__in=prvni[zacatek:zacatek + 500]).update(prvni_pouziti=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0221_uloha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsarzekrokbedna',
+            name='prvni_pouziti',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Bedna je na zařízení použita poprvé (udržuje services.prvni_pouziti_service).', verbose_name='První použití'),
+        ),
+        migrations.AddField(
+            model_name='sarzekrokbedna',
+            name='prvni_pouziti',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Bedna je na zařízení použita poprvé (udržuje services.prvni_pouziti_service).', verbose_name='První použití'),
+        ),
+        migrations.RunPython(naplnit_prvni_pouziti, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:18
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def naplnit_souhrny_vyroby(apps, schema_editor):
+    # Souhrny se spočítají po dávkách dní stejně jako příkazem rebuild_rollups. Výpočet (směny, prostoje,
+    # ceník) je jen ve službě, která pracuje s aktuálními modely – tabulky, které čte, se po této migraci
+    # nemění. Bez kroků šarží (nová databáze) se nic nepočítá.
+    from orders.services.souhrny_vyroby_service import prestav_souhrny_vyroby
+    prestav_souhrny_vyroby()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0222_sarzekrokbedna_prvni_pouziti'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SouhrnVyrobyZakaznika',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datum', models.DateField(db_index=True, verbose_name='Datum')),
+                ('den_smeny', models.DateField(db_index=True, verbose_name='Den směny')),
+                ('smena', models.CharField(max_length=3, verbose_name='Směna')),
+                ('pocet_beden', models.PositiveIntegerField(default=0, verbose_name='Beden')),
+                ('kg', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg')),
+                ('kg_prvni_pouziti', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg prvního použití')),
+                ('aktualizovano', models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')),
+                ('cena_prvni_pouziti', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=15, verbose_name='Cena prvního použití')),
+                ('podil_rostu', models.DecimalField(decimal_places=6, default=Decimal('0.000000'), max_digits=12, verbose_name='Podíl roštů')),
+                ('zakaznik', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.zakaznik', verbose_name='Zákazník')),
+                ('zarizeni', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.zarizeni', verbose_name='Pracoviště')),
+            ],
+            options={
+                'verbose_name': 'Souhrn výroby zákazníka',
+                'verbose_name_plural': 'souhrny výroby zákazníků',
+            },
+        ),
+        migrations.CreateModel(
+            name='SouhrnVyrobyZarizeni',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datum', models.DateField(db_index=True, verbose_name='Datum')),
+                ('den_smeny', models.DateField(db_index=True, verbose_name='Den směny')),
+                ('smena', models.CharField(max_length=3, verbose_name='Směna')),
+                ('pocet_beden', models.PositiveIntegerField(default=0, verbose_name='Beden')),
+                ('kg', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg')),
+                ('kg_prvni_pouziti', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Netto kg prvního použití')),
+                ('aktualizovano', models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')),
+                ('pocet_kroku', models.PositiveIntegerField(default=0, verbose_name='Kroků')),
+                ('pocet_kroku_vruty', models.PositiveIntegerField(default=0, verbose_name='Kroků s vruty')),
+                ('pocet_kroku_zelezo', models.PositiveIntegerField(default=0, verbose_name='Kroků se železem')),
+                ('pocet_pater', models.PositiveIntegerField(default=0, verbose_name='Pater')),
+                ('doba_behu_minut', models.PositiveIntegerField(default=0, verbose_name='Doba běhu (min)')),
+                ('prostoj_minut', models.PositiveIntegerField(default=0, verbose_name='Prostoj (min)')),
+                ('zarizeni', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.zarizeni', verbose_name='Pracoviště')),
+            ],
+            options={
+                'verbose_name': 'Souhrn výroby zařízení',
+                'verbose_name_plural': 'souhrny výroby zařízení',
+                'constraints': [models.UniqueConstraint(fields=('datum', 'den_smeny', 'smena', 'zarizeni'), name='uniq_souhrnvyrobyzarizeni_den_smena')],
+            },
+        ),
+        migrations.RunPython(naplnit_souhrny_vyroby, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:29
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0223_souhrny_vyroby'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistikaKamionuMesice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rok', models.PositiveSmallIntegerField(verbose_name='Rok')),
+                ('mesic', models.PositiveSmallIntegerField(verbose_name='Měsíc')),
+                ('prijem', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Příjem kg')),
+                ('vydej', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Výdej kg')),
+                ('hmotnost_krivych', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=12, verbose_name='Křivých kg')),
+                ('pocet_kamionu_prijem', models.PositiveIntegerField(default=0, verbose_name='Kamionů příjem')),
+                ('pocet_kamionu_vydej', models.PositiveIntegerField(default=0, verbose_name='Kamionů výdej')),
+                ('aktualizovano', models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')),
+                ('zakaznik', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.zakaznik', verbose_name='Zákazník')),
+            ],
+            options={
+                'verbose_name': 'Statistika kamionů za měsíc',
+                'verbose_name_plural': 'statistiky kamionů za měsíce',
+                'constraints': [models.UniqueConstraint(fields=('rok', 'mesic', 'zakaznik'), name='uniq_statistikakamionu_mesic_zakaznik')],
+            },
+        ),
+    ]
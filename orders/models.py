@@ -6,9 +6,9 @@ from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Sum
-from django.db.models import Q, Max, F, Exists, OuterRef
-from django.db.models.functions import ExtractYear
+from django.db.models import Sum, Count, Case, When, Value, Subquery
+from django.db.models import Q, Max, F, Exists, OuterRef, Window, IntegerField
+from django.db.models.functions import Coalesce, ExtractYear, Lag, RowNumber
 from django.utils import timezone
 from datetime import datetime, timedelta
 
@@ -27,6 +27,8 @@ from .choices import (
     KamionChoice,
     AlphabetChoice,
     TypZarizeniChoice,
+    StavUlohyChoice,
+    TypUlohyChoice,
     STAV_BEDNY_SKLADEM,
     STAV_BEDNY_PRO_NAVEZENI,
     STAV_BEDNY_ROZPRACOVANOST,
@@ -35,6 +37,24 @@ from .choices import (
 import logging
 logger = logging.getLogger('orders')
 
+
+def ulozeny_souhrn(obj):
+    """
+    Uložený souhrn beden kamionu nebo zakázky (SouhrnKamionu / SouhrnZakazky přes related_name 'souhrn'),
+    nebo None, pokud ještě neexistuje. Souhrn načtený přes select_related('souhrn') se použije, jinak se
+    načte jedním dotazem podle primárního klíče a neukládá se do instance – opakované čtení vrací
+    aktuální hodnoty i po změně beden.
+    """
+    popisovac = type(obj).souhrn
+    if popisovac.is_cached(obj):
+        try:
+            return obj.souhrn
+        except ObjectDoesNotExist:
+            return None
+    if obj.pk is None:
+        return None
+    return popisovac.related.related_model.objects.filter(pk=obj.pk).first()
+
 class Zakaznik(models.Model):
     nazev = models.CharField(max_length=100, verbose_name='Název zákazníka', unique=True)
     zkraceny_nazev = models.CharField(max_length=15, verbose_name='Zkrácený název', unique=True,
@@ -104,6 +124,74 @@ class Odberatel(models.Model):
         return  f"{self.zkraceny_nazev} ({self.adresa}, {self.zkratka_statu}-{self.psc} {self.mesto})"
 
 
+class KamionQuerySet(models.QuerySet):
+    """
+    QuerySet kamionů s anotacemi souhrnných hodnot beden (hmotnosti, počty, příznaky typu kamionu).
+    """
+
+    def with_totals(self):
+        """
+        Doplní do kamionů souhrny beden jedním dotazem. Každá hodnota je korelovaný subquery nad bednami kamionu
+        (bedny zakázek příjmu pro kamion příjem, bedny zakázek výdeje pro kamion výdej), takže anotace nejsou
+        ovlivněny joiny z filtrů changelistu. Property kamionu tyto anotace použijí, pokud jsou k dispozici.
+        """
+        bedny = Bedna.objects.filter(
+            Q(zakazka__kamion_prijem=OuterRef('pk')) | Q(zakazka__kamion_vydej=OuterRef('pk'))
+        ).order_by().annotate(_kamion=Value(1)).values('_kamion')
+
+        def souhrn(agregace, default):
+            return Coalesce(Subquery(bedny.annotate(hodnota=agregace).values('hodnota')[:1]), default)
+
+        nula_kg = Value(Decimal('0.0'), output_field=models.DecimalField(max_digits=12, decimal_places=1))
+        nula_ks = Value(0)
+        pocet = Count('pk')
+        pocet_expedovanych = Count('pk', filter=Q(stav_bedny=StavBednyChoice.EXPEDOVANO))
+        prijem = Q(prijem_vydej=KamionChoice.PRIJEM)
+
+        return self.annotate(
+            hmotnost_netto_ann=souhrn(Sum('hmotnost'), nula_kg),
+            tara_ann=souhrn(Sum('tara'), nula_kg),
+            hmotnost_fakturovanych_netto_ann=souhrn(Sum('hmotnost', filter=Q(fakturovat=True)), nula_kg),
+            hmotnost_vyrovnanych_ann=souhrn(
+                Sum('hmotnost', filter=Q(fakturovat=True, rovnat=RovnaniChoice.VYROVNANA)), nula_kg
+            ),
+            hmotnost_otryskanych_ann=souhrn(
+                Sum('hmotnost', filter=Q(fakturovat=True, tryskat=TryskaniChoice.OTRYSKANA)), nula_kg
+            ),
+            pocet_beden_ann=souhrn(pocet, nula_ks),
+            pocet_beden_fakturovanych_ann=souhrn(Count('pk', filter=Q(fakturovat=True)), nula_ks),
+            pocet_beden_nefakturovanych_ann=souhrn(Count('pk', filter=Q(fakturovat=False)), nula_ks),
+            pocet_beden_neprijatych_ann=souhrn(Count('pk', filter=Q(stav_bedny=StavBednyChoice.NEPRIJATO)), nula_ks),
+            pocet_beden_skladem_ann=Case(
+                When(prijem, then=souhrn(Count('pk', filter=Q(stav_bedny__in=STAV_BEDNY_SKLADEM)), nula_ks)),
+                default=nula_ks,
+            ),
+            # Kamion výdej obsahuje jen expedované bedny, proto se počítají všechny.
+            pocet_beden_expedovano_ann=Case(
+                When(prijem, then=souhrn(pocet_expedovanych, nula_ks)),
+                default=souhrn(pocet, nula_ks),
+            ),
+            pocet_beden_expedovano_fakturovanych_ann=Case(
+                When(prijem, then=souhrn(Count('pk', filter=Q(stav_bedny=StavBednyChoice.EXPEDOVANO, fakturovat=True)), nula_ks)),
+                default=souhrn(Count('pk', filter=Q(fakturovat=True)), nula_ks),
+            ),
+        ).with_priznaky()
+
+    def with_priznaky(self):
+        """
+        Doplní do kamionů příznaky zakázek (má zakázky, má neexpedované zakázky příjmu). Souhrny beden
+        jsou v uloženém souhrnu kamionu (select_related('souhrn')), příznaky zakázek souhrn nemá.
+        """
+        return self.annotate(
+            ma_zakazky_ann=Exists(
+                Zakazka.objects.filter(Q(kamion_prijem=OuterRef('pk')) | Q(kamion_vydej=OuterRef('pk')))
+            ),
+            ma_neexpedovane_zakazky_ann=Exists(
+                Zakazka.objects.filter(kamion_prijem=OuterRef('pk'), expedovano=False)
+            ),
+        )
+
+
 class Kamion(models.Model):
     zakaznik = models.ForeignKey(Zakaznik, on_delete=models.PROTECT, related_name='kamiony', verbose_name='Zákazník')
     odberatel = models.ForeignKey(Odberatel, on_delete=models.SET_NULL, related_name='kamiony', verbose_name='Odběratel', blank=True, null=True)
@@ -118,6 +206,8 @@ class Kamion(models.Model):
                                                     help_text='Pokud je vyplněno, použije se tato hmotnost brutto na dodacím listu místo vypočtené hodnoty.')
     history = HistoricalRecords()
 
+    objects = KamionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Kamión'
         verbose_name_plural = 'kamióny'
@@ -138,11 +228,26 @@ class Kamion(models.Model):
         """
         return f'{self.poradove_cislo}.{self.prijem_vydej} {self.zakaznik.zkratka} {self.datum.strftime("%Y")}'
 
+    def _souhrn_beden(self):
+        """
+        Uložený souhrn beden kamionu (ulozeny_souhrn), pro neplatný typ kamionu None – property pak
+        hlásí neplatný typ jako při výpočtu z beden.
+        """
+        if self.prijem_vydej not in (KamionChoice.PRIJEM, KamionChoice.VYDEJ):
+            return None
+        return ulozeny_souhrn(self)
+
     @property
     def celkova_hmotnost_netto(self):
         """
         Vrací celkovou hmotnost netto všech beden spojených s tímto kamionem.
         """
+        # Anotace z Kamion.objects.with_totals() – bez dalšího dotazu.
+        if hasattr(self, 'hmotnost_netto_ann'):
+            return self.hmotnost_netto_ann
+        souhrn = self._souhrn_beden()
+        if souhrn is not None:
+            return souhrn.hmotnost
         # Pokud je kamion pro výdej, vrací hmotnost beden spojených s výdejem.
         if self.prijem_vydej == KamionChoice.VYDEJ:
             return Bedna.objects.filter(
@@ -162,6 +267,11 @@ class Kamion(models.Model):
         Vrací celkovou hmotnost netto všech beden spojených s tímto kamionem,
         které jsou označeny jako fakturovat == True.
         """
+        if hasattr(self, 'hmotnost_fakturovanych_netto_ann'):
+            return self.hmotnost_fakturovanych_netto_ann
+        souhrn = self._souhrn_beden()
+        if souhrn is not None:
+            return souhrn.hmotnost_fakturovanych
         # Pokud je kamion pro výdej, vrací hmotnost beden spojených s výdejem.
         if self.prijem_vydej == KamionChoice.VYDEJ:
             return Bedna.objects.filter(
@@ -182,6 +292,11 @@ class Kamion(models.Model):
         """
         Vrací celkovou hmotnost brutto všech beden ve všech zakázkách spojených s tímto kamionem.
         """
+        if hasattr(self, 'tara_ann') and hasattr(self, 'hmotnost_netto_ann'):
+            return self.tara_ann + self.hmotnost_netto_ann
+        souhrn = self._souhrn_beden()
+        if souhrn is not None:
+            return souhrn.tara + souhrn.hmotnost
         # Pokud je kamion pro výdej, vrací hmotnost beden spojených s výdejem.
         if self.prijem_vydej == KamionChoice.VYDEJ:
             celkova_tara = Bedna.objects.filter(
@@ -200,37 +315,27 @@ class Kamion(models.Model):
     def cena_za_kamion_vydej(self):
         """
         Vrací cenu za kamion výdej na základě zákazníka, předpisu a délky, pouze pro kamionu výdej.
-        Celkovou cenu vypočte podle property cena_za_zakazku pro jednotlivé zakázky v kamionu.
+        Celkovou cenu vypočte služba fakturace kamionu (services.fakturace_service) jako součet
+        zaokrouhlených cen beden, ceny z ceníku se načítají jedním dotazem pro všechny zakázky.
         Neobsahuje bedny, které mají fakturovat=False.
         Pokud není cena nalezena, vrací 0.
         """
-        # Získá všechny zakázky obsažené v kamionu.        
-        zakazky = self.zakazky_vydej.all()
-        if zakazky.exists() and self.prijem_vydej == KamionChoice.VYDEJ:
-            return Decimal(
-                sum(
-                    Decimal(zakazka.cena_za_zakazku) for zakazka in zakazky
-                ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            )
-        return Decimal('0.00')
+        from .services.fakturace_service import build_fakturace_kamionu
+
+        return build_fakturace_kamionu(self).cena_za_kamion_vydej
     
     @property
     def cena_rovnani_za_kamion_vydej(self):
         """
         Vrací cenu rovnání za kamion výdej na základě zákazníka, předpisu a délky, pouze pro kamionu výdej.
-        Celkovou cenu vypočte podle property cena_rovnani_za_zakazku pro jednotlivé zakázky v kamionu.
+        Celkovou cenu vypočte služba fakturace kamionu (services.fakturace_service) jako součet
+        zaokrouhlených cen beden, ceny z ceníku se načítají jedním dotazem pro všechny zakázky.
         Neobsahuje bedny, které mají fakturovat=False.
         Pokud není cena nalezena, vrací 0.
         """
-        # Získá všechny zakázky obsažené v kamionu.        
-        zakazky = self.zakazky_vydej.all()
-        if zakazky.exists() and self.prijem_vydej == KamionChoice.VYDEJ:
-            return Decimal(
-                sum(
-                    Decimal(zakazka.cena_rovnani_za_zakazku) for zakazka in zakazky
-                ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            )
-        return Decimal('0.00')
+        from .services.fakturace_service import build_fakturace_kamionu
+
+        return build_fakturace_kamionu(self).cena_rovnani_za_kamion_vydej
 
     @property
     def pocet_vyrovnanych_beden(self):
@@ -250,19 +355,14 @@ class Kamion(models.Model):
     def cena_tryskani_za_kamion_vydej(self):
         """
         Vrací cenu tryskání za kamion výdej na základě zákazníka, předpisu a délky, pouze pro kamionu výdej.
-        Celkovou cenu vypočte podle property cena_tryskani_za_zakazku pro jednotlivé zakázky v kamionu.
+        Celkovou cenu vypočte služba fakturace kamionu (services.fakturace_service) jako součet
+        zaokrouhlených cen beden, ceny z ceníku se načítají jedním dotazem pro všechny zakázky.
         Neobsahuje bedny, které mají fakturovat=False.
         Pokud není cena nalezena, vrací 0.
         """
-        # Získá všechny zakázky obsažené v kamionu.        
-        zakazky = self.zakazky_vydej.all()
-        if zakazky.exists() and self.prijem_vydej == KamionChoice.VYDEJ:
-            return Decimal(
-                sum(
-                    Decimal(zakazka.cena_tryskani_za_zakazku) for zakazka in zakazky
-                ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            )
-        return Decimal('0.00')
+        from .services.fakturace_service import build_fakturace_kamionu
+
+        return build_fakturace_kamionu(self).cena_tryskani_za_kamion_vydej
     
     @property
     def pocet_otryskanych_beden(self):
@@ -283,7 +383,12 @@ class Kamion(models.Model):
         """
         Vrací celkový počet beden spojených s tímto kamionem, které jsou ve stavu STAV_BEDNY_SKLADEM.
         """
+        if hasattr(self, 'pocet_beden_skladem_ann'):
+            return self.pocet_beden_skladem_ann
         if self.prijem_vydej == KamionChoice.PRIJEM:
+            souhrn = self._souhrn_beden()
+            if souhrn is not None:
+                return souhrn.pocet_beden_skladem
             return Bedna.objects.filter(
                 zakazka__kamion_prijem=self,
                 stav_bedny__in=STAV_BEDNY_SKLADEM,
@@ -295,6 +400,14 @@ class Kamion(models.Model):
         """
         Vrací počet beden spojených s tímto kamionem, které jsou ve stavu EXPEDOVANO.
         """
+        if hasattr(self, 'pocet_beden_expedovano_ann'):
+            return self.pocet_beden_expedovano_ann
+        souhrn = self._souhrn_beden()
+        if souhrn is not None and self.prijem_vydej == KamionChoice.PRIJEM:
+            return souhrn.pocet_beden_expedovano
+        # Kamion výdej obsahuje jen expedované bedny, proto vrací počet všech beden.
+        if souhrn is not None and self.prijem_vydej == KamionChoice.VYDEJ:
+            return souhrn.pocet_beden
         # Pokud je kamion pro příjem, vrací počet beden ve stavu expedováno.
         if self.prijem_vydej == KamionChoice.PRIJEM:
             return Bedna.objects.filter(
@@ -313,6 +426,12 @@ class Kamion(models.Model):
         """
         Vrací počet beden spojených s tímto kamionem, které jsou ve stavu EXPEDOVANO a mají fakturovat=True.
         """
+        if hasattr(self, 'pocet_beden_expedovano_fakturovanych_ann'):
+            return self.pocet_beden_expedovano_fakturovanych_ann
+        if self.prijem_vydej == KamionChoice.VYDEJ:
+            souhrn = self._souhrn_beden()
+            if souhrn is not None:
+                return souhrn.pocet_beden_fakturovanych
         # Pokud je kamion pro příjem, vrací počet beden ve stavu expedováno.
         if self.prijem_vydej == KamionChoice.PRIJEM:
             return Bedna.objects.filter(
@@ -334,6 +453,8 @@ class Kamion(models.Model):
         Vrací True, pokud kamion obsahuje alespoň jednu bednu, která má fakturovat=False.
         Jinak vrací False.
         """
+        if hasattr(self, 'pocet_beden_nefakturovanych_ann'):
+            return self.pocet_beden_nefakturovanych_ann > 0
         if self.prijem_vydej == KamionChoice.VYDEJ:
             return Bedna.objects.filter(
                 zakazka__kamion_vydej=self,
@@ -352,6 +473,8 @@ class Kamion(models.Model):
         """
         Vrací pro kamion výdej celkovou hmotnost beden, které mají stav tryskání: otryskaná a fakturovat=True.
         """
+        if self.prijem_vydej == KamionChoice.VYDEJ and hasattr(self, 'hmotnost_otryskanych_ann'):
+            return self.hmotnost_otryskanych_ann
         if self.prijem_vydej == KamionChoice.VYDEJ:
             return Bedna.objects.filter(
                 zakazka__kamion_vydej=self,
@@ -365,6 +488,8 @@ class Kamion(models.Model):
         """
         Vrací pro kamion výdej celkovou hmotnost beden, které mají stav rovnání: vyrovnaná a fakturovat=True.
         """
+        if self.prijem_vydej == KamionChoice.VYDEJ and hasattr(self, 'hmotnost_vyrovnanych_ann'):
+            return self.hmotnost_vyrovnanych_ann
         if self.prijem_vydej == KamionChoice.VYDEJ:
             return Bedna.objects.filter(
                 zakazka__kamion_vydej=self,
@@ -383,8 +508,10 @@ class Kamion(models.Model):
         """
         Uloží instanci Kamion.
         - Pokud se jedná o novou instanci (bez PK), před uložením:
-          * nastaví `poradove_cislo` na další číslo v řadě pro daného zákazníka, typ kamionu (prijem_vydej) a daný rok.
+          * nastaví `poradove_cislo` na další číslo v řadě pro daného zákazníka, typ kamionu (prijem_vydej) a daný rok
+            (čítač v services.cislovani_service).
           * pokud je vytvářený kamion pro výdej, nastaví cislo_dl na požadovaný řetězec.
+          * založí prázdný souhrn beden kamionu (SouhrnKamionu).
         """
         is_existing_instance = bool(self.pk)
 
@@ -394,33 +521,31 @@ class Kamion(models.Model):
         max_attempts = 5
         last_error = None
 
+        from .services.cislovani_service import dalsi_cislo, rada_kamionu, srovnej
+
+        zakaznik = Zakaznik.objects.get(pk=self.zakaznik_id)
+        typ_kamionu = self.prijem_vydej
+        rada = rada_kamionu(zakaznik.pk, typ_kamionu, self.datum.year)
+
         for attempt in range(max_attempts):
             try:
                 with transaction.atomic():
-                    zakaznik = Zakaznik.objects.select_for_update().get(pk=self.zakaznik_id)
-                    typ_kamionu = self.prijem_vydej
-                    rok = self.datum.year
-
-                    posledni_cislo = (
-                        self.__class__.objects
-                        .filter(zakaznik_id=zakaznik.pk, prijem_vydej=typ_kamionu, datum__year=rok)
-                        .aggregate(max_cislo=Max('poradove_cislo'))
-                        .get('max_cislo')
-                    ) or 0
-
-                    self.poradove_cislo = posledni_cislo + 1
+                    self.poradove_cislo = dalsi_cislo(rada)
 
                     if typ_kamionu == KamionChoice.VYDEJ:
                         self.cislo_dl = f"EXP-{int(self.poradove_cislo):03d}-{self.datum.year}-{zakaznik.zkratka}"
 
-                    return super().save(*args, **kwargs)
+                    super().save(*args, **kwargs)
+                    SouhrnKamionu.objects.create(kamion_id=self.pk)
+                    return
             except IntegrityError as error:
                 last_error = error
                 logger.warning(
-                    f"Kolize pořadového čísla kamionu při ukládání (pokus {attempt + 1}/{max_attempts}), opakuji.",
+                    f"Kolize pořadového čísla kamionu při ukládání (pokus {attempt + 1}/{max_attempts}), srovnávám čítač a opakuji.",
                     exc_info=True,
                 )
                 self.poradove_cislo = None
+                srovnej(rada)
 
         raise last_error
     
@@ -566,28 +691,40 @@ class Zakazka(models.Model):
 
     @property
     def celkova_hmotnost(self):
+        souhrn = ulozeny_souhrn(self)
+        if souhrn is not None:
+            return souhrn.hmotnost
         return self.bedny.aggregate(suma=Sum('hmotnost'))['suma'] or 0
     
     @property
     def celkova_hmotnost_fakturovanych(self):
+        souhrn = ulozeny_souhrn(self)
+        if souhrn is not None:
+            return souhrn.hmotnost_fakturovanych
         return self.bedny.filter(fakturovat=True).aggregate(suma=Sum('hmotnost'))['suma'] or 0
     
     @property
     def pocet_beden(self):
         """
-        Vrací počet beden spojených s touto zakázkou.
+        Vrací počet beden spojených s touto zakázkou (z uloženého souhrnu zakázky, pokud existuje).
         """
         if not hasattr(self, 'bedny'):
             return 0
+        souhrn = ulozeny_souhrn(self)
+        if souhrn is not None:
+            return souhrn.pocet_beden
         return self.bedny.count()
     
     @property
     def pocet_beden_fakturovanych(self):
         """
-        Vrací počet beden spojených s touto zakázkou, které mají fakturovat=True.
+        Vrací počet beden spojených s touto zakázkou, které mají fakturovat=True (z uloženého souhrnu zakázky, pokud existuje).
         """
         if not hasattr(self, 'bedny'):
             return 0
+        souhrn = ulozeny_souhrn(self)
+        if souhrn is not None:
+            return souhrn.pocet_beden_fakturovanych
         return self.bedny.filter(fakturovat=True).count()
 
     def get_admin_url(self):
@@ -604,6 +741,20 @@ class Zakazka(models.Model):
         match = re.match(r"^(.*?)(\s+\d+.*)?$", self.popis)
         return match.group(1).strip() if match else self.popis
 
+    def _najdi_cenu(self, predpis, zakaznik, delka, popis=None):
+        """
+        Najde řádek ceníku pro předpis, zákazníka a délku přes sdílený intervalový index ceníku
+        (viz services.cenik_service). Vrací None, pokud cena neexistuje nebo jich je více.
+        """
+        from .services.cenik_service import get_cenik_resolver
+
+        return get_cenik_resolver().resolve(
+            zakaznik_id=zakaznik.pk,
+            predpis_id=predpis.pk,
+            delka=delka,
+            popis=popis,
+        )
+
     @property
     def cena_za_kg(self):
         """
@@ -622,20 +773,8 @@ class Zakazka(models.Model):
         if not predpis or not zakaznik:
             return Decimal('0.00')
 
-        try:
-            cena = Cena.objects.get(
-                predpis=predpis,
-                delka_min__lte=delka,
-                delka_max__gt=delka,
-                zakaznik=zakaznik
-            )
-        except Cena.DoesNotExist:
-            return Decimal('0.00')
-        except Cena.MultipleObjectsReturned:
-            logger.warning(
-                f"Nalezeno více cen pro zakázku {self.pk} "
-                f"(predpis={getattr(predpis, 'id', predpis)}, delka={delka}, zakaznik={getattr(zakaznik, 'id', zakaznik)})"
-            )
+        cena = self._najdi_cenu(predpis, zakaznik, delka, popis=f'zakázku {self.pk}')
+        if cena is None:
             return Decimal('0.00')
 
         return cena.cena_za_kg or Decimal('0.00')
@@ -679,20 +818,8 @@ class Zakazka(models.Model):
         if not predpis or not zakaznik or not zakaznik.fakturovat_rovnani:
             return Decimal('0.00')
 
-        try:
-            cena = Cena.objects.get(
-                predpis=predpis,
-                delka_min__lte=delka,
-                delka_max__gt=delka,
-                zakaznik=zakaznik
-            )
-        except Cena.DoesNotExist:
-            return Decimal('0.00')
-        except Cena.MultipleObjectsReturned:
-            logger.warning(
-                f"Nalezeno více cen rovnání pro zakázku {self.pk} "
-                f"(predpis={getattr(predpis, 'id', predpis)}, delka={delka}, zakaznik={getattr(zakaznik, 'id', zakaznik)})"
-            )
+        cena = self._najdi_cenu(predpis, zakaznik, delka, popis=f'rovnání zakázky {self.pk}')
+        if cena is None:
             return Decimal('0.00')
 
         return cena.cena_rovnani_za_kg or Decimal('0.00')    
@@ -728,20 +855,8 @@ class Zakazka(models.Model):
         if not predpis or not zakaznik or not zakaznik.fakturovat_tryskani:
             return Decimal('0.00')
 
-        try:
-            cena = Cena.objects.get(
-                predpis=predpis,
-                delka_min__lte=delka,
-                delka_max__gt=delka,
-                zakaznik=zakaznik
-            )
-        except Cena.DoesNotExist:
-            return Decimal('0.00')
-        except Cena.MultipleObjectsReturned:
-            logger.warning(
-                f"Nalezeno více cen tryskání pro zakázku {self.pk} "
-                f"(predpis={getattr(predpis, 'id', predpis)}, delka={delka}, zakaznik={getattr(zakaznik, 'id', zakaznik)})"
-            )
+        cena = self._najdi_cenu(predpis, zakaznik, delka, popis=f'tryskání zakázky {self.pk}')
+        if cena is None:
             return Decimal('0.00')
 
         return cena.cena_tryskani_za_kg or Decimal('0.00')
@@ -810,17 +925,66 @@ class Zakazka(models.Model):
         ]
         return ", ".join(vyrobni_zakazky)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._souhrn_kamiony = instance._kamiony_pro_souhrn()
+        instance._vyroba_hodnoty = instance._hodnoty_pro_vyrobu()
+        return instance
+
+    def _kamiony_pro_souhrn(self):
+        """Kamiony, jejichž souhrn beden závisí na této zakázce (odložená pole se nenačítají)."""
+        return (self.__dict__.get('kamion_prijem_id'), self.__dict__.get('kamion_vydej_id'))
+
+    def _hodnoty_pro_vyrobu(self):
+        """Hodnoty, ze kterých souhrny výroby počítají zákazníka a cenu prvního použití beden zakázky."""
+        return (self.__dict__.get('predpis_id'), self.__dict__.get('delka'), self.__dict__.get('kamion_prijem_id'))
+
+    def save(self, *args, **kwargs):
+        """
+        Uloží instanci Zakazka.
+        - Nové zakázce založí prázdný souhrn beden (SouhrnZakazky).
+        - Při změně kamionu příjem nebo výdej přepočítá souhrny původních i nových kamionů.
+        - Při změně předpisu, délky nebo kamionu příjem přepočítá souhrny výroby dní, kdy byly
+          bedny zakázky v krocích šarží (cena prvního použití a zákazník).
+        """
+        je_nova = self._state.adding
+        puvodni_kamiony = getattr(self, '_souhrn_kamiony', None)
+        puvodni_vyroba = getattr(self, '_vyroba_hodnoty', None)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            nove_kamiony = self._kamiony_pro_souhrn()
+            nova_vyroba = self._hodnoty_pro_vyrobu()
+            if je_nova:
+                SouhrnZakazky.objects.get_or_create(zakazka_id=self.pk)
+            else:
+                if puvodni_kamiony != nove_kamiony:
+                    from .services.souhrny_service import oznac_zmenu_souhrnu
+                    oznac_zmenu_souhrnu(kamion_ids=(*(puvodni_kamiony or ()), *nove_kamiony))
+                if puvodni_vyroba != nova_vyroba:
+                    from .services.souhrny_vyroby_service import dny_beden, oznac_zmenu_vyroby
+                    oznac_zmenu_vyroby(dny_beden(self.bedny.values_list('pk', flat=True)))
+            self._souhrn_kamiony = nove_kamiony
+            self._vyroba_hodnoty = nova_vyroba
+
     # --- Delete guards ---
     def delete(self, using=None, keep_parents=False):
         """
         Zamezí mazání zakázky, pokud má bedny v jiném stavu než NEPRIJATO.
+        Po smazání přepočítá souhrny kamionů zakázky.
         """        
         if Bedna.objects.filter(zakazka=self).exclude(stav_bedny=StavBednyChoice.NEPRIJATO).exists():
             raise ProtectedError(
                 "Mazání zablokováno: Zakázka obsahuje bedny v jiném stavu než NEPRIJATO.",
                 [self],
             )
-        return super().delete(using=using, keep_parents=keep_parents)
+        from .services.souhrny_service import oznac_zmenu_souhrnu
+        kamion_ids = (self.kamion_prijem_id, self.kamion_vydej_id)
+        with transaction.atomic():
+            vysledek = super().delete(using=using, keep_parents=keep_parents)
+            oznac_zmenu_souhrnu(kamion_ids=kamion_ids)
+        return vysledek
     
 
 class Cena(models.Model):
@@ -903,6 +1067,66 @@ class PoziceZakazkaOrder(models.Model):
 
 hmotnost_validator = MinValueValidator(Decimal('0.0'), message='Hmotnost a tára musí být kladné číslo.')
 
+
+class BednaQuerySet(models.QuerySet):
+    """
+    QuerySet beden s anotacemi pořadí bedny v zakázce pro tiskové výstupy (karty beden, dodací listy).
+    """
+
+    def with_poradi(self):
+        """
+        Doplní do vybraných beden pořadí bedny v zakázce podle čísla bedny (poradi_bedny_ann), počet beden
+        zakázky (pocet_beden_zakazky_ann) a příznak bedny k měření tvrdosti a povrchu pro SSH (mereni_ssh_ann)
+        jedním dotazem pomocí okenních funkcí RowNumber a Count.
+        Okna se počítají nad všemi bednami dotčených zakázek a výběr beden se uplatní až nad nimi
+        (filtr na okenní funkci, Django ho převede na vnější dotaz), takže pořadí platí pro celou zakázku
+        i při tisku jen části beden. Řazení vstupního querysetu se zachová, další filtry je nutné
+        použít před voláním této metody.
+        """
+        vybrane = self.order_by().values('pk')
+        qs = (
+            self.model._default_manager
+            .filter(zakazka_id__in=self.order_by().values('zakazka_id'))
+            .annotate(
+                poradi_bedny_ann=Window(RowNumber(), partition_by=[F('zakazka_id')], order_by=[F('cislo_bedny').asc()]),
+                pocet_beden_zakazky_ann=Window(Count('pk'), partition_by=[F('zakazka_id')]),
+                vybrana_ann=Window(
+                    Max(Case(When(pk__in=vybrane, then=Value(1)), default=Value(0), output_field=IntegerField())),
+                    partition_by=[F('pk')],
+                ),
+            )
+            .annotate(mereni_ssh_ann=self._mereni_ssh())
+            .filter(vybrana_ann=1)
+        )
+        if self.query.order_by:
+            qs = qs.order_by(*self.query.order_by)
+        return qs
+
+    @staticmethod
+    def _mereni_ssh():
+        """
+        Výraz příznaku bedny k měření pro SSH nad anotacemi pořadí a počtu beden,
+        stejná pravidla jako Bedna._containers_for_measurement_SSH.
+        """
+        pocet = F('pocet_beden_zakazky_ann')
+        vybrana = (
+            Q(poradi_bedny_ann=1)
+            | Q(poradi_bedny_ann=pocet)
+            | Q(pocet_beden_zakazky_ann__gt=8, poradi_bedny_ann=pocet / 2)
+            | Q(pocet_beden_zakazky_ann__gt=8, poradi_bedny_ann=pocet / 2 + 1)
+            | Q(pocet_beden_zakazky_ann__gte=5, pocet_beden_zakazky_ann__lte=8, poradi_bedny_ann=(pocet + 1) / 2)
+        )
+        return Case(
+            When(Q(zakazka__kamion_prijem__zakaznik__zkratka='SSH') & vybrana, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        )
+
+
+# Pole bedny, ze kterých se počítají uložené souhrny zakázek a kamionů (SouhrnZakazky, SouhrnKamionu).
+POLE_SOUHRNU_BEDNY = ('zakazka_id', 'stav_bedny', 'hmotnost', 'tara', 'fakturovat')
+
+
 class Bedna(models.Model):
     zakazka = models.ForeignKey(Zakazka, on_delete=models.CASCADE, related_name='bedny', verbose_name='Zakázka')
     pozice = models.ForeignKey(Pozice, on_delete=models.SET_NULL, null=True, blank=True, related_name='bedny', verbose_name='Pozice')
@@ -929,6 +1153,8 @@ class Bedna(models.Model):
                                      help_text='Pokud není bedna určena k fakturaci, nebude zahrnuta do proforma faktury pro zákazníka.')
     history = HistoricalRecords()
 
+    objects = BednaQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Bedna'
         verbose_name_plural = 'bedny'
@@ -965,7 +1191,10 @@ class Bedna(models.Model):
     def poradi_bedny(self):
         """
         Vrací pořadí bedny v rámci zakázky - dle čísla bedny z celkového počtu beden v zakázce.
+        Pokud je bedna načtena přes Bedna.objects.with_poradi(), použije anotaci bez dalšího dotazu.
         """
+        if hasattr(self, 'poradi_bedny_ann'):
+            return self.poradi_bedny_ann
         cisla_beden = self.zakazka.bedny.values_list('cislo_bedny', flat=True).order_by('cislo_bedny')
         if len(cisla_beden) == 0:
             return 0
@@ -974,6 +1203,16 @@ class Bedna(models.Model):
                 return i 
             
         return 0  # pokud není nalezeno, vrací 0
+
+    @property
+    def pocet_beden_v_zakazce(self):
+        """
+        Vrací počet beden v zakázce bedny. Pokud je bedna načtena přes Bedna.objects.with_poradi(),
+        použije anotaci bez dalšího dotazu.
+        """
+        if hasattr(self, 'pocet_beden_zakazky_ann'):
+            return self.pocet_beden_zakazky_ann
+        return self.zakazka.pocet_beden
     
     @property
     def hmotnost_brutto(self):
@@ -1115,11 +1354,14 @@ class Bedna(models.Model):
         - Vždy se měří první a poslední bedna.
         - Pokud je celkový počet beden větší než 8, měří se také dvě střední bedny (dolní a horní střed).
         - Pokud je celkový počet beden mezi 5 a 8 (včetně), měří se prostřední bedna.
+        Pokud je bedna načtena přes Bedna.objects.with_poradi(), použije anotaci bez dalšího dotazu.
         """
+        if hasattr(self, 'mereni_ssh_ann'):
+            return self.mereni_ssh_ann
         if self.zakazka.kamion_prijem.zakaznik.zkratka != 'SSH':
             return False
 
-        total_bedny = self.zakazka.pocet_beden
+        total_bedny = self.pocet_beden_v_zakazce
         selected_bedny = self._containers_for_measurement_SSH(total_bedny)
 
         return self.poradi_bedny in selected_bedny
@@ -1179,46 +1421,58 @@ class Bedna(models.Model):
         """
         Uloží instanci Bedna.
         - Pokud se jedná o novou instanci (bez PK):
-          * Před uložením nastaví `cislo_bedny` na další číslo v řadě pro daného zákazníka.
+          * Před uložením nastaví `cislo_bedny` na další číslo v řadě pro daného zákazníka (čítač v services.cislovani_service).
           * Pro zákazníka s příznakem `vse_tryskat` nastaví `tryskat` na `SPINAVA`, ale pouze
             pokud je délka bedny menší než 900mm - delší díly se nevlezou do tryskače.
+          * Po potvrzení transakce předgeneruje čárový kód bedny do úložiště kódů (services.barcode_service).
         - Pokud je stav bedny jiný než K_NAVEZENI nebo NAVEZENO, vymaže pozici.
+        - Při změně zakázky, stavu, hmotnosti, táry nebo fakturace přepočítá souhrny dotčených zakázek a kamionů.
+        - Při změně bedny k navezení (stav, pozice, zakázka) srovná pořadí zakázek v dotčených pozicích.
         """
         is_existing_instance = bool(self.pk)
+        puvodni_souhrn = getattr(self, '_souhrn_hodnoty', None)
+        puvodni_navezeni = getattr(self, '_navezeni_hodnoty', None)
 
         if self.stav_bedny not in [StavBednyChoice.K_NAVEZENI, StavBednyChoice.NAVEZENO]:
             self.pozice = None
 
         if is_existing_instance:
-            return super().save(*args, **kwargs)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self._aktualizuj_souhrny(puvodni_souhrn)
+                self._aktualizuj_poradi_navezeni(puvodni_navezeni)
+            return
 
         max_attempts = 5
         last_error = None
 
+        from .services.barcode_service import predgeneruj_po_commitu
+        from .services.cislovani_service import dalsi_cislo, rada_beden, srovnej
+
+        zakaznik = self.zakazka.kamion_prijem.zakaznik
+        rada = rada_beden(zakaznik)
+
         for attempt in range(max_attempts):
             try:
                 with transaction.atomic():
-                    zakaznik = Zakaznik.objects.select_for_update().get(pk=self.zakazka.kamion_prijem.zakaznik_id)
-
-                    posledni_cislo = (
-                        self.__class__.objects
-                        .filter(zakazka__kamion_prijem__zakaznik_id=zakaznik.pk)
-                        .aggregate(max_cislo=Max('cislo_bedny'))
-                        .get('max_cislo')
-                    )
-                    self.cislo_bedny = (posledni_cislo + 1) if posledni_cislo else zakaznik.ciselna_rada + 1
+                    self.cislo_bedny = dalsi_cislo(rada)
 
                     if zakaznik.vse_tryskat and self.zakazka.delka and self.zakazka.delka < 900:
                         self.tryskat = TryskaniChoice.SPINAVA
 
-                    return super().save(*args, **kwargs)
+                    super().save(*args, **kwargs)
+                    self._aktualizuj_souhrny(None, nova=True)
+                    self._aktualizuj_poradi_navezeni(None)
+                    predgeneruj_po_commitu([self.cislo_bedny])
+                    return
             except IntegrityError as error:
                 last_error = error
                 logger.warning(
-                    f"Kolize čísla bedny při ukládání (pokus {attempt + 1}/{max_attempts}), opakuji.",
+                    f"Kolize čísla bedny při ukládání (pokus {attempt + 1}/{max_attempts}), srovnávám čítač a opakuji.",
                     exc_info=True,
                 )
                 self.cislo_bedny = None
+                srovnej(rada)
 
         raise last_error
 
@@ -1463,7 +1717,159 @@ class Bedna(models.Model):
                 "Mazání zablokováno: Bedna má jiný stav než NEPRIJATO.",
                 [self],
             )
-        return super().delete(using=using, keep_parents=keep_parents)
+        from .services.souhrny_service import oznac_zmenu_souhrnu, zmen_souhrny_bedny
+        zakazka_id = self.zakazka_id
+        puvodni = getattr(self, '_souhrn_hodnoty', None)
+        with transaction.atomic():
+            vysledek = super().delete(using=using, keep_parents=keep_parents)
+            if puvodni is not None:
+                zmen_souhrny_bedny(puvodni, None)
+            else:
+                oznac_zmenu_souhrnu(zakazka_ids=[zakazka_id])
+        return vysledek
+
+    # --- Souhrny beden ---
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Bez některého pole souhrnu (only/defer) nejsou původní hodnoty známé – souhrny se pak přepočítají z beden.
+        instance._souhrn_hodnoty = None if instance.get_deferred_fields().intersection(POLE_SOUHRNU_BEDNY) else instance._hodnoty_pro_souhrn()
+        instance._navezeni_hodnoty = instance._hodnoty_pro_navezeni()
+        return instance
+
+    def _hodnoty_pro_souhrn(self):
+        """Hodnoty bedny, ze kterých se počítají souhrny zakázky a kamionu (odložená pole se nenačítají)."""
+        return tuple(self.__dict__.get(pole) for pole in POLE_SOUHRNU_BEDNY)
+
+    def _aktualizuj_souhrny(self, puvodni, nova=False):
+        """
+        Upraví souhrny zakázky bedny (a při přesunu i původní zakázky) o rozdíl příspěvku bedny,
+        pokud se změnila některá z hodnot, ze kterých se souhrny počítají. Bez původních hodnot
+        (bedna nenačtená z databáze nebo načtená bez některého pole souhrnu) se souhrny přepočítají z beden.
+        """
+        nove = self._hodnoty_pro_souhrn()
+        if puvodni != nove:
+            from .services.souhrny_service import oznac_zmenu_souhrnu, zmen_souhrny_bedny
+            if puvodni is not None or nova:
+                zmen_souhrny_bedny(puvodni, nove)
+            else:
+                zakazka_ids = [self.zakazka_id]
+                if puvodni is not None:
+                    zakazka_ids.append(puvodni[0])
+                oznac_zmenu_souhrnu(zakazka_ids=zakazka_ids)
+            if puvodni is not None and (puvodni[0], puvodni[2]) != (nove[0], nove[2]):
+                # Zakázka a hmotnost bedny vstupují do souhrnů výroby dní, kdy byla bedna v krocích šarží.
+                from .services.souhrny_vyroby_service import dny_beden, oznac_zmenu_vyroby
+                oznac_zmenu_vyroby(dny_beden([self.pk]))
+        self._souhrn_hodnoty = nove
+
+    # --- Pořadí zakázek v pozicích k navezení ---
+    def _hodnoty_pro_navezeni(self):
+        return tuple(self.__dict__.get(pole) for pole in ('stav_bedny', 'pozice_id', 'zakazka_id'))
+
+    def _aktualizuj_poradi_navezeni(self, puvodni):
+        """
+        Srovná pořadí zakázek (PoziceZakazkaOrder) v pozicích, kde bedna k navezení přibyla nebo ubyla.
+        """
+        nove = self._hodnoty_pro_navezeni()
+        if puvodni != nove and StavBednyChoice.K_NAVEZENI in (nove[0], puvodni[0] if puvodni else None):
+            from .services.navezeni_service import oznac_zmenu_navezeni
+            oznac_zmenu_navezeni([nove[1], puvodni[1] if puvodni else None])
+        self._navezeni_hodnoty = nove
+
+class SouhrnBeden(models.Model):
+    """
+    Společná pole uložených souhrnů beden (počty a hmotnosti). Hodnoty udržuje služba
+    services.souhrny_service při každé změně bedny nebo zakázky, ověření a přestavba
+    je v příkazu `manage.py souhrny_beden`.
+    """
+    pocet_beden = models.PositiveIntegerField(default=0, db_index=True, verbose_name='Beden')
+    pocet_beden_fakturovanych = models.PositiveIntegerField(default=0, verbose_name='Beden fakturovaných')
+    pocet_beden_neprijatych = models.PositiveIntegerField(default=0, verbose_name='Beden nepřijatých')
+    pocet_beden_skladem = models.PositiveIntegerField(default=0, db_index=True, verbose_name='Beden skladem')
+    pocet_beden_k_expedici = models.PositiveIntegerField(default=0, db_index=True, verbose_name='Beden k expedici')
+    pocet_beden_expedovano = models.PositiveIntegerField(default=0, verbose_name='Beden expedovaných')
+    hmotnost = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), db_index=True, verbose_name='Netto kg')
+    hmotnost_fakturovanych = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Netto fakturovaných kg')
+    tara = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Tára kg')
+    hmotnost_k_expedici_brutto = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Brutto k expedici kg')
+    aktualizovano = models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')
+
+    class Meta:
+        abstract = True
+
+
+class SouhrnZakazky(SouhrnBeden):
+    """
+    Uložený souhrn beden zakázky – slouží pro řazení a filtrování v administraci bez agregace beden.
+    """
+    zakazka = models.OneToOneField(Zakazka, on_delete=models.CASCADE, primary_key=True, related_name='souhrn', verbose_name='Zakázka')
+
+    class Meta:
+        verbose_name = 'Souhrn zakázky'
+        verbose_name_plural = 'souhrny zakázek'
+
+    def __str__(self):
+        return f'Souhrn zakázky {self.zakazka_id}'
+
+
+class SouhrnKamionu(SouhrnBeden):
+    """
+    Uložený souhrn beden kamionu – bedny zakázek příjmu (kamion příjem) nebo výdeje (kamion výdej).
+    """
+    kamion = models.OneToOneField(Kamion, on_delete=models.CASCADE, primary_key=True, related_name='souhrn', verbose_name='Kamión')
+
+    class Meta:
+        verbose_name = 'Souhrn kamionu'
+        verbose_name_plural = 'souhrny kamionů'
+
+    def __str__(self):
+        return f'Souhrn kamionu {self.kamion_id}'
+
+
+class StatistikaKamionuMesice(models.Model):
+    """
+    Uložené měsíční pohyby kamionů zákazníka – fakturovaná hmotnost netto přijatá a vydaná, hmotnost
+    vyrovnaných (křivých) beden ve výdeji a počty kamionů. Řádky ukládá jen pro uzavřené měsíce (po
+    lhůtě na opravy) příkaz `manage.py statistiky_kamionu`, dashboard je jen čte; neuložené měsíce
+    počítá services.statistiky_kamionu_service vždy znovu.
+    """
+    rok = models.PositiveSmallIntegerField(verbose_name='Rok')
+    mesic = models.PositiveSmallIntegerField(verbose_name='Měsíc')
+    zakaznik = models.ForeignKey(Zakaznik, on_delete=models.CASCADE, related_name='+', verbose_name='Zákazník')
+    prijem = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Příjem kg')
+    vydej = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Výdej kg')
+    hmotnost_krivych = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Křivých kg')
+    pocet_kamionu_prijem = models.PositiveIntegerField(default=0, verbose_name='Kamionů příjem')
+    pocet_kamionu_vydej = models.PositiveIntegerField(default=0, verbose_name='Kamionů výdej')
+    aktualizovano = models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')
+
+    class Meta:
+        verbose_name = 'Statistika kamionů za měsíc'
+        verbose_name_plural = 'statistiky kamionů za měsíce'
+        constraints = [
+            models.UniqueConstraint(fields=['rok', 'mesic', 'zakaznik'], name='uniq_statistikakamionu_mesic_zakaznik'),
+        ]
+
+    def __str__(self):
+        return f'Kamiony {self.mesic}/{self.rok} zákazníka {self.zakaznik_id}'
+
+
+class CitacCisel(models.Model):
+    """
+    Čítač číselné řady (čísla beden, pořadová čísla kamionů, čísla šarží, pořadí kroků šarže).
+    Hodnota je poslední přidělené číslo, zvyšuje ji služba services.cislovani_service.
+    """
+    klic = models.CharField(max_length=100, primary_key=True, verbose_name='Klíč řady')
+    hodnota = models.PositiveBigIntegerField(default=0, verbose_name='Poslední číslo')
+
+    class Meta:
+        verbose_name = 'Čítač čísel'
+        verbose_name_plural = 'čítače čísel'
+
+    def __str__(self):
+        return f'{self.klic}: {self.hodnota}'
+
 
 # Model je v UI přejmenován na "Pracoviště"
 class Zarizeni(models.Model):
@@ -1582,26 +1988,67 @@ class Sarze(models.Model):
         max_attempts = 5
         last_error = None
 
+        from .services.cislovani_service import dalsi_cislo, rada_sarzi, srovnej
+
+        rada = rada_sarzi()
+
         for attempt in range(max_attempts):
             try:
                 with transaction.atomic():
-                    last_number = (
-                        Sarze.objects
-                        .aggregate(max_cislo=Max('cislo_sarze'))
-                        .get('max_cislo')
-                    ) or 0
-                    self.cislo_sarze = last_number + 1
+                    self.cislo_sarze = dalsi_cislo(rada)
                     return super().save(*args, **kwargs)
             except IntegrityError as error:
                 last_error = error
                 logger.warning(
-                    f"Kolize čísla šarže při ukládání (pokus {attempt + 1}/{max_attempts}), opakuji.",
+                    f"Kolize čísla šarže při ukládání (pokus {attempt + 1}/{max_attempts}), srovnávám čítač a opakuji.",
                     exc_info=True,
                 )
                 self.cislo_sarze = None
+                srovnej(rada)
 
         raise last_error
 
+class SarzeKrokQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Hromadné smazání kroků přepočítá příznak prvního použití beden, které v nich byly,
+        a souhrny výroby dní smazaných kroků.
+        """
+        from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+        from .services.souhrny_vyroby_service import dny_po_zmene_kroku, odlozene_souhrny_vyroby, oznac_zmenu_vyroby
+        with transaction.atomic(), odlozene_souhrny_vyroby():
+            bedna_ids = set(
+                SarzeKrokBedna.objects.filter(krok__in=self.values('pk'), bedna__isnull=False)
+                .values_list('bedna_id', flat=True)
+            )
+            dny = dny_po_zmene_kroku(*self.order_by().values_list('datum', flat=True).distinct())
+            vysledek = super().delete()
+            prepocitej_prvni_pouziti(bedna_ids)
+            oznac_zmenu_vyroby(dny)
+        return vysledek
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def s_prodlevou(self):
+        """
+        Anotuje kroky datem, datem konce a koncem předchozího kroku na stejném zařízení jedním dotazem
+        (okenní funkce Lag přes kroky querysetu rozdělené podle zařízení a seřazené podle data, začátku
+        a pořadí). SarzeKrok.prodleva a SarzeKrok.takt pak další dotazy nepotřebují.
+        Předchozí krok se hledá jen mezi kroky querysetu – ten proto nesmí vynechávat kroky zařízení
+        uvnitř období. U prvního kroku zařízení v querysetu se předchozí krok dohledá dotazem.
+        """
+        okno = {
+            'partition_by': [F('zarizeni_id')],
+            'order_by': [F('datum').asc(nulls_first=True), F('zacatek').asc(), F('poradi').asc()],
+        }
+        return self.select_related('zarizeni').annotate(
+            predchozi_datum=Window(Lag('datum'), **okno),
+            predchozi_datum_konce=Window(Lag('datum_konce'), **okno),
+            predchozi_konec=Window(Lag('konec'), **okno),
+        )
+
+
 class SarzeKrok(models.Model):
     sarze = models.ForeignKey(Sarze, on_delete=models.CASCADE, related_name='kroky', verbose_name='Šarže')
     poradi = models.PositiveIntegerField(verbose_name='Pořadí')
@@ -1631,6 +2078,8 @@ class SarzeKrok(models.Model):
     poznamka = models.CharField(max_length=100, blank=True, null=True, verbose_name='Poznámka')
     history = HistoricalRecords()
 
+    objects = SarzeKrokQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Krok šarže'
         verbose_name_plural = 'kroky šarže'
@@ -1687,26 +2136,32 @@ class SarzeKrok(models.Model):
             if update_fields is not None:
                 kwargs['update_fields'] = set(update_fields) | {'datum_konce'}
 
+        from .services.souhrny_vyroby_service import odlozene_souhrny_vyroby
+
         if self.pk or self.poradi:
-            result = super().save(*args, **kwargs)
+            puvodni_poradi = getattr(self, '_poradi_pouziti', None)
+            puvodni_vyroba = getattr(self, '_vyroba_hodnoty', None)
+            with transaction.atomic(), odlozene_souhrny_vyroby():
+                result = super().save(*args, **kwargs)
+                self._aktualizuj_prvni_pouziti(puvodni_poradi)
+                self._aktualizuj_souhrny_vyroby(puvodni_vyroba)
             self._finish_vruty_sarze_if_terminal_step_finished()
             return result
 
         max_attempts = 5
         last_error = None
 
+        from .services.cislovani_service import dalsi_cislo, rada_kroku, srovnej
+
+        rada = rada_kroku(self.sarze_id)
+
         for attempt in range(max_attempts):
             try:
                 with transaction.atomic():
-                    Sarze.objects.select_for_update().get(pk=self.sarze_id)
-                    last_number = (
-                        SarzeKrok.objects
-                        .filter(sarze_id=self.sarze_id)
-                        .aggregate(max_poradi=Max('poradi'))
-                        .get('max_poradi')
-                    ) or 0
-                    self.poradi = last_number + 1
+                    self.poradi = dalsi_cislo(rada)
                     result = super().save(*args, **kwargs)
+                    self._poradi_pouziti = self._hodnoty_pro_prvni_pouziti()
+                    self._aktualizuj_souhrny_vyroby(None)
                     self._finish_vruty_sarze_if_terminal_step_finished()
                     return result
             except IntegrityError as error:
@@ -1714,13 +2169,73 @@ class SarzeKrok(models.Model):
                     raise
                 last_error = error
                 logger.warning(
-                    f"Kolize pořadí kroku při ukládání (pokus {attempt + 1}/{max_attempts}), opakuji.",
+                    f"Kolize pořadí kroku při ukládání (pokus {attempt + 1}/{max_attempts}), srovnávám čítač a opakuji.",
                     exc_info=True,
                 )
                 self.poradi = None
+                srovnej(rada)
 
         raise last_error
 
+    def delete(self, using=None, keep_parents=False):
+        """
+        Smaže krok i s jeho bednami, přepočítá příznak prvního použití těchto beden
+        a souhrny výroby dne kroku.
+        """
+        from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+        from .services.souhrny_vyroby_service import dny_po_zmene_kroku, odlozene_souhrny_vyroby, oznac_zmenu_vyroby
+        with transaction.atomic(), odlozene_souhrny_vyroby():
+            bedna_ids = set(
+                self.krok_bedny.filter(bedna__isnull=False).values_list('bedna_id', flat=True)
+            ) if self.pk else set()
+            vysledek = super().delete(using=using, keep_parents=keep_parents)
+            prepocitej_prvni_pouziti(bedna_ids)
+            oznac_zmenu_vyroby(dny_po_zmene_kroku(self.datum))
+        return vysledek
+
+    # --- První použití beden ---
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._poradi_pouziti = instance._hodnoty_pro_prvni_pouziti()
+        instance._vyroba_hodnoty = instance._hodnoty_pro_vyrobu()
+        return instance
+
+    def _hodnoty_pro_prvni_pouziti(self):
+        """Hodnoty kroku, podle kterých se určuje první použití beden (odložená pole se nenačítají)."""
+        return tuple(self.__dict__.get(pole) for pole in ('zarizeni_id', 'datum', 'zacatek', 'poradi'))
+
+    def _aktualizuj_prvni_pouziti(self, puvodni):
+        """
+        Po změně zařízení, data, začátku nebo pořadí kroku přepočítá první použití jeho beden.
+        Bez známých původních hodnot (instance nenačtená z databáze) přepočítá vždy.
+        """
+        nove = self._hodnoty_pro_prvni_pouziti()
+        if puvodni != nove:
+            from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+            prepocitej_prvni_pouziti(
+                self.krok_bedny.filter(bedna__isnull=False).values_list('bedna_id', flat=True)
+            )
+        self._poradi_pouziti = nove
+
+    # --- Souhrny výroby ---
+    def _hodnoty_pro_vyrobu(self):
+        """Hodnoty kroku, ze kterých se počítají souhrny výroby (odložená pole se nenačítají)."""
+        return tuple(
+            self.__dict__.get(pole) for pole in ('zarizeni_id', 'datum', 'zacatek', 'datum_konce', 'konec', 'poradi')
+        )
+
+    def _aktualizuj_souhrny_vyroby(self, puvodni):
+        """
+        Po změně zařízení, času nebo pořadí kroku přepočítá souhrny výroby původního i nového dne kroku
+        a následujících dní, jejichž prostoj může na kroku záviset. Nový krok přepočítá vždy.
+        """
+        nove = self._hodnoty_pro_vyrobu()
+        if puvodni != nove:
+            from .services.souhrny_vyroby_service import dny_po_zmene_kroku, oznac_zmenu_vyroby
+            oznac_zmenu_vyroby(dny_po_zmene_kroku(self.datum, puvodni[1] if puvodni else None))
+        self._vyroba_hodnoty = nove
+
     def _finish_vruty_sarze_if_terminal_step_finished(self):
         if not self.konec or not self.sarze_id or not self.zarizeni_id:
             return
@@ -1747,7 +2262,8 @@ class SarzeKrok(models.Model):
         """
         Rozdíl mezi začátkem aktuálního kroku a koncem předchozího kroku
         na stejném zařízení v minutách.
-        Počítá se pouze pro zařízení typu VICEUCELOVKA.
+        Počítá se pouze pro zařízení typu VICEUCELOVKA. Předchozí krok se bere z anotace
+        SarzeKrokQuerySet.s_prodlevou (nebo vyroba_service.dopln_prodlevy), jinak se dohledá dotazem.
         """
         if (
             not self.zarizeni_id
@@ -1757,43 +2273,33 @@ class SarzeKrok(models.Model):
         ):
             return '-'
 
-        predchozi_krok = (
-            SarzeKrok.objects
-            .filter(zarizeni=self.zarizeni)
-            .exclude(pk=self.pk)
-            .filter(
-                Q(datum__lt=self.datum)
-                | Q(datum=self.datum, zacatek__lt=self.zacatek)
-                | Q(
-                    datum=self.datum,
-                    zacatek=self.zacatek,
-                    poradi__lt=self.poradi,
+        if getattr(self, 'predchozi_datum', None) is not None:
+            predchozi_datum_konce, predchozi_konec = self.predchozi_datum_konce, self.predchozi_konec
+        else:
+            predchozi_krok = (
+                SarzeKrok.objects
+                .filter(zarizeni=self.zarizeni)
+                .exclude(pk=self.pk)
+                .filter(
+                    Q(datum__lt=self.datum)
+                    | Q(datum=self.datum, zacatek__lt=self.zacatek)
+                    | Q(
+                        datum=self.datum,
+                        zacatek=self.zacatek,
+                        poradi__lt=self.poradi,
+                    )
                 )
+                .order_by('-datum', '-zacatek', '-poradi')
+                .values('datum_konce', 'konec')
+                .first()
             )
-            .order_by('-datum', '-zacatek', '-poradi')
-            .first()
-        )
-
-        if (
-            not predchozi_krok
-            or not predchozi_krok.konec
-            or not predchozi_krok.datum_konce
-            or not predchozi_krok.zacatek
-            or not predchozi_krok.datum
-        ):
-            return '-'
-
-        datum_predchoziho_kroku = predchozi_krok.datum_konce
+            if not predchozi_krok:
+                return '-'
+            predchozi_datum_konce, predchozi_konec = predchozi_krok['datum_konce'], predchozi_krok['konec']
 
-        # Dlouhá odstávka stroje (více než 1 den) se do prostoje nepočítá.
-        if datum_predchoziho_kroku < (self.datum - timedelta(days=1)):
-            return 0
-
-        prodleva = (
-            datetime.combine(self.datum, self.zacatek)
-            - datetime.combine(datum_predchoziho_kroku, predchozi_krok.konec)
-        ).total_seconds() / 60
-        return int(prodleva)
+        from .services.vyroba_service import prodleva_minut
+        prodleva = prodleva_minut(self.datum, self.zacatek, predchozi_datum_konce, predchozi_konec)
+        return '-' if prodleva is None else prodleva
 
     @property
     def takt(self):
@@ -1818,6 +2324,26 @@ class SarzeKrok(models.Model):
         return round(takt, 1)
 
 
+class SarzeKrokBednaQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Hromadné smazání záznamů (např. celého patra) přepočítá příznak prvního použití jejich beden
+        a souhrny výroby dní jejich kroků.
+        """
+        from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+        from .services.souhrny_vyroby_service import odlozene_souhrny_vyroby, oznac_zmenu_vyroby
+        with transaction.atomic(), odlozene_souhrny_vyroby():
+            bedna_ids = set(self.filter(bedna__isnull=False).values_list('bedna_id', flat=True))
+            dny = set(self.order_by().values_list('krok__datum', flat=True).distinct())
+            vysledek = super().delete()
+            prepocitej_prvni_pouziti(bedna_ids)
+            oznac_zmenu_vyroby(dny)
+        return vysledek
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class SarzeKrokBedna(models.Model):
     krok = models.ForeignKey(SarzeKrok, on_delete=models.CASCADE, related_name='krok_bedny', verbose_name='Krok šarže')
     bedna = models.ForeignKey(
@@ -1845,8 +2371,14 @@ class SarzeKrokBedna(models.Model):
         verbose_name='Procent z patra', blank=True, null=True, validators=[MinValueValidator(0), MaxValueValidator(100)],
         help_text='Podíl využití patra pro danou bednu (0-100).',
     )  
+    prvni_pouziti = models.BooleanField(
+        default=False, db_index=True, editable=False, verbose_name='První použití',
+        help_text='Bedna je na zařízení použita poprvé (udržuje services.prvni_pouziti_service).',
+    )
     history = HistoricalRecords()
 
+    objects = SarzeKrokBednaQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Bedna v kroku šarže'
         verbose_name_plural = 'deník'
@@ -1956,21 +2488,34 @@ class SarzeKrokBedna(models.Model):
     def save(self, *args, **kwargs):
         update_fields = kwargs.get('update_fields')
         bedna_will_be_saved = self._state.adding or update_fields is None or 'bedna' in update_fields
-        previous_bedna_id = None
-        if bedna_will_be_saved and self.pk:
-            previous_bedna_id = (
+        # Změna bedny, kroku nebo patra může změnit první použití bedny.
+        poradi_will_be_saved = bedna_will_be_saved or bool({'krok', 'patro'} & set(update_fields))
+        previous = None
+        if poradi_will_be_saved and self.pk:
+            previous = (
                 type(self).objects
                 .filter(pk=self.pk)
-                .values_list('bedna_id', flat=True)
+                .values_list('bedna_id', 'krok_id', 'patro')
                 .first()
             )
+        previous_bedna_id = previous[0] if previous and bedna_will_be_saved else None
 
         bedna_added = (
             bedna_will_be_saved
             and self.bedna_id is not None
             and self.bedna_id != previous_bedna_id
         )
-        super().save(*args, **kwargs)
+        if self.bedna_id is None:
+            self.prvni_pouziti = False
+        from .services.souhrny_vyroby_service import dny_kroku, odlozene_souhrny_vyroby, oznac_zmenu_vyroby
+        with transaction.atomic(), odlozene_souhrny_vyroby():
+            super().save(*args, **kwargs)
+            if poradi_will_be_saved and previous != (self.bedna_id, self.krok_id, self.patro):
+                from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+                prvni_pouziti = prepocitej_prvni_pouziti([self.bedna_id, previous[0] if previous else None])
+                self.prvni_pouziti = prvni_pouziti.get(self.pk, False)
+            if update_fields is None or set(update_fields) - {'prvni_pouziti'}:
+                oznac_zmenu_vyroby(dny_kroku([self.krok_id, previous[1] if previous else None]))
 
         if not bedna_added or not self.krok_id:
             return
@@ -2001,55 +2546,89 @@ class SarzeKrokBedna(models.Model):
                 bedna.pozice = None
                 bedna.save(update_fields=['stav_bedny', 'pozice'])
 
-    @property
-    def prvni_pouziti(self):
-        """
-        True, pokud je tato bedna na daném zařízení poprvé použita v tomto kroku.
-        Počítá se pouze pro zařízení typu VICEUCELOVKA.
-        """
-        if (
-            not self.krok
-            or not self.bedna
-            or not self.krok.zarizeni
-            or self.krok.zarizeni.typ_zarizeni != TypZarizeniChoice.VICEUCELOVKA
-            or not self.krok.datum
-            or not self.krok.zacatek
-        ):
-            return False
+    def delete(self, using=None, keep_parents=False):
+        """Smaže záznam a přepočítá příznak prvního použití jeho bedny a souhrny výroby dne kroku."""
+        from .services.prvni_pouziti_service import prepocitej_prvni_pouziti
+        from .services.souhrny_vyroby_service import dny_kroku, odlozene_souhrny_vyroby, oznac_zmenu_vyroby
+        bedna_id = self.bedna_id
+        with transaction.atomic(), odlozene_souhrny_vyroby():
+            dny = dny_kroku([self.krok_id])
+            vysledek = super().delete(using=using, keep_parents=keep_parents)
+            prepocitej_prvni_pouziti([bedna_id])
+            oznac_zmenu_vyroby(dny)
+        return vysledek
 
-        same_krok_prior_qs = SarzeKrokBedna.objects.filter(
-            krok_id=self.krok_id,
-            bedna_id=self.bedna_id,
-        )
-        if self.pk:
-            same_krok_prior_qs = same_krok_prior_qs.exclude(pk=self.pk)
 
-        same_krok_prior_filter = Q(patro__lt=self.patro)
-        if self.pk:
-            same_krok_prior_filter |= Q(patro=self.patro, pk__lt=self.pk)
+# Dočasný alias pro postupný refaktor dalších vrstev (admin/filtry/views/testy).
+SarzeBedna = SarzeKrokBedna
 
-        if same_krok_prior_qs.filter(same_krok_prior_filter).exists():
-            return False
 
-        return not SarzeKrokBedna.objects.filter(
-            bedna=self.bedna,
-            krok__zarizeni=self.krok.zarizeni,
-        ).exclude(krok_id=self.krok_id).filter(
-            Q(krok__datum__lt=self.krok.datum)
-            | Q(
-                krok__datum=self.krok.datum,
-                krok__zacatek__lt=self.krok.zacatek,
-            )
-            | Q(
-                krok__datum=self.krok.datum,
-                krok__zacatek=self.krok.zacatek,
-                krok__poradi__lt=self.krok.poradi,
-            )
-        ).exists()
+class SouhrnVyroby(models.Model):
+    """
+    Společná pole denních souhrnů výroby. Řádek patří kalendářnímu dni kroků šarží, dni začátku směny,
+    směně (den/noc) a zařízení. Hodnoty udržuje služba services.souhrny_vyroby_service při změně kroků
+    šarží a jejich beden, přestavba je v příkazu `manage.py rebuild_rollups`.
+    """
+    datum = models.DateField(db_index=True, verbose_name='Datum')
+    den_smeny = models.DateField(db_index=True, verbose_name='Den směny')
+    smena = models.CharField(max_length=3, verbose_name='Směna')
+    zarizeni = models.ForeignKey(Zarizeni, on_delete=models.CASCADE, related_name='+', verbose_name='Pracoviště')
+    pocet_beden = models.PositiveIntegerField(default=0, verbose_name='Beden')
+    kg = models.DecimalField(max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Netto kg')
+    kg_prvni_pouziti = models.DecimalField(
+        max_digits=12, decimal_places=1, default=Decimal('0.0'), verbose_name='Netto kg prvního použití',
+    )
+    aktualizovano = models.DateTimeField(auto_now=True, verbose_name='Aktualizováno')
+
+    class Meta:
+        abstract = True
 
 
-# Dočasný alias pro postupný refaktor dalších vrstev (admin/filtry/views/testy).
-SarzeBedna = SarzeKrokBedna
+class SouhrnVyrobyZarizeni(SouhrnVyroby):
+    """
+    Denní souhrn výroby zařízení ve směně – počty kroků, pater, beden, výkon v kg, doba běhu a prostoj.
+    """
+    pocet_kroku = models.PositiveIntegerField(default=0, verbose_name='Kroků')
+    pocet_kroku_vruty = models.PositiveIntegerField(default=0, verbose_name='Kroků s vruty')
+    pocet_kroku_zelezo = models.PositiveIntegerField(default=0, verbose_name='Kroků se železem')
+    pocet_pater = models.PositiveIntegerField(default=0, verbose_name='Pater')
+    doba_behu_minut = models.PositiveIntegerField(default=0, verbose_name='Doba běhu (min)')
+    prostoj_minut = models.PositiveIntegerField(default=0, verbose_name='Prostoj (min)')
+
+    class Meta:
+        verbose_name = 'Souhrn výroby zařízení'
+        verbose_name_plural = 'souhrny výroby zařízení'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['datum', 'den_smeny', 'smena', 'zarizeni'], name='uniq_souhrnvyrobyzarizeni_den_smena',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Výroba {self.datum} ({self.smena}) zařízení {self.zarizeni_id}'
+
+
+class SouhrnVyrobyZakaznika(SouhrnVyroby):
+    """
+    Denní souhrn výroby zákazníka na zařízení ve směně – výkon a cena zboží z prvního použití beden
+    a podíl roštů (součet podílů procent zákazníka na patrech kroků).
+    """
+    zakaznik = models.ForeignKey(
+        Zakaznik, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='Zákazník',
+    )
+    cena_prvni_pouziti = models.DecimalField(
+        max_digits=15, decimal_places=3, default=Decimal('0.000'), verbose_name='Cena prvního použití',
+    )
+    podil_rostu = models.DecimalField(
+        max_digits=12, decimal_places=6, default=Decimal('0.000000'), verbose_name='Podíl roštů',
+    )
+
+    class Meta:
+        verbose_name = 'Souhrn výroby zákazníka'
+        verbose_name_plural = 'souhrny výroby zákazníků'
+
+    def __str__(self):
+        return f'Výroba {self.datum} ({self.smena}) zákazníka {self.zakaznik_id}'
 
 
 class PriorityNotificationRecipient(models.Model):
@@ -2171,3 +2750,56 @@ class RozpracovanostBednaSnapshot(models.Model):
 
     def __str__(self):
         return f"{self.rozpracovanost_id}: {self.bedna_id}"
+
+
+class Uloha(models.Model):
+    """
+    Úloha na pozadí (import zakázek, tisk karet a rozpracovanosti, CSV exporty).
+    Úlohu zařadí akce v adminu, zpracuje ji proces `manage.py run_jobs` přes services.ulohy_service
+    a výsledek se ukládá jako soubor ke stažení ze stránky úlohy.
+    """
+    typ = models.CharField(choices=TypUlohyChoice.choices, max_length=2, verbose_name='Typ úlohy')
+    stav = models.CharField(choices=StavUlohyChoice.choices, max_length=2, default=StavUlohyChoice.CEKA, verbose_name='Stav úlohy')
+    popis = models.CharField(max_length=255, blank=True, verbose_name='Popis')
+    parametry = models.JSONField(default=dict, blank=True, verbose_name='Parametry')
+    vytvoril = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='ulohy',
+        blank=True,
+        null=True,
+        verbose_name='Vytvořil',
+    )
+    vytvoreno = models.DateTimeField(auto_now_add=True, verbose_name='Vytvořeno')
+    zahajeno = models.DateTimeField(blank=True, null=True, verbose_name='Zahájeno')
+    dokonceno = models.DateTimeField(blank=True, null=True, verbose_name='Dokončeno')
+    worker = models.CharField(max_length=100, blank=True, verbose_name='Zpracovatel')
+    prubeh = models.PositiveIntegerField(default=0, verbose_name='Zpracováno')
+    celkem = models.PositiveIntegerField(default=0, verbose_name='Celkem')
+    zprava = models.TextField(blank=True, verbose_name='Zpráva')
+    vysledek = models.FileField(upload_to='ulohy/%Y/%m/', blank=True, verbose_name='Výsledek')
+    nazev_souboru = models.CharField(max_length=255, blank=True, verbose_name='Název souboru')
+
+    class Meta:
+        verbose_name = 'Úloha'
+        verbose_name_plural = 'úlohy'
+        ordering = ['-vytvoreno']
+        indexes = [
+            models.Index(fields=['stav', 'vytvoreno'], name='uloha_stav_vytvoreno_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_typ_display()} #{self.pk} ({self.get_stav_display()})"
+
+    def get_absolute_url(self):
+        return reverse('uloha_detail', args=[self.pk])
+
+    @property
+    def je_dokoncena(self):
+        return self.stav in (StavUlohyChoice.HOTOVO, StavUlohyChoice.CHYBA)
+
+    @property
+    def procenta(self):
+        if not self.celkem:
+            return 100 if self.stav == StavUlohyChoice.HOTOVO else 0
+        return min(100, round(100 * self.prubeh / self.celkem))
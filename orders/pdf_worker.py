@@ -0,0 +1,91 @@
+"""
+Vykreslení PDF WeasyPrintem v pracovním procesu poolu (viz services.pdf_render_service).
+
+Modul se načítá i ve spuštěných pracovních procesech bez nastaveného Djanga,
+proto nesmí importovat nic z Djanga ani z aplikace. Dostává hotové HTML a cesty k CSS
+a vrací obsah PDF spolu s dobou vykreslení.
+
+Rozparsované styly a konfigurace písem (FontConfiguration) se drží po celou dobu života procesu,
+takže se sdílené CSS a jeho písma nenačítají při každém tisku znovu.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger('orders')
+
+# Registr rozparsovaných stylů procesu: (cesta, čas úpravy souboru) -> CSS.
+_styly = {}
+_konfigurace_pisem = None
+
+
+def konfigurace_pisem():
+    """Sdílená FontConfiguration procesu – styly i vykreslení musí používat stejnou instanci."""
+    global _konfigurace_pisem
+    if _konfigurace_pisem is None:
+        from weasyprint.text.fonts import FontConfiguration
+        _konfigurace_pisem = FontConfiguration()
+    return _konfigurace_pisem
+
+
+def vyprazdni_styly():
+    """Zahodí rozparsované styly i konfiguraci písem (písma z @font-face patří ke konfiguraci)."""
+    global _konfigurace_pisem
+    _styly.clear()
+    _konfigurace_pisem = None
+
+
+def nacti_styl(cesta):
+    """
+    Rozparsovaný styl ze souboru `cesta` z registru procesu. Po úpravě souboru (jiný čas úpravy)
+    se registr vyprázdní a styl se načte znovu s novou konfigurací písem.
+    """
+    klic = (cesta, os.stat(cesta).st_mtime_ns)
+    styl = _styly.get(klic)
+    if styl is None:
+        if any(ulozena == cesta for ulozena, _cas in _styly):
+            vyprazdni_styly()
+        from weasyprint import CSS
+        styl = _styly[klic] = CSS(filename=cesta, font_config=konfigurace_pisem())
+    return styl
+
+
+def inicializuj_proces():
+    """Načte WeasyPrint a konfiguraci písem hned při startu procesu, aby první tisk nečekal."""
+    try:
+        konfigurace_pisem()
+    except Exception:
+        # Chyba se projeví až při tisku, kde ji uvidí volající.
+        logger.warning("WeasyPrint se v pracovním procesu PDF nepodařilo načíst.", exc_info=True)
+
+
+def vyrendruj(html, base_url=None, css_soubory=()):
+    """Vykreslí HTML do PDF. Vrací dvojici (obsah PDF, doba vykreslení v sekundách)."""
+    from weasyprint import HTML
+
+    zacatek = time.perf_counter()
+    stylesheets = [nacti_styl(cesta) for cesta in css_soubory]
+    pdf = HTML(string=html, base_url=base_url).write_pdf(
+        stylesheets=stylesheets,
+        font_config=konfigurace_pisem(),
+    )
+    return pdf, time.perf_counter() - zacatek
+
+
+def smycka_procesu(spojeni, funkce=vyrendruj):
+    """
+    Hlavní smyčka pracovního procesu – přijímá úlohy (argumenty pro `funkce`) ze spojení s rodičem
+    a posílá zpět (True, výsledek) nebo (False, popis chyby). Skončí, když rodič spojení zavře.
+    """
+    if funkce is vyrendruj:
+        inicializuj_proces()
+    while True:
+        try:
+            argumenty = spojeni.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            odpoved = (True, funkce(*argumenty))
+        except Exception as exc:
+            odpoved = (False, f"{type(exc).__name__}: {exc}")
+        spojeni.send(odpoved)
@@ -1,9 +1,115 @@
 from .exceptions import ServiceError, ServiceValidationError, ServiceOperationError
+from .pdf_render_service import (
+    metriky_pdf,
+    vyrendruj_pdf,
+)
+from .pdf_cache_service import (
+    otisk_kamionu,
+    pdf_kamionu,
+    vycisti_pdf_cache,
+)
+from .barcode_service import (
+    predgeneruj_kody_beden,
+    predgeneruj_po_commitu,
+)
 from .pdf_cards_service import (
     build_cards_pdf,
     validate_cards_input,
     resolve_customer_templates,
 )
+from .dashboard_service import (
+    BunkaPrehledu,
+    PrehledBeden,
+    prehled_beden,
+)
+from .historie_service import (
+    RocniRady,
+    historie_vyroby,
+    vyrobni_zarizeni,
+    vyuziti_zakazniku,
+)
+from .prvni_pouziti_service import (
+    prepocitej_prvni_pouziti,
+    prestav_prvni_pouziti,
+    zkontroluj_prvni_pouziti,
+)
+from .vyroba_service import (
+    StatistikaVyroby,
+    StatistikyVyroby,
+    dopln_prodlevy,
+    kroky_s_prodlevou,
+    prvni_pouziti_beden,
+    statistiky_vyroby,
+)
+from .cenik_service import (
+    CenaZaznam,
+    CenikResolver,
+    cenik_scope,
+    get_cenik_resolver,
+    invalidate_cenik,
+)
+from .fakturace_service import (
+    FakturaceBedny,
+    FakturaceZakazky,
+    FakturaceKamionu,
+    annotate_ceny_zakazek,
+    build_fakturace_kamionu,
+)
+from .cislovani_service import (
+    Rada,
+    rezervuj,
+    dalsi_cislo,
+    srovnej,
+)
+from .souhrny_service import (
+    KontrolaSouhrnu,
+    oznac_zmenu_souhrnu,
+    odlozene_souhrny,
+    prepocitej_souhrny,
+    prestav_souhrny,
+    zkontroluj_souhrny,
+    zmen_souhrny_bedny,
+)
+from .souhrny_vyroby_service import (
+    odlozene_souhrny_vyroby,
+    oznac_zmenu_vyroby,
+    prepocitej_ceny_vyroby,
+    prepocitej_souhrny_vyroby,
+    prestav_souhrny_vyroby,
+    zkontroluj_souhrny_vyroby,
+)
+from .navezeni_service import (
+    odlozene_poradi_navezeni,
+    oznac_zmenu_navezeni,
+    srovnej_poradi_navezeni,
+)
+from .statistiky_kamionu_service import (
+    PohybyKamionu,
+    StatistikyKamionu,
+    dopln_statistiky_kamionu,
+    porovnej_roky,
+    prestav_statistiky_kamionu,
+    rozsah_let,
+    statistiky_roku,
+)
+from .import_service import (
+    ParsovanyImport,
+    VysledekImportu,
+    importuj_zakazky,
+    nacti_parsovany_import,
+    uklid_importy,
+    uloz_parsovany_import,
+)
+from .ulohy_service import (
+    VysledekUlohy,
+    nastav_prubeh,
+    oznac_prerusene_ulohy,
+    prekracuje_prah,
+    registruj_ulohu,
+    uklid_ulohy,
+    zarad_ulohu,
+    zpracuj_dalsi_ulohu,
+)
 from .expedice_service import (
     ExpediceResult,
     validate_expedice_preconditions,
@@ -17,9 +123,64 @@ __all__ = [
     "ServiceError",
     "ServiceValidationError",
     "ServiceOperationError",
+    "metriky_pdf",
+    "vyrendruj_pdf",
+    "otisk_kamionu",
+    "pdf_kamionu",
+    "vycisti_pdf_cache",
     "build_cards_pdf",
     "validate_cards_input",
     "resolve_customer_templates",
+    "CenaZaznam",
+    "CenikResolver",
+    "cenik_scope",
+    "get_cenik_resolver",
+    "invalidate_cenik",
+    "FakturaceBedny",
+    "FakturaceZakazky",
+    "FakturaceKamionu",
+    "annotate_ceny_zakazek",
+    "build_fakturace_kamionu",
+    "Rada",
+    "rezervuj",
+    "dalsi_cislo",
+    "srovnej",
+    "KontrolaSouhrnu",
+    "oznac_zmenu_souhrnu",
+    "odlozene_souhrny",
+    "prepocitej_souhrny",
+    "prestav_souhrny",
+    "zkontroluj_souhrny",
+    "zmen_souhrny_bedny",
+    "odlozene_souhrny_vyroby",
+    "oznac_zmenu_vyroby",
+    "prepocitej_ceny_vyroby",
+    "prepocitej_souhrny_vyroby",
+    "prestav_souhrny_vyroby",
+    "zkontroluj_souhrny_vyroby",
+    "odlozene_poradi_navezeni",
+    "oznac_zmenu_navezeni",
+    "srovnej_poradi_navezeni",
+    "PohybyKamionu",
+    "StatistikyKamionu",
+    "dopln_statistiky_kamionu",
+    "porovnej_roky",
+    "prestav_statistiky_kamionu",
+    "statistiky_roku",
+    "ParsovanyImport",
+    "VysledekImportu",
+    "importuj_zakazky",
+    "nacti_parsovany_import",
+    "uklid_importy",
+    "uloz_parsovany_import",
+    "VysledekUlohy",
+    "nastav_prubeh",
+    "oznac_prerusene_ulohy",
+    "prekracuje_prah",
+    "registruj_ulohu",
+    "uklid_ulohy",
+    "zarad_ulohu",
+    "zpracuj_dalsi_ulohu",
     "ExpediceResult",
     "validate_expedice_preconditions",
     "expedice_beden_do_noveho_kamionu",
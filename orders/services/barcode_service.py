@@ -0,0 +1,190 @@
+"""
+Úložiště čárových a QR kódů na lokálním disku sdílené všemi procesy aplikace.
+
+Vygenerovaný kód (SVG nebo předrastrovaný PNG) se uloží pod klíčem z druhu kódu, hodnoty, formátu
+a parametrů generátoru, takže ho po restartu ani v jiném workeru není třeba generovat znovu.
+Kódy beden se předgenerují hromadně hned po založení beden (`predgeneruj_kody_beden`), tisk karet
+je pak jen načte. Formát pro tiskové šablony určuje nastavení BARCODE_FORMAT ('svg' nebo 'png').
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger("orders")
+
+QR = 'qr'
+CODE128 = 'code128'
+SVG = 'svg'
+PNG = 'png'
+
+# Parametry generátorů jsou součástí klíče – po jejich změně se kódy vygenerují znovu.
+VOLBY_QR = {
+    'error_correction': 'M',
+    'box_size': 10,
+    'border': 2,
+}
+VOLBY_CODE128 = {
+    'module_width': 0.7,
+    'module_height': 12.0,
+    'quiet_zone': 2.5,
+    'font_size': 0,
+    'text_distance': 0,
+    'write_text': False,
+}
+DPI_PNG = 300
+
+
+def _adresar():
+    return Path(getattr(settings, 'BARCODE_CACHE_DIR', Path(settings.BASE_DIR) / 'barcode_cache'))
+
+
+def format_tisku():
+    """Formát kódů v tiskových šablonách podle nastavení BARCODE_FORMAT."""
+    return PNG if getattr(settings, 'BARCODE_FORMAT', SVG) == PNG else SVG
+
+
+def _inline_svg(svg):
+    start = svg.find("<svg")
+    if start == -1:
+        return ""
+    return svg[start:]
+
+
+def _qr(hodnota, format):
+    try:
+        import qrcode
+        import qrcode.image.svg
+    except ImportError:
+        return None
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=VOLBY_QR['box_size'],
+        border=VOLBY_QR['border'],
+    )
+    qr.add_data(hodnota)
+    qr.make(fit=True)
+    output = BytesIO()
+    if format == SVG:
+        image = qr.make_image(
+            image_factory=qrcode.image.svg.SvgPathImage,
+            attrib={"class": "bedna-qr-svg"},
+        )
+        image.save(output)
+        return _inline_svg(output.getvalue().decode("utf-8")).encode("utf-8")
+    qr.make_image().save(output, format='PNG', dpi=(DPI_PNG, DPI_PNG))
+    return output.getvalue()
+
+
+def _code128(hodnota, format):
+    try:
+        import barcode
+        from barcode.writer import ImageWriter, SVGWriter
+    except ImportError:
+        return None
+
+    if format == SVG:
+        svg_bytes = barcode.get_barcode_class("code128")(hodnota, writer=SVGWriter()).render(
+            writer_options=dict(VOLBY_CODE128),
+        )
+        return _inline_svg(svg_bytes.decode("utf-8")).encode("utf-8")
+    image = barcode.get_barcode_class("code128")(hodnota, writer=ImageWriter(format='PNG')).render(
+        writer_options={**VOLBY_CODE128, 'dpi': DPI_PNG},
+    )
+    output = BytesIO()
+    image.save(output, format='PNG', dpi=(DPI_PNG, DPI_PNG))
+    return output.getvalue()
+
+
+_GENERATORY = {QR: (_qr, VOLBY_QR), CODE128: (_code128, VOLBY_CODE128)}
+
+
+def cesta_kodu(druh, hodnota, format=SVG):
+    """Cesta souboru kódu v úložišti – klíčem je druh, hodnota, formát a parametry generátoru."""
+    _generator, volby = _GENERATORY[druh]
+    klic = hashlib.sha256(repr((druh, str(hodnota), format, sorted(volby.items()), DPI_PNG)).encode('utf-8')).hexdigest()
+    return _adresar() / druh / klic[:2] / f"{klic}.{format}"
+
+
+def _uloz(cesta, obsah):
+    try:
+        cesta.parent.mkdir(parents=True, exist_ok=True)
+        fd, docasna = tempfile.mkstemp(dir=cesta.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as soubor:
+            soubor.write(obsah)
+        os.replace(docasna, cesta)
+    except OSError:
+        logger.warning(f"Kód {cesta} se nepodařilo uložit do úložiště kódů.", exc_info=True)
+        return False
+    return True
+
+
+def zajisti_kod(druh, hodnota, format=SVG):
+    """
+    Vrátí cestu uloženého kódu, chybějící kód vygeneruje a uloží.
+    Vrací None, pokud generátor není k dispozici nebo kód nelze uložit.
+    """
+    cesta = cesta_kodu(druh, hodnota, format)
+    if cesta.exists():
+        return cesta
+    generator, _volby = _GENERATORY[druh]
+    obsah = generator(str(hodnota), format)
+    if obsah is None or not _uloz(cesta, obsah):
+        return None
+    return cesta
+
+
+@lru_cache(maxsize=4096)
+def _svg_z_uloziste(druh, hodnota, adresar):
+    cesta = zajisti_kod(druh, hodnota, SVG)
+    return cesta.read_text(encoding='utf-8') if cesta else ""
+
+
+def kod_svg(druh, hodnota):
+    """Inline SVG kódu z úložiště (v procesu navíc drží posledních 4096 kódů v paměti)."""
+    return _svg_z_uloziste(druh, str(hodnota), str(_adresar()))
+
+
+def kod_png_uri(druh, hodnota):
+    """file:// URI předrastrovaného PNG kódu z úložiště pro tag <img> v tiskové šabloně, nebo ''."""
+    cesta = zajisti_kod(druh, str(hodnota), PNG)
+    return cesta.resolve().as_uri() if cesta else ""
+
+
+def predgeneruj_kody_beden(cisla_beden, format=None):
+    """
+    Hromadně vygeneruje chybějící kódy Code128 beden ve formátu tisku, aby tisk karet kódy jen načítal.
+    Vrací počet nově vygenerovaných kódů.
+    """
+    format = format or format_tisku()
+    vygenerovano = 0
+    for cislo in cisla_beden:
+        if cislo is None or cesta_kodu(CODE128, cislo, format).exists():
+            continue
+        if zajisti_kod(CODE128, cislo, format):
+            vygenerovano += 1
+    if vygenerovano:
+        logger.info(f"Předgenerováno {vygenerovano} kódů beden ({format}).")
+    return vygenerovano
+
+
+def predgeneruj_po_commitu(cisla_beden):
+    """Naplánuje předgenerování kódů beden po potvrzení transakce, ve které bedny vznikly."""
+    cisla_beden = list(cisla_beden)
+
+    def predgeneruj():
+        try:
+            predgeneruj_kody_beden(cisla_beden)
+        except Exception:
+            # Chybějící kód se vygeneruje až při tisku.
+            logger.warning("Předgenerování kódů beden selhalo.", exc_info=True)
+
+    transaction.on_commit(predgeneruj)
@@ -0,0 +1,207 @@
+import bisect
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db.models import Count, OuterRef, Subquery
+
+from ..models import Cena, Zakaznik
+
+logger = logging.getLogger("orders")
+
+
+@dataclass(frozen=True)
+class CenaZaznam:
+    """Jeden řádek ceníku pro konkrétní předpis a délkový interval <delka_min, delka_max)."""
+    cena_id: int
+    delka_min: Decimal
+    delka_max: Decimal
+    cena_za_kg: Decimal
+    cena_rovnani_za_kg: Decimal | None
+    cena_tryskani_za_kg: Decimal | None
+
+
+@dataclass
+class _IntervalyPredpisu:
+    """Seřazené intervaly cen jednoho předpisu zákazníka."""
+    zaznamy: list[CenaZaznam] = field(default_factory=list)
+    mins: list[Decimal] = field(default_factory=list)
+    prekryvy: bool = False
+
+
+@dataclass
+class _CenikZakaznika:
+    stamp: tuple
+    predpisy: dict[int, _IntervalyPredpisu]
+
+
+# Ceníky načtené v tomto procesu, klíčované id zákazníka.
+_CENIK_CACHE: dict[int, _CenikZakaznika] = {}
+_CENIK_LOCK = threading.Lock()
+
+_aktivni_resolver = contextvars.ContextVar("cenik_resolver", default=None)
+
+
+def _cenik_stamp(zakaznik_id):
+    """
+    Vrátí otisk ceníku zákazníka jedním dotazem: čas poslední změny ceny (z historie)
+    a počet a nejvyšší id vazeb cena-předpis. Změna otisku znamená nutnost načíst ceník znovu.
+    """
+    historie = Cena.history.model.objects.filter(zakaznik_id=OuterRef("pk"))
+    vazby = Cena.predpis.through.objects.filter(cena__zakaznik_id=OuterRef("pk"))
+    return (
+        Zakaznik.objects
+        .filter(pk=zakaznik_id)
+        .annotate(
+            posledni_zmena=Subquery(
+                historie.order_by("-history_date", "-history_id").values("history_date")[:1]
+            ),
+            pocet_vazeb=Subquery(
+                vazby.order_by().values("cena__zakaznik_id").annotate(pocet=Count("pk")).values("pocet")[:1]
+            ),
+            posledni_vazba=Subquery(vazby.order_by("-pk").values("pk")[:1]),
+        )
+        .values_list("posledni_zmena", "pocet_vazeb", "posledni_vazba")
+        .first()
+    )
+
+
+def _build_cenik(zakaznik_id, stamp):
+    """Načte všechny ceny zákazníka a sestaví intervalový index pro každý předpis."""
+    rows = (
+        Cena.predpis.through.objects
+        .filter(cena__zakaznik_id=zakaznik_id)
+        .values_list(
+            "predpis_id",
+            "cena_id",
+            "cena__delka_min",
+            "cena__delka_max",
+            "cena__cena_za_kg",
+            "cena__cena_rovnani_za_kg",
+            "cena__cena_tryskani_za_kg",
+        )
+    )
+    predpisy: dict[int, _IntervalyPredpisu] = {}
+    for predpis_id, cena_id, delka_min, delka_max, cena_za_kg, cena_rovnani, cena_tryskani in rows:
+        predpisy.setdefault(predpis_id, _IntervalyPredpisu()).zaznamy.append(
+            CenaZaznam(
+                cena_id=cena_id,
+                delka_min=delka_min,
+                delka_max=delka_max,
+                cena_za_kg=cena_za_kg,
+                cena_rovnani_za_kg=cena_rovnani,
+                cena_tryskani_za_kg=cena_tryskani,
+            )
+        )
+
+    for intervaly in predpisy.values():
+        intervaly.zaznamy.sort(key=lambda z: (z.delka_min, z.delka_max, z.cena_id))
+        intervaly.mins = [z.delka_min for z in intervaly.zaznamy]
+        # Překrývající se intervaly jsou chyba ceníku, pro ně se hledá lineárně,
+        # aby se zachovalo hlášení více nalezených cen.
+        intervaly.prekryvy = any(
+            predchozi.delka_max > dalsi.delka_min
+            for predchozi, dalsi in zip(intervaly.zaznamy, intervaly.zaznamy[1:])
+        )
+
+    return _CenikZakaznika(stamp=stamp, predpisy=predpisy)
+
+
+def invalidate_cenik(zakaznik_id=None):
+    """
+    Zahodí ceník načtený v tomto procesu – pro jednoho zákazníka, nebo (bez parametru) pro všechny.
+    Volá se po uložení ceny nebo předpisu v administraci.
+    """
+    with _CENIK_LOCK:
+        if zakaznik_id is None:
+            _CENIK_CACHE.clear()
+        else:
+            _CENIK_CACHE.pop(zakaznik_id, None)
+
+
+class CenikResolver:
+    """
+    Vyhledává ceny podle zákazníka, předpisu a délky v intervalovém indexu v paměti.
+
+    Ceník zákazníka se načte jednou a sdílí se v rámci procesu. Platnost sdíleného ceníku
+    ověří každý resolver jedním dotazem na otisk ceníku při prvním použití zákazníka,
+    další vyhledání jsou již bez dotazů do databáze (O(log n)).
+    """
+
+    def __init__(self):
+        self._ceniky: dict[int, _CenikZakaznika] = {}
+
+    def _cenik(self, zakaznik_id):
+        cenik = self._ceniky.get(zakaznik_id)
+        if cenik is not None:
+            return cenik
+
+        stamp = _cenik_stamp(zakaznik_id)
+        with _CENIK_LOCK:
+            cenik = _CENIK_CACHE.get(zakaznik_id)
+        if cenik is None or cenik.stamp != stamp:
+            cenik = _build_cenik(zakaznik_id, stamp)
+            with _CENIK_LOCK:
+                _CENIK_CACHE[zakaznik_id] = cenik
+
+        self._ceniky[zakaznik_id] = cenik
+        return cenik
+
+    def find_ceny(self, *, zakaznik_id, predpis_id, delka):
+        """Vrátí všechny ceny, jejichž interval <delka_min, delka_max) obsahuje zadanou délku."""
+        if not zakaznik_id or not predpis_id or delka is None:
+            return []
+
+        intervaly = self._cenik(zakaznik_id).predpisy.get(predpis_id)
+        if intervaly is None:
+            return []
+
+        if intervaly.prekryvy:
+            return [z for z in intervaly.zaznamy if z.delka_min <= delka < z.delka_max]
+
+        index = bisect.bisect_right(intervaly.mins, delka) - 1
+        if index < 0:
+            return []
+        zaznam = intervaly.zaznamy[index]
+        return [zaznam] if delka < zaznam.delka_max else []
+
+    def resolve(self, *, zakaznik_id, predpis_id, delka, popis=None):
+        """
+        Vrátí jedinou platnou cenu pro zákazníka, předpis a délku, nebo None.
+        Při více nalezených cenách zaloguje varování a vrací None (stejně jako dříve při MultipleObjectsReturned).
+        """
+        ceny = self.find_ceny(zakaznik_id=zakaznik_id, predpis_id=predpis_id, delka=delka)
+        if len(ceny) > 1:
+            logger.warning(
+                f"Nalezeno více cen{f' pro {popis}' if popis else ''} "
+                f"(predpis={predpis_id}, delka={delka}, zakaznik={zakaznik_id})"
+            )
+            return None
+        return ceny[0] if ceny else None
+
+
+@contextmanager
+def cenik_scope():
+    """
+    Sdílí jeden resolver pro všechny cenové výpočty uvnitř bloku (např. render proformy),
+    takže se otisk ceníku ověřuje jen jednou na zákazníka.
+    """
+    resolver = _aktivni_resolver.get()
+    if resolver is not None:
+        yield resolver
+        return
+
+    resolver = CenikResolver()
+    token = _aktivni_resolver.set(resolver)
+    try:
+        yield resolver
+    finally:
+        _aktivni_resolver.reset(token)
+
+
+def get_cenik_resolver():
+    """Vrátí resolver aktivního `cenik_scope`, mimo něj nový resolver pro jednorázový výpočet."""
+    return _aktivni_resolver.get() or CenikResolver()
@@ -0,0 +1,135 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from ..models import Bedna, CitacCisel, Kamion, Sarze, SarzeKrok
+from .exceptions import ServiceValidationError
+
+logger = logging.getLogger("orders")
+
+
+@dataclass(frozen=True)
+class Rada:
+    """
+    Číselná řada – klíč čítače v tabulce CitacCisel a funkce, která vrátí poslední číslo
+    použité v datech. Ta slouží k založení čítače a k jeho srovnání po ruční změně čísel.
+    """
+    klic: str
+    posledni_v_datech: Callable[[], int]
+
+
+def rada_beden(zakaznik):
+    """Čísla beden zákazníka – navazují na nejvyšší číslo bedny zákazníka, jinak na jeho číselnou řadu."""
+    def posledni():
+        posledni_cislo = (
+            Bedna.objects
+            .filter(zakazka__kamion_prijem__zakaznik_id=zakaznik.pk)
+            .aggregate(max_cislo=Max('cislo_bedny'))
+            .get('max_cislo')
+        )
+        return posledni_cislo or zakaznik.ciselna_rada
+    return Rada(klic=f"bedna:{zakaznik.pk}", posledni_v_datech=posledni)
+
+
+def rada_kamionu(zakaznik_id, prijem_vydej, rok):
+    """Pořadová čísla kamionů zákazníka pro typ kamionu (příjem/výdej) a rok."""
+    def posledni():
+        return (
+            Kamion.objects
+            .filter(zakaznik_id=zakaznik_id, prijem_vydej=prijem_vydej, datum__year=rok)
+            .aggregate(max_cislo=Max('poradove_cislo'))
+            .get('max_cislo')
+        ) or 0
+    return Rada(klic=f"kamion:{zakaznik_id}:{prijem_vydej}:{rok}", posledni_v_datech=posledni)
+
+
+def rada_sarzi():
+    """Globální čísla šarží."""
+    def posledni():
+        return Sarze.objects.aggregate(max_cislo=Max('cislo_sarze')).get('max_cislo') or 0
+    return Rada(klic="sarze", posledni_v_datech=posledni)
+
+
+def rada_kroku(sarze_id):
+    """Pořadí kroků v rámci šarže."""
+    def posledni():
+        return (
+            SarzeKrok.objects
+            .filter(sarze_id=sarze_id)
+            .aggregate(max_poradi=Max('poradi'))
+            .get('max_poradi')
+        ) or 0
+    return Rada(klic=f"sarze_krok:{sarze_id}", posledni_v_datech=posledni)
+
+
+def _zvys(klic, pocet):
+    """
+    Atomicky zvýší čítač o `pocet` jedním příkazem UPDATE … RETURNING a vrátí novou hodnotu,
+    nebo None, pokud čítač neexistuje. Zámek řádku čítače drží databáze do konce transakce.
+    """
+    ops = connection.ops
+    tabulka = ops.quote_name(CitacCisel._meta.db_table)
+    hodnota = ops.quote_name('hodnota')
+    klic_sloupec = ops.quote_name('klic')
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {tabulka} SET {hodnota} = {hodnota} + %s WHERE {klic_sloupec} = %s RETURNING {hodnota}",
+                [pocet, klic],
+            )
+            radek = cursor.fetchone()
+        return radek[0] if radek else None
+
+    # Databáze bez RETURNING – zvýšení a čtení ve stejné transakci pod zámkem řádku.
+    with transaction.atomic():
+        citac = CitacCisel.objects.select_for_update().filter(klic=klic).first()
+        if citac is None:
+            return None
+        citac.hodnota += pocet
+        citac.save(update_fields=['hodnota'])
+        return citac.hodnota
+
+
+def rezervuj(rada, pocet=1):
+    """
+    Rezervuje `pocet` po sobě jdoucích čísel řady a vrátí je jako range.
+    Chybějící čítač se založí z posledního čísla v datech. Rezervace je součástí aktuální
+    transakce – při jejím zrušení se čítač vrátí zpět a čísla se nevyplýtvají.
+    """
+    if pocet < 1:
+        raise ServiceValidationError("Počet rezervovaných čísel musí být alespoň 1.")
+
+    posledni = _zvys(rada.klic, pocet)
+    if posledni is None:
+        CitacCisel.objects.bulk_create(
+            [CitacCisel(klic=rada.klic, hodnota=rada.posledni_v_datech())],
+            ignore_conflicts=True,
+        )
+        posledni = _zvys(rada.klic, pocet)
+    return range(posledni - pocet + 1, posledni + 1)
+
+
+def dalsi_cislo(rada):
+    """Vrátí další číslo řady."""
+    return rezervuj(rada, 1)[0]
+
+
+def srovnej(rada):
+    """
+    Posune čítač alespoň na poslední číslo použité v datech (např. po ručním přečíslování),
+    aby další rezervace nekolidovaly. Vrací aktuální hodnotu čítače.
+    """
+    posledni = rada.posledni_v_datech()
+    with transaction.atomic():
+        citac, created = CitacCisel.objects.select_for_update().get_or_create(
+            klic=rada.klic, defaults={'hodnota': posledni},
+        )
+        if not created and citac.hodnota < posledni:
+            logger.warning(f"Čítač {rada.klic} ({citac.hodnota}) byl za daty ({posledni}), srovnávám.")
+            citac.hodnota = posledni
+            citac.save(update_fields=['hodnota'])
+    return citac.hodnota
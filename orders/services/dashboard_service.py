@@ -0,0 +1,157 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from ..choices import STAV_BEDNY_SKLADEM, RovnaniChoice, StavBednyChoice, TryskaniChoice
+from ..models import Bedna
+
+logger = logging.getLogger("orders")
+
+CELKEM = 'CELKEM'
+# Bedny přijaté před více dny se na přehledu počítají jako po exspiraci.
+DNY_DO_EXSPIRACE = 28
+
+_ZAKAZNIK = 'zakazka__kamion_prijem__zakaznik__zkraceny_nazev'
+
+
+@dataclass(frozen=True)
+class StavPrehledu:
+    """Řádek přehledu stavu beden – podmínka nad bednami, barva a úroveň odsazení."""
+    klic: str
+    podminka: Q
+    barva: str
+    uroven: int = 0
+    skupina: bool = False
+    # Počítají se jen bedny kompletních zakázek (všechny bedny zakázky jsou k expedici).
+    jen_kompletni: bool = False
+
+    @property
+    def label(self):
+        return self.klic
+
+
+@dataclass
+class BunkaPrehledu:
+    """Počet a hmotnost (t) beden jednoho zákazníka v jednom stavu, zvlášť i za kompletní zakázky."""
+    barva: str = ''
+    pocet: int = 0
+    hmotnost: Decimal = Decimal('0')
+    pocet_kompletni: int = 0
+    hmotnost_kompletni: Decimal = Decimal('0')
+
+    @property
+    def pocet_nekompletni(self):
+        return self.pocet - self.pocet_kompletni
+
+    @property
+    def hmotnost_nekompletni(self):
+        return self.hmotnost - self.hmotnost_kompletni
+
+
+@dataclass
+class PrehledBeden:
+    """
+    Přehled stavu neexpedovaných beden podle zákazníků pro dashboard beden.
+    `bunky[zakaznik][klic stavu]` je BunkaPrehledu, poslední zákazník je souhrnný řádek CELKEM.
+    """
+    stavy: list[StavPrehledu] = field(default_factory=list)
+    bunky: dict[str, dict[str, BunkaPrehledu]] = field(default_factory=dict)
+
+    @property
+    def zakaznici(self):
+        return list(self.bunky)
+
+
+def stavy_prehledu(dnes=None):
+    """Definice řádků přehledu stavu beden v pořadí, v jakém se zobrazují."""
+    dnes = dnes or timezone.now().date()
+    surove = [StavBednyChoice.PRIJATO, StavBednyChoice.K_NAVEZENI, StavBednyChoice.NAVEZENO, StavBednyChoice.DO_ZPRACOVANI]
+    zpracovane = [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO, StavBednyChoice.K_EXPEDICI]
+    ke_kontrole = Q(stav_bedny__in=[StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO])
+    return [
+        StavPrehledu('Nepřijaté', Q(stav_bedny=StavBednyChoice.NEPRIJATO), 'gray', 0, skupina=True),
+        StavPrehledu('Surové', Q(stav_bedny__in=surove), 'red', 0, skupina=True),
+        StavPrehledu('Přijaté', Q(stav_bedny=StavBednyChoice.PRIJATO), 'red', 1),
+        StavPrehledu('K navezení', Q(stav_bedny=StavBednyChoice.K_NAVEZENI), 'red', 1),
+        StavPrehledu('Navezené', Q(stav_bedny=StavBednyChoice.NAVEZENO), 'red', 1),
+        StavPrehledu('Ve zpracování', Q(stav_bedny=StavBednyChoice.DO_ZPRACOVANI), 'red', 1),
+        StavPrehledu('Zpracované', Q(stav_bedny__in=zpracovane), 'orange', 0, skupina=True),
+        StavPrehledu('Zakalené ke kontrole', Q(stav_bedny=StavBednyChoice.ZAKALENO), 'orange', 1),
+        StavPrehledu('K tryskání', Q(tryskat=TryskaniChoice.SPINAVA) & ke_kontrole, 'yellowgreen', 1),
+        StavPrehledu(
+            'K rovnání',
+            Q(rovnat__in=[RovnaniChoice.KRIVA, RovnaniChoice.KOULENI, RovnaniChoice.ROVNA_SE]) & ke_kontrole,
+            'blue', 1,
+        ),
+        StavPrehledu('Křivé', Q(rovnat=RovnaniChoice.KRIVA) & ke_kontrole, 'blue', 2),
+        StavPrehledu('Koulení', Q(rovnat=RovnaniChoice.KOULENI) & ke_kontrole, 'blue', 2),
+        StavPrehledu('Rovná se', Q(rovnat=RovnaniChoice.ROVNA_SE) & ke_kontrole, 'blue', 2),
+        StavPrehledu('K expedici', Q(stav_bedny=StavBednyChoice.K_EXPEDICI), 'green', 1),
+        StavPrehledu(
+            'K expedici po zakázkách', Q(stav_bedny=StavBednyChoice.K_EXPEDICI), 'green', 2, jen_kompletni=True,
+        ),
+        StavPrehledu(
+            'Po exspiraci',
+            Q(stav_bedny__in=STAV_BEDNY_SKLADEM,
+              zakazka__kamion_prijem__datum__lt=dnes - timedelta(days=DNY_DO_EXSPIRACE)),
+            '#ff66b3', 0,
+        ),
+    ]
+
+
+def prehled_beden(dnes=None):
+    """
+    Spočítá přehled stavu neexpedovaných beden podle zákazníků jedním seskupeným dotazem.
+
+    Bedny se seskupí podle zákazníka a příznaku kompletní zakázky (žádná bedna zakázky není
+    v jiném stavu než K expedici), každý stav přehledu je dvojice podmíněných agregací
+    Count/Sum s `filter=`. Souhrnný řádek CELKEM se dopočítá ze skupin v Pythonu.
+    Zobrazují se jen zákazníci s alespoň jednou neexpedovanou bednou.
+    """
+    stavy = stavy_prehledu(dnes)
+    agregace = {}
+    for index, stav in enumerate(stavy):
+        agregace[f'pocet_{index}'] = Count('id', filter=stav.podminka)
+        agregace[f'hmotnost_{index}'] = Sum('hmotnost', filter=stav.podminka)
+
+    nekompletni_bedny = Bedna.objects.filter(zakazka_id=OuterRef('zakazka_id')).exclude(
+        stav_bedny=StavBednyChoice.K_EXPEDICI,
+    )
+    skupiny = (
+        Bedna.objects.exclude(stav_bedny=StavBednyChoice.EXPEDOVANO)
+        .annotate(kompletni=~Exists(nekompletni_bedny))
+        .values(_ZAKAZNIK, 'kompletni')
+        .annotate(**agregace)
+        .order_by()
+    )
+
+    def prazdny_radek():
+        return {stav.klic: BunkaPrehledu(barva=stav.barva) for stav in stavy}
+
+    radky = {}
+    celkem = prazdny_radek()
+    for skupina in skupiny:
+        zakaznik = skupina[_ZAKAZNIK]
+        cilove = [celkem]
+        if zakaznik is not None:
+            cilove.append(radky.setdefault(zakaznik, prazdny_radek()))
+        for index, stav in enumerate(stavy):
+            if stav.jen_kompletni and not skupina['kompletni']:
+                continue
+            pocet = skupina[f'pocet_{index}']
+            tuny = (skupina[f'hmotnost_{index}'] or 0) / Decimal(1000)
+            for radek in cilove:
+                bunka = radek[stav.klic]
+                bunka.pocet += pocet
+                bunka.hmotnost += tuny
+                if skupina['kompletni']:
+                    bunka.pocet_kompletni += pocet
+                    bunka.hmotnost_kompletni += tuny
+
+    bunky = {zakaznik: radky[zakaznik] for zakaznik in sorted(radky)}
+    bunky[CELKEM] = celkem
+    return PrehledBeden(stavy=stavy, bunky=bunky)
@@ -8,6 +8,7 @@ from ..choices import StavBednyChoice, RovnaniChoice, TryskaniChoice, ZinkovaniC
 from ..models import Zakazka, Bedna, Kamion
 from .exceptions import ServiceValidationError
 from .logging_utils import resolve_actor_name, build_log_context
+from .souhrny_service import odlozene_souhrny
 
 logger = logging.getLogger("orders")
 
@@ -69,6 +70,7 @@ def _clone_zakazka_for_expedice(zakazka):
 
 
 @transaction.atomic
+@odlozene_souhrny()
 def expedice_zakazek_do_existujiciho_kamionu(*, zakazky_qs, kamion_vydej, actor=None):
     result = ExpediceResult()
     actor_name = resolve_actor_name(actor)
@@ -112,6 +114,7 @@ def expedice_zakazek_do_existujiciho_kamionu(*, zakazky_qs, kamion_vydej, actor=
 
 
 @transaction.atomic
+@odlozene_souhrny()
 def expedice_beden_do_existujiciho_kamionu(*, bedny_qs, kamion_vydej, actor=None):
     result = ExpediceResult()
     actor_name = resolve_actor_name(actor)
@@ -154,6 +157,7 @@ def expedice_beden_do_existujiciho_kamionu(*, bedny_qs, kamion_vydej, actor=None
 
 
 @transaction.atomic
+@odlozene_souhrny()
 def expedice_beden_do_noveho_kamionu(*, bedny_qs, zakaznici, odberatel, actor=None, today=None):
     if not bedny_qs.exists():
         raise ServiceValidationError("Není vybrána žádná bedna.")
@@ -184,6 +188,7 @@ def expedice_beden_do_noveho_kamionu(*, bedny_qs, zakaznici, odberatel, actor=No
 
 
 @transaction.atomic
+@odlozene_souhrny()
 def expedice_zakazek_do_noveho_kamionu(*, zakazky_qs, zakaznici, odberatel, actor=None, today=None):
     if not zakazky_qs.exists():
         raise ServiceValidationError("Není vybrána žádná zakázka.")
@@ -0,0 +1,235 @@
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..choices import KamionChoice, RovnaniChoice, TryskaniChoice
+from ..models import Bedna, Cena, Kamion, Zakazka
+
+logger = logging.getLogger("orders")
+
+NULA = Decimal('0.00')
+
+
+def _zaokrouhli(hodnota):
+    return Decimal(hodnota).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+@dataclass(frozen=True)
+class FakturaceBedny:
+    """Ceny jedné bedny kamionu výdej (EUR/kg a EUR/bedna) pro kalení, rovnání a tryskání."""
+    pozice: int
+    bedna: Bedna
+    zakazka: Zakazka
+    cena_za_kg: Decimal
+    cena_za_bednu: Decimal
+    cena_rovnani_za_kg: Decimal
+    cena_rovnani_za_bednu: Decimal
+    cena_tryskani_za_kg: Decimal
+    cena_tryskani_za_bednu: Decimal
+
+
+@dataclass
+class FakturaceZakazky:
+    """Ceny, počty a hmotnosti fakturovaných beden jedné zakázky kamionu výdej."""
+    zakazka: Zakazka
+    pocet_cen: int = 0
+    cena_za_kg: Decimal = NULA
+    cena_rovnani_za_kg: Decimal = NULA
+    cena_tryskani_za_kg: Decimal = NULA
+    cena_za_zakazku: Decimal = NULA
+    cena_rovnani_za_zakazku: Decimal = NULA
+    cena_tryskani_za_zakazku: Decimal = NULA
+    pocet_beden_fakturovanych: int = 0
+    celkova_hmotnost_fakturovanych: Decimal = Decimal('0.0')
+    pocet_vyrovnanych_beden: int = 0
+    hmotnost_vyrovnanych_beden: Decimal = Decimal('0.0')
+    pocet_otryskanych_beden: int = 0
+    hmotnost_otryskanych_beden: Decimal = Decimal('0.0')
+    bedny: list[FakturaceBedny] = field(default_factory=list)
+
+
+@dataclass
+class FakturaceKamionu:
+    """
+    Výsledek výpočtu fakturace kamionu výdej – ceny po bednách, po zakázkách a za celý kamion.
+    Používají ho šablony proforma faktury, validace cen před tiskem a cenové property kamionu.
+    """
+    kamion: Kamion
+    zakazky: list[FakturaceZakazky] = field(default_factory=list)
+    cena_za_kamion_vydej: Decimal = NULA
+    cena_rovnani_za_kamion_vydej: Decimal = NULA
+    cena_tryskani_za_kamion_vydej: Decimal = NULA
+
+    @property
+    def bedny(self):
+        """Všechny bedny kamionu v pořadí zakázek s průběžným číslem pozice."""
+        return [bedna for zakazka in self.zakazky for bedna in zakazka.bedny]
+
+    @property
+    def pocet_beden_fakturovanych(self):
+        return sum(z.pocet_beden_fakturovanych for z in self.zakazky)
+
+    @property
+    def celkova_hmotnost_fakturovanych(self):
+        return sum((z.celkova_hmotnost_fakturovanych for z in self.zakazky), Decimal('0.0'))
+
+    @property
+    def pocet_vyrovnanych_beden(self):
+        return sum(z.pocet_vyrovnanych_beden for z in self.zakazky)
+
+    @property
+    def hmotnost_vyrovnanych_beden(self):
+        return sum((z.hmotnost_vyrovnanych_beden for z in self.zakazky), Decimal('0.0'))
+
+    @property
+    def pocet_otryskanych_beden(self):
+        return sum(z.pocet_otryskanych_beden for z in self.zakazky)
+
+    @property
+    def hmotnost_otryskanych_beden(self):
+        return sum((z.hmotnost_otryskanych_beden for z in self.zakazky), Decimal('0.0'))
+
+    def zakazka(self, zakazka_id):
+        """Vrátí fakturaci zakázky podle id, nebo None."""
+        return next((z for z in self.zakazky if z.zakazka.pk == zakazka_id), None)
+
+
+def _cenik_subquery(sloupec):
+    """Subquery na sloupec ceníku pro zákazníka, předpis a délkový interval <delka_min, delka_max) zakázky."""
+    return Subquery(
+        Cena.objects.filter(
+            zakaznik=OuterRef('kamion_prijem__zakaznik'),
+            predpis=OuterRef('predpis'),
+            delka_min__lte=OuterRef('delka'),
+            delka_max__gt=OuterRef('delka'),
+        ).order_by('pk').values(sloupec)[:1],
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def annotate_ceny_zakazek(zakazky_qs):
+    """
+    Doplní do querysetu zakázek počet nalezených cen (pocet_cen_ann) a ceny za kg z ceníku
+    (cena_za_kg_ann, cena_rovnani_za_kg_ann, cena_tryskani_za_kg_ann) – vše v jednom dotazu.
+    """
+    pocet_cen = Subquery(
+        Cena.objects.filter(
+            zakaznik=OuterRef('kamion_prijem__zakaznik'),
+            predpis=OuterRef('predpis'),
+            delka_min__lte=OuterRef('delka'),
+            delka_max__gt=OuterRef('delka'),
+        ).order_by().values('zakaznik').annotate(pocet=Count('pk')).values('pocet')[:1],
+        output_field=IntegerField(),
+    )
+    return zakazky_qs.annotate(
+        pocet_cen_ann=Coalesce(pocet_cen, Value(0)),
+        cena_za_kg_ann=_cenik_subquery('cena_za_kg'),
+        cena_rovnani_za_kg_ann=_cenik_subquery('cena_rovnani_za_kg'),
+        cena_tryskani_za_kg_ann=_cenik_subquery('cena_tryskani_za_kg'),
+    )
+
+
+def _ceny_zakazky(zakazka):
+    """
+    Vrátí ceny za kg zakázky z anotací se stejnými pravidly jako property zakázky:
+    bez předpisu, zákazníka nebo při více nalezených cenách je cena 0,
+    rovnání a tryskání se počítá jen zákazníkům s příslušným příznakem fakturace.
+    """
+    zakaznik = zakazka.kamion_prijem.zakaznik if zakazka.kamion_prijem_id else None
+    if not zakazka.predpis_id or not zakaznik:
+        return NULA, NULA, NULA
+    if zakazka.pocet_cen_ann > 1:
+        logger.warning(
+            f"Nalezeno více cen pro zakázku {zakazka.pk} "
+            f"(predpis={zakazka.predpis_id}, delka={zakazka.delka}, zakaznik={zakaznik.pk})"
+        )
+    if zakazka.pocet_cen_ann != 1:
+        return NULA, NULA, NULA
+
+    cena_za_kg = zakazka.cena_za_kg_ann or NULA
+    cena_rovnani = (zakazka.cena_rovnani_za_kg_ann or NULA) if zakaznik.fakturovat_rovnani else NULA
+    cena_tryskani = (zakazka.cena_tryskani_za_kg_ann or NULA) if zakaznik.fakturovat_tryskani else NULA
+    return cena_za_kg, cena_rovnani, cena_tryskani
+
+
+def build_fakturace_kamionu(kamion):
+    """
+    Spočítá fakturaci kamionu výdej dvěma dotazy (zakázky s cenami připojenými z ceníku podle délky
+    a bedny kamionu) místo dotazu do ceníku pro každou bednu.
+    Zaokrouhlení odpovídá property modelů: cena bedny se zaokrouhlí na 2 desetinná místa,
+    ceny zakázek a kamionu jsou součty zaokrouhlených cen fakturovaných beden.
+    Pro kamion příjem vrací prázdný výsledek s nulovými cenami.
+    """
+    fakturace = FakturaceKamionu(kamion=kamion)
+    if kamion.pk is None or kamion.prijem_vydej != KamionChoice.VYDEJ:
+        return fakturace
+
+    zakazky = annotate_ceny_zakazek(
+        kamion.zakazky_vydej.select_related('kamion_prijem__zakaznik', 'predpis', 'typ_hlavy').order_by('id')
+    )
+    fakturace_zakazek = {}
+    for zakazka in zakazky:
+        cena_za_kg, cena_rovnani, cena_tryskani = _ceny_zakazky(zakazka)
+        fakturace_zakazek[zakazka.pk] = FakturaceZakazky(
+            zakazka=zakazka,
+            pocet_cen=zakazka.pocet_cen_ann,
+            cena_za_kg=cena_za_kg,
+            cena_rovnani_za_kg=cena_rovnani,
+            cena_tryskani_za_kg=cena_tryskani,
+        )
+    fakturace.zakazky = list(fakturace_zakazek.values())
+
+    bedny = Bedna.objects.filter(zakazka__kamion_vydej=kamion).order_by('zakazka_id', 'id')
+    pozice = 0
+    for bedna in bedny:
+        zakazka_fakturace = fakturace_zakazek[bedna.zakazka_id]
+        bedna.zakazka = zakazka_fakturace.zakazka
+        pozice += 1
+
+        vyrovnana = bedna.rovnat == RovnaniChoice.VYROVNANA
+        otryskana = bedna.tryskat == TryskaniChoice.OTRYSKANA
+        cena_za_kg = zakazka_fakturace.cena_za_kg
+        cena_rovnani_za_kg = zakazka_fakturace.cena_rovnani_za_kg if vyrovnana else NULA
+        cena_tryskani_za_kg = zakazka_fakturace.cena_tryskani_za_kg if otryskana else NULA
+
+        if bedna.fakturovat and bedna.hmotnost:
+            cena_za_bednu = _zaokrouhli(cena_za_kg * bedna.hmotnost)
+            cena_rovnani_za_bednu = _zaokrouhli(cena_rovnani_za_kg * bedna.hmotnost)
+            cena_tryskani_za_bednu = _zaokrouhli(cena_tryskani_za_kg * bedna.hmotnost)
+        else:
+            cena_za_bednu = cena_rovnani_za_bednu = cena_tryskani_za_bednu = NULA
+
+        zakazka_fakturace.bedny.append(FakturaceBedny(
+            pozice=pozice,
+            bedna=bedna,
+            zakazka=zakazka_fakturace.zakazka,
+            cena_za_kg=cena_za_kg,
+            cena_za_bednu=cena_za_bednu,
+            cena_rovnani_za_kg=cena_rovnani_za_kg,
+            cena_rovnani_za_bednu=cena_rovnani_za_bednu,
+            cena_tryskani_za_kg=cena_tryskani_za_kg,
+            cena_tryskani_za_bednu=cena_tryskani_za_bednu,
+        ))
+
+        if not bedna.fakturovat:
+            continue
+        hmotnost = bedna.hmotnost or Decimal('0.0')
+        zakazka_fakturace.cena_za_zakazku += cena_za_bednu
+        zakazka_fakturace.cena_rovnani_za_zakazku += cena_rovnani_za_bednu
+        zakazka_fakturace.cena_tryskani_za_zakazku += cena_tryskani_za_bednu
+        zakazka_fakturace.pocet_beden_fakturovanych += 1
+        zakazka_fakturace.celkova_hmotnost_fakturovanych += hmotnost
+        if vyrovnana:
+            zakazka_fakturace.pocet_vyrovnanych_beden += 1
+            zakazka_fakturace.hmotnost_vyrovnanych_beden += hmotnost
+        if otryskana:
+            zakazka_fakturace.pocet_otryskanych_beden += 1
+            zakazka_fakturace.hmotnost_otryskanych_beden += hmotnost
+
+    fakturace.cena_za_kamion_vydej = _zaokrouhli(sum((z.cena_za_zakazku for z in fakturace.zakazky), NULA))
+    fakturace.cena_rovnani_za_kamion_vydej = _zaokrouhli(sum((z.cena_rovnani_za_zakazku for z in fakturace.zakazky), NULA))
+    fakturace.cena_tryskani_za_kamion_vydej = _zaokrouhli(sum((z.cena_tryskani_za_zakazku for z in fakturace.zakazky), NULA))
+    return fakturace
@@ -0,0 +1,177 @@
+"""
+Roční historie výroby nad kumulativními součty.
+
+Denní hodnoty roku (výkon a cena zboží z prvního použití beden, počet roštů, prostoj a pracovní dny
+po zařízeních, výkon a podíl roštů po zákaznících) se jednou načtou seskupenými dotazy nad denními
+souhrny výroby (services.souhrny_vyroby_service) do polí NumPy a převedou na kumulativní součty. Součet libovolného rozsahu dní (rok, měsíc, týden, den) je pak
+rozdíl dvou prvků nezávisle na délce rozsahu.
+
+Hodnoty se ukládají jako celá čísla v pevné řádové čárce (viz MERITKA), takže součty kg a cen
+odpovídají součtům Decimal bez zaokrouhlovacích chyb.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.db.models import Sum
+
+from ..choices import TypZarizeniChoice
+from ..models import SouhrnVyrobyZakaznika, SouhrnVyrobyZarizeni, Zarizeni
+
+logger = logging.getLogger("orders")
+
+CELKEM = 'CELKEM'
+BEZ_ZAKAZNIKA = '-'
+
+# Veličiny řad a počet desetinných míst, na které se ukládají.
+KG = 'kg'
+CENA = 'cena'
+ROSTY = 'rosty'
+PROSTOJ = 'prostoj'
+PRACOVNI_DNY = 'pracovni_dny'
+PODIL_ROSTU = 'podil_rostu'
+MERITKA = {KG: 1, CENA: 4, ROSTY: 0, PROSTOJ: 0, PRACOVNI_DNY: 0, PODIL_ROSTU: 12}
+
+
+def vyrobni_zarizeni():
+    """Zařízení, pro která se počítá historie výroby (víceúčelové pece), seřazená podle kódu."""
+    return list(Zarizeni.objects.filter(typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA).order_by('kod_zarizeni'))
+
+
+class RocniRady:
+    """
+    Denní řady jednoho roku klíčované (veličina, klíč) – klíčem je kód zařízení, zákazník nebo CELKEM.
+    Hodnoty se přidávají metodou `pridej`, po `uzavri` se z nich stanou kumulativní součty
+    a `soucet` vrací součet za rozsah dní včetně obou mezí.
+    """
+
+    def __init__(self, rok):
+        self.rok = rok
+        self.od = date(rok, 1, 1)
+        self.do = date(rok, 12, 31)
+        self.pocet_dni = (self.do - self.od).days + 1
+        self._pridane = defaultdict(lambda: ([], []))
+        self._kumulace = {}
+
+    def klice(self, velicina):
+        return sorted(klic for vel, klic in self._kumulace if vel == velicina)
+
+    def pridej(self, velicina, klic, den, hodnota):
+        if hodnota is None or not self.od <= den <= self.do:
+            return
+        meritko = MERITKA[velicina]
+        if meritko:
+            hodnota = (Decimal(hodnota).scaleb(meritko)).to_integral_value(rounding=ROUND_HALF_UP)
+        indexy, hodnoty = self._pridane[(velicina, klic)]
+        indexy.append((den - self.od).days)
+        hodnoty.append(int(hodnota))
+
+    def uzavri(self):
+        for rada, (indexy, hodnoty) in self._pridane.items():
+            denni = np.zeros(self.pocet_dni, dtype=np.int64)
+            np.add.at(denni, np.asarray(indexy, dtype=np.intp), np.asarray(hodnoty, dtype=np.int64))
+            self._kumulace[rada] = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(denni)))
+        self._pridane.clear()
+        return self
+
+    def soucet(self, velicina, klic, od, do):
+        """Součet řady za dny `od`–`do` (včetně); mimo rok nebo pro prázdný rozsah je 0."""
+        meritko = MERITKA[velicina]
+        nula = Decimal('0') if meritko else 0
+        kumulace = self._kumulace.get((velicina, klic))
+        if kumulace is None or not od or not do or do < od:
+            return nula
+        zacatek = max((od - self.od).days, 0)
+        konec = min((do - self.od).days + 1, self.pocet_dni)
+        if konec <= zacatek:
+            return nula
+        hodnota = int(kumulace[konec] - kumulace[zacatek])
+        return Decimal(hodnota).scaleb(-meritko) if meritko else hodnota
+
+
+def historie_vyroby(rok, kody_zarizeni):
+    """
+    Načte denní řady výroby roku `rok` pro zařízení `kody_zarizeni` dvěma dotazy nad denními souhrny výroby:
+    - KG (první použití beden), PROSTOJ (minuty nad toleranci prodlevy) a PRACOVNI_DNY po zařízeních,
+      KG, PRACOVNI_DNY a ROSTY (počet kroků s bednami) za všechna zařízení (CELKEM),
+    - CENA po zařízeních (cena zboží z prvního použití podle ceníku zákazníka) a CELKEM.
+    """
+    rady = RocniRady(rok)
+    souhrny = SouhrnVyrobyZarizeni.objects.filter(
+        datum__gte=rady.od, datum__lte=rady.do, zarizeni__kod_zarizeni__in=list(kody_zarizeni),
+    )
+
+    pracovni_dny = set()
+    radky = (
+        souhrny
+        .values('datum', 'zarizeni__kod_zarizeni')
+        .annotate(
+            kg=Sum('kg_prvni_pouziti'), rosty=Sum('pocet_kroku_vruty'),
+            prostoj=Sum('prostoj_minut'), kroku=Sum('pocet_kroku'),
+        )
+        .order_by()
+    )
+    for radek in radky:
+        den, kod = radek['datum'], radek['zarizeni__kod_zarizeni']
+        if radek['kg']:
+            rady.pridej(KG, kod, den, radek['kg'])
+            rady.pridej(KG, CELKEM, den, radek['kg'])
+        rady.pridej(ROSTY, CELKEM, den, radek['rosty'])
+        rady.pridej(PROSTOJ, kod, den, radek['prostoj'])
+        if radek['kroku']:
+            pracovni_dny.add((kod, den))
+            pracovni_dny.add((CELKEM, den))
+    for kod, den in pracovni_dny:
+        rady.pridej(PRACOVNI_DNY, kod, den, 1)
+
+    ceny = (
+        SouhrnVyrobyZakaznika.objects
+        .filter(datum__gte=rady.od, datum__lte=rady.do, zarizeni__kod_zarizeni__in=list(kody_zarizeni), kg_prvni_pouziti__gt=0)
+        .values('datum', 'zarizeni__kod_zarizeni')
+        .annotate(cena=Sum('cena_prvni_pouziti'))
+        .order_by()
+    )
+    for radek in ceny:
+        rady.pridej(CENA, radek['zarizeni__kod_zarizeni'], radek['datum'], radek['cena'])
+        rady.pridej(CENA, CELKEM, radek['datum'], radek['cena'])
+
+    return rady.uzavri()
+
+
+def vyuziti_zakazniku(rok, kody_zarizeni):
+    """
+    Načte denní řady využití roštů podle zákazníků roku `rok` na zařízeních `kody_zarizeni` dvěma dotazy
+    nad denními souhrny výroby: KG po zákaznících (první použití beden) a CELKEM, PODIL_ROSTU po zákaznících
+    (podíl procent z pater zákazníka na kroku) a ROSTY – počet kroků s bednami (CELKEM). Zákazník bez jména je '-'.
+    """
+    rady = RocniRady(rok)
+    kody_zarizeni = list(kody_zarizeni)
+
+    radky = (
+        SouhrnVyrobyZakaznika.objects
+        .filter(datum__gte=rady.od, datum__lte=rady.do, zarizeni__kod_zarizeni__in=kody_zarizeni)
+        .values('datum', 'zakaznik__zkraceny_nazev')
+        .annotate(kg=Sum('kg_prvni_pouziti'), podil=Sum('podil_rostu'))
+        .order_by()
+    )
+    for radek in radky:
+        zakaznik = radek['zakaznik__zkraceny_nazev'] or BEZ_ZAKAZNIKA
+        if radek['kg']:
+            rady.pridej(KG, zakaznik, radek['datum'], radek['kg'])
+            rady.pridej(KG, CELKEM, radek['datum'], radek['kg'])
+        if radek['podil']:
+            rady.pridej(PODIL_ROSTU, zakaznik, radek['datum'], radek['podil'])
+
+    rosty = (
+        SouhrnVyrobyZarizeni.objects
+        .filter(datum__gte=rady.od, datum__lte=rady.do, zarizeni__kod_zarizeni__in=kody_zarizeni)
+        .values('datum')
+        .annotate(pocet=Sum('pocet_kroku_vruty'))
+        .order_by()
+    )
+    for radek in rosty:
+        rady.pridej(ROSTY, CELKEM, radek['datum'], radek['pocet'])
+
+    return rady.uzavri()
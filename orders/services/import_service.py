@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import pickle
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history
+
+from ..choices import StavBednyChoice, TryskaniChoice
+from ..models import Bedna, Zakazka
+from .barcode_service import predgeneruj_po_commitu
+from .cislovani_service import rada_beden, rezervuj
+from .souhrny_service import prepocitej_souhrny
+
+logger = logging.getLogger("orders")
+
+DAVKA = 500
+
+IMPORT_TMP_DIR = "tmp/imports"
+# Jak dlouho se drží nahraný soubor a rozparsovaný náhled mezi náhledem a potvrzením importu.
+IMPORT_TTL = getattr(settings, 'IMPORT_SESSION_TTL', timedelta(hours=6))
+
+
+@dataclass
+class ParsovanyImport:
+    """Výsledek parse_excel uložený mezi náhledem a potvrzením importu."""
+    token: str
+    file_hash: str
+    df: pd.DataFrame
+    preview: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+    required_fields: list = field(default_factory=list)
+
+
+@dataclass
+class VysledekImportu:
+    """Počty zakázek a beden založených importem."""
+    pocet_zakazek: int = 0
+    pocet_beden: int = 0
+
+
+def zkontroluj_povinna_pole(df, required_fields):
+    """
+    Ověří povinná pole ve všech řádcích najednou ještě před zápisem do databáze.
+    Vyvolá ValueError se stejnou hláškou jako původní import po jednotlivých řádcích.
+    """
+    for field in required_fields:
+        if field not in df.columns or df[field].isna().any():
+            logger.error(f"Chyba: Povinné pole '{field}' nesmí být prázdné.")
+            raise ValueError(f"Chyba: Povinné pole '{field}' nesmí být prázdné.")
+
+
+def importuj_zakazky(df, kamion, strategy, warnings, required_fields=None, user=None, prubeh=None):
+    """
+    Uloží zakázky a bedny z dataframe připraveného strategií importu hromadně.
+    - Povinná pole se ověří pro celý soubor předem, mapování řádků zůstává na strategii
+      (map_row_to_zakazka_kwargs/map_row_to_bedna_kwargs) včetně jejích chyb a varování.
+      Řádky se mapují po dávkách DAVKA, `prubeh(zpracovano_radku)` se zavolá po každé dávce.
+    - Zakázky a bedny se sestaví v paměti, čísla beden se rezervují jednou pro celý import
+      a vše se zapíše přes bulk_create včetně historických záznamů.
+    - Souhrny beden zakázek a kamionu se přepočítají jednou na konci.
+    Vše proběhne v jedné transakci, při chybě se nic neuloží.
+    """
+    if not required_fields:
+        required_fields = strategy.get_required_fields()
+    zkontroluj_povinna_pole(df, required_fields)
+
+    zakazky_cache = {}
+    radky_beden = []
+    for zacatek in range(0, len(df), DAVKA):
+        for row in df.iloc[zacatek:zacatek + DAVKA].to_dict('records'):
+            cache_key = strategy.get_cache_key(row)
+            if cache_key not in zakazky_cache:
+                zakazka_kwargs = strategy.map_row_to_zakazka_kwargs(row, kamion, warnings)
+                zakazky_cache[cache_key] = Zakazka(**zakazka_kwargs)
+            radky_beden.append((cache_key, strategy.map_row_to_bedna_kwargs(row)))
+        if prubeh:
+            prubeh(len(radky_beden))
+
+    if not radky_beden:
+        return VysledekImportu()
+
+    zakaznik = kamion.zakaznik
+    with transaction.atomic():
+        zakazky = bulk_create_with_history(
+            list(zakazky_cache.values()), Zakazka, batch_size=DAVKA, default_user=user,
+        )
+
+        cisla = rezervuj(rada_beden(zakaznik), len(radky_beden))
+        bedny = []
+        for cislo_bedny, (cache_key, bedna_kwargs) in zip(cisla, radky_beden):
+            zakazka = zakazky_cache[cache_key]
+            bedna = Bedna(zakazka=zakazka, cislo_bedny=cislo_bedny, **bedna_kwargs)
+            # Stejná pravidla jako Bedna.save() pro novou bednu.
+            if bedna.stav_bedny not in (StavBednyChoice.K_NAVEZENI, StavBednyChoice.NAVEZENO):
+                bedna.pozice = None
+            if zakaznik.vse_tryskat and zakazka.delka and zakazka.delka < 900:
+                bedna.tryskat = TryskaniChoice.SPINAVA
+            bedny.append(bedna)
+        bulk_create_with_history(bedny, Bedna, batch_size=DAVKA, default_user=user)
+        # Čárové kódy nových beden se vygenerují po potvrzení importu, tisk karet je jen načte.
+        predgeneruj_po_commitu(cisla)
+
+        prepocitej_souhrny(zakazka_ids=[z.pk for z in zakazky], kamion_ids=[kamion.pk])
+
+    logger.info(
+        f"Import do kamionu {kamion}: založeno {len(zakazky)} zakázek a {len(bedny)} beden "
+        f"(čísla {cisla.start}–{cisla.stop - 1})."
+    )
+    return VysledekImportu(pocet_zakazek=len(zakazky), pocet_beden=len(bedny))
+
+
+# --- Úložiště rozparsovaných importů mezi náhledem a potvrzením ---
+
+def hash_souboru(soubor):
+    """SHA-256 obsahu nahraného souboru (čte se po blocích)."""
+    h = hashlib.sha256()
+    for blok in soubor.chunks():
+        h.update(blok)
+    return h.hexdigest()
+
+
+def cesta_parsovaneho_importu(token, file_hash):
+    """Cesta artefaktu v default_storage – klíčem je token importu a hash souboru."""
+    return f"{IMPORT_TMP_DIR}/{token}-{file_hash[:16]}.pkl"
+
+
+def uloz_parsovany_import(parsovany):
+    """
+    Uloží rozparsovaný a zvalidovaný dataframe s náhledem, aby potvrzení importu nemuselo
+    znovu číst Excel. Artefakt je pickle v soukromém dočasném úložišti, zapisuje ho jen server.
+    Vrací cestu artefaktu.
+    """
+    cesta = cesta_parsovaneho_importu(parsovany.token, parsovany.file_hash)
+    if default_storage.exists(cesta):
+        default_storage.delete(cesta)
+    default_storage.save(cesta, ContentFile(pickle.dumps(parsovany, protocol=pickle.HIGHEST_PROTOCOL)))
+    return cesta
+
+
+def nacti_parsovany_import(token, file_hash):
+    """
+    Vrátí uložený ParsovanyImport pro token a hash souboru, nebo None, pokud chybí, vypršel
+    nebo nepatří k danému souboru – potvrzení pak soubor rozparsuje znovu.
+    """
+    if not token or not file_hash:
+        return None
+    cesta = cesta_parsovaneho_importu(token, file_hash)
+    try:
+        if not default_storage.exists(cesta):
+            return None
+        if default_storage.get_modified_time(cesta) < timezone.now() - IMPORT_TTL:
+            return None
+        with default_storage.open(cesta, 'rb') as soubor:
+            parsovany = pickle.load(soubor)
+    except Exception:
+        logger.warning(f"Nepodařilo se načíst rozparsovaný import {cesta}, soubor se načte znovu.", exc_info=True)
+        return None
+    if not isinstance(parsovany, ParsovanyImport) or parsovany.token != token or parsovany.file_hash != file_hash:
+        logger.warning(f"Rozparsovaný import {cesta} nepatří k importu {token}, soubor se načte znovu.")
+        return None
+    return parsovany
+
+
+def smaz_import(token, info):
+    """Smaže nahraný soubor a rozparsovaný artefakt importu podle záznamu v session."""
+    cesty = [info.get('path')]
+    if info.get('hash'):
+        cesty.append(cesta_parsovaneho_importu(token, info['hash']))
+    for cesta in cesty:
+        if not cesta:
+            continue
+        try:
+            default_storage.delete(cesta)
+        except Exception:
+            logger.warning(f"Nepodařilo se smazat dočasný importní soubor {cesta}.", exc_info=True)
+
+
+def vyrad_prosle_importy(tmp_map, ted=None):
+    """
+    Odebere z mapy importů v session záznamy starší než IMPORT_TTL a smaže jejich soubory.
+    Záznamy bez času vytvoření (ze starší verze) se ponechají. Vrací počet vyřazených tokenů.
+    """
+    ted = ted or timezone.now()
+    prosle = []
+    for token, info in tmp_map.items():
+        vytvoreno = info.get('vytvoreno')
+        if vytvoreno and ted - datetime.fromisoformat(vytvoreno) > IMPORT_TTL:
+            prosle.append(token)
+    for token in prosle:
+        smaz_import(token, tmp_map.pop(token))
+    return len(prosle)
+
+
+def uklid_importy(max_stari=None, ted=None):
+    """
+    Smaže z dočasného úložiště importů všechny soubory starší než `max_stari` (výchozí IMPORT_TTL),
+    tedy i soubory opuštěných náhledů, které už žádná session neuklidí. Vrací počet smazaných souborů.
+    """
+    hranice = (ted or timezone.now()) - (max_stari or IMPORT_TTL)
+    try:
+        _, soubory = default_storage.listdir(IMPORT_TMP_DIR)
+    except (FileNotFoundError, NotImplementedError):
+        return 0
+    smazano = 0
+    for nazev in soubory:
+        cesta = f"{IMPORT_TMP_DIR}/{nazev}"
+        try:
+            if default_storage.get_modified_time(cesta) < hranice:
+                default_storage.delete(cesta)
+                smazano += 1
+        except Exception:
+            logger.warning(f"Nepodařilo se uklidit dočasný importní soubor {cesta}.", exc_info=True)
+    if smazano:
+        logger.info(f"Uklizeno {smazano} prošlých dočasných importních souborů.")
+    return smazano
@@ -0,0 +1,117 @@
+"""
+Pořadí zakázek v pozicích pro přehled beden k navezení (PoziceZakazkaOrder).
+
+Pořadí se srovnává při zápisech, které mění dvojice (pozice, zakázka) beden ve stavu K_NAVEZENI –
+uložení bedny (Bedna.save), hromadné akce a přesuny zakázek mezi pozicemi. Přehled a jeho PDF
+pořadí jen čtou.
+"""
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from ..choices import StavBednyChoice
+from ..models import Bedna, Pozice, PoziceZakazkaOrder
+
+logger = logging.getLogger("orders")
+
+_odlozene_pozice = contextvars.ContextVar("navezeni_odlozene_pozice", default=None)
+
+
+def srovnej_poradi_navezeni(pozice_ids):
+    """
+    Srovná pořadí zakázek v pozicích `pozice_ids` s bednami K_NAVEZENI několika hromadnými dotazy:
+    smaže pořadí zakázek, které v pozici už nemají bednu k navezení, přečísluje zbývající od 1
+    bez mezer a nové zakázky přidá na konec pozice (podle id zakázky). Poznámky a příznak
+    'Následně?' zachovaných zakázek se nemění. Vrací počet změněných záznamů pořadí.
+    """
+    pozice_ids = sorted({pk for pk in pozice_ids if pk})
+    if not pozice_ids:
+        return 0
+
+    with transaction.atomic():
+        # Zámek pozic serializuje souběžné srovnání stejných pozic.
+        list(Pozice.objects.select_for_update().filter(pk__in=pozice_ids).order_by('pk').values_list('pk', flat=True))
+
+        aktivni = {}
+        for pozice_id, zakazka_id in (
+            Bedna.objects
+            .filter(stav_bedny=StavBednyChoice.K_NAVEZENI, pozice_id__in=pozice_ids, zakazka__isnull=False)
+            .values_list('pozice_id', 'zakazka_id')
+            .distinct()
+            .order_by('pozice_id', 'zakazka_id')
+        ):
+            aktivni.setdefault(pozice_id, []).append(zakazka_id)
+
+        poradi = list(PoziceZakazkaOrder.objects.filter(pozice_id__in=pozice_ids).order_by('pozice_id', 'poradi', 'pk'))
+        # Pořadí je v pozici unikátní – přečíslované záznamy se nejdřív posunou za nejvyšší použité číslo.
+        posun = max((order.poradi for order in poradi), default=0) + 1
+        zastarale = {order.pk for order in poradi if order.zakazka_id not in aktivni.get(order.pozice_id, ())}
+        if zastarale:
+            PoziceZakazkaOrder.objects.filter(pk__in=zastarale).delete()
+
+        ponechane = {}
+        for order in poradi:
+            if order.pk not in zastarale:
+                ponechane.setdefault(order.pozice_id, []).append(order)
+
+        zmenene = []
+        nove = []
+        for pozice_id in pozice_ids:
+            seznam = ponechane.get(pozice_id, [])
+            for idx, order in enumerate(seznam, start=1):
+                if order.poradi != idx:
+                    order.poradi = idx
+                    zmenene.append(order)
+            existujici = {order.zakazka_id for order in seznam}
+            for zakazka_id in aktivni.get(pozice_id, ()):
+                if zakazka_id not in existujici:
+                    nove.append(PoziceZakazkaOrder(
+                        pozice_id=pozice_id, zakazka_id=zakazka_id, poradi=len(seznam) + 1, poznamka_k_navezeni=None,
+                    ))
+                    seznam.append(nove[-1])
+
+        if zmenene:
+            PoziceZakazkaOrder.objects.filter(pk__in=[order.pk for order in zmenene]).update(poradi=F('poradi') + posun)
+            PoziceZakazkaOrder.objects.bulk_update(zmenene, ['poradi'], batch_size=500)
+        if nove:
+            PoziceZakazkaOrder.objects.bulk_create(nove, batch_size=500)
+
+    return len(zastarale) + len(zmenene) + len(nove)
+
+
+def oznac_zmenu_navezeni(pozice_ids):
+    """
+    Zaznamená změnu beden k navezení v pozicích. Uvnitř `odlozene_poradi_navezeni()` se srovnání
+    odloží na konec bloku, jinak proběhne hned v aktuální transakci.
+    """
+    pozice_ids = {pk for pk in pozice_ids if pk}
+    if not pozice_ids:
+        return
+    odlozene = _odlozene_pozice.get()
+    if odlozene is not None:
+        odlozene.update(pozice_ids)
+        return
+    srovnej_poradi_navezeni(pozice_ids)
+
+
+@contextmanager
+def odlozene_poradi_navezeni():
+    """
+    Sloučí srovnání pořadí uvnitř bloku (např. označení více beden k navezení) do jednoho srovnání
+    na jeho konci. Při výjimce se srovnání neprovede – transakce se stejně vrací zpět.
+    """
+    if _odlozene_pozice.get() is not None:
+        yield
+        return
+
+    odlozene = set()
+    token = _odlozene_pozice.set(odlozene)
+    try:
+        yield
+    finally:
+        _odlozene_pozice.reset(token)
+    srovnej_poradi_navezeni(odlozene)
+
@@ -0,0 +1,192 @@
+"""
+Cache vygenerovaných PDF dokladů kamionu (dodací list, proforma faktura, protokol výdeje) na lokálním disku.
+
+Klíč PDF tvoří šablona, kamion, varianta dokladu (např. jméno tisknoucího uživatele) a otisk obsahu
+kamionu – poslední id historie kamionu, jeho zakázek a beden, složení zakázek a beden, hodnoty polí
+beden měněných hromadně, čas přepočtu souhrnů a poslední změny ceníku a číselníků. Dokud se nic
+nezmění, opakovaný tisk vrátí bajtově stejné PDF bez výpočtu cen a vykreslení. Po změně vznikne nový klíč a staré PDF časem vytlačí
+limit velikosti cache (nejdéle nepoužité soubory se mažou jako první).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Count, Max, Sum
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+from ..choices import KamionChoice
+from ..models import Bedna, Cena, Kamion, Odberatel, Predpis, SouhrnKamionu, SouhrnZakazky, TypHlavy, Zakaznik, Zakazka
+
+logger = logging.getLogger("orders")
+
+# Pole beden, která akce a pohledy mění hromadně přes QuerySet.update() – bez záznamu historie
+# a u zinkování i bez přepočtu souhrnů. Jejich hodnoty jsou přímo součástí otisku kamionu.
+POLE_HROMADNYCH_ZMEN_BEDEN = ('stav_bedny', 'zinkovat', 'pozice_id')
+
+
+def _adresar():
+    return Path(getattr(settings, 'PDF_CACHE_DIR', Path(settings.BASE_DIR) / 'pdf_cache'))
+
+
+def _limit():
+    return getattr(settings, 'PDF_CACHE_MAX_MB', 200) * 1024 * 1024
+
+
+def _posledni_historie(model, **filtry):
+    # Čas záznamu odliší i stejná id historie v jiné (např. obnovené nebo testovací) databázi.
+    posledni = model.history.filter(**filtry).aggregate(id=Max('history_id'), cas=Max('history_date'))
+    return posledni['id'], posledni['cas']
+
+
+def _cas_souboru(cesta):
+    try:
+        return os.stat(cesta).st_mtime_ns if cesta else None
+    except OSError:
+        return None
+
+
+def otisk_kamionu(kamion):
+    """
+    Otisk obsahu kamionu pro klíč cache. Změní se při každé uložené změně kamionu, jeho zakázek
+    a beden (i hromadné změně stavu, zinkování nebo pozice beden přes QuerySet.update()), při přidání
+    nebo odebrání zakázky či bedny a při změně ceníku, předpisů, typů hlav, zákazníka nebo odběratele.
+    """
+    if kamion.prijem_vydej == KamionChoice.VYDEJ:
+        zakazky = Zakazka.objects.filter(kamion_vydej_id=kamion.pk)
+    else:
+        zakazky = Zakazka.objects.filter(kamion_prijem_id=kamion.pk)
+    zakazky_ids = zakazky.values('pk')
+    bedny = Bedna.objects.filter(zakazka_id__in=zakazky_ids)
+
+    slozeni_zakazek = zakazky.aggregate(pocet=Count('pk'), soucet=Sum('pk'))
+    slozeni_beden = bedny.aggregate(pocet=Count('pk'), soucet=Sum('pk'))
+    casti = [
+        kamion.pk,
+        _posledni_historie(Kamion, id=kamion.pk),
+        slozeni_zakazek['pocet'], slozeni_zakazek['soucet'],
+        _posledni_historie(Zakazka, id__in=zakazky_ids),
+        slozeni_beden['pocet'], slozeni_beden['soucet'],
+        _posledni_historie(Bedna, id__in=bedny.values('pk')),
+        tuple(bedny.order_by('pk').values_list('pk', *POLE_HROMADNYCH_ZMEN_BEDEN)),
+        SouhrnKamionu.objects.filter(kamion_id=kamion.pk).aggregate(cas=Max('aktualizovano'))['cas'],
+        SouhrnZakazky.objects.filter(zakazka_id__in=zakazky_ids).aggregate(cas=Max('aktualizovano'))['cas'],
+        _posledni_historie(Zakaznik, id=kamion.zakaznik_id),
+        _posledni_historie(Odberatel, id=kamion.odberatel_id),
+        _posledni_historie(Cena),
+        _posledni_historie(Predpis),
+        _posledni_historie(TypHlavy),
+    ]
+    return hashlib.sha256(repr(casti).encode('utf-8')).hexdigest()
+
+
+def _soubor_sablony(sablona):
+    try:
+        return getattr(get_template(sablona).origin, 'name', None)
+    except TemplateDoesNotExist:
+        # Chybějící šablonu nahlásí až vykreslení dokladu.
+        return None
+
+
+def klic_pdf(sablona, kamion, varianta=()):
+    """Klíč PDF v cache – šablona (včetně času její úpravy), sdílené CSS, kamion, varianta a otisk kamionu."""
+    casti = [
+        sablona,
+        _cas_souboru(_soubor_sablony(sablona)),
+        _cas_souboru(finders.find('orders/css/pdf_shared.css')),
+        kamion.pk,
+        tuple(varianta),
+        otisk_kamionu(kamion),
+    ]
+    return hashlib.sha256(repr(casti).encode('utf-8')).hexdigest()
+
+
+def _cesta(klic):
+    return _adresar() / klic[:2] / f"{klic}.pdf"
+
+
+def nacti_pdf(klic):
+    """Vrátí PDF z cache, nebo None. Čas úpravy souboru slouží jako čas posledního použití pro LRU."""
+    cesta = _cesta(klic)
+    try:
+        obsah = cesta.read_bytes()
+        os.utime(cesta)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        logger.warning(f"PDF cache: soubor {cesta} nelze načíst.", exc_info=True)
+        return None
+    return obsah
+
+
+def uloz_pdf(klic, obsah):
+    """Uloží PDF do cache (atomicky přes dočasný soubor) a vynutí limit velikosti cache."""
+    cesta = _cesta(klic)
+    try:
+        cesta.parent.mkdir(parents=True, exist_ok=True)
+        fd, docasna = tempfile.mkstemp(dir=cesta.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as soubor:
+            soubor.write(obsah)
+        os.replace(docasna, cesta)
+    except OSError:
+        logger.warning(f"PDF cache: soubor {cesta} nelze uložit.", exc_info=True)
+        return
+    vynut_limit()
+
+
+def _soubory_cache():
+    soubory = []
+    for cesta in _adresar().glob('*/*.pdf'):
+        try:
+            stat = cesta.stat()
+        except FileNotFoundError:
+            continue
+        soubory.append((stat.st_mtime_ns, stat.st_size, cesta))
+    return soubory
+
+
+def vynut_limit(limit=None):
+    """Smaže nejdéle nepoužitá PDF, dokud cache nepřekračuje `limit` bajtů (výchozí PDF_CACHE_MAX_MB). Vrací počet smazaných."""
+    limit = _limit() if limit is None else limit
+    soubory = _soubory_cache()
+    velikost = sum(size for _cas, size, _cesta in soubory)
+    smazano = 0
+    for _cas, size, cesta in sorted(soubory):
+        if velikost <= limit:
+            break
+        try:
+            cesta.unlink()
+        except FileNotFoundError:
+            pass
+        velikost -= size
+        smazano += 1
+    if smazano:
+        logger.info(f"PDF cache: smazáno {smazano} nejdéle nepoužitých PDF kvůli limitu velikosti.")
+    return smazano
+
+
+def vycisti_pdf_cache():
+    """Smaže celou cache PDF. Vrací počet smazaných souborů."""
+    return vynut_limit(limit=0)
+
+
+def pdf_kamionu(sablona, kamion, vyrob, varianta=()):
+    """
+    Vrátí PDF dokladu kamionu z cache, při chybějícím nebo neaktuálním záznamu ho vytvoří funkcí `vyrob`
+    (vrací obsah PDF) a uloží. `varianta` rozlišuje výstupy téže šablony, např. jméno tisknoucího uživatele.
+    Při PDF_CACHE_MAX_MB = 0 je cache vypnutá.
+    """
+    if not _limit():
+        return vyrob()
+    klic = klic_pdf(sablona, kamion, varianta)
+    obsah = nacti_pdf(klic)
+    if obsah is not None:
+        logger.debug(f"PDF cache: {sablona} pro kamion {kamion.pk} vrácen z cache.")
+        return obsah
+    obsah = vyrob()
+    uloz_pdf(klic, obsah)
+    return obsah
@@ -1,15 +1,21 @@
-import gc
+import io
 import logging
+from itertools import islice
 
+from django.conf import settings
+from django.contrib.staticfiles import finders
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils import timezone
-from weasyprint import HTML
+from pypdf import PdfReader, PdfWriter
 
 from .exceptions import ServiceValidationError
+from .pdf_render_service import vyrendruj_pdf
 
 logger = logging.getLogger("orders")
 
+ODDELOVAC_STRAN = '<p style="page-break-after: always"></p>'
+
 
 def validate_cards_input(*, bedny_qs, template_paths, require_single_customer=True):
     errors = []
@@ -46,28 +52,84 @@ def build_context_for_bedna(
     generated_at,
     user_display_name,
     # barcode_base_url=None,
+    pdf_styl_sdileny=False,
 ):
     return {
         "bedna": bedna,
         "generated_at": generated_at,
         "user_last_name": user_display_name,
+        # Sdílené styly karet dostane WeasyPrint jako soubor, šablona je pak nevkládá ke každé kartě.
+        "pdf_styl_sdileny": pdf_styl_sdileny,
         # Dočasně vypnuto společně s QR kódem v šabloně
         # orders/karta_bedny/_bedna_identification_codes.html.
         # "barcode_base_url": barcode_base_url,
     }
 
 
-def render_pages(*, bedny_qs, template_paths, context_builder):
+def _bedny_k_tisku(bedny_qs):
+    """
+    Bedny pro tisk karet. Pořadí bedny v zakázce, počet beden zakázky a příznak měření SSH se načtou
+    přes with_poradi(), šablony se tak nedotazují pro každou bednu.
+    """
+    return bedny_qs.with_poradi().select_related(
+        'zakazka__kamion_prijem__zakaznik',
+        'zakazka__predpis',
+        'zakazka__typ_hlavy',
+    )
+
+
+def _html_beden(bedny, template_paths, context_builder):
     html_parts = []
-    for bedna in bedny_qs:
+    for bedna in bedny:
         context = context_builder(bedna)
         for template_path in template_paths:
             html_parts.append(render_to_string(template_path, context))
-            html_parts.append('<p style="page-break-after: always"></p>')
+            html_parts.append(ODDELOVAC_STRAN)
     return "".join(html_parts)
 
 
-def build_cards_pdf(*, bedny_qs, template_paths, filename, request=None, generated_at=None, user_display_name=""):
+def render_pages(*, bedny_qs, template_paths, context_builder):
+    """Vyrendruje šablony pro všechny bedny do jednoho HTML."""
+    return _html_beden(_bedny_k_tisku(bedny_qs), template_paths, context_builder)
+
+
+def render_pages_po_davkach(*, bedny_qs, template_paths, context_builder, velikost_davky):
+    """
+    Vyrendruje šablony po dávkách `velikost_davky` beden a vrací dvojice (HTML dávky, počet beden v dávce).
+    Bedny se načítají průběžně, v paměti je vždy jen jedna dávka.
+    """
+    bedny = _bedny_k_tisku(bedny_qs).iterator(chunk_size=velikost_davky)
+    while davka := list(islice(bedny, velikost_davky)):
+        yield _html_beden(davka, template_paths, context_builder), len(davka)
+
+
+def spoj_pdf(pdf_soubory):
+    """
+    Spojí PDF dávek (iterovatelné obsahy PDF) do jednoho PDF. Dávky se čtou postupně, takže naráz
+    je rozpracované jen jedno vykreslení. Jediné PDF se vrací beze změny.
+    """
+    pdf_soubory = iter(pdf_soubory)
+    prvni = next(pdf_soubory)
+    druhy = next(pdf_soubory, None)
+    if druhy is None:
+        return prvni
+
+    writer = PdfWriter()
+    for obsah in (prvni, druhy, *pdf_soubory):
+        writer.append(PdfReader(io.BytesIO(obsah)))
+    # Písma a obrázky se opakují v každé dávce, ve výsledném PDF stačí jednou.
+    writer.compress_identical_objects()
+    vystup = io.BytesIO()
+    writer.write(vystup)
+    return vystup.getvalue()
+
+
+def build_cards_pdf(*, bedny_qs, template_paths, filename, request=None, generated_at=None, user_display_name="", base_url=None, prubeh=None):
+    """
+    PDF karet pro vybrané bedny. Karty se vykreslují po dávkách PDF_KARTY_DAVKA beden do samostatných
+    dokumentů WeasyPrintu, které se průběžně spojí, takže paměť vykreslení nezávisí na počtu beden.
+    Volitelný `prubeh` dostává po každé dávce počet vytištěných beden.
+    """
     errors = validate_cards_input(
         bedny_qs=bedny_qs,
         template_paths=template_paths,
@@ -76,7 +138,6 @@ def build_cards_pdf(*, bedny_qs, template_paths, filename, request=None, generat
     if errors:
         raise ServiceValidationError("; ".join(errors))
 
-    gc.collect()
     generated_at = generated_at or timezone.now()
 
     if not user_display_name and request and hasattr(request, "user") and request.user.is_authenticated:
@@ -90,7 +151,12 @@ def build_cards_pdf(*, bedny_qs, template_paths, filename, request=None, generat
     # orders/karta_bedny/_bedna_identification_codes.html.
     # barcode_base_url = request.build_absolute_uri("/") if request else None
 
-    html_string = render_pages(
+    if request:
+        base_url = request.build_absolute_uri("/")
+    css_path = finders.find('orders/css/pdf_shared.css')
+    css_soubory = [css_path] if css_path else []
+
+    davky = render_pages_po_davkach(
         bedny_qs=bedny_qs,
         template_paths=template_paths,
         context_builder=lambda bedna: build_context_for_bedna(
@@ -98,15 +164,27 @@ def build_cards_pdf(*, bedny_qs, template_paths, filename, request=None, generat
             generated_at,
             user_display_name,
             # barcode_base_url,
+            pdf_styl_sdileny=bool(css_path),
         ),
+        velikost_davky=max(1, getattr(settings, 'PDF_KARTY_DAVKA', 50)),
     )
-
-    base_url = request.build_absolute_uri("/") if request else None
-    pdf_file = HTML(string=html_string, base_url=base_url).write_pdf()
+    vytisteno = 0
+
+    def pdf_davek():
+        nonlocal vytisteno
+        for html_string, pocet in davky:
+            pdf_davky = vyrendruj_pdf(html_string, base_url=base_url, css_soubory=css_soubory)
+            del html_string
+            vytisteno += pocet
+            if prubeh:
+                prubeh(vytisteno)
+            yield pdf_davky
+
+    pdf_file = spoj_pdf(pdf_davek())
     response = HttpResponse(pdf_file, content_type="application/pdf")
     response["Content-Disposition"] = f"inline; filename={filename}"
 
     logger.info(
-        f"Vygenerována PDF dokumentace pro {bedny_qs.count()} beden ({len(template_paths)} šablon na bednu)."
+        f"Vygenerována PDF dokumentace pro {vytisteno} beden ({len(template_paths)} šablon na bednu)."
     )
     return response
@@ -0,0 +1,296 @@
+"""
+Vykreslování PDF WeasyPrintem přes pool dlouho žijících pracovních procesů.
+
+Všechny tisky PDF (karty beden, DL a proforma, protokoly, rozpracovanost, průvodky) volají
+`vyrendruj_pdf`. Souběžně se vykresluje nejvýše PDF_RENDER_PROCESU dokumentů, další tisky čekají
+ve frontě (nejvýše PDF_RENDER_FRONTA čekajících, každý nejdéle PDF_RENDER_CEKANI sekund)
+a vykreslení, které trvá déle než PDF_RENDER_TIMEOUT, se ukončí i s pracovním procesem.
+Limit platí pro jeden proces aplikace (worker gunicornu, `run_jobs`).
+Při PDF_RENDER_PROCESU = 0 se vykresluje přímo ve volajícím vlákně (vývoj, testy).
+"""
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+
+from .. import pdf_worker
+from .exceptions import ServiceOperationError
+
+logger = logging.getLogger("orders")
+
+
+@dataclass
+class MetrikyPdf:
+    """Souhrnné metriky tisků PDF od startu procesu aplikace."""
+    pocet: int = 0
+    chyby: int = 0
+    timeouty: int = 0
+    odmitnuto: int = 0
+    ve_fronte: int = 0
+    vykresluje_se: int = 0
+    cekani_celkem: float = 0.0
+    cekani_max: float = 0.0
+    render_celkem: float = 0.0
+    render_max: float = 0.0
+
+    def zaznamenej(self, cekani, render):
+        self.pocet += 1
+        self.cekani_celkem += cekani
+        self.cekani_max = max(self.cekani_max, cekani)
+        self.render_celkem += render
+        self.render_max = max(self.render_max, render)
+
+    def snapshot(self):
+        data = asdict(self)
+        data['cekani_prumer'] = self.cekani_celkem / self.pocet if self.pocet else 0.0
+        data['render_prumer'] = self.render_celkem / self.pocet if self.pocet else 0.0
+        return data
+
+
+class _PracovniProces:
+    """Jeden dlouho žijící proces s WeasyPrintem, komunikuje s rodičem přes Pipe."""
+
+    def __init__(self, kontext, funkce):
+        self.spojeni, detske_spojeni = kontext.Pipe()
+        self.proces = kontext.Process(
+            target=pdf_worker.smycka_procesu,
+            args=(detske_spojeni, funkce),
+            name='pdf-render',
+            daemon=True,
+        )
+        self.proces.start()
+        detske_spojeni.close()
+        self.uloh = 0
+
+    def spust(self, argumenty, timeout):
+        """Pošle úlohu procesu a počká na výsledek. Při překročení `timeout` vyhodí TimeoutError."""
+        self.uloh += 1
+        self.spojeni.send(argumenty)
+        if not self.spojeni.poll(timeout):
+            raise TimeoutError
+        return self.spojeni.recv()
+
+    def ukonci(self):
+        try:
+            self.spojeni.close()
+        finally:
+            if self.proces.is_alive():
+                self.proces.terminate()
+            self.proces.join(timeout=5)
+
+
+class RenderPool:
+    """
+    Pool pracovních procesů pro vykreslování PDF s omezenou souběžností a frontou.
+
+    Volné procesy drží ve frontě, tisk si jeden vypůjčí (nebo počká, až se uvolní) a po vykreslení
+    ho vrátí. Proces, který překročil timeout, spadl nebo už zpracoval `max_uloh` dokumentů,
+    se ukončí a místo něj se při další potřebě spustí nový.
+    """
+
+    def __init__(self, procesu=2, fronta=20, timeout=120, cekani=60, max_uloh=100,
+                 start_method='spawn', funkce=None):
+        self.procesu = procesu
+        self.fronta = fronta
+        self.timeout = timeout
+        self.cekani = cekani
+        self.max_uloh = max_uloh
+        self.funkce = funkce or pdf_worker.vyrendruj
+        self.metriky = MetrikyPdf()
+        self._kontext = multiprocessing.get_context(start_method) if procesu else None
+        self._volne = queue.LifoQueue()
+        self._spusteno = 0
+        self._zamek = threading.Lock()
+        self._inline = threading.BoundedSemaphore(1)
+
+    def _vypujc_proces(self):
+        """Vrátí volný proces, případně spustí nový. Když do `cekani` sekund žádný není, vrátí None."""
+        konec = time.monotonic() + self.cekani
+        while True:
+            try:
+                proces = self._volne.get_nowait()
+            except queue.Empty:
+                proces = None
+            if proces is not None:
+                return proces
+            with self._zamek:
+                if self._spusteno < self.procesu:
+                    self._spusteno += 1
+                    break
+            zbyva = konec - time.monotonic()
+            if zbyva <= 0:
+                return None
+            try:
+                proces = self._volne.get(timeout=zbyva)
+            except queue.Empty:
+                return None
+            if proces is not None:
+                return proces
+        try:
+            return _PracovniProces(self._kontext, self.funkce)
+        except Exception:
+            with self._zamek:
+                self._spusteno -= 1
+            raise
+
+    def _vrat_proces(self, proces, ukoncit=False):
+        if ukoncit or self.max_uloh and proces.uloh >= self.max_uloh:
+            proces.ukonci()
+            with self._zamek:
+                self._spusteno -= 1
+            # Místo pro nový proces mohl mezitím čekající tisk propásnout – probudí ho zařazený None.
+            self._volne.put(None)
+        else:
+            self._volne.put(proces)
+
+    def _zarad_do_fronty(self):
+        with self._zamek:
+            if self.metriky.ve_fronte >= self.fronta:
+                self.metriky.odmitnuto += 1
+                raise ServiceOperationError(
+                    "Tiskových požadavků je právě příliš mnoho, zkuste to prosím za chvíli znovu."
+                )
+            self.metriky.ve_fronte += 1
+
+    def _uvolni_z_fronty(self, cekani, vykresluje_se):
+        with self._zamek:
+            self.metriky.ve_fronte -= 1
+            self.metriky.vykresluje_se += vykresluje_se
+            if not vykresluje_se:
+                self.metriky.odmitnuto += 1
+        if not vykresluje_se:
+            raise ServiceOperationError(
+                f"Tisk PDF čekal ve frontě déle než {self.cekani} s, zkuste to prosím za chvíli znovu."
+            )
+
+    def spust(self, *argumenty, timeout=None):
+        """Spustí `funkce(*argumenty)` v pracovním procesu a vrátí (obsah, doba vykreslení)."""
+        timeout = timeout or self.timeout
+        self._zarad_do_fronty()
+        zacatek = time.perf_counter()
+
+        if not self.procesu:
+            ziskano = self._inline.acquire(timeout=self.cekani)
+            cekani = time.perf_counter() - zacatek
+            self._uvolni_z_fronty(cekani, ziskano)
+            try:
+                return self._dokonci(cekani, lambda: self.funkce(*argumenty))
+            finally:
+                self._inline.release()
+
+        try:
+            proces = self._vypujc_proces()
+        except Exception:
+            with self._zamek:
+                self.metriky.ve_fronte -= 1
+            raise
+        cekani = time.perf_counter() - zacatek
+        self._uvolni_z_fronty(cekani, proces is not None)
+
+        ukoncit = False
+        try:
+            return self._dokonci(cekani, lambda: self._vysledek_procesu(proces, argumenty, timeout))
+        except ServiceOperationError:
+            # Proces po timeoutu nebo pádu není použitelný, nahradí ho nový.
+            ukoncit = True
+            raise
+        finally:
+            self._vrat_proces(proces, ukoncit=ukoncit)
+
+    def _vysledek_procesu(self, proces, argumenty, timeout):
+        try:
+            uspech, vysledek = proces.spust(argumenty, timeout)
+        except TimeoutError:
+            with self._zamek:
+                self.metriky.timeouty += 1
+            raise ServiceOperationError(
+                f"Vykreslení PDF nebylo dokončeno do {timeout} s a bylo přerušeno."
+            ) from None
+        except (OSError, EOFError) as exc:
+            raise ServiceOperationError("Proces pro vykreslení PDF neočekávaně skončil.") from exc
+        if not uspech:
+            raise RuntimeError(f"Vykreslení PDF selhalo: {vysledek}")
+        return vysledek
+
+    def _dokonci(self, cekani, spust):
+        try:
+            obsah, render = spust()
+        except Exception:
+            with self._zamek:
+                self.metriky.chyby += 1
+            raise
+        finally:
+            with self._zamek:
+                self.metriky.vykresluje_se -= 1
+        with self._zamek:
+            self.metriky.zaznamenej(cekani, render)
+        logger.debug(f"PDF vykresleno za {render:.2f} s, ve frontě čekalo {cekani:.2f} s.")
+        return obsah, render
+
+    def snapshot(self):
+        with self._zamek:
+            return self.metriky.snapshot()
+
+    def zavri(self):
+        """Ukončí všechny volné pracovní procesy."""
+        while True:
+            try:
+                proces = self._volne.get_nowait()
+            except queue.Empty:
+                break
+            if proces is not None:
+                proces.ukonci()
+                with self._zamek:
+                    self._spusteno -= 1
+
+
+_pool = None
+_pool_zamek = threading.Lock()
+
+
+def ziskej_pool():
+    """Pool procesu aplikace, vytvořený líně podle nastavení při prvním tisku."""
+    global _pool
+    with _pool_zamek:
+        if _pool is None:
+            _pool = RenderPool(
+                procesu=getattr(settings, 'PDF_RENDER_PROCESU', 2),
+                fronta=getattr(settings, 'PDF_RENDER_FRONTA', 20),
+                timeout=getattr(settings, 'PDF_RENDER_TIMEOUT', 120),
+                cekani=getattr(settings, 'PDF_RENDER_CEKANI', 60),
+                max_uloh=getattr(settings, 'PDF_RENDER_MAX_ULOH', 100),
+            )
+        return _pool
+
+
+def zavri_pool():
+    """Ukončí pracovní procesy poolu, další tisk vytvoří nový pool podle aktuálního nastavení."""
+    global _pool
+    with _pool_zamek:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.zavri()
+
+
+atexit.register(zavri_pool)
+
+
+def vyrendruj_pdf(html, *, base_url=None, css_soubory=(), timeout=None):
+    """
+    Vykreslí HTML do PDF v poolu pracovních procesů a vrátí obsah PDF.
+
+    Styly se předávají jako cesty k CSS souborům. Při plné frontě, dlouhém čekání ve frontě
+    nebo překročení timeoutu vyhodí ServiceOperationError, chyba WeasyPrintu se propaguje.
+    """
+    obsah, _render = ziskej_pool().spust(html, base_url, tuple(str(cesta) for cesta in css_soubory), timeout=timeout)
+    return obsah
+
+
+def metriky_pdf():
+    """Snapshot metrik tisků PDF tohoto procesu (počty, fronta, doby čekání a vykreslení)."""
+    return ziskej_pool().snapshot()
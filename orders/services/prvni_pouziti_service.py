@@ -0,0 +1,117 @@
+"""
+Uložený příznak prvního použití bedny na zařízení (SarzeKrokBedna.prvni_pouziti).
+
+Záznam bedny v kroku šarže je prvním použitím, pokud bedna na stejném zařízení neprošla žádným
+dřívějším krokem (podle data, začátku a pořadí kroku) a v rámci kroku jde o její první záznam
+(podle patra a id). Příznak udržují SarzeKrokBedna a SarzeKrok při uložení a smazání, ověření
+a přestavba je v příkazu `manage.py prvni_pouziti`.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from ..models import SarzeKrokBedna
+from .souhrny_vyroby_service import oznac_zmenu_vyroby
+
+logger = logging.getLogger("orders")
+
+DAVKA = 500
+
+_POLE = ('pk', 'bedna_id', 'krok_id', 'patro', 'krok__zarizeni_id', 'krok__datum', 'krok__zacatek', 'krok__poradi')
+
+
+def urci_prvni_pouziti(radky):
+    """
+    Z řádků záznamů beden (slovníky s klíči _POLE) vrátí množinu pk záznamů, které jsou prvním použitím.
+    Kroky se stejným datem, začátkem a pořadím na stejném zařízení jsou rovnocenné – první použití
+    může být v každém z nich. Kroky bez data se za dřívější použití nepočítají.
+    """
+    skupiny = defaultdict(list)
+    for radek in radky:
+        if radek['bedna_id'] is None or radek['krok__datum'] is None or radek['krok__zacatek'] is None:
+            continue
+        skupiny[(radek['bedna_id'], radek['krok__zarizeni_id'])].append(radek)
+
+    prvni = set()
+    for radky_skupiny in skupiny.values():
+        poradi_kroku = min((r['krok__datum'], r['krok__zacatek'], r['krok__poradi']) for r in radky_skupiny)
+        v_prvnich_krocich = defaultdict(list)
+        for radek in radky_skupiny:
+            if (radek['krok__datum'], radek['krok__zacatek'], radek['krok__poradi']) == poradi_kroku:
+                v_prvnich_krocich[radek['krok_id']].append(radek)
+        for radky_kroku in v_prvnich_krocich.values():
+            prvni.add(min(radky_kroku, key=lambda r: (r['patro'], r['pk']))['pk'])
+    return prvni
+
+
+def spocitej_prvni_pouziti(bedna_ids):
+    """
+    Spočítá příznaky všech záznamů zadaných beden.
+    Vrací (dict pk → (id bedny, uložený příznak), množina pk prvních použití).
+    """
+    radky = list(
+        SarzeKrokBedna.objects.filter(bedna_id__in=bedna_ids).order_by().values('prvni_pouziti', *_POLE)
+    )
+    ulozene = {radek['pk']: (radek['bedna_id'], radek['prvni_pouziti']) for radek in radky}
+    return ulozene, urci_prvni_pouziti(radky)
+
+
+def prepocitej_prvni_pouziti(bedna_ids):
+    """
+    Přepočítá a uloží příznak prvního použití všech záznamů zadaných beden. Zapisuje jen změněné
+    záznamy (bez historie – příznak je odvozená hodnota) a přepočítá souhrny výroby dní změněných
+    záznamů. Vrací dict pk → nový příznak.
+    """
+    bedna_ids = {pk for pk in bedna_ids if pk}
+    if not bedna_ids:
+        return {}
+
+    with transaction.atomic():
+        ulozene, prvni = spocitej_prvni_pouziti(bedna_ids)
+        zapnout = [pk for pk, (_bedna_id, priznak) in ulozene.items() if pk in prvni and not priznak]
+        vypnout = [pk for pk, (_bedna_id, priznak) in ulozene.items() if pk not in prvni and priznak]
+        if zapnout:
+            SarzeKrokBedna.objects.filter(pk__in=zapnout).update(prvni_pouziti=True)
+        if vypnout:
+            SarzeKrokBedna.objects.filter(pk__in=vypnout).update(prvni_pouziti=False)
+        if zapnout or vypnout:
+            oznac_zmenu_vyroby(
+                SarzeKrokBedna.objects.filter(pk__in=zapnout + vypnout)
+                .values_list('krok__datum', flat=True).distinct().order_by()
+            )
+    return {pk: pk in prvni for pk in ulozene}
+
+
+def _bedny_s_kroky():
+    return list(
+        SarzeKrokBedna.objects.exclude(bedna_id=None).order_by('bedna_id').values_list('bedna_id', flat=True).distinct()
+    )
+
+
+def zkontroluj_prvni_pouziti():
+    """Porovná uložené příznaky prvního použití se spočítanými. Vrací seřazená id beden s rozdílem."""
+    bedna_ids = _bedny_s_kroky()
+    rozdilne = []
+    for zacatek in range(0, len(bedna_ids), DAVKA):
+        davka = bedna_ids[zacatek:zacatek + DAVKA]
+        ulozene, prvni = spocitej_prvni_pouziti(davka)
+        rozdilne.extend(bedna_id for pk, (bedna_id, priznak) in ulozene.items() if priznak != (pk in prvni))
+    return sorted(set(rozdilne))
+
+
+def prestav_prvni_pouziti(bedna_ids=None):
+    """
+    Přepočítá příznaky prvního použití po dávkách beden. Bez parametru přestaví všechny
+    (i záznamy bez bedny, které příznak mít nesmí). Vrací počet přepočítaných beden.
+    """
+    if bedna_ids is None:
+        SarzeKrokBedna.objects.filter(bedna_id=None, prvni_pouziti=True).update(prvni_pouziti=False)
+        bedna_ids = _bedny_s_kroky()
+    bedna_ids = sorted(set(bedna_ids))
+
+    for zacatek in range(0, len(bedna_ids), DAVKA):
+        prepocitej_prvni_pouziti(bedna_ids[zacatek:zacatek + DAVKA])
+
+    logger.info(f"Přestaveny příznaky prvního použití pro {len(bedna_ids)} beden.")
+    return len(bedna_ids)
@@ -2,10 +2,10 @@ from django.conf import settings
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 import django.utils.timezone as timezone
-from weasyprint import HTML
 
 from ..choices import TypZarizeniChoice
 from ..models import SarzeKrok
+from .pdf_render_service import vyrendruj_pdf
 
 
 def get_tisk_pruvodky_vruty_krok(sarze):
@@ -56,7 +56,7 @@ def build_tisk_pruvodky_vruty_response(request, krok, filename):
         },
     )
     base_url = getattr(settings, 'WEASYPRINT_BASEURL', None) or request.build_absolute_uri('/')
-    pdf_bytes = HTML(string=html_string, base_url=base_url).write_pdf()
+    pdf_bytes = vyrendruj_pdf(html_string, base_url=base_url)
 
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="{filename}"'
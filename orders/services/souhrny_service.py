@@ -0,0 +1,324 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..choices import KamionChoice, StavBednyChoice, STAV_BEDNY_SKLADEM
+from ..models import Bedna, Kamion, SouhrnKamionu, SouhrnZakazky, Zakazka
+
+logger = logging.getLogger("orders")
+
+POCTY = (
+    'pocet_beden',
+    'pocet_beden_fakturovanych',
+    'pocet_beden_neprijatych',
+    'pocet_beden_skladem',
+    'pocet_beden_k_expedici',
+    'pocet_beden_expedovano',
+)
+HMOTNOSTI = (
+    'hmotnost',
+    'hmotnost_fakturovanych',
+    'tara',
+    'hmotnost_k_expedici_brutto',
+)
+POLE_SOUHRNU = POCTY + HMOTNOSTI
+
+DAVKA = 500
+
+_odlozene_zmeny = contextvars.ContextVar("souhrny_odlozene_zmeny", default=None)
+
+
+@dataclass
+class KontrolaSouhrnu:
+    """Výsledek ověření uložených souhrnů – id zakázek a kamionů s neaktuálním nebo chybějícím souhrnem."""
+    zakazky: list[int] = field(default_factory=list)
+    kamiony: list[int] = field(default_factory=list)
+
+    @property
+    def v_poradku(self):
+        return not self.zakazky and not self.kamiony
+
+
+def _agregace_beden():
+    """Agregace nad bednami pro všechna pole souhrnu (klíče s příponou _ann kvůli kolizi s poli bedny)."""
+    k_expedici = Q(stav_bedny=StavBednyChoice.K_EXPEDICI)
+    nula = Value(Decimal('0.0'))
+    brutto = DecimalField(max_digits=12, decimal_places=1)
+    return {
+        'pocet_beden_ann': Count('pk'),
+        'pocet_beden_fakturovanych_ann': Count('pk', filter=Q(fakturovat=True)),
+        'pocet_beden_neprijatych_ann': Count('pk', filter=Q(stav_bedny=StavBednyChoice.NEPRIJATO)),
+        'pocet_beden_skladem_ann': Count('pk', filter=Q(stav_bedny__in=STAV_BEDNY_SKLADEM)),
+        'pocet_beden_k_expedici_ann': Count('pk', filter=k_expedici),
+        'pocet_beden_expedovano_ann': Count('pk', filter=Q(stav_bedny=StavBednyChoice.EXPEDOVANO)),
+        'hmotnost_ann': Sum('hmotnost'),
+        'hmotnost_fakturovanych_ann': Sum('hmotnost', filter=Q(fakturovat=True)),
+        'tara_ann': Sum('tara'),
+        'hmotnost_k_expedici_brutto_ann': Sum(
+            Coalesce(F('hmotnost'), nula, output_field=brutto) + Coalesce(F('tara'), nula, output_field=brutto),
+            filter=k_expedici,
+            output_field=brutto,
+        ),
+    }
+
+
+def _normalizuj(hodnoty):
+    """Převede výsledek agregace na hodnoty polí souhrnu (None → 0, hmotnosti na 0.1 kg)."""
+    vysledek = {}
+    for pole in POCTY:
+        vysledek[pole] = hodnoty.get(pole) or 0
+    for pole in HMOTNOSTI:
+        vysledek[pole] = Decimal(hodnoty.get(pole) or 0).quantize(Decimal('0.1'))
+    return vysledek
+
+
+def _z_agregace(radek):
+    """Hodnoty polí souhrnu z řádku agregace beden."""
+    return _normalizuj({pole: radek[f'{pole}_ann'] for pole in POLE_SOUHRNU})
+
+
+def spocitej_souhrny_zakazek(zakazka_ids):
+    """Spočítá souhrny beden pro zadané zakázky jedním agregačním dotazem. Vrací dict id zakázky → hodnoty."""
+    zakazka_ids = list(zakazka_ids)
+    vysledek = {zakazka_id: _normalizuj({}) for zakazka_id in zakazka_ids}
+    radky = (
+        Bedna.objects.filter(zakazka_id__in=zakazka_ids)
+        .order_by()
+        .values('zakazka_id')
+        .annotate(**_agregace_beden())
+    )
+    for radek in radky:
+        vysledek[radek['zakazka_id']] = _z_agregace(radek)
+    return vysledek
+
+
+def spocitej_souhrny_kamionu(kamiony):
+    """
+    Spočítá souhrny beden kamionů. `kamiony` je dict id kamionu → prijem_vydej.
+    Kamion příjem sčítá bedny svých zakázek příjmu, kamion výdej bedny zakázek výdeje.
+    """
+    vysledek = {kamion_id: _normalizuj({}) for kamion_id in kamiony}
+    for typ, cesta in ((KamionChoice.PRIJEM, 'zakazka__kamion_prijem_id'), (KamionChoice.VYDEJ, 'zakazka__kamion_vydej_id')):
+        ids = [kamion_id for kamion_id, prijem_vydej in kamiony.items() if prijem_vydej == typ]
+        if not ids:
+            continue
+        radky = (
+            Bedna.objects.filter(**{f'{cesta}__in': ids})
+            .order_by()
+            .values(cesta)
+            .annotate(**_agregace_beden())
+        )
+        for radek in radky:
+            vysledek[radek[cesta]] = _z_agregace(radek)
+    return vysledek
+
+
+def _uloz_souhrny(model, klic, hodnoty):
+    """Založí chybějící řádky souhrnů, uzamkne je a přepíše spočítanými hodnotami."""
+    if not hodnoty:
+        return
+    ids = sorted(hodnoty)
+    model.objects.bulk_create([model(**{klic: pk}) for pk in ids], ignore_conflicts=True)
+    # Zámek řádků souhrnu serializuje souběžné přepočty stejné zakázky/kamionu.
+    list(model.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+    ted = timezone.now()
+    model.objects.bulk_update(
+        [model(**{klic: pk}, aktualizovano=ted, **hodnoty[pk]) for pk in ids],
+        POLE_SOUHRNU + ('aktualizovano',),
+        batch_size=DAVKA,
+    )
+
+
+def prepocitej_souhrny(*, zakazka_ids=(), kamion_ids=()):
+    """
+    Přepočítá a uloží souhrny zadaných zakázek a kamionů v jedné transakci.
+    Ke kamionům se automaticky přidají kamiony příjmu a výdeje přepočítaných zakázek.
+    """
+    zakazka_ids = {pk for pk in zakazka_ids if pk}
+    kamion_ids = {pk for pk in kamion_ids if pk}
+    if not zakazka_ids and not kamion_ids:
+        return
+
+    with transaction.atomic():
+        if zakazka_ids:
+            zakazky = Zakazka.objects.filter(pk__in=zakazka_ids).values_list('pk', 'kamion_prijem_id', 'kamion_vydej_id')
+            existujici = set()
+            for zakazka_id, kamion_prijem_id, kamion_vydej_id in zakazky:
+                existujici.add(zakazka_id)
+                kamion_ids.update(pk for pk in (kamion_prijem_id, kamion_vydej_id) if pk)
+            _uloz_souhrny(SouhrnZakazky, 'zakazka_id', spocitej_souhrny_zakazek(existujici))
+
+        if kamion_ids:
+            kamiony = dict(Kamion.objects.filter(pk__in=kamion_ids).values_list('pk', 'prijem_vydej'))
+            _uloz_souhrny(SouhrnKamionu, 'kamion_id', spocitej_souhrny_kamionu(kamiony))
+
+
+def _prispevek_bedny(hodnoty):
+    """
+    Příspěvek jedné bedny do polí souhrnu. `hodnoty` jsou Bedna._hodnoty_pro_souhrn() –
+    (zakazka_id, stav_bedny, hmotnost, tara, fakturovat).
+    """
+    _, stav_bedny, hmotnost, tara, fakturovat = hodnoty
+    hmotnost = Decimal(str(hmotnost or 0)).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+    tara = Decimal(str(tara or 0)).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+    k_expedici = stav_bedny == StavBednyChoice.K_EXPEDICI
+    return {
+        'pocet_beden': 1,
+        'pocet_beden_fakturovanych': int(bool(fakturovat)),
+        'pocet_beden_neprijatych': int(stav_bedny == StavBednyChoice.NEPRIJATO),
+        'pocet_beden_skladem': int(stav_bedny in STAV_BEDNY_SKLADEM),
+        'pocet_beden_k_expedici': int(k_expedici),
+        'pocet_beden_expedovano': int(stav_bedny == StavBednyChoice.EXPEDOVANO),
+        'hmotnost': hmotnost,
+        'hmotnost_fakturovanych': hmotnost if fakturovat else Decimal('0.0'),
+        'tara': tara,
+        'hmotnost_k_expedici_brutto': hmotnost + tara if k_expedici else Decimal('0.0'),
+    }
+
+
+def _pricti_souhrny(model, rozdily):
+    """
+    Přičte rozdíly {id: {pole: rozdíl}} k uloženým souhrnům jedním UPDATE na řádek.
+    Vrací id, jejichž řádek souhrnu ještě neexistuje.
+    """
+    chybejici = set()
+    ted = timezone.now()
+    for pk, rozdil in rozdily.items():
+        zmeny = {pole: F(pole) + hodnota for pole, hodnota in rozdil.items() if hodnota}
+        if not zmeny:
+            continue
+        if not model.objects.filter(pk=pk).update(**zmeny, aktualizovano=ted):
+            chybejici.add(pk)
+    return chybejici
+
+
+def zmen_souhrny_bedny(puvodni, nove):
+    """
+    Promítne změnu jedné bedny do souhrnů zakázek a kamionů přírůstkem místo přepočtu z beden.
+    `puvodni` a `nove` jsou Bedna._hodnoty_pro_souhrn() před a po změně (None pro novou, resp. smazanou
+    bednu). Od souhrnu původní zakázky a jejích kamionů se odečte původní příspěvek bedny, k nové
+    zakázce a jejím kamionům se přičte nový – jeden dotaz na zakázky a UPDATE s F() výrazy na každý
+    dotčený souhrn. Chybějící nebo nekonzistentní souhrn (záporný počet) se přepočítá z beden.
+    Uvnitř `odlozene_souhrny()` se zakázky jen zaznamenají k přepočtu na konci bloku.
+    """
+    zakazka_ids = {hodnoty[0] for hodnoty in (puvodni, nove) if hodnoty is not None and hodnoty[0]}
+    if _odlozene_zmeny.get() is not None:
+        oznac_zmenu_souhrnu(zakazka_ids=zakazka_ids)
+        return
+
+    rozdily_zakazek = {}
+    for hodnoty, znamenko in ((puvodni, -1), (nove, 1)):
+        if hodnoty is None or not hodnoty[0]:
+            continue
+        rozdil = rozdily_zakazek.setdefault(hodnoty[0], dict.fromkeys(POLE_SOUHRNU, 0))
+        for pole, hodnota in _prispevek_bedny(hodnoty).items():
+            rozdil[pole] += znamenko * hodnota
+
+    rozdily_kamionu = {}
+    for zakazka_id, kamion_prijem_id, kamion_vydej_id in (
+        Zakazka.objects.filter(pk__in=zakazka_ids).values_list('pk', 'kamion_prijem_id', 'kamion_vydej_id')
+    ):
+        for kamion_id in (kamion_prijem_id, kamion_vydej_id):
+            if not kamion_id:
+                continue
+            rozdil = rozdily_kamionu.setdefault(kamion_id, dict.fromkeys(POLE_SOUHRNU, 0))
+            for pole, hodnota in rozdily_zakazek[zakazka_id].items():
+                rozdil[pole] += hodnota
+
+    try:
+        with transaction.atomic():
+            chybejici_zakazky = _pricti_souhrny(SouhrnZakazky, rozdily_zakazek)
+            chybejici_kamiony = _pricti_souhrny(SouhrnKamionu, rozdily_kamionu)
+    except IntegrityError:
+        # Záporný počet – uložený souhrn nebyl aktuální, přepočítá se celý.
+        logger.warning(f"Souhrny zakázek {sorted(zakazka_ids)} nešlo upravit přírůstkem, přepočítají se z beden.")
+        prepocitej_souhrny(zakazka_ids=zakazka_ids)
+        return
+    if chybejici_zakazky or chybejici_kamiony:
+        prepocitej_souhrny(zakazka_ids=chybejici_zakazky, kamion_ids=chybejici_kamiony)
+
+
+def oznac_zmenu_souhrnu(*, zakazka_ids=(), kamion_ids=()):
+    """
+    Zaznamená změnu beden zakázek nebo zakázek kamionů. Uvnitř `odlozene_souhrny()` se přepočet
+    odloží na konec bloku, jinak proběhne hned v aktuální transakci.
+    """
+    odlozene = _odlozene_zmeny.get()
+    if odlozene is not None:
+        odlozene['zakazky'].update(pk for pk in zakazka_ids if pk)
+        odlozene['kamiony'].update(pk for pk in kamion_ids if pk)
+        return
+    prepocitej_souhrny(zakazka_ids=zakazka_ids, kamion_ids=kamion_ids)
+
+
+@contextmanager
+def odlozene_souhrny():
+    """
+    Sloučí přepočty souhrnů uvnitř bloku (např. expedice po jednotlivých bednách) do jednoho přepočtu
+    na jeho konci. Při výjimce se přepočet neprovede – transakce se stejně vrací zpět.
+    """
+    if _odlozene_zmeny.get() is not None:
+        yield
+        return
+
+    odlozene = {'zakazky': set(), 'kamiony': set()}
+    token = _odlozene_zmeny.set(odlozene)
+    try:
+        yield
+    finally:
+        _odlozene_zmeny.reset(token)
+    prepocitej_souhrny(zakazka_ids=odlozene['zakazky'], kamion_ids=odlozene['kamiony'])
+
+
+def _rozdilne(ulozene, spocitane):
+    """Vrátí id, jejichž uložený souhrn chybí nebo se liší od spočítaného."""
+    return sorted(
+        pk for pk, hodnoty in spocitane.items()
+        if pk not in ulozene or _normalizuj(ulozene[pk]) != hodnoty
+    )
+
+
+def zkontroluj_souhrny():
+    """Porovná uložené souhrny všech zakázek a kamionů s hodnotami spočítanými z beden."""
+    kontrola = KontrolaSouhrnu()
+
+    zakazka_ids = list(Zakazka.objects.order_by('pk').values_list('pk', flat=True))
+    for zacatek in range(0, len(zakazka_ids), DAVKA):
+        davka = zakazka_ids[zacatek:zacatek + DAVKA]
+        ulozene = {r['zakazka_id']: r for r in SouhrnZakazky.objects.filter(zakazka_id__in=davka).values('zakazka_id', *POLE_SOUHRNU)}
+        kontrola.zakazky.extend(_rozdilne(ulozene, spocitej_souhrny_zakazek(davka)))
+
+    kamiony = list(Kamion.objects.order_by('pk').values_list('pk', 'prijem_vydej'))
+    for zacatek in range(0, len(kamiony), DAVKA):
+        davka = dict(kamiony[zacatek:zacatek + DAVKA])
+        ulozene = {r['kamion_id']: r for r in SouhrnKamionu.objects.filter(kamion_id__in=davka).values('kamion_id', *POLE_SOUHRNU)}
+        kontrola.kamiony.extend(_rozdilne(ulozene, spocitej_souhrny_kamionu(davka)))
+
+    return kontrola
+
+
+def prestav_souhrny(*, zakazka_ids=None, kamion_ids=None):
+    """
+    Přestaví uložené souhrny po dávkách. Bez parametrů přestaví souhrny všech zakázek a kamionů.
+    Vrací počet přepočítaných zakázek a kamionů.
+    """
+    if zakazka_ids is None and kamion_ids is None:
+        zakazka_ids = Zakazka.objects.values_list('pk', flat=True)
+        kamion_ids = Kamion.objects.values_list('pk', flat=True)
+    zakazka_ids = sorted(set(zakazka_ids or ()))
+    kamion_ids = sorted(set(kamion_ids or ()))
+
+    for zacatek in range(0, len(zakazka_ids), DAVKA):
+        prepocitej_souhrny(zakazka_ids=zakazka_ids[zacatek:zacatek + DAVKA])
+    for zacatek in range(0, len(kamion_ids), DAVKA):
+        prepocitej_souhrny(kamion_ids=kamion_ids[zacatek:zacatek + DAVKA])
+
+    logger.info(f"Přestavěny souhrny beden: {len(zakazka_ids)} zakázek, {len(kamion_ids)} kamionů.")
+    return len(zakazka_ids), len(kamion_ids)
@@ -0,0 +1,365 @@
+"""
+Denní souhrny výroby (SouhrnVyrobyZarizeni, SouhrnVyrobyZakaznika).
+
+Dashboardy výroby a roční historie čtou jen tyto souhrny, takže cena stránky nezávisí na délce
+historie. Souhrn dne se přepočítá z kroků šarží a jejich beden při každé změně kroku, záznamu bedny
+v kroku, příznaku prvního použití nebo hmotnosti a zakázky bedny. Změna času kroku ovlivní prostoj
+následujících kroků na zařízení, proto se přepočítají i dny PRESAH_PRODLEVY po něm. Po změně ceníku
+se přepočítá cena prvního použití zákazníka. Ověření a přestavba je v příkazu `manage.py rebuild_rollups`.
+"""
+import contextvars
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Count, DecimalField, Exists, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..choices import TypZarizeniChoice
+from ..models import Cena, SarzeKrok, SarzeKrokBedna, SouhrnVyrobyZakaznika, SouhrnVyrobyZarizeni, Zarizeni
+from .vyroba_service import PRESAH_PRODLEVY, TOLERANCE_PRODLEVY, kroky_s_prodlevou, prodleva_minut, smena_kroku
+
+logger = logging.getLogger("orders")
+
+POLE_ZARIZENI = (
+    'pocet_kroku',
+    'pocet_kroku_vruty',
+    'pocet_kroku_zelezo',
+    'pocet_pater',
+    'pocet_beden',
+    'kg',
+    'kg_prvni_pouziti',
+    'doba_behu_minut',
+    'prostoj_minut',
+)
+POLE_ZAKAZNIKA = ('pocet_beden', 'kg', 'kg_prvni_pouziti', 'cena_prvni_pouziti', 'podil_rostu')
+DESETINNA_MISTA = {'kg': Decimal('0.1'), 'kg_prvni_pouziti': Decimal('0.1'), 'cena_prvni_pouziti': Decimal('0.001'), 'podil_rostu': Decimal('0.000001')}
+
+# Počet dní přestavovaných v jedné transakci příkazem rebuild_rollups.
+DAVKA_DNI = 31
+
+_odlozene_dny = contextvars.ContextVar("souhrny_vyroby_odlozene_dny", default=None)
+
+
+def _prazdne(pole):
+    return {nazev: Decimal('0') if nazev in DESETINNA_MISTA else 0 for nazev in pole}
+
+
+def _normalizuj(hodnoty, pole):
+    """Hodnoty souhrnu zaokrouhlené na desetinná místa polí modelu (None → 0)."""
+    vysledek = {}
+    for nazev in pole:
+        hodnota = hodnoty.get(nazev) or 0
+        vysledek[nazev] = Decimal(hodnota).quantize(DESETINNA_MISTA[nazev]) if nazev in DESETINNA_MISTA else int(hodnota)
+    return vysledek
+
+
+def _cena_bedny():
+    """Cena zboží bedny podle ceníku zákazníka (hmotnost × cena za kg předpisu a délky zakázky, jinak 0)."""
+    cena_za_kg = Cena.objects.filter(
+        zakaznik=OuterRef('bedna__zakazka__kamion_prijem__zakaznik'),
+        delka_min__lte=OuterRef('bedna__zakazka__delka'),
+        delka_max__gt=OuterRef('bedna__zakazka__delka'),
+        predpis=OuterRef('bedna__zakazka__predpis'),
+    ).values('cena_za_kg')[:1]
+    return ExpressionWrapper(
+        F('bedna__hmotnost') * Coalesce(
+            Subquery(cena_za_kg, output_field=DecimalField(max_digits=10, decimal_places=2)),
+            Value(Decimal('0.00')), output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        output_field=DecimalField(max_digits=15, decimal_places=3),
+    )
+
+
+def _prvni_pouziti_s_hmotnosti():
+    return Q(prvni_pouziti=True, bedna__hmotnost__gt=0)
+
+
+def _kroky(od, do):
+    pocet_pater = (
+        SarzeKrokBedna.objects
+        .filter(krok_id=OuterRef('pk'))
+        .order_by()
+        .values('krok_id')
+        .annotate(pocet=Count('patro', distinct=True))
+        .values('pocet')
+    )
+    return (
+        kroky_s_prodlevou(od, do)
+        .annotate(
+            ma_vruty=Exists(SarzeKrokBedna.objects.filter(krok_id=OuterRef('pk'), bedna__isnull=False)),
+            ma_zelezo=Exists(SarzeKrokBedna.objects.filter(
+                krok_id=OuterRef('pk'), bedna__isnull=True, popis_mimo_db__isnull=False,
+            )),
+            pocet_pater=Coalesce(Subquery(pocet_pater, output_field=IntegerField()), 0),
+        )
+        .order_by()
+        .values(
+            'datum', 'zacatek', 'datum_konce', 'konec', 'zarizeni_id', 'zarizeni__typ_zarizeni',
+            'ma_vruty', 'ma_zelezo', 'pocet_pater', 'predchozi_datum_konce', 'predchozi_konec',
+        )
+    )
+
+
+def _bedny_kroku(od, do):
+    """Záznamy beden kroků s datem `od`–`do` seskupené po krocích a zákaznících."""
+    prvni = _prvni_pouziti_s_hmotnosti()
+    return (
+        SarzeKrokBedna.objects
+        .filter(krok__datum__gte=od, krok__datum__lte=do, bedna__isnull=False)
+        .values('krok_id', 'krok__datum', 'krok__zacatek', 'krok__zarizeni_id', 'bedna__zakazka__kamion_prijem__zakaznik_id')
+        .annotate(
+            pocet_beden=Count('pk'),
+            kg=Sum('bedna__hmotnost'),
+            kg_prvni_pouziti=Sum('bedna__hmotnost', filter=prvni),
+            cena_prvni_pouziti=Sum(_cena_bedny(), filter=prvni),
+            procent=Sum('procent_z_patra'),
+        )
+        .order_by()
+    )
+
+
+def doba_behu_minut(datum, zacatek, datum_konce, konec):
+    """Doba běhu ukončeného kroku v minutách (stejně jako SarzeKrok.takt), jinak 0."""
+    if not datum or not zacatek or not datum_konce or not konec:
+        return 0
+    rozdil = datetime.combine(datum_konce, konec) - datetime.combine(datum, zacatek)
+    return max(int(rozdil.total_seconds() / 60), 0)
+
+
+def spocitej_souhrny_vyroby(dny):
+    """
+    Spočítá souhrny výroby zadaných dní z kroků šarží a jejich beden dvěma dotazy.
+    Vrací (dict (datum, den směny, směna, id zařízení) → hodnoty,
+    dict (datum, den směny, směna, id zařízení, id zákazníka) → hodnoty).
+    """
+    dny = set(dny)
+    zarizeni = defaultdict(lambda: _prazdne(POLE_ZARIZENI))
+    zakaznici = defaultdict(lambda: _prazdne(POLE_ZAKAZNIKA))
+    if not dny:
+        return {}, {}
+    od, do = min(dny), max(dny)
+
+    for krok in _kroky(od, do):
+        if krok['datum'] not in dny:
+            continue
+        souhrn = zarizeni[(krok['datum'], *smena_kroku(krok['datum'], krok['zacatek']), krok['zarizeni_id'])]
+        souhrn['pocet_kroku'] += 1
+        souhrn['pocet_kroku_vruty'] += int(krok['ma_vruty'])
+        souhrn['pocet_kroku_zelezo'] += int(krok['ma_zelezo'])
+        souhrn['pocet_pater'] += krok['pocet_pater']
+        souhrn['doba_behu_minut'] += doba_behu_minut(krok['datum'], krok['zacatek'], krok['datum_konce'], krok['konec'])
+        if krok['zarizeni__typ_zarizeni'] == TypZarizeniChoice.VICEUCELOVKA:
+            prodleva = prodleva_minut(krok['datum'], krok['zacatek'], krok['predchozi_datum_konce'], krok['predchozi_konec'])
+            if prodleva is not None:
+                souhrn['prostoj_minut'] += max(prodleva - TOLERANCE_PRODLEVY, 0)
+
+    radky = [radek for radek in _bedny_kroku(od, do) if radek['krok__datum'] in dny]
+    procent_kroku = defaultdict(Decimal)
+    for radek in radky:
+        procent_kroku[radek['krok_id']] += radek['procent'] or 0
+    for radek in radky:
+        klic = (radek['krok__datum'], *smena_kroku(radek['krok__datum'], radek['krok__zacatek']), radek['krok__zarizeni_id'])
+        souhrn_zakaznika = zakaznici[(*klic, radek['bedna__zakazka__kamion_prijem__zakaznik_id'])]
+        for souhrn in (zarizeni[klic], souhrn_zakaznika):
+            souhrn['pocet_beden'] += radek['pocet_beden']
+            souhrn['kg'] += radek['kg'] or 0
+            souhrn['kg_prvni_pouziti'] += radek['kg_prvni_pouziti'] or 0
+        souhrn_zakaznika['cena_prvni_pouziti'] += radek['cena_prvni_pouziti'] or 0
+        procent = radek['procent'] or 0
+        if procent > 0 and procent_kroku[radek['krok_id']] > 0:
+            souhrn_zakaznika['podil_rostu'] += Decimal(procent) / procent_kroku[radek['krok_id']]
+
+    return (
+        {klic: _normalizuj(hodnoty, POLE_ZARIZENI) for klic, hodnoty in zarizeni.items()},
+        {klic: _normalizuj(hodnoty, POLE_ZAKAZNIKA) for klic, hodnoty in zakaznici.items()},
+    )
+
+
+def _zamkni():
+    """
+    Uzamkne zařízení do konce transakce – serializuje souběžné přepočty souhrnů výroby, které
+    mažou a znovu zakládají řádky stejných dní. FOR NO KEY UPDATE neblokuje zakládání kroků.
+    """
+    list(Zarizeni.objects.select_for_update(no_key=True).order_by('pk').values_list('pk', flat=True))
+
+
+def prepocitej_souhrny_vyroby(dny):
+    """Přepočítá a uloží souhrny výroby zadaných dní v jedné transakci."""
+    dny = {den for den in dny if den}
+    if not dny:
+        return
+
+    with transaction.atomic():
+        _zamkni()
+        zarizeni, zakaznici = spocitej_souhrny_vyroby(dny)
+        SouhrnVyrobyZarizeni.objects.filter(datum__in=dny).delete()
+        SouhrnVyrobyZakaznika.objects.filter(datum__in=dny).delete()
+        ted = timezone.now()
+        SouhrnVyrobyZarizeni.objects.bulk_create([
+            SouhrnVyrobyZarizeni(
+                datum=datum, den_smeny=den_smeny, smena=smena, zarizeni_id=zarizeni_id, aktualizovano=ted, **hodnoty,
+            )
+            for (datum, den_smeny, smena, zarizeni_id), hodnoty in zarizeni.items()
+        ])
+        SouhrnVyrobyZakaznika.objects.bulk_create([
+            SouhrnVyrobyZakaznika(
+                datum=datum, den_smeny=den_smeny, smena=smena, zarizeni_id=zarizeni_id, zakaznik_id=zakaznik_id,
+                aktualizovano=ted, **hodnoty,
+            )
+            for (datum, den_smeny, smena, zarizeni_id, zakaznik_id), hodnoty in zakaznici.items()
+        ])
+
+
+def dny_po_zmene_kroku(*data):
+    """Dny, jejichž souhrn závisí na kroku s datem `data` – den kroku a dny, kdy může být krokem ovlivněn prostoj."""
+    return {den + timedelta(days=posun) for den in data if den for posun in range(PRESAH_PRODLEVY.days + 1)}
+
+
+def dny_kroku(krok_ids):
+    """Data zadaných kroků."""
+    krok_ids = {pk for pk in krok_ids if pk}
+    if not krok_ids:
+        return set()
+    return set(SarzeKrok.objects.filter(pk__in=krok_ids).values_list('datum', flat=True).distinct().order_by())
+
+
+def dny_beden(bedna_ids):
+    """Data kroků, ve kterých byly zadané bedny."""
+    bedna_ids = {pk for pk in bedna_ids if pk}
+    if not bedna_ids:
+        return set()
+    return set(
+        SarzeKrokBedna.objects.filter(bedna_id__in=bedna_ids)
+        .values_list('krok__datum', flat=True).distinct().order_by()
+    )
+
+
+def oznac_zmenu_vyroby(dny):
+    """
+    Zaznamená změnu výroby zadaných dní. Uvnitř `odlozene_souhrny_vyroby()` se přepočet odloží
+    na konec bloku, jinak proběhne hned v aktuální transakci.
+    """
+    odlozene = _odlozene_dny.get()
+    if odlozene is not None:
+        odlozene.update(den for den in dny if den)
+        return
+    prepocitej_souhrny_vyroby(dny)
+
+
+@contextmanager
+def odlozene_souhrny_vyroby():
+    """
+    Sloučí přepočty souhrnů výroby uvnitř bloku (např. uložení kroku s bednami po jednotlivých
+    záznamech) do jednoho přepočtu na jeho konci. Při výjimce se přepočet neprovede.
+    """
+    if _odlozene_dny.get() is not None:
+        yield
+        return
+
+    odlozene = set()
+    token = _odlozene_dny.set(odlozene)
+    try:
+        yield
+    finally:
+        _odlozene_dny.reset(token)
+    prepocitej_souhrny_vyroby(odlozene)
+
+
+def prepocitej_ceny_vyroby(zakaznik_id=None):
+    """
+    Po změně ceníku přepočítá cenu prvního použití v souhrnech zákazníka (bez parametru všech zákazníků)
+    jedním seskupeným dotazem a hromadným uložením změněných řádků.
+    """
+    souhrny = SouhrnVyrobyZakaznika.objects.all()
+    zaznamy = SarzeKrokBedna.objects.filter(_prvni_pouziti_s_hmotnosti(), krok__datum__isnull=False)
+    if zakaznik_id is not None:
+        souhrny = souhrny.filter(zakaznik_id=zakaznik_id)
+        zaznamy = zaznamy.filter(bedna__zakazka__kamion_prijem__zakaznik_id=zakaznik_id)
+
+    ceny = defaultdict(Decimal)
+    radky = (
+        zaznamy
+        .values('krok__datum', 'krok__zacatek', 'krok__zarizeni_id', 'bedna__zakazka__kamion_prijem__zakaznik_id')
+        .annotate(cena=Sum(_cena_bedny()))
+        .order_by()
+    )
+    for radek in radky:
+        datum = radek['krok__datum']
+        klic = (datum, *smena_kroku(datum, radek['krok__zacatek']), radek['krok__zarizeni_id'], radek['bedna__zakazka__kamion_prijem__zakaznik_id'])
+        ceny[klic] += radek['cena'] or 0
+
+    with transaction.atomic():
+        _zamkni()
+        zmenene = []
+        for souhrn in souhrny.only('pk', 'datum', 'den_smeny', 'smena', 'zarizeni_id', 'zakaznik_id', 'cena_prvni_pouziti'):
+            klic = (souhrn.datum, souhrn.den_smeny, souhrn.smena, souhrn.zarizeni_id, souhrn.zakaznik_id)
+            cena = Decimal(ceny.get(klic, 0)).quantize(DESETINNA_MISTA['cena_prvni_pouziti'])
+            if souhrn.cena_prvni_pouziti != cena:
+                souhrn.cena_prvni_pouziti = cena
+                zmenene.append(souhrn)
+        SouhrnVyrobyZakaznika.objects.bulk_update(zmenene, ['cena_prvni_pouziti'], batch_size=500)
+    return len(zmenene)
+
+
+def dny_s_kroky(od=None, do=None):
+    """Seřazené dny, ve kterých jsou kroky šarží nebo uložené souhrny výroby (volitelně jen `od`–`do`)."""
+    kroky = SarzeKrok.objects.filter(datum__isnull=False)
+    souhrny = SouhrnVyrobyZarizeni.objects.all()
+    if od:
+        kroky, souhrny = kroky.filter(datum__gte=od), souhrny.filter(datum__gte=od)
+    if do:
+        kroky, souhrny = kroky.filter(datum__lte=do), souhrny.filter(datum__lte=do)
+    return sorted(
+        set(kroky.values_list('datum', flat=True).distinct().order_by())
+        | set(souhrny.values_list('datum', flat=True).distinct().order_by())
+    )
+
+
+def _davky_dni(dny):
+    for zacatek in range(0, len(dny), DAVKA_DNI):
+        yield dny[zacatek:zacatek + DAVKA_DNI]
+
+
+def _ulozene(dny):
+    zarizeni = {
+        (r['datum'], r['den_smeny'], r['smena'], r['zarizeni_id']): _normalizuj(r, POLE_ZARIZENI)
+        for r in SouhrnVyrobyZarizeni.objects.filter(datum__in=dny).values('datum', 'den_smeny', 'smena', 'zarizeni_id', *POLE_ZARIZENI)
+    }
+    zakaznici = {
+        (r['datum'], r['den_smeny'], r['smena'], r['zarizeni_id'], r['zakaznik_id']): _normalizuj(r, POLE_ZAKAZNIKA)
+        for r in SouhrnVyrobyZakaznika.objects.filter(datum__in=dny).values(
+            'datum', 'den_smeny', 'smena', 'zarizeni_id', 'zakaznik_id', *POLE_ZAKAZNIKA,
+        )
+    }
+    return zarizeni, zakaznici
+
+
+def zkontroluj_souhrny_vyroby(od=None, do=None):
+    """Porovná uložené souhrny výroby se spočítanými z kroků. Vrací seřazené dny s rozdílem."""
+    rozdilne = set()
+    for davka in _davky_dni(dny_s_kroky(od, do)):
+        ulozene = _ulozene(davka)
+        for ulozeny, spocitany in zip(ulozene, spocitej_souhrny_vyroby(davka)):
+            for klic in ulozeny.keys() | spocitany.keys():
+                if ulozeny.get(klic) != spocitany.get(klic):
+                    rozdilne.add(klic[0])
+    return sorted(rozdilne)
+
+
+def prestav_souhrny_vyroby(dny=None, od=None, do=None):
+    """
+    Přestaví souhrny výroby po dávkách dní. Bez `dny` přestaví všechny dny s kroky nebo souhrny
+    (volitelně jen `od`–`do`). Vrací počet přestavěných dní.
+    """
+    dny = sorted(set(dny)) if dny is not None else dny_s_kroky(od, do)
+    for davka in _davky_dni(dny):
+        prepocitej_souhrny_vyroby(davka)
+    logger.info(f"Přestavěny souhrny výroby za {len(dny)} dní.")
+    return len(dny)
@@ -0,0 +1,250 @@
+"""
+Měsíční statistiky kamionů (příjem, výdej a hmotnost vyrovnaných beden) po zákaznících pro dashboard kamionů.
+
+Měsíce uzavřené déle než ODKLAD_ULOZENI_DNU dní ukládá do StatistikaKamionuMesice jen příkaz
+`manage.py statistiky_kamionu --doplnit` (spouštěný pravidelně, např. z cronu); dashboard je pak jen čte.
+Načtení dashboardu nic neukládá – měsíce, které ještě uložené nejsou, a aktuální měsíc se počítají
+z kamionů (Kamion.objects.with_totals()). Uložené měsíce se samy nepřepočítávají – po opravě starších
+kamionů nebo beden je přestaví `manage.py statistiky_kamionu --rok RRRR`.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from ..choices import KamionChoice
+from ..models import Kamion, StatistikaKamionuMesice, Zakaznik
+
+logger = logging.getLogger("orders")
+
+MESICE = range(1, 13)
+
+# Počet dní po konci měsíce, během kterých se ještě čekají opravy kamionů a beden a měsíc se neukládá.
+ODKLAD_ULOZENI_DNU = 7
+
+
+@dataclass
+class PohybyKamionu:
+    """Součty kamionů jednoho zákazníka (nebo více zákazníků) za měsíc nebo rok, hmotnosti v kg."""
+    prijem: Decimal = Decimal('0')
+    vydej: Decimal = Decimal('0')
+    hmotnost_krivych: Decimal = Decimal('0')
+    pocet_kamionu_prijem: int = 0
+    pocet_kamionu_vydej: int = 0
+
+    def pricti(self, jine):
+        for pole in fields(self):
+            setattr(self, pole.name, getattr(self, pole.name) + getattr(jine, pole.name))
+        return self
+
+    @property
+    def rozdil(self):
+        return self.prijem - self.vydej
+
+    @property
+    def procento_krivych(self):
+        """Podíl vyrovnaných (křivých) beden z výdeje v procentech, bez výdeje None."""
+        if not self.vydej:
+            return None
+        return Decimal(self.hmotnost_krivych) / Decimal(self.vydej) * Decimal('100')
+
+    def jako_slovnik(self):
+        return {
+            'prijem': self.prijem,
+            'vydej': self.vydej,
+            'hmotnost_krivych': self.hmotnost_krivych,
+            'pocet_kamionu_prijem': self.pocet_kamionu_prijem,
+            'pocet_kamionu_vydej': self.pocet_kamionu_vydej,
+            'rozdil': self.rozdil,
+            'procento_krivych': self.procento_krivych,
+        }
+
+
+@dataclass
+class StatistikyKamionu:
+    """
+    Statistiky kamionů roku `rok` – `mesice[(mesic, zakaznik_id)]`.
+    `ulozene` jsou měsíce načtené z uložených statistik, ostatní se spočítaly z kamionů.
+    """
+    rok: int
+    mesice: dict = field(default_factory=lambda: defaultdict(PohybyKamionu))
+    ulozene: set = field(default_factory=set)
+
+    def mesic(self, mesic, zakaznik_id=None):
+        """Pohyby za měsíc pro zákazníka, bez zákazníka součet všech zákazníků."""
+        vysledek = PohybyKamionu()
+        for (m, zakaznik), pohyby in self.mesice.items():
+            if m == mesic and (zakaznik_id is None or zakaznik == zakaznik_id):
+                vysledek.pricti(pohyby)
+        return vysledek
+
+    def rocni(self, zakaznik_id=None):
+        """Pohyby za celý rok pro zákazníka, bez zákazníka součet všech zákazníků."""
+        vysledek = PohybyKamionu()
+        for (_, zakaznik), pohyby in self.mesice.items():
+            if zakaznik_id is None or zakaznik == zakaznik_id:
+                vysledek.pricti(pohyby)
+        return vysledek
+
+
+def je_uzavreny(rok, mesic, dnes=None):
+    """Měsíc je uzavřený, pokud už skončil a uplynulo ODKLAD_ULOZENI_DNU dní – jen takový se ukládá do statistik."""
+    dnes = dnes or timezone.localdate()
+    return _posledni_den(rok, mesic) + timedelta(days=ODKLAD_ULOZENI_DNU) < dnes
+
+
+def rozsah_let(dnes=None):
+    """
+    Roky, pro které se statistiky počítají – od roku prvního kamionu po aktuální rok (bez kamionů
+    jen aktuální rok). Roky mimo rozsah se nenačítají ani neukládají.
+    """
+    dnes = dnes or timezone.localdate()
+    prvni = Kamion.objects.aggregate(prvni=Min('datum'))['prvni']
+    return range(min(prvni.year, dnes.year) if prvni else dnes.year, dnes.year + 1)
+
+
+def spocitej_pohyby(od, do):
+    """
+    Spočítá pohyby kamionů s datem `od`–`do` (včetně) po měsících a zákaznících jedním dotazem
+    nad Kamion.objects.with_totals(). Vrací {(rok, mesic, zakaznik_id): PohybyKamionu}.
+    """
+    vysledek = defaultdict(PohybyKamionu)
+    kamiony = (
+        Kamion.objects.filter(datum__gte=od, datum__lte=do)
+        .with_totals()
+        .values('datum', 'zakaznik_id', 'prijem_vydej', 'hmotnost_fakturovanych_netto_ann', 'hmotnost_vyrovnanych_ann')
+    )
+    for kamion in kamiony:
+        pohyby = vysledek[(kamion['datum'].year, kamion['datum'].month, kamion['zakaznik_id'])]
+        if kamion['prijem_vydej'] == KamionChoice.PRIJEM:
+            pohyby.prijem += kamion['hmotnost_fakturovanych_netto_ann'] or 0
+            pohyby.pocet_kamionu_prijem += 1
+        elif kamion['prijem_vydej'] == KamionChoice.VYDEJ:
+            pohyby.vydej += kamion['hmotnost_fakturovanych_netto_ann'] or 0
+            pohyby.hmotnost_krivych += kamion['hmotnost_vyrovnanych_ann'] or 0
+            pohyby.pocet_kamionu_vydej += 1
+    return vysledek
+
+
+def _posledni_den(rok, mesic):
+    return (date(rok + 1, 1, 1) if mesic == 12 else date(rok, mesic + 1, 1)) - timedelta(days=1)
+
+
+def _uloz_mesice(rok, mesice, prepsat=False):
+    """
+    Spočítá a uloží statistiky uzavřených měsíců `mesice` roku `rok` pro všechny zákazníky (i nulové,
+    aby se měsíc bez kamionů znovu nepočítal). Bez `prepsat` se už uložené řádky ponechají (souběžné
+    doplnění), s `prepsat` se nahradí. Vrací {(mesic, zakaznik_id): PohybyKamionu}.
+    """
+    mesice = sorted(mesice)
+    if not mesice:
+        return {}
+    pohyby = spocitej_pohyby(date(rok, mesice[0], 1), _posledni_den(rok, mesice[-1]))
+    zakaznici = list(Zakaznik.objects.values_list('pk', flat=True))
+    vysledek = {}
+    radky = []
+    for mesic in mesice:
+        for zakaznik_id in zakaznici:
+            hodnoty = pohyby.get((rok, mesic, zakaznik_id), PohybyKamionu())
+            vysledek[(mesic, zakaznik_id)] = hodnoty
+            radky.append(StatistikaKamionuMesice(
+                rok=rok, mesic=mesic, zakaznik_id=zakaznik_id,
+                **{pole.name: getattr(hodnoty, pole.name) for pole in fields(hodnoty)},
+            ))
+    with transaction.atomic():
+        if prepsat:
+            StatistikaKamionuMesice.objects.filter(rok=rok, mesic__in=mesice).delete()
+        StatistikaKamionuMesice.objects.bulk_create(radky, ignore_conflicts=not prepsat)
+    logger.info(f"Uloženy statistiky kamionů roku {rok} za měsíce {', '.join(str(mesic) for mesic in mesice)}.")
+    return vysledek
+
+
+def statistiky_roku(rok, dnes=None):
+    """
+    Statistiky kamionů roku `rok` pro dashboard – nic neukládá. Uzavřené měsíce se čtou z uložených
+    statistik, ostatní (ještě neuložené, aktuální a budoucí) se počítají z kamionů jedním dotazem.
+    Rok mimo `rozsah_let()` vrací prázdné statistiky.
+    """
+    dnes = dnes or timezone.localdate()
+    vysledek = StatistikyKamionu(rok=rok)
+    if rok not in rozsah_let(dnes):
+        return vysledek
+    uzavrene = {mesic for mesic in MESICE if je_uzavreny(rok, mesic, dnes)}
+
+    for statistika in StatistikaKamionuMesice.objects.filter(rok=rok, mesic__in=uzavrene):
+        vysledek.mesice[(statistika.mesic, statistika.zakaznik_id)] = PohybyKamionu(
+            **{pole.name: getattr(statistika, pole.name) for pole in fields(PohybyKamionu)}
+        )
+        vysledek.ulozene.add(statistika.mesic)
+
+    spocitat = [mesic for mesic in MESICE if mesic not in vysledek.ulozene]
+    if spocitat:
+        for (_, mesic, zakaznik_id), pohyby in spocitej_pohyby(date(rok, spocitat[0], 1), date(rok, 12, 31)).items():
+            if mesic not in vysledek.ulozene:
+                vysledek.mesice[(mesic, zakaznik_id)] = pohyby
+    return vysledek
+
+
+def porovnej_roky(roky, zakaznik_ids=None, dnes=None, nactene=None):
+    """
+    Porovnání let po měsících – {rok: {'mesice': {mesic: pohyby}, 'celkem': pohyby}} jako slovníky
+    (PohybyKamionu.jako_slovnik). Se `zakaznik_ids` se sčítají jen tito zákazníci, jinak všichni.
+    `nactene` jsou již načtené StatistikyKamionu podle roku, které se znovu nenačítají.
+    """
+    nactene = nactene or {}
+    porovnani = {}
+    for rok in sorted(set(roky)):
+        statistiky = nactene.get(rok) or statistiky_roku(rok, dnes)
+        zakaznici = [None] if zakaznik_ids is None else list(zakaznik_ids)
+        mesice = {}
+        for mesic in MESICE:
+            pohyby = PohybyKamionu()
+            for zakaznik_id in zakaznici:
+                pohyby.pricti(statistiky.mesic(mesic, zakaznik_id))
+            mesice[mesic] = pohyby
+        celkem = PohybyKamionu()
+        for pohyby in mesice.values():
+            celkem.pricti(pohyby)
+        porovnani[rok] = {
+            'mesice': {mesic: pohyby.jako_slovnik() for mesic, pohyby in mesice.items()},
+            'celkem': celkem.jako_slovnik(),
+        }
+    return porovnani
+
+
+def dopln_statistiky_kamionu(dnes=None):
+    """
+    Spočítá a uloží uzavřené měsíce všech let v `rozsah_let()`, které ještě uložené nejsou (pro pravidelné
+    spouštění). Už uložené měsíce nepřepočítává. Vrací počet uložených měsíců.
+    """
+    dnes = dnes or timezone.localdate()
+    ulozene = set(StatistikaKamionuMesice.objects.values_list('rok', 'mesic').distinct())
+    pocet = 0
+    for rok in rozsah_let(dnes):
+        chybejici = [mesic for mesic in MESICE if je_uzavreny(rok, mesic, dnes) and (rok, mesic) not in ulozene]
+        _uloz_mesice(rok, chybejici)
+        pocet += len(chybejici)
+    return pocet
+
+
+def prestav_statistiky_kamionu(rok=None, dnes=None):
+    """
+    Znovu spočítá a uloží statistiky uzavřených měsíců roku `rok`, bez roku všech let s kamiony.
+    Vrací počet přestavěných měsíců.
+    """
+    dnes = dnes or timezone.localdate()
+    if rok is None:
+        roky = sorted({datum.year for datum in Kamion.objects.dates('datum', 'year')})
+    else:
+        roky = [rok]
+    pocet = 0
+    for r in roky:
+        uzavrene = [mesic for mesic in MESICE if je_uzavreny(r, mesic, dnes)]
+        _uloz_mesice(r, uzavrene, prepsat=True)
+        pocet += len(uzavrene)
+    return pocet
@@ -0,0 +1,179 @@
+"""
+Úlohy na pozadí uložené v databázi.
+
+Akce v adminu, které by blokovaly request (import velkých manifestů, tisk karet a rozpracovanosti,
+CSV exporty), místo přímé odpovědi zařadí úlohu (`zarad_ulohu`) a přesměrují na stránku úlohy.
+Proces `manage.py run_jobs` úlohy postupně přebírá a spouští jejich obsluhu registrovanou
+přes `registruj_ulohu`. Vše běží nad databází (i SQLite) a lokálním úložištěm souborů.
+"""
+import logging
+import os
+import socket
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from ..choices import StavUlohyChoice
+from ..models import Uloha
+
+logger = logging.getLogger("orders")
+
+# Výběry větší než tento počet beden (řádků importu) se zpracují úlohou na pozadí.
+PRAH_BEDEN = getattr(settings, 'ULOHY_PRAH_BEDEN', 200)
+# Úloha, která běží déle, se považuje za přerušenou (spadlý nebo ukončený worker).
+MAX_DOBA_BEHU = getattr(settings, 'ULOHY_MAX_DOBA_BEHU', timedelta(hours=2))
+# Jak dlouho se drží dokončené úlohy a jejich soubory.
+ULOHY_TTL = getattr(settings, 'ULOHY_TTL', timedelta(days=7))
+
+_OBSLUHY = {}
+
+
+@dataclass
+class VysledekUlohy:
+    """Výsledek obsluhy úlohy – obsah souboru ke stažení a zpráva pro uživatele."""
+    obsah: bytes | str | None = None
+    nazev_souboru: str = ''
+    zprava: str = ''
+
+
+def registruj_ulohu(typ):
+    """
+    Dekorátor registrující obsluhu pro typ úlohy. Obsluha dostane instanci Uloha
+    a vrací VysledekUlohy, chyby hlásí výjimkou.
+    """
+    def dekorator(funkce):
+        _OBSLUHY[typ] = funkce
+        return funkce
+    return dekorator
+
+
+def nazev_workeru():
+    """Identifikace procesu workeru (host:pid) ukládaná k převzaté úloze."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def prekracuje_prah(pocet):
+    """Zda má být práce nad `pocet` bednami (řádky) zpracována na pozadí."""
+    return pocet > PRAH_BEDEN
+
+
+def zarad_ulohu(typ, parametry=None, *, user=None, popis='', celkem=0):
+    """Zařadí novou úlohu do fronty a vrátí ji."""
+    uloha = Uloha.objects.create(
+        typ=typ,
+        parametry=parametry or {},
+        vytvoril=user if getattr(user, 'is_authenticated', False) else None,
+        popis=popis[:255],
+        celkem=celkem,
+    )
+    logger.info(f"Uživatel {user} zařadil úlohu {uloha.pk} ({uloha.get_typ_display()}): {popis}")
+    return uloha
+
+
+def nastav_prubeh(uloha, prubeh, celkem=None):
+    """Uloží průběh úlohy jedním UPDATE, aby ho stránka úlohy mohla průběžně zobrazovat."""
+    uloha.prubeh = prubeh
+    zmeny = {'prubeh': prubeh}
+    if celkem is not None:
+        uloha.celkem = celkem
+        zmeny['celkem'] = celkem
+    Uloha.objects.filter(pk=uloha.pk).update(**zmeny)
+
+
+def _prevezmi_ulohu(worker):
+    """
+    Převezme nejstarší čekající úlohu. Převzetí je podmíněný UPDATE na stav CEKA,
+    takže i na SQLite úlohu převezme nejvýše jeden worker.
+    """
+    for pk in Uloha.objects.filter(stav=StavUlohyChoice.CEKA).order_by('vytvoreno', 'pk').values_list('pk', flat=True)[:10]:
+        prevzato = Uloha.objects.filter(pk=pk, stav=StavUlohyChoice.CEKA).update(
+            stav=StavUlohyChoice.BEZI,
+            zahajeno=timezone.now(),
+            worker=worker,
+        )
+        if prevzato:
+            return Uloha.objects.get(pk=pk)
+    return None
+
+
+def spust_ulohu(uloha):
+    """Spustí obsluhu převzaté úlohy a uloží výsledek nebo chybu."""
+    obsluha = _OBSLUHY.get(uloha.typ)
+    try:
+        if obsluha is None:
+            raise LookupError(f"Pro typ úlohy {uloha.typ} není registrovaná obsluha.")
+        vysledek = obsluha(uloha) or VysledekUlohy()
+    except Exception as exc:
+        logger.error(f"Úloha {uloha.pk} ({uloha.get_typ_display()}) selhala: {exc}", exc_info=True)
+        uloha.stav = StavUlohyChoice.CHYBA
+        uloha.zprava = f"{exc}\n\n{traceback.format_exc()}" if settings.DEBUG else str(exc)
+        uloha.dokonceno = timezone.now()
+        uloha.save(update_fields=['stav', 'zprava', 'dokonceno'])
+        return uloha
+
+    if vysledek.obsah is not None:
+        obsah = vysledek.obsah.encode('utf-8') if isinstance(vysledek.obsah, str) else vysledek.obsah
+        uloha.vysledek.save(vysledek.nazev_souboru, ContentFile(obsah), save=False)
+        uloha.nazev_souboru = vysledek.nazev_souboru
+    uloha.stav = StavUlohyChoice.HOTOVO
+    uloha.zprava = vysledek.zprava
+    uloha.dokonceno = timezone.now()
+    if uloha.celkem:
+        uloha.prubeh = uloha.celkem
+    uloha.save(update_fields=['stav', 'zprava', 'dokonceno', 'prubeh', 'vysledek', 'nazev_souboru'])
+    logger.info(
+        f"Úloha {uloha.pk} ({uloha.get_typ_display()}) dokončena za "
+        f"{(uloha.dokonceno - uloha.zahajeno).total_seconds():.1f} s."
+    )
+    return uloha
+
+
+def zpracuj_dalsi_ulohu(worker=None):
+    """Převezme a zpracuje jednu čekající úlohu. Vrací ji, nebo None, pokud fronta je prázdná."""
+    uloha = _prevezmi_ulohu(worker or nazev_workeru())
+    if uloha is None:
+        return None
+    return spust_ulohu(uloha)
+
+
+def oznac_prerusene_ulohy(max_doba=None, ted=None):
+    """
+    Úlohy ve stavu BEZI starší než `max_doba` (výchozí MAX_DOBA_BEHU) označí jako chybné –
+    jejich worker skončil bez dokončení. Znovu se nespouští, protože mohly být zpracované zčásti.
+    Vrací počet označených úloh.
+    """
+    hranice = (ted or timezone.now()) - (max_doba or MAX_DOBA_BEHU)
+    pocet = Uloha.objects.filter(stav=StavUlohyChoice.BEZI, zahajeno__lt=hranice).update(
+        stav=StavUlohyChoice.CHYBA,
+        zprava='Úloha byla přerušena (zpracování nebylo dokončeno).',
+        dokonceno=ted or timezone.now(),
+    )
+    if pocet:
+        logger.warning(f"Označeno {pocet} přerušených úloh na pozadí.")
+    return pocet
+
+
+def uklid_ulohy(max_stari=None, ted=None):
+    """
+    Smaže dokončené úlohy starší než `max_stari` (výchozí ULOHY_TTL) včetně jejich souborů.
+    Vrací počet smazaných úloh.
+    """
+    hranice = (ted or timezone.now()) - (max_stari or ULOHY_TTL)
+    stare = list(Uloha.objects.filter(
+        stav__in=[StavUlohyChoice.HOTOVO, StavUlohyChoice.CHYBA],
+        dokonceno__lt=hranice,
+    ))
+    for uloha in stare:
+        if uloha.vysledek:
+            try:
+                uloha.vysledek.delete(save=False)
+            except Exception:
+                logger.warning(f"Nepodařilo se smazat soubor úlohy {uloha.pk}.", exc_info=True)
+    Uloha.objects.filter(pk__in=[uloha.pk for uloha in stare]).delete()
+    if stare:
+        logger.info(f"Uklizeno {len(stare)} starých úloh na pozadí.")
+    return len(stare)
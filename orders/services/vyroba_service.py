@@ -0,0 +1,221 @@
+"""
+Statistiky výroby po dnech, směnách a zařízeních pro dashboard výroby.
+
+Celé období se načte dvěma dotazy nad denními souhrny výroby (SouhrnVyrobyZarizeni a SouhrnVyrobyZakaznika,
+viz services.souhrny_vyroby_service) nezávisle na jeho délce. Služba zde dále poskytuje rozdělení kroků
+do směn a výpočet prodlevy (konec předchozího kroku na zařízení, viz SarzeKrokQuerySet.s_prodlevou),
+ze kterých se souhrny počítají.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from ..choices import TypZarizeniChoice
+from ..models import SarzeKrok, SarzeKrokBedna, SouhrnVyrobyZakaznika, SouhrnVyrobyZarizeni
+
+logger = logging.getLogger("orders")
+
+SMENA_DEN = 'den'
+SMENA_NOC = 'noc'
+# Denní směna začíná v 6:00, noční v 18:00 a končí v 6:00 následujícího dne.
+HRANICE_SMEN = (time(6, 0), time(18, 0))
+# Prodleva mezi kroky do této délky (v minutách) se do prostoje nepočítá.
+TOLERANCE_PRODLEVY = 10
+# Kroky tolik dní před obdobím se načítají jako možné předchozí kroky pro prodlevu. Starší předchozí
+# krok znamená odstávku delší než den, která se do prostoje nepočítá.
+PRESAH_PRODLEVY = timedelta(days=2)
+
+
+@dataclass
+class StatistikaVyroby:
+    """Součty kroků šarží jednoho zařízení za den nebo směnu."""
+    kroku: int = 0
+    kroku_vruty: int = 0
+    kroku_zelezo: int = 0
+    prostoj_minut: int = 0
+    pater: int = 0
+    vykon_kg: Decimal = Decimal('0')
+
+    def pricti(self, jina):
+        for pole in fields(self):
+            setattr(self, pole.name, getattr(self, pole.name) + getattr(jina, pole.name))
+        return self
+
+
+@dataclass
+class StatistikyVyroby:
+    """
+    Statistiky výroby za období `od`–`do`.
+    - `dny[(datum, kod_zarizeni)]` – kalendářní den kroku,
+    - `smeny[(datum, smena, kod_zarizeni)]` – den, ve kterém směna začala (noční směna končí ráno dalšího dne),
+    - `zakaznici[(datum, zakaznik)]` – výkon v kg z prvního použití beden na výrobních zařízeních za kalendářní den.
+    `kody_zarizeni` jsou výrobní zařízení, `kody_nakladani` zařízení pro nakládání šarží.
+    """
+    od: date
+    do: date
+    kody_zarizeni: tuple = ()
+    kody_nakladani: tuple = ()
+    dny: dict = field(default_factory=lambda: defaultdict(StatistikaVyroby))
+    smeny: dict = field(default_factory=lambda: defaultdict(StatistikaVyroby))
+    zakaznici: dict = field(default_factory=lambda: defaultdict(Decimal))
+
+    def _soucet(self, zdroj, klic, kody):
+        vysledek = StatistikaVyroby()
+        for kod in self.kody_zarizeni if kody is None else kody:
+            if (*klic, kod) in zdroj:
+                vysledek.pricti(zdroj[(*klic, kod)])
+        return vysledek
+
+    def den(self, datum, kody=None):
+        """Součet za kalendářní den přes zadaná zařízení (výchozí všechna výrobní)."""
+        return self._soucet(self.dny, (datum,), kody)
+
+    def smena(self, datum, smena, kody=None):
+        """Součet za směnu začínající v den `datum` přes zadaná zařízení (výchozí všechna výrobní)."""
+        return self._soucet(self.smeny, (datum, smena), kody)
+
+    def nakladani(self, datum, smena):
+        """Nakládání šarží ve směně – počet kroků (šarží) a pater."""
+        return self.smena(datum, smena, self.kody_nakladani)
+
+    def zakaznici_dne(self, datum):
+        """Výkon v kg podle zákazníků za kalendářní den, seřazený podle zákazníka."""
+        return sorted(
+            ((zakaznik, kg) for (den, zakaznik), kg in self.zakaznici.items() if den == datum),
+            key=lambda polozka: polozka[0] or '',
+        )
+
+    def dny_obdobi(self):
+        return [self.od + timedelta(days=posun) for posun in range((self.do - self.od).days + 1)]
+
+
+def smena_kroku(datum, zacatek):
+    """Vrátí (den začátku směny, směna) pro krok začínající v `datum` v čase `zacatek`."""
+    zacatek_dne, zacatek_noci = HRANICE_SMEN
+    if zacatek < zacatek_dne:
+        return datum - timedelta(days=1), SMENA_NOC
+    if zacatek < zacatek_noci:
+        return datum, SMENA_DEN
+    return datum, SMENA_NOC
+
+
+def prodleva_minut(datum, zacatek, predchozi_datum_konce, predchozi_konec):
+    """
+    Prodleva v minutách mezi koncem předchozího kroku na zařízení a začátkem kroku (stejně jako SarzeKrok.prodleva).
+    Bez ukončeného předchozího kroku vrací None, dlouhá odstávka (více než 1 den) se nepočítá.
+    """
+    if not datum or not zacatek or not predchozi_datum_konce or not predchozi_konec:
+        return None
+    if predchozi_datum_konce < datum - timedelta(days=1):
+        return 0
+    rozdil = datetime.combine(datum, zacatek) - datetime.combine(predchozi_datum_konce, predchozi_konec)
+    return int(rozdil.total_seconds() / 60)
+
+
+def prvni_pouziti_beden(od, do, kody_zarizeni):
+    """
+    Queryset záznamů SarzeKrokBedna, ve kterých byla bedna s hmotností na daném zařízení použita poprvé,
+    pro kroky s datem od `od` do `do` (včetně). Čte uložený příznak SarzeKrokBedna.prvni_pouziti.
+    """
+    return (
+        SarzeKrokBedna.objects
+        .filter(
+            prvni_pouziti=True,
+            krok__datum__gte=od,
+            krok__datum__lte=do,
+            krok__zarizeni__kod_zarizeni__in=kody_zarizeni,
+            bedna__isnull=False,
+            bedna__hmotnost__isnull=False,
+            bedna__hmotnost__gt=0,
+        )
+        .select_related('krok', 'krok__sarze', 'krok__zarizeni', 'bedna')
+    )
+
+
+def kroky_s_prodlevou(od, do):
+    """
+    Kroky šarží s datem od `od` do `do` anotované koncem předchozího kroku na zařízení (s_prodlevou).
+    Načítají se i kroky z PRESAH_PRODLEVY před obdobím, aby měl i první krok období předchozí krok –
+    volající je přeskočí podle data.
+    """
+    return SarzeKrok.objects.filter(datum__gte=od - PRESAH_PRODLEVY, datum__lte=do).s_prodlevou()
+
+
+def dopln_prodlevy(kroky):
+    """
+    Doplní krokům (např. stránce changelistu) konec předchozího kroku na zařízení jedním dotazem,
+    takže SarzeKrok.prodleva nepotřebuje dotaz na každý krok. Kroky, jejichž předchozí krok leží
+    před načteným obdobím, si ho dohledají samy.
+    """
+    kroky = [krok for krok in kroky if krok is not None and krok.datum]
+    if not kroky:
+        return
+    predchozi = {
+        radek['pk']: radek
+        for radek in (
+            kroky_s_prodlevou(min(krok.datum for krok in kroky), max(krok.datum for krok in kroky))
+            .filter(zarizeni_id__in={krok.zarizeni_id for krok in kroky})
+            .values('pk', 'predchozi_datum', 'predchozi_datum_konce', 'predchozi_konec')
+        )
+    }
+    for krok in kroky:
+        radek = predchozi.get(krok.pk)
+        if radek and radek['predchozi_datum'] is not None:
+            krok.predchozi_datum = radek['predchozi_datum']
+            krok.predchozi_datum_konce = radek['predchozi_datum_konce']
+            krok.predchozi_konec = radek['predchozi_konec']
+
+
+def statistiky_vyroby(od, do, kody_zarizeni):
+    """
+    Načte statistiky výroby za dny `od`–`do` na výrobních zařízeních `kody_zarizeni` a nakládání šarží
+    z denních souhrnů výroby (services.souhrny_vyroby_service). Noční směna posledního dne zasahuje
+    do rána dalšího dne, proto se načítají i souhrny směn podle dne začátku směny.
+    Počet dotazů nezávisí na délce období ani historie.
+    """
+    kody_zarizeni = tuple(kody_zarizeni)
+    vysledek = StatistikyVyroby(od=od, do=do, kody_zarizeni=kody_zarizeni)
+    kody_nakladani = set()
+
+    souhrny = (
+        SouhrnVyrobyZarizeni.objects
+        .filter(Q(datum__gte=od, datum__lte=do) | Q(den_smeny__gte=od, den_smeny__lte=do))
+        .filter(Q(zarizeni__kod_zarizeni__in=kody_zarizeni) | Q(zarizeni__typ_zarizeni=TypZarizeniChoice.NAKLADANI))
+        .values(
+            'datum', 'den_smeny', 'smena', 'zarizeni__kod_zarizeni', 'zarizeni__typ_zarizeni',
+            'pocet_kroku', 'pocet_kroku_vruty', 'pocet_kroku_zelezo', 'pocet_pater', 'prostoj_minut', 'kg_prvni_pouziti',
+        )
+    )
+    for souhrn in souhrny:
+        kod = souhrn['zarizeni__kod_zarizeni']
+        if souhrn['zarizeni__typ_zarizeni'] == TypZarizeniChoice.NAKLADANI:
+            kody_nakladani.add(kod)
+        statistika = StatistikaVyroby(
+            kroku=souhrn['pocet_kroku'],
+            kroku_vruty=souhrn['pocet_kroku_vruty'],
+            kroku_zelezo=souhrn['pocet_kroku_zelezo'],
+            prostoj_minut=souhrn['prostoj_minut'],
+            pater=souhrn['pocet_pater'],
+            vykon_kg=souhrn['kg_prvni_pouziti'] if kod in kody_zarizeni else Decimal('0'),
+        )
+        if od <= souhrn['den_smeny'] <= do:
+            vysledek.smeny[(souhrn['den_smeny'], souhrn['smena'], kod)].pricti(statistika)
+        if od <= souhrn['datum'] <= do:
+            vysledek.dny[(souhrn['datum'], kod)].pricti(statistika)
+
+    vykon = (
+        SouhrnVyrobyZakaznika.objects
+        .filter(datum__gte=od, datum__lte=do, zarizeni__kod_zarizeni__in=kody_zarizeni, kg_prvni_pouziti__gt=0)
+        .values('datum', 'zakaznik__zkraceny_nazev')
+        .annotate(kg=Sum('kg_prvni_pouziti'))
+        .order_by()
+    )
+    for skupina in vykon:
+        vysledek.zakaznici[(skupina['datum'], skupina['zakaznik__zkraceny_nazev'])] += skupina['kg']
+
+    vysledek.kody_nakladani = tuple(sorted(kody_nakladani))
+    return vysledek
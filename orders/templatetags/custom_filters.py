@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django import template
 from decimal import Decimal, ROUND_HALF_UP
 
+from orders.models import Bedna
 from orders.utils import format_cislo_bedny
 
 register = template.Library()
@@ -85,11 +88,18 @@ def flatten_bedny(zakazky):
     """
     Sloučí všechny bedny ze všech zakázek do jednoho seznamu s čísly pozic.
     Vrací list tuplů: (pozice, bedna, zakazka)
+    Bedny všech zakázek se načtou jedním dotazem včetně pořadí bedny a počtu beden zakázky (with_poradi()).
     """
+    zakazky = list(zakazky)
+    bedny_zakazek = defaultdict(list)
+    for bedna in Bedna.objects.filter(zakazka__in=zakazky).order_by('id').with_poradi():
+        bedny_zakazek[bedna.zakazka_id].append(bedna)
+
     result = []
     pos = 1
     for zakazka in zakazky:
-        for bedna in zakazka.bedny.all():
+        for bedna in bedny_zakazek[zakazka.pk]:
+            bedna.zakazka = zakazka
             result.append((pos, bedna, zakazka))
             pos += 1
     return result
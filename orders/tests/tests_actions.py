@@ -5,6 +5,7 @@ from django.contrib.admin.sites import AdminSite
 from django.http import HttpResponse
 from django.urls import reverse
 from django.core.management import call_command
+from django.test import override_settings
 from django.db import IntegrityError
 
 from decimal import Decimal
@@ -13,11 +14,12 @@ from datetime import date, time
 import csv
 import io
 import json
+import tempfile
 
 from orders.models import (
     Zakaznik, Kamion, Zakazka, Bedna, Predpis, TypHlavy,
     Odberatel, Pozice, PoziceZakazkaOrder, Rozpracovanost, RozpracovanostBednaSnapshot, Cena,
-    Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna,
+    Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Uloha,
 )
 from orders.choices import (
     KamionChoice,
@@ -26,6 +28,8 @@ from orders.choices import (
     TryskaniChoice,
     TypZarizeniChoice,
     ZinkovaniChoice,
+    StavUlohyChoice,
+    TypUlohyChoice,
     STAV_BEDNY_ROZPRACOVANOST,
 )
 from orders import actions
@@ -129,9 +133,8 @@ class ActionsTests(ActionsBase):
         return [m.message for m in list(request._messages)]
 
     @patch('orders.services.sarze_print_service.render_to_string', return_value='<html></html>')
-    @patch('orders.services.sarze_print_service.HTML')
-    def test_tisk_pruvodky_vruty_sarze_action_success(self, html_mock, render_mock):
-        html_mock.return_value.write_pdf.return_value = b'%PDF-test'
+    @patch('orders.services.sarze_print_service.vyrendruj_pdf', return_value=b'%PDF-test')
+    def test_tisk_pruvodky_vruty_sarze_action_success(self, pdf_mock, render_mock):
         admin_obj = self._messaging_admin()
         request = self.get_request()
         nakladani = Zarizeni.objects.create(
@@ -173,7 +176,7 @@ class ActionsTests(ActionsBase):
         context = render_mock.call_args.args[1]
         self.assertEqual(context['krok'], krok)
         self.assertIn(item, list(context['items']))
-        html_mock.return_value.write_pdf.assert_called_once()
+        pdf_mock.assert_called_once()
 
     def test_tisk_pruvodky_vruty_sarze_action_requires_single_sarze(self):
         admin_obj = self._messaging_admin()
@@ -244,8 +247,8 @@ class ActionsTests(ActionsBase):
 
     @patch('orders.actions.render_to_string', return_value='<html></html>')
     @patch('orders.actions.finders.find', return_value=None)
-    @patch('orders.actions.HTML')
-    def test_tisk_rozpracovanost_action_success(self, html_mock, find_mock, render_mock):
+    @patch('orders.actions.vyrendruj_pdf', return_value=b'%PDF-1.4%')
+    def test_tisk_rozpracovanost_action_success(self, pdf_mock, find_mock, render_mock):
         self.zakaznik.fakturovat_rovnani = True
         self.zakaznik.fakturovat_tryskani = True
         self.zakaznik.save(update_fields=['fakturovat_rovnani', 'fakturovat_tryskani'])
@@ -285,8 +288,6 @@ class ActionsTests(ActionsBase):
         queryset = Rozpracovanost.objects.filter(pk=snapshot.pk)
 
         pdf_bytes = b'%PDF-1.4%'
-        html_instance = html_mock.return_value
-        html_instance.write_pdf.return_value = pdf_bytes
 
         response = actions.tisk_rozpracovanost_action(self.admin, request, queryset)
 
@@ -297,7 +298,7 @@ class ActionsTests(ActionsBase):
         self.assertIn('rozpracovanost_', response['Content-Disposition'])
 
         render_mock.assert_called_once()
-        html_instance.write_pdf.assert_called_once()
+        pdf_mock.assert_called_once()
         find_mock.assert_called_once_with('orders/css/pdf_shared.css')
 
         context = render_mock.call_args[0][1]
@@ -335,8 +336,8 @@ class ActionsTests(ActionsBase):
 
     @patch('orders.actions.render_to_string', return_value='<html></html>')
     @patch('orders.actions.finders.find', return_value=None)
-    @patch('orders.actions.HTML')
-    def test_tisk_rozpracovanost_action_ignores_non_fakturovat_bedny(self, html_mock, find_mock, render_mock):
+    @patch('orders.actions.vyrendruj_pdf', return_value=b'%PDF-1.4%')
+    def test_tisk_rozpracovanost_action_ignores_non_fakturovat_bedny(self, pdf_mock, find_mock, render_mock):
         cena = Cena.objects.create(
             popis='Test cena',
             zakaznik=self.zakaznik,
@@ -376,9 +377,6 @@ class ActionsTests(ActionsBase):
         request = self.get_request('post')
         queryset = Rozpracovanost.objects.filter(pk=snapshot.pk)
 
-        html_instance = html_mock.return_value
-        html_instance.write_pdf.return_value = b'%PDF-1.4%'
-
         response = actions.tisk_rozpracovanost_action(self.admin, request, queryset)
 
         self.assertEqual(response.status_code, 200)
@@ -432,8 +430,8 @@ class ActionsTests(ActionsBase):
 
     @patch('orders.actions.render_to_string', return_value='<html></html>')
     @patch('orders.actions.finders.find', return_value=None)
-    @patch('orders.actions.HTML')
-    def test_tisk_rozpracovanost_action_warns_on_missing_pricing(self, html_mock, find_mock, render_mock):
+    @patch('orders.actions.vyrendruj_pdf', return_value=b'%PDF-1.4%')
+    def test_tisk_rozpracovanost_action_warns_on_missing_pricing(self, pdf_mock, find_mock, render_mock):
         admin_obj = self._messaging_admin()
 
         unknown = Predpis.objects.create(nazev='Neznámý předpis', skupina=1, zakaznik=self.zakaznik)
@@ -457,9 +455,6 @@ class ActionsTests(ActionsBase):
         request = self.get_request('post')
         queryset = Rozpracovanost.objects.filter(pk=snapshot.pk)
 
-        html_instance = html_mock.return_value
-        html_instance.write_pdf.return_value = b'%PDF-1.4%'
-
         response = actions.tisk_rozpracovanost_action(admin_obj, request, queryset)
 
         self.assertEqual(response.status_code, 200)
@@ -1786,6 +1781,31 @@ class ExportBednyCsvActionTests(ActionsBase):
         self.assertEqual(rows[1][1], self.zakazka.artikl)
         self.assertEqual(rows[2][1], zak2.artikl)
 
+    def test_export_bedny_dl_action_velky_vyber_zaradi_ulohu(self):
+        self.bedna.stav_bedny = StavBednyChoice.K_EXPEDICI
+        self.bedna.save(update_fields=['stav_bedny'])
+        qs = Bedna.objects.filter(pk=self.bedna.pk)
+        req = self.get_request('get', data={'stav_bedny': StavBednyChoice.K_EXPEDICI})
+        primy_export = actions.export_bedny_dl_action(self.bedna_admin, req, qs).content
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            req = self.get_request('get', data={'stav_bedny': StavBednyChoice.K_EXPEDICI})
+            with patch('orders.actions.prekracuje_prah', return_value=True):
+                resp = actions.export_bedny_dl_action(self.bedna_admin, req, qs)
+
+            uloha = Uloha.objects.get()
+            self.assertEqual(resp.status_code, 302)
+            self.assertEqual(resp['Location'], reverse('uloha_detail', args=[uloha.pk]))
+            self.assertEqual((uloha.typ, uloha.stav, uloha.parametry['s_hpm']), (TypUlohyChoice.CSV_DL, StavUlohyChoice.CEKA, True))
+
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+
+            uloha.refresh_from_db()
+            self.assertEqual(uloha.stav, StavUlohyChoice.HOTOVO, uloha.zprava)
+            self.assertTrue(uloha.nazev_souboru.endswith('.csv'))
+            with uloha.vysledek.open('rb') as soubor:
+                self.assertEqual(soubor.read(), primy_export)
+
 
 class BednaAdminPollingTests(ActionsBase):
     @classmethod
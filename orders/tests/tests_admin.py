@@ -5,6 +5,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission, Group
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.http import HttpResponse
 from django.urls import reverse
 
@@ -13,6 +14,7 @@ from datetime import date, time
 from django.utils import timezone
 from unittest.mock import patch
 from types import SimpleNamespace
+import io
 import json
 
 from orders.admin import KamionAdmin, ZakazkaAdmin, BednaAdmin, BednaInline, NotificationAdmin, SarzeAdmin, SarzeKrokAdmin, SarzeKrokBednaAdmin, SarzeKrokBednaInline, SarzeKrokInline, PredpisAdmin, CenaAdmin
@@ -20,8 +22,10 @@ from orders import actions
 from orders.actions import vytvorit_dalsi_krok_sarze_action, vytvorit_novy_krok_z_kroku_sarze_action
 from orders.forms import ImportZakazekForm
 from orders.import_strategies import EURImportStrategy
-from orders.models import Zakaznik, Kamion, Zakazka, Bedna, Predpis, TypHlavy, Odberatel, Cena, Notification, PriorityNotificationRecipient, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna
-from orders.choices import StavBednyChoice, StavSarzeChoice, SklademZakazkyChoice, PrijemVydejChoice, KamionChoice, ZinkovaniChoice, PrioritaChoice, TypZarizeniChoice
+from orders.models import Zakaznik, Kamion, Zakazka, Bedna, Predpis, TypHlavy, Odberatel, Cena, Notification, PriorityNotificationRecipient, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Uloha
+from orders.choices import StavBednyChoice, StavSarzeChoice, SklademZakazkyChoice, PrijemVydejChoice, KamionChoice, ZinkovaniChoice, PrioritaChoice, TypZarizeniChoice, StavUlohyChoice, TypUlohyChoice
+from orders.services.import_service import nacti_parsovany_import
+from orders.services.souhrny_service import oznac_zmenu_souhrnu
 from orders.filters import DelkaFilter, TypSarzeFilter
 
 
@@ -87,6 +91,7 @@ class KamionAdminTests(AdminBase):
         return kamion_vydej, zakazka
 
     def test_eur_import_reads_sarze_as_text_and_strips_whitespace(self):
+        TypHlavy.objects.create(nazev='TK', popis='Test')
         predpis_column_name = 'n. Zg. / \n' 'as drg'
         df_data = {
             'Abhol- datum': ['2024-01-01', '2024-01-01'],
@@ -111,14 +116,14 @@ class KamionAdminTests(AdminBase):
         df = pandas_mod.DataFrame(df_data)
         request = self.get_request('post')
 
-        with patch('orders.import_strategies.pd.read_excel', return_value=df.copy()) as read_excel_mock:
+        with patch('orders.import_reader.cti_excel_po_davkach', return_value=iter([df.copy()])) as reader_mock:
             parsed_df, preview, errors, warnings, required_fields = EURImportStrategy().parse_excel(
                 excel_stream=object(),
                 request=request,
                 kamion=self.kamion,
             )
 
-        self.assertEqual(read_excel_mock.call_args.kwargs['dtype']['Material- charge'], str)
+        self.assertEqual(reader_mock.call_args.kwargs['dtype']['Material- charge'], str)
         self.assertEqual(errors, [])
         self.assertEqual(list(parsed_df['sarze']), ['48885', 'T56666'])
         self.assertEqual([row['sarze'] for row in preview], ['48885', 'T56666'])
@@ -218,7 +223,7 @@ class KamionAdminTests(AdminBase):
 
         self.assertTrue(ImportZakazekForm(valid_req.POST, valid_req.FILES).is_valid())
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             zak_before = Zakazka.objects.count()
             bedna_before = Bedna.objects.count()
             preview_resp = self.admin.import_view(valid_req)
@@ -231,7 +236,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = valid_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         if resp.status_code != 302:
@@ -303,7 +308,7 @@ class KamionAdminTests(AdminBase):
         preview_req.session = DummySession()
         preview_req._messages = FallbackStorage(preview_req)
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             preview_resp = self.admin.import_view(preview_req)
 
         self.assertEqual(preview_resp.status_code, 200)
@@ -314,7 +319,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = preview_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         self.assertEqual(resp.status_code, 302)
@@ -364,7 +369,7 @@ class KamionAdminTests(AdminBase):
 
         self.assertTrue(ImportZakazekForm(valid_req.POST, valid_req.FILES).is_valid())
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             zak_before = Zakazka.objects.count()
             bedna_before = Bedna.objects.count()
             preview_resp = self.admin.import_view(valid_req)
@@ -377,7 +382,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = valid_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         if resp.status_code != 302:
@@ -458,7 +463,7 @@ class KamionAdminTests(AdminBase):
             },
         ])
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             zak_before = Zakazka.objects.count()
             bedna_before = Bedna.objects.count()
             preview_resp = self.admin.import_view(valid_req)
@@ -471,7 +476,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = valid_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         self.assertEqual(resp.status_code, 302)
@@ -552,7 +557,7 @@ class KamionAdminTests(AdminBase):
             },
         ])
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             zak_before = Zakazka.objects.count()
             bedna_before = Bedna.objects.count()
             preview_resp = self.admin.import_view(valid_req)
@@ -565,7 +570,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = valid_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         self.assertEqual(resp.status_code, 302)
@@ -646,7 +651,7 @@ class KamionAdminTests(AdminBase):
             },
         ])
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import), patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             preview_resp = self.admin.import_view(valid_req)
 
         self.assertEqual(preview_resp.status_code, 200)
@@ -658,7 +663,7 @@ class KamionAdminTests(AdminBase):
         import_req._messages = FallbackStorage(import_req)
 
         existing_bedna_ids = set(Bedna.objects.values_list('id', flat=True))
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         self.assertEqual(resp.status_code, 302)
@@ -714,7 +719,7 @@ class KamionAdminTests(AdminBase):
 
         existing_ids = set(Bedna.objects.values_list('id', flat=True))
 
-        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch.object(self.admin, '_render_import', wraps=self.admin._render_import) as render_mock, patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(valid_req)
 
         self.assertEqual(resp.status_code, 200)
@@ -725,7 +730,7 @@ class KamionAdminTests(AdminBase):
         import_req.session = valid_req.session
         import_req._messages = FallbackStorage(import_req)
 
-        with patch('orders.admin.pd.read_excel', side_effect=lambda *args, **kwargs: df.copy()):
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
             resp = self.admin.import_view(import_req)
 
         self.assertEqual(resp.status_code, 302)
@@ -737,6 +742,68 @@ class KamionAdminTests(AdminBase):
         )
         self.assertEqual(new_bedny, ['27', '157', '304-B', '505A', '754'])
 
+    def test_import_view_velky_import_zaradi_ulohu_na_pozadi(self):
+        url = f'/admin/orders/kamion/import-zakazek/?kamion={self.kamion.pk}'
+        file_mock = SimpleUploadedFile('eur.xlsx', b'fake-velky', content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        valid_req = self.get_request('post', data={'file': file_mock}, path=url)
+        valid_req.FILES['file'] = file_mock
+        valid_req.session = DummySession()
+        valid_req._messages = FallbackStorage(valid_req)
+
+        predpis_column_name = 'n. Zg. / \n' 'as drg'
+        Predpis.objects.create(nazev='00123_Ø10', skupina=1, zakaznik=self.zakaznik)
+        TypHlavy.objects.get_or_create(nazev='TK', defaults={'popis': 'Test'})
+
+        import pandas as pandas_mod
+        df = pandas_mod.DataFrame({
+            'Abhol- datum': ['2024-01-01'] * 5,
+            'Unnamed: 7': ['10 x 50'] * 5,
+            'Bezeichnung': [f'desc {i}' for i in range(5)],
+            'Sonder / Zusatzinfo': [''] * 5,
+            'Artikel- nummer': ['A1'] * 5,
+            predpis_column_name: ['123'] * 5,
+            'Material- charge': ['M1'] * 5,
+            'Material': ['steel'] * 5,
+            'Ober- fläche': ['ZP'] * 5,
+            'Gewicht in kg': [1] * 5,
+            'Gew.': [1] * 5,
+            'Tara kg': [1] * 5,
+            'Behälter-Nr.:': [1, 2, 3, 4, 5],
+            'Lief.': ['L1'] * 5,
+            'Fertigungs- auftrags Nr.': [f'F{i}' for i in range(5)],
+            'Unnamed: 6': ['TK'] * 5,
+        })
+        existing_ids = set(Bedna.objects.values_list('id', flat=True))
+
+        with patch('orders.import_reader.cti_excel_po_davkach', side_effect=lambda *args, **kwargs: iter([df.copy()])):
+            self.admin.import_view(valid_req)
+        tmp_token = next(iter(valid_req.session.get('import_tmp_files', {})), None)
+        self.assertTrue(tmp_token)
+
+        import_req = self.get_request('post', data={'tmp_token': tmp_token}, path=url)
+        import_req.session = valid_req.session
+        import_req._messages = FallbackStorage(import_req)
+        with patch('orders.admin.prekracuje_prah', return_value=True), patch('orders.import_reader.cti_excel_po_davkach') as reader_mock:
+            resp = self.admin.import_view(import_req)
+
+        # Potvrzení jen zařadí úlohu, Excel se znovu nečte a nic se zatím neuloží
+        reader_mock.assert_not_called()
+        uloha = Uloha.objects.get()
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp['Location'], reverse('uloha_detail', args=[uloha.pk]))
+        self.assertEqual((uloha.typ, uloha.stav, uloha.celkem), (TypUlohyChoice.IMPORT_ZAKAZEK, StavUlohyChoice.CEKA, 5))
+        self.assertNotIn(tmp_token, import_req.session['import_tmp_files'])
+        self.assertFalse(Bedna.objects.exclude(id__in=existing_ids).exists())
+
+        call_command('run_jobs', '--once', stdout=io.StringIO())
+
+        uloha.refresh_from_db()
+        self.assertEqual(uloha.stav, StavUlohyChoice.HOTOVO, uloha.zprava)
+        self.assertEqual((uloha.prubeh, uloha.vytvoril), (5, self.user))
+        self.assertIn('a 5 beden', uloha.zprava)
+        self.assertEqual(Bedna.objects.exclude(id__in=existing_ids).count(), 5)
+        self.assertIsNone(nacti_parsovany_import(tmp_token, uloha.parametry['hash']))
+
     def test_save_formset_creates_bedny(self):
         admin_form = type('F', (), {'instance': self.kamion})()
 
@@ -1040,11 +1107,14 @@ class KamionAdminTests(AdminBase):
         self.assertEqual(self.admin.get_typ_kamionu(self.kamion), 'Nepřijatý')
 
         # Komplet přijatý: žádná NEPRIJATO, aspoň jedna "skladem" (např. PRIJATO)
+        # Hromadná změna stavu přepočítá souhrny jako akce (typ kamionu se čte ze souhrnu kamionu).
         z1.bedny.update(stav_bedny=StavBednyChoice.PRIJATO)
+        oznac_zmenu_souhrnu(zakazka_ids=[z1.pk])
         self.assertEqual(self.admin.get_typ_kamionu(self.kamion), 'Komplet přijatý')
 
         # Vyexpedovaný: všechny zakázky expedovány a všechny bedny ve stavu EXPEDOVANO
         z1.bedny.update(stav_bedny=StavBednyChoice.EXPEDOVANO)
+        oznac_zmenu_souhrnu(zakazka_ids=[z1.pk])
         z1.expedovano = True
         z1.save()
         self.assertEqual(self.admin.get_typ_kamionu(self.kamion), 'Vyexpedovaný')
@@ -2845,6 +2915,34 @@ class SarzeKrokAdminActionTests(AdminBase):
         self.krok.datum_konce = None
         self.assertEqual(self.admin.get_datum_konce(self.krok), '-')
 
+    def test_changelist_doplni_prodlevy_strance_jednim_dotazem(self):
+        pec = Zarizeni.objects.create(
+            kod_zarizeni='XL9',
+            nazev_zarizeni='Pec XL9',
+            zkraceny_nazev_zarizeni='XL9',
+            typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+        )
+        for poradi, (zacatek, konec) in enumerate([(time(6, 0), time(7, 0)), (time(7, 15), time(8, 0)), (time(9, 0), time(10, 0))], start=2):
+            SarzeKrok.objects.create(
+                sarze=self.sarze, poradi=poradi, datum=date.today(), zarizeni=pec,
+                zacatek=zacatek, konec=konec, operator='OP',
+            )
+        request = self.factory.get('/')
+        request.user = self.user
+        changelist = self.admin.get_changelist_instance(request)
+
+        # Dotaz potřebuje jen první krok pece, jehož předchozí krok není na stránce.
+        with self.assertNumQueries(1):
+            prodlevy = {
+                (krok.zarizeni.kod_zarizeni, krok.zacatek): self.admin.get_prodleva(krok)
+                for krok in changelist.result_list
+            }
+
+        self.assertEqual(prodlevy[('XL9', time(6, 0))], '-')
+        self.assertEqual(prodlevy[('XL9', time(7, 15))], 15)
+        self.assertEqual(prodlevy[('XL9', time(9, 0))], 60)
+        self.assertEqual(prodlevy[('B1', time(7, 30))], '-')
+
     def test_sarzekrok_changelist_includes_polling(self):
         self.client.force_login(self.user)
         response = self.client.get(reverse('admin:orders_sarzekrok_changelist'))
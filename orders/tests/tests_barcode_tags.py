@@ -1,9 +1,20 @@
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 from types import SimpleNamespace
+from unittest.mock import patch
 
+from django.core.management import call_command
+from django.template import Context, Template
 from django.test import SimpleTestCase
 from django.urls import reverse
 
+from orders.models import Bedna
+from orders.services import barcode_service
 from orders.templatetags.barcode_tags import (
+    bedna_code128,
     bedna_code128_svg,
     bedna_qr_svg,
     bedna_scan_url,
@@ -11,7 +22,22 @@ from orders.templatetags.barcode_tags import (
 )
 
 
-class BarcodeTagsTests(SimpleTestCase):
+from .tests_models import ModelsBase
+
+
+class UlozisteKoduMixin:
+    """Každý test pracuje s vlastním dočasným úložištěm kódů."""
+
+    def setUp(self):
+        super().setUp()
+        self.adresar = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.adresar, ignore_errors=True)
+        nastaveni = self.settings(BARCODE_CACHE_DIR=self.adresar, BARCODE_FORMAT='svg')
+        nastaveni.enable()
+        self.addCleanup(nastaveni.disable)
+
+
+class BarcodeTagsTests(UlozisteKoduMixin, SimpleTestCase):
     def test_bedna_qr_svg_uses_scan_url(self):
         bedna = SimpleNamespace(cislo_bedny=123456)
         context = {"barcode_base_url": "https://example.test/"}
@@ -44,3 +70,75 @@ class BarcodeTagsTests(SimpleTestCase):
         svg = str(sarze_code128_svg(sarze)).lstrip()
 
         self.assertTrue(svg.startswith("<svg"))
+
+
+class UlozisteKoduTests(UlozisteKoduMixin, SimpleTestCase):
+    def test_kod_se_ulozi_na_disk_a_dalsi_cteni_ho_negeneruje(self):
+        svg = barcode_service.kod_svg(barcode_service.CODE128, 123456)
+        cesta = barcode_service.cesta_kodu(barcode_service.CODE128, 123456)
+
+        self.assertTrue(cesta.exists())
+        self.assertEqual(cesta.read_text(encoding='utf-8'), svg)
+        # Jiný proces (prázdná paměťová cache) kód jen načte z disku.
+        barcode_service._svg_z_uloziste.cache_clear()
+        with patch.object(barcode_service, '_code128', side_effect=AssertionError("generuje se znovu")):
+            self.assertEqual(barcode_service.kod_svg(barcode_service.CODE128, 123456), svg)
+
+    def test_klic_rozlisuje_hodnotu_format_a_druh(self):
+        cesty = {
+            barcode_service.cesta_kodu(barcode_service.CODE128, 1),
+            barcode_service.cesta_kodu(barcode_service.CODE128, 2),
+            barcode_service.cesta_kodu(barcode_service.CODE128, 1, barcode_service.PNG),
+            barcode_service.cesta_kodu(barcode_service.QR, 1),
+        }
+        self.assertEqual(len(cesty), 4)
+
+    def test_predgenerovani_vygeneruje_jen_chybejici_kody(self):
+        self.assertEqual(barcode_service.predgeneruj_kody_beden([1, 2, None]), 2)
+        self.assertEqual(barcode_service.predgeneruj_kody_beden([1, 2, 3]), 1)
+
+    def test_png_format_vlozi_predrastrovany_obrazek(self):
+        bedna = SimpleNamespace(cislo_bedny=123456)
+        with self.settings(BARCODE_FORMAT='png'):
+            barcode_service.predgeneruj_kody_beden([123456])
+            cesta = barcode_service.cesta_kodu(barcode_service.CODE128, 123456, barcode_service.PNG)
+            with patch.object(barcode_service, '_code128', side_effect=AssertionError("generuje se při tisku")):
+                html = str(bedna_code128(bedna))
+
+        self.assertTrue(cesta.read_bytes().startswith(b'\x89PNG'))
+        self.assertIn(f'src="{cesta.resolve().as_uri()}"', html)
+        self.assertTrue(html.startswith('<img'))
+
+    def test_sablona_karty_pouzije_kod_z_uloziste(self):
+        bedna = SimpleNamespace(cislo_bedny=123456)
+        html = Template(
+            '{% include "orders/karta_bedny/_bedna_identification_codes.html" %}'
+        ).render(Context({'bedna': bedna}))
+
+        self.assertIn('<svg', html)
+        self.assertTrue(barcode_service.cesta_kodu(barcode_service.CODE128, 123456).exists())
+
+
+class PredgenerovaniKoduBedenTests(UlozisteKoduMixin, ModelsBase):
+    def test_nova_bedna_ma_kod_po_potvrzeni_transakce(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bedna = Bedna.objects.create(
+                zakazka=self.zakazka, hmotnost=Decimal("2"), tara=Decimal("1"), mnozstvi=1,
+            )
+
+        self.assertTrue(barcode_service.cesta_kodu(barcode_service.CODE128, bedna.cislo_bedny).exists())
+
+    def test_ulozeni_existujici_bedny_kod_negeneruje(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.bedna1.poznamka = "změna"
+            self.bedna1.save()
+
+        self.assertEqual(callbacks, [])
+
+    def test_prikaz_predgeneruje_kody_existujicich_beden(self):
+        call_command('predgeneruj_kody', format=barcode_service.PNG, stdout=StringIO())
+
+        for bedna in (self.bedna1, self.bedna2):
+            self.assertTrue(
+                barcode_service.cesta_kodu(barcode_service.CODE128, bedna.cislo_bedny, barcode_service.PNG).exists()
+            )
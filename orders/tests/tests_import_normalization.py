@@ -0,0 +1,373 @@
+import logging
+import random
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from orders import import_normalization as normalizace
+from orders.choices import PrioritaChoice
+
+logger = logging.getLogger('orders')
+
+EUROTEC_XLSX = settings.BASE_DIR / 'Eurotec.xlsx'
+PRIKLADU = 300
+
+
+# --- Původní řádkové funkce strategií, vůči kterým se ověřuje sloupcová normalizace ---
+
+def puvodni_rozdel_rozmer_eur(row):
+    try:
+        text = str(row.get('rozmer', '') or '')
+        text = text.replace('×', 'x').replace('X', 'x')
+        prumer_str, delka_str = text.replace(',', '.').split('x')
+        return Decimal(prumer_str.strip()), Decimal(delka_str.strip())
+    except Exception:
+        return None, None
+
+
+def puvodni_priorita(row):
+    if pd.notna(row['dodatecne_info']) and 'sehr eilig' in row['dodatecne_info'].lower():
+        return PrioritaChoice.VYSOKA
+    elif pd.notna(row['dodatecne_info']) and 'eilig' in row['dodatecne_info'].lower():
+        return PrioritaChoice.STREDNI
+    return PrioritaChoice.NIZKA
+
+
+def puvodni_celozavit(row):
+    return bool(pd.notna(row['popis']) and 'konstrux' in row['popis'].lower())
+
+
+def puvodni_odfosfatovat(row):
+    return bool(pd.notna(row['dodatecne_info']) and 'muss entphosphatiert werden' in row['dodatecne_info'].lower())
+
+
+def puvodni_mnozstvi(row):
+    try:
+        hmotnost = row.get('hmotnost')
+        hmotnost_ks = row.get('hmotnost_ks')
+        if pd.isna(hmotnost) or pd.isna(hmotnost_ks) or hmotnost_ks == 0:
+            return 1
+        return max(int(hmotnost / hmotnost_ks), 1)
+    except Exception:
+        return 1
+
+
+def puvodni_split_behalter(val):
+    if pd.isna(val):
+        return (pd.NA, '')
+    s = str(val).strip()
+    match = re.match(r'^(\d+)(.*)$', s)
+    if match:
+        return (int(match.group(1)), match.group(2).strip())
+    return (pd.NA, s)
+
+
+def puvodni_normalize_behalter(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int,)):
+        return str(value)
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return str(value).rstrip('0').rstrip('.')
+    text = str(value).strip()
+    match = re.match(r'^(\d+)\.0+$', text)
+    if match:
+        return match.group(1)
+    return text
+
+
+def puvodni_cele_cislo_spx(value):
+    digits = re.sub(r"\D", "", str(value or "").strip())
+    return int(digits) if digits else None
+
+
+def puvodni_desetinne_cislo_spx(value):
+    text = str(value or "").replace(',', '.').strip()
+    match = re.search(r"([0-9]+(?:\.[0-9]+)?)", text)
+    if not match:
+        return None
+    return Decimal(match.group(1)).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
+
+
+def puvodni_rozdel_rozmer_spx(value):
+    pattern = re.compile(r"^(?:(?P<prefix>.*?)\s+)?(?P<prumer>[0-9]+[.,]?[0-9]*)\*(?P<delka>[0-9]+[.,]?[0-9]*)")
+    text = str(value or '').replace('×', '*').replace('X', '*').strip()
+    if not text:
+        return None, None, None
+    match = pattern.match(text)
+    if not match:
+        return None, None, None
+    prefix = (match.group('prefix') or '').strip()
+    prumer = Decimal(match.group('prumer').replace(',', '.')).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
+    delka = Decimal(match.group('delka').replace(',', '.')).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP)
+    return prefix, prumer, delka
+
+
+def puvodni_nahled_eur(df):
+    error_values = '!!!!!!'
+    preview = []
+    for _, r in df.iterrows():
+        raw_datum = r.get('datum')
+        datum_fmt = error_values
+        if pd.notna(raw_datum):
+            if hasattr(raw_datum, 'strftime'):
+                datum_fmt = raw_datum.strftime('%d.%m.%Y')
+            else:
+                dconv = pd.to_datetime(raw_datum, errors='coerce')
+                if pd.notna(dconv):
+                    datum_fmt = dconv.strftime('%d.%m.%Y')
+        beh_raw = r.get('behalter_nr')
+        try:
+            predpis_val = int(r.get('predpis')) if pd.notna(r.get('predpis')) else error_values
+        except Exception:
+            predpis_val = error_values
+        preview.append({
+            'datum': datum_fmt,
+            'behalter_nr': str(beh_raw).strip() if pd.notna(beh_raw) else error_values,
+            'artikl': str(r.get('artikl')).strip() if pd.notna(r.get('artikl')) else error_values,
+            'prumer': r.get('prumer') if pd.notna(r.get('prumer')) else error_values,
+            'predpis': predpis_val,
+            'hmotnost': r.get('hmotnost') if pd.notna(r.get('hmotnost')) else error_values,
+            'vrstva': str(r.get('vrstva')).strip() if pd.notna(r.get('vrstva')) else error_values,
+        })
+    return preview
+
+
+def klic(hodnota):
+    """Porovnávací klíč – prázdné hodnoty jsou si rovny, Decimal se porovnává i zápisem (8 vs 8.0)."""
+    if hodnota is None or hodnota is pd.NA or (isinstance(hodnota, float) and np.isnan(hodnota)):
+        return ('NA',)
+    if isinstance(hodnota, Decimal):
+        return ('Decimal', str(hodnota))
+    if isinstance(hodnota, (bool, np.bool_)):
+        return ('bool', bool(hodnota))
+    if isinstance(hodnota, (int, np.integer)):
+        return ('int', int(hodnota))
+    return (type(hodnota).__name__, hodnota)
+
+
+# --- Generátory příkladů ve stylu Eurotec.xlsx ---
+
+def nahodny_rozmer(rng):
+    prumer = rng.choice(['8', '10', '6,5', '12.0', ' 8 ', 'x', '', None, np.nan, 'abc', '1e1'])
+    delka = rng.choice(['220', '500', '60,5', '100.00', ' 90', '', 'y'])
+    oddelovac = rng.choice(['x', 'X', '×', ' x ', '*', 'xx'])
+    if prumer is None or (isinstance(prumer, float) and np.isnan(prumer)):
+        return prumer
+    return f"{prumer}{oddelovac}{delka}"
+
+
+def nahodny_text(rng):
+    return rng.choice([
+        None, np.nan, '', 'sehr eilig', 'EILIG!', 'Muss entphosphatiert werden', 'müssen gerichtet werden',
+        'HSPT SK DAG T40 8x220/95', 'KonstruX SK 8x300', 'eilig, muss entphosphatiert werden', '  ',
+    ])
+
+
+def nahodny_behalter(rng):
+    return rng.choice([
+        None, np.nan, 37, 0, 12.0, 12.5, 1e3, '12', ' 12a ', '12.000', '007', 'B-12', '12 b', 'abc', '', 3.25,
+    ])
+
+
+def nahodne_cislo(rng):
+    return rng.choice([None, np.nan, 0, 0.0, 320.0, 329.5, 1, 0.046, 0.104, -5.0, 1e-9, float('inf')])
+
+
+def nahodny_text_spx(rng):
+    return rng.choice([
+        '', None, 0, '1.000 ST', '250', '12,5 kg', 'kg', ' 7,25 ', 'abc 3.456 def', 42, 12.5, '0',
+    ])
+
+
+def nahodny_rozmer_spx(rng):
+    return rng.choice([
+        '', None, 'TG 6,0*160,00', '6,0*160,00', '6.0X80', 'TG6*80', 'SPAX 4×40', '*', 'abc', ' 5*50 ', 'A B 8,*12',
+    ])
+
+
+def nahodny_dataframe_eur(rng, pocet):
+    return pd.DataFrame({
+        'rozmer': [nahodny_rozmer(rng) for _ in range(pocet)],
+        'dodatecne_info': [nahodny_text(rng) for _ in range(pocet)],
+        'popis': [nahodny_text(rng) for _ in range(pocet)],
+        'hmotnost': [nahodne_cislo(rng) for _ in range(pocet)],
+        'hmotnost_ks': [nahodne_cislo(rng) for _ in range(pocet)],
+        'behalter_nr': [nahodny_behalter(rng) for _ in range(pocet)],
+    })
+
+
+def eurotec_dataframe():
+    """Sloupce z Eurotec.xlsx pojmenované jako po přejmenování v EURImportStrategy."""
+    df = pd.read_excel(
+        EUROTEC_XLSX, nrows=200, engine='openpyxl',
+        dtype={'Artikel- nummer': str, 'Vorgang+': str, 'Material- charge': str},
+    )
+    return df.rename(columns={
+        'Unnamed: 7': 'rozmer',
+        'Abhol- datum': 'datum',
+        'Material- charge': 'sarze',
+        'Artikel- nummer': 'artikl',
+        'Be-schich-tung': 'vrstva',
+        'Bezeichnung': 'popis',
+        'n. Zg. / \nas drg': 'predpis',
+        'Gewicht in kg': 'hmotnost',
+        'Behälter-Nr.:': 'behalter_nr',
+        'Sonder / Zusatzinfo': 'dodatecne_info',
+        'Gew.': 'hmotnost_ks',
+    })
+
+
+class ImportNormalizationTests(SimpleTestCase):
+    """Sloupcová normalizace musí dávat stejné hodnoty jako původní řádkové funkce."""
+
+    def assertStejneHodnoty(self, vysledek, ocekavane):
+        self.assertEqual([klic(v) for v in vysledek], [klic(v) for v in ocekavane])
+
+    def zkontroluj_eur(self, df):
+        prumer, delka, chybne = normalizace.rozdel_rozmer_eur(df['rozmer'])
+        ocekavane = [puvodni_rozdel_rozmer_eur(r) for _, r in df.iterrows()]
+        self.assertStejneHodnoty(prumer, [p for p, _ in ocekavane])
+        self.assertStejneHodnoty(delka, [d for _, d in ocekavane])
+        self.assertEqual(list(chybne), [p is None for p, _ in ocekavane])
+
+        texty = df[df['dodatecne_info'].map(lambda v: v is None or isinstance(v, (str, float)))]
+        self.assertEqual(list(normalizace.priorita(texty['dodatecne_info'])), [puvodni_priorita(r) for _, r in texty.iterrows()])
+        self.assertEqual(list(normalizace.odfosfatovat(texty['dodatecne_info'])), [puvodni_odfosfatovat(r) for _, r in texty.iterrows()])
+        self.assertEqual(list(normalizace.celozavit(df['popis'])), [puvodni_celozavit(r) for _, r in df.iterrows()])
+
+        mnozstvi = normalizace.mnozstvi_v_bedne(df['hmotnost'], df['hmotnost_ks'])
+        self.assertStejneHodnoty(mnozstvi, list(df.apply(puvodni_mnozstvi, axis=1)))
+
+        behalter = normalizace.normalizuj_behalter(df['behalter_nr'])
+        ocekavane_behalter = df['behalter_nr'].apply(puvodni_normalize_behalter)
+        self.assertStejneHodnoty(behalter, ocekavane_behalter)
+
+        cislo, pripona = normalizace.rozdel_behalter(behalter)
+        rozdeleno = ocekavane_behalter.apply(puvodni_split_behalter)
+        self.assertStejneHodnoty(cislo, pd.to_numeric(rozdeleno.str[0], errors='coerce').astype('Int64'))
+        self.assertEqual(list(pripona), list(rozdeleno.str[1].fillna('').astype(str)))
+
+    def test_eurotec_xlsx(self):
+        if not EUROTEC_XLSX.exists():
+            self.skipTest("Soubor Eurotec.xlsx není k dispozici.")
+        df = eurotec_dataframe()
+        self.zkontroluj_eur(df)
+
+        df['prumer'], _, _ = normalizace.rozdel_rozmer_eur(df['rozmer'])
+        sloupce = {
+            'datum': normalizace.format_datum,
+            'behalter_nr': normalizace.text_nebo_chyba,
+            'artikl': normalizace.text_nebo_chyba,
+            'prumer': normalizace.hodnota_nebo_chyba,
+            'predpis': normalizace.format_cele_cislo,
+            'hmotnost': normalizace.hodnota_nebo_chyba,
+            'vrstva': normalizace.text_nebo_chyba,
+        }
+        nahled = normalizace.nahled(df, sloupce)
+        ocekavany = puvodni_nahled_eur(df)
+        self.assertEqual(
+            [{k: klic(v) for k, v in radek.items()} for radek in nahled],
+            [{k: klic(v) for k, v in radek.items()} for radek in ocekavany],
+        )
+
+    def test_nahodne_priklady_eur(self):
+        rng = random.Random(20250603)
+        for _ in range(5):
+            self.zkontroluj_eur(nahodny_dataframe_eur(rng, PRIKLADU // 5))
+
+    def test_nahodne_priklady_spx(self):
+        rng = random.Random(4444)
+        mnozstvi = pd.Series([nahodny_text_spx(rng) for _ in range(PRIKLADU)], dtype=object)
+        hodnoty, chyby = normalizace.cele_cislo_spx(mnozstvi)
+        ocekavane = mnozstvi.apply(puvodni_cele_cislo_spx)
+        self.assertStejneHodnoty(hodnoty, ocekavane)
+        self.assertEqual(str(hodnoty.dtype), str(ocekavane.dtype))
+        self.assertEqual(len(chyby), int(ocekavane.isna().sum()))
+
+        hmotnost, _ = normalizace.desetinne_cislo_spx(mnozstvi, 'hmotnost')
+        self.assertStejneHodnoty(hmotnost, mnozstvi.apply(puvodni_desetinne_cislo_spx))
+
+        brutto = pd.Series([nahodny_text_spx(rng) for _ in range(PRIKLADU)], dtype=object)
+        brutto, _ = normalizace.desetinne_cislo_spx(brutto, 'brutto')
+        tara, chyby = normalizace.tara_spx(brutto, hmotnost)
+        for b, h, t in zip(brutto, hmotnost, tara):
+            if b is None or h is None or h == 0 or b == 0 or b <= h:
+                self.assertIsNone(t)
+            else:
+                self.assertEqual(t, (b - h).quantize(Decimal('0.0'), rounding=ROUND_HALF_UP))
+        self.assertEqual(len(chyby), sum(t is None for t in tara))
+
+        rozmer = pd.Series([nahodny_rozmer_spx(rng) for _ in range(PRIKLADU)], dtype=object)
+        prefix, prumer, delka, chyby = normalizace.rozdel_rozmer_spx(rozmer)
+        ocekavane = [puvodni_rozdel_rozmer_spx(v) for v in rozmer]
+        self.assertStejneHodnoty(prefix, [o[0] for o in ocekavane])
+        self.assertStejneHodnoty(prumer, [o[1] for o in ocekavane])
+        self.assertStejneHodnoty(delka, [o[2] for o in ocekavane])
+        self.assertEqual(len(chyby), sum(o[1] is None for o in ocekavane))
+
+        popis = pd.Series([rng.choice(['SPAX-3 TK ', ' vrut', '']) for _ in range(PRIKLADU)], dtype=object)
+        self.assertEqual(
+            list(normalizace.popis_s_prefixem(popis, prefix)),
+            [
+                f"{p.strip()} {pre}".strip() if pd.notna(pre) and str(pre).strip() else p.strip()
+                for p, pre in zip(popis, prefix)
+            ],
+        )
+
+    def test_benchmark_na_1000_radku(self):
+        """
+        Micro-benchmark normalizace EUR na 1000 řádků: sloupcově vs. řádkové df.apply a iterrows.
+        Časy se jen logují, shodu výsledků ověřují testy výše.
+        """
+        rng = random.Random(1000)
+        df = nahodny_dataframe_eur(rng, 1000)
+        df['dodatecne_info'] = df['dodatecne_info'].fillna('')
+        df['popis'] = df['popis'].fillna('')
+        df['datum'] = [rng.choice([date(2025, 6, 3), datetime(2025, 6, 4), '2025-06-05', None]) for _ in range(1000)]
+
+        def po_radcich():
+            vysledek = df.copy()
+            vysledek[['prumer', 'delka']] = vysledek.apply(lambda row: pd.Series(puvodni_rozdel_rozmer_eur(row)), axis=1)
+            vysledek['priorita'] = vysledek.apply(puvodni_priorita, axis=1)
+            vysledek['celozavit'] = vysledek.apply(puvodni_celozavit, axis=1)
+            vysledek['odfosfatovat'] = vysledek.apply(puvodni_odfosfatovat, axis=1)
+            vysledek['mnozstvi'] = vysledek.apply(puvodni_mnozstvi, axis=1)
+            vysledek['behalter_nr'] = vysledek['behalter_nr'].apply(puvodni_normalize_behalter)
+            vysledek[['num', 'suffix']] = vysledek['behalter_nr'].apply(puvodni_split_behalter).apply(pd.Series)
+            return puvodni_nahled_eur(vysledek)
+
+        def sloupcove():
+            vysledek = df.copy()
+            vysledek['prumer'], vysledek['delka'], _ = normalizace.rozdel_rozmer_eur(vysledek['rozmer'])
+            vysledek['priorita'] = normalizace.priorita(vysledek['dodatecne_info'])
+            vysledek['celozavit'] = normalizace.celozavit(vysledek['popis'])
+            vysledek['odfosfatovat'] = normalizace.odfosfatovat(vysledek['dodatecne_info'])
+            vysledek['mnozstvi'] = normalizace.mnozstvi_v_bedne(vysledek['hmotnost'], vysledek['hmotnost_ks'])
+            vysledek['behalter_nr'] = normalizace.normalizuj_behalter(vysledek['behalter_nr'])
+            vysledek['num'], vysledek['suffix'] = normalizace.rozdel_behalter(vysledek['behalter_nr'])
+            return normalizace.nahled(vysledek, {
+                'datum': normalizace.format_datum,
+                'behalter_nr': normalizace.text_nebo_chyba,
+                'prumer': normalizace.hodnota_nebo_chyba,
+                'hmotnost': normalizace.hodnota_nebo_chyba,
+            })
+
+        casy = {}
+        for nazev, funkce in (('po_radcich', po_radcich), ('sloupcove', sloupcove)):
+            zacatek = time.perf_counter()
+            funkce()
+            casy[nazev] = time.perf_counter() - zacatek
+
+        logger.info(
+            f"Benchmark normalizace importu EUR na 1000 řádků: po řádcích {casy['po_radcich'] * 1000:.1f} ms, "
+            f"sloupcově {casy['sloupcove'] * 1000:.1f} ms."
+        )
@@ -0,0 +1,165 @@
+import io
+import logging
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+import pandas as pd
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase
+from openpyxl import Workbook
+
+from orders import import_reader
+from orders.import_reader import cti_excel_po_davkach
+from orders.import_strategies import EURImportStrategy, SPXImportStrategy
+
+logger = logging.getLogger('orders')
+
+HLAVICKA_EUR = [
+    None, 'Abhol- datum', 'Prod. Datum', 'Material- charge', 'Vorgang+', 'Artikel- nummer', None, None,
+    'Be-schich-tung', 'Bezeichnung', 'n. Zg. / \nas drg', 'Material', 'Ober- fläche', 'Gewicht in kg', 'Tara kg',
+    'Gew + Tara', 'Menge       ', 'Behälter-Nr.:', 'VPE', 'Box', 'Anzahl Boxen pro Behälter', 'Gew.',
+    'Unterschrift Kontrolle  \nLabel + CE \nRoth / Wulfert', 'Härterei', 'von Härterei \nnach Galvanik',
+    'Galvanik', 'vom Galvanik nach Eurotec', 'Sonder / Zusatzinfo', 'Lief.', 'Fertigungs- auftrags Nr.', 'Bediener',
+]
+
+
+def sesit(radky, zahlavi=()):
+    """Obsah xlsx souboru s jedním listem zapsaný v režimu write_only."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for radek in list(zahlavi) + list(radky):
+        ws.append(radek)
+    vystup = io.BytesIO()
+    wb.save(vystup)
+    return vystup.getvalue()
+
+
+def obecne_radky(pocet):
+    yield ['cislo', 'kod', 'text', 'hodnota', 'datum', 'poznamka']
+    for i in range(pocet):
+        yield [
+            i, f"{i:06d}", f"radek {i % 37}", i * 0.25,
+            datetime(2025, 1, 1) + timedelta(days=i % 30),
+            'pozn' if i % 7 == 0 else None,
+        ]
+
+
+def eur_radky(pocet):
+    yield HLAVICKA_EUR
+    for i in range(pocet):
+        prumer = 6 + i % 3
+        delka = 40 + 10 * (i % 20)
+        yield [
+            f"{i + 1}.", datetime(2025, 6, 3), datetime(2025, 5, 23), 420000 + i // 10, '030625', 944000 + i // 10,
+            'SK', f"{prumer}x{delka}", '5-8', f"HSPT SK DAG T40 {prumer}x{delka}/95", 1052, '19MnB4', 'blau',
+            320, 61, 381, None, i + 1, None, None, None, 0.046, None, None, None, None, None,
+            'muss entphosphatiert werden' if i % 2 else None, 'FN', f"02510-{i:05d}", None,
+        ]
+
+
+def spx_radky(pocet_beden):
+    yield ['Bestellnr.', 'Material', 'Kurztext', 'Menge', 'ME Gewicht', 'GE']
+    for i in range(pocet_beden):
+        yield [f"WO-{i}", f"SPX-{i % 40}", 'SPAX-3 SMK vrut', '12', '24,0', '30,5']
+        yield [f"SARZE-{i}", f"SPX-{i % 40}", f"TG {5 + i % 2},0*{100 + i % 50},0", '', '', '']
+
+
+def request_importu():
+    request = RequestFactory().post('/admin/orders/kamion/import-zakazek/')
+    request.user = AnonymousUser()
+    return request
+
+
+class StreamoveCteniExceluTests(SimpleTestCase):
+    """Testy proudového čtení Excelu po dávkách."""
+
+    def test_10k_radku_po_davkach_odpovida_read_excel(self):
+        obsah = sesit(obecne_radky(10000))
+        prubeh = []
+
+        davky = list(cti_excel_po_davkach(io.BytesIO(obsah), dtype={'kod': str}, prubeh=prubeh.append))
+
+        self.assertEqual([len(davka) for davka in davky], [1000] * 10)
+        self.assertEqual(prubeh, list(range(1000, 10001, 1000)))
+        ocekavane = pd.read_excel(io.BytesIO(obsah), engine='openpyxl', dtype={'kod': str})
+        pd.testing.assert_frame_equal(pd.concat(davky), ocekavane)
+
+    def test_drzi_v_pameti_jen_jednu_davku(self):
+        """V okamžiku vrácení dávky nejsou z listu převedené žádné další řádky – v paměti je jen jedna dávka."""
+        obsah = sesit(obecne_radky(10000))
+        prevedeno = []
+        puvodni_radek = import_reader._radek
+
+        def pocitany_radek(cells):
+            prevedeno.append(1)
+            return puvodni_radek(cells)
+
+        vraceno = 0
+        nejvic_rozpracovano = 0
+        with patch('orders.import_reader._radek', side_effect=pocitany_radek):
+            for davka in cti_excel_po_davkach(io.BytesIO(obsah), velikost_davky=500):
+                vraceno += len(davka)
+                nejvic_rozpracovano = max(nejvic_rozpracovano, len(prevedeno) - 1 - vraceno)
+                del davka
+        self.assertEqual(vraceno, 10000)
+        self.assertLessEqual(nejvic_rozpracovano, 0)
+        self.assertEqual(len(prevedeno), 10001)
+
+    def test_cteni_konci_na_prvnim_prazdnem_radku(self):
+        radky = [['a', 'b'], [1, 'x'], [2, 'y'], [], ['Summe', 3], [], []]
+        obsah = sesit(radky)
+
+        df = pd.concat(cti_excel_po_davkach(io.BytesIO(obsah), velikost_davky=2))
+        self.assertEqual(df.to_dict('list'), {'a': [1, 2], 'b': ['x', 'y']})
+
+        df = pd.concat(cti_excel_po_davkach(io.BytesIO(obsah), velikost_davky=2, do_prazdneho_radku=False))
+        pd.testing.assert_frame_equal(df, pd.read_excel(io.BytesIO(obsah), engine='openpyxl'))
+
+    def test_prazdny_list_vrati_prazdny_dataframe(self):
+        davky = list(cti_excel_po_davkach(io.BytesIO(sesit([['a', 'b']]))))
+        self.assertEqual(len(davky), 1)
+        self.assertEqual(list(davky[0].columns), ['a', 'b'])
+        self.assertTrue(davky[0].empty)
+
+
+class StreamovyImportStrategiiTests(SimpleTestCase):
+    """Import velkých manifestů přes strategie – bez limitu řádků, normalizace po dávkách."""
+
+    def test_eur_10k_radku_bez_limitu(self):
+        obsah = sesit(eur_radky(10000))
+        prubeh = []
+
+        zacatek = time.perf_counter()
+        df, preview, errors, warnings, required_fields = EURImportStrategy().parse_excel(
+            io.BytesIO(obsah), request_importu(), None, prubeh=prubeh.append,
+        )
+        logger.info(f"Streamové čtení EUR manifestu 10000 řádků: {time.perf_counter() - zacatek:.2f} s.")
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(df), 10000)
+        self.assertEqual(len(preview), 10000)
+        self.assertEqual(prubeh, list(range(1000, 10001, 1000)))
+        self.assertEqual(sorted(df['behalter_nr']), sorted(str(i) for i in range(1, 10001)))
+        self.assertEqual(int(df['odfosfatovat'].sum()), 5000)
+        prvni = df.iloc[0]
+        self.assertEqual((prvni['prumer'], prvni['delka']), (Decimal('6'), Decimal('40')))
+        self.assertNotIn('rozmer', df.columns)
+
+    def test_spx_10k_radku_po_dvojicich(self):
+        obsah = sesit(spx_radky(5000), zahlavi=[['Lieferschein']] + [[]] * 4)
+        prubeh = []
+
+        df, preview, errors, warnings, required_fields = SPXImportStrategy().parse_excel(
+            io.BytesIO(obsah), request_importu(), None, prubeh=prubeh.append,
+        )
+
+        self.assertEqual(errors, [])
+        self.assertEqual(prubeh, list(range(1000, 10001, 1000)))
+        self.assertEqual(len(df), 5000)
+        self.assertEqual(sorted(df['sarze']), sorted(f"SARZE-{i}" for i in range(5000)))
+        radek = df[df['vyrobni_zakazka'] == 'WO-1'].iloc[0]
+        self.assertEqual(radek['sarze'], 'SARZE-1')
+        self.assertEqual((radek['prumer'], radek['delka'], radek['tara']), (Decimal('6.0'), Decimal('101.0'), Decimal('6.5')))
+        self.assertEqual(radek['popis'], 'SPAX-3 SMK vrut TG')
@@ -292,6 +292,118 @@ class TestModels(ModelsBase):
         self.assertEqual(self.kamion_prijem.pocet_beden_expedovano, 1)
 
 
+class TestKamionWithTotals(ModelsBase):
+    """
+    Testy anotací Kamion.objects.with_totals() – hodnoty musí odpovídat property kamionu.
+    """
+    VLASTNOSTI = (
+        'celkova_hmotnost_netto',
+        'celkova_hmotnost_brutto',
+        'celkova_hmotnost_fakturovanych_netto',
+        'pocet_beden_skladem',
+        'pocet_beden_expedovano',
+        'pocet_beden_expedovano_fakturovanych',
+        'obsahuje_bedny_s_priznakem_nefakturovat',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bedna1.stav_bedny = StavBednyChoice.EXPEDOVANO
+        cls.bedna1.tryskat = TryskaniChoice.OTRYSKANA
+        cls.bedna1.save()
+        Bedna.objects.create(
+            zakazka=cls.zakazka,
+            hmotnost=Decimal("4.5"),
+            tara=Decimal("2"),
+            mnozstvi=1,
+            fakturovat=False,
+            rovnat=RovnaniChoice.VYROVNANA,
+        )
+
+    def test_with_totals_matches_properties(self):
+        for kamion in (self.kamion_prijem, self.kamion_vydej, self.kamion_prijem_rot):
+            anotovany = Kamion.objects.with_totals().get(pk=kamion.pk)
+            for vlastnost in self.VLASTNOSTI:
+                with self.subTest(kamion=kamion.pk, vlastnost=vlastnost):
+                    self.assertEqual(getattr(anotovany, vlastnost), getattr(Kamion.objects.get(pk=kamion.pk), vlastnost))
+        vydej = Kamion.objects.with_totals().get(pk=self.kamion_vydej.pk)
+        self.assertEqual(vydej.hmotnost_otryskanych_beden, self.kamion_vydej.hmotnost_otryskanych_beden)
+        self.assertEqual(vydej.hmotnost_vyrovnanych_beden, self.kamion_vydej.hmotnost_vyrovnanych_beden)
+
+    def test_with_totals_single_query_and_no_queries_per_row(self):
+        with self.assertNumQueries(1):
+            kamiony = list(Kamion.objects.with_totals())
+            for kamion in kamiony:
+                kamion.celkova_hmotnost_netto
+                kamion.celkova_hmotnost_brutto
+                kamion.pocet_beden_skladem
+        self.assertEqual(len(kamiony), 3)
+
+    def test_with_totals_not_inflated_by_filter_joins(self):
+        """Filtry přes bedny (jako v changelistu) nesmí násobit součty anotací."""
+        kamion = (
+            Kamion.objects.with_totals()
+            .filter(prijem_vydej=KamionChoice.PRIJEM, zakazky_prijem__bedny__stav_bedny=StavBednyChoice.NEPRIJATO)
+            .distinct()
+            .get(pk=self.kamion_prijem.pk)
+        )
+        self.assertEqual(kamion.celkova_hmotnost_netto, Decimal("8.5"))
+        self.assertEqual(kamion.pocet_beden_ann, 3)
+        self.assertTrue(kamion.ma_zakazky_ann)
+        self.assertTrue(kamion.ma_neexpedovane_zakazky_ann)
+        self.assertEqual(kamion.pocet_beden_neprijatych_ann, 2)
+
+
+class TestBednaWithPoradi(ModelsBase):
+    """
+    Testy anotací Bedna.objects.with_poradi() – hodnoty musí odpovídat property bedny.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.zakaznik_ssh = Zakaznik.objects.create(
+            nazev="SSH", zkraceny_nazev="SSH", zkratka="SSH", ciselna_rada=700000,
+        )
+        kamion_ssh = Kamion.objects.create(zakaznik=cls.zakaznik_ssh, datum=date.today(), prijem_vydej=KamionChoice.PRIJEM)
+        cls.zakazky_ssh = []
+        for pocet in (1, 5, 6, 9, 12):
+            zakazka = Zakazka.objects.create(
+                kamion_prijem=kamion_ssh, artikl=f"S{pocet}", prumer=Decimal("10"), delka=Decimal("100"),
+                predpis=cls.predpis, typ_hlavy=cls.typ_hlavy, popis="Test",
+            )
+            for _ in range(pocet):
+                Bedna.objects.create(zakazka=zakazka, hmotnost=Decimal("1"), tara=Decimal("1"), mnozstvi=1)
+            cls.zakazky_ssh.append(zakazka)
+
+    def test_with_poradi_matches_properties(self):
+        anotovane = Bedna.objects.with_poradi()
+        self.assertEqual(anotovane.count(), Bedna.objects.count())
+        for bedna in anotovane:
+            puvodni = Bedna.objects.get(pk=bedna.pk)
+            with self.subTest(bedna=bedna.cislo_bedny):
+                self.assertEqual(bedna.poradi_bedny, puvodni.poradi_bedny)
+                self.assertEqual(bedna.pocet_beden_v_zakazce, puvodni.zakazka.pocet_beden)
+                self.assertEqual(bedna.bedna_k_mereni_tvrdosti_a_povrchu_SSH, puvodni.bedna_k_mereni_tvrdosti_a_povrchu_SSH)
+
+    def test_with_poradi_subset_keeps_order_position(self):
+        """Pořadí a počet se počítají z celé zakázky i při výběru jen některých beden; řazení se zachová."""
+        zakazka = self.zakazky_ssh[-1]
+        vyber = Bedna.objects.filter(zakazka=zakazka).order_by('-cislo_bedny')[:3]
+        bedny = list(Bedna.objects.filter(pk__in=vyber.values('pk')).order_by('-cislo_bedny').with_poradi())
+        self.assertEqual([b.poradi_bedny for b in bedny], [12, 11, 10])
+        self.assertEqual({b.pocet_beden_v_zakazce for b in bedny}, {12})
+        self.assertEqual([b.bedna_k_mereni_tvrdosti_a_povrchu_SSH for b in bedny], [True, False, False])
+
+    def test_with_poradi_single_query(self):
+        with self.assertNumQueries(1):
+            for bedna in Bedna.objects.filter(zakazka__in=self.zakazky_ssh).with_poradi():
+                bedna.poradi_bedny
+                bedna.pocet_beden_v_zakazce
+                bedna.bedna_k_mereni_tvrdosti_a_povrchu_SSH
+
+
 class TestSarzeModels(ModelsBase):
     @classmethod
     def setUpTestData(cls):
@@ -439,6 +551,37 @@ class TestSarzeModels(ModelsBase):
         )
         self.assertEqual(current.prodleva, 90)
 
+    def test_sarzekrok_s_prodlevou_bez_dotazu_na_krok(self):
+        zar = Zarizeni.objects.create(
+            kod_zarizeni="ZP",
+            nazev_zarizeni="Zařízení prodleva",
+            typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+        )
+        zacatky = [(time(6, 0), time(8, 0)), (time(8, 20), time(10, 0)), (time(11, 0), None)]
+        for index, (zacatek, konec) in enumerate(zacatky):
+            SarzeKrok.objects.create(
+                sarze=Sarze.objects.create(cislo_sarze=200 + index, datum_zalozeni=date(2026, 2, 16)),
+                poradi=1,
+                datum=date(2026, 2, 16),
+                zarizeni=zar,
+                zacatek=zacatek,
+                konec=konec,
+                operator="Op",
+            )
+        ocekavane = [
+            (krok.pk, krok.prodleva, krok.takt)
+            for krok in SarzeKrok.objects.filter(zarizeni=zar).select_related('zarizeni')
+        ]
+
+        kroky = list(SarzeKrok.objects.filter(zarizeni=zar).s_prodlevou().order_by('datum', 'zacatek'))
+        # Jen první krok zařízení v querysetu dohledá předchozí krok dotazem.
+        with self.assertNumQueries(1):
+            vysledek = [(krok.pk, krok.prodleva, krok.takt) for krok in kroky]
+
+        self.assertEqual(sorted(vysledek), sorted(ocekavane))
+        self.assertEqual([prodleva for _pk, prodleva, _takt in vysledek], ['-', 20, 60])
+        self.assertEqual([takt for _pk, _prodleva, takt in vysledek], [2.0, 1.7, '-'])
+
     def test_sarzekrok_takt_cross_midnight(self):
         sarze = Sarze.objects.create(
             cislo_sarze=10,
@@ -0,0 +1,1503 @@
+import io
+import logging
+import os
+import sys
+import types
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, time as cas, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+from pypdf import PdfReader, PdfWriter
+from django.contrib.staticfiles import finders
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from orders import pdf_worker
+from orders.choices import KamionChoice, StavBednyChoice, StavUlohyChoice, TryskaniChoice, TypUlohyChoice, TypZarizeniChoice, ZinkovaniChoice
+from orders.import_strategies import EURImportStrategy
+from orders.models import (
+    Bedna, Cena, CitacCisel, Kamion, Predpis, Sarze, SarzeKrok, SarzeKrokBedna, SouhrnKamionu, SouhrnVyrobyZakaznika,
+    SouhrnVyrobyZarizeni, SouhrnZakazky, StatistikaKamionuMesice, Uloha, Zakazka, Zakaznik, Zarizeni,
+)
+from orders.services.cislovani_service import Rada, rada_beden, rezervuj
+from orders.services.cenik_service import CenikResolver, cenik_scope, invalidate_cenik
+from orders.services.dashboard_service import CELKEM, prehled_beden
+from orders.services.fakturace_service import build_fakturace_kamionu
+from orders.services.historie_service import CELKEM as HISTORIE_CELKEM, KG, PROSTOJ, ROSTY, RocniRady, historie_vyroby
+from orders.services.prvni_pouziti_service import prestav_prvni_pouziti, zkontroluj_prvni_pouziti
+from orders.services.vyroba_service import SMENA_DEN, SMENA_NOC, statistiky_vyroby
+from orders.services.import_service import (
+    ParsovanyImport,
+    cesta_parsovaneho_importu,
+    hash_souboru,
+    importuj_zakazky,
+    nacti_parsovany_import,
+    uklid_importy,
+    uloz_parsovany_import,
+    vyrad_prosle_importy,
+)
+from orders.services.souhrny_service import odlozene_souhrny, prestav_souhrny, zkontroluj_souhrny
+from orders.services.statistiky_kamionu_service import (
+    ODKLAD_ULOZENI_DNU,
+    dopln_statistiky_kamionu,
+    je_uzavreny,
+    porovnej_roky,
+    prestav_statistiky_kamionu,
+    statistiky_roku,
+)
+from orders.services.souhrny_vyroby_service import (
+    prepocitej_ceny_vyroby,
+    prestav_souhrny_vyroby,
+    zkontroluj_souhrny_vyroby,
+)
+from orders.services import ulohy_service
+from orders.services import pdf_cache_service
+from orders.services.exceptions import ServiceOperationError
+from orders.services.pdf_cards_service import build_cards_pdf
+from orders.services.pdf_render_service import RenderPool, vyrendruj_pdf, zavri_pool
+from orders.services.ulohy_service import (
+    VysledekUlohy,
+    nastav_prubeh,
+    oznac_prerusene_ulohy,
+    uklid_ulohy,
+    zarad_ulohu,
+    zpracuj_dalsi_ulohu,
+)
+from .tests_models import ModelsBase
+
+logger = logging.getLogger('orders')
+
+
+class CenikResolverTests(ModelsBase):
+    """Testy intervalového indexu ceníku."""
+
+    def setUp(self):
+        invalidate_cenik()
+
+    def test_resolve_respects_interval_boundaries(self):
+        """Délka rovná delka_min je v intervalu, délka rovná delka_max už ne."""
+        resolver = CenikResolver()
+        kwargs = {'zakaznik_id': self.zakaznik.pk, 'predpis_id': self.predpis.pk}
+        self.assertEqual(resolver.resolve(delka=Decimal('50'), **kwargs).cena_id, self.cena.pk)
+        self.assertEqual(resolver.resolve(delka=Decimal('149.9'), **kwargs).cena_id, self.cena.pk)
+        self.assertIsNone(resolver.resolve(delka=Decimal('150'), **kwargs))
+        self.assertIsNone(resolver.resolve(delka=Decimal('49.9'), **kwargs))
+
+    def test_overlapping_intervals_return_none(self):
+        """Překrývající se ceny pro stejnou délku se chovají jako dříve MultipleObjectsReturned."""
+        cena = Cena.objects.create(
+            popis='Překryv',
+            zakaznik=self.zakaznik,
+            delka_min=Decimal('100'),
+            delka_max=Decimal('200'),
+            cena_za_kg=Decimal('9.00'),
+        )
+        cena.predpis.add(self.predpis)
+
+        resolver = CenikResolver()
+        kwargs = {'zakaznik_id': self.zakaznik.pk, 'predpis_id': self.predpis.pk}
+        self.assertEqual(len(resolver.find_ceny(delka=Decimal('120'), **kwargs)), 2)
+        self.assertIsNone(resolver.resolve(delka=Decimal('120'), **kwargs))
+        self.assertEqual(resolver.resolve(delka=Decimal('60'), **kwargs).cena_id, self.cena.pk)
+        self.assertEqual(resolver.resolve(delka=Decimal('160'), **kwargs).cena_id, cena.pk)
+
+    def test_scope_resolves_many_prices_with_single_query(self):
+        """V rámci jednoho scope se po načtení ceníku už nedotazuje databáze."""
+        zakazka = Zakazka.objects.select_related('kamion_prijem__zakaznik', 'predpis').get(pk=self.zakazka.pk)
+        with cenik_scope():
+            zakazka.cena_za_kg
+            with self.assertNumQueries(0):
+                for _ in range(50):
+                    self.assertEqual(zakazka.cena_za_kg, Decimal('2.00'))
+                    self.assertEqual(zakazka.cena_tryskani_za_kg, Decimal('0.50'))
+
+    def test_changed_price_is_picked_up_by_new_resolver(self):
+        """Uložení ceny změní otisk ceníku, další resolver načte novou cenu i bez invalidace."""
+        kwargs = {'zakaznik_id': self.zakaznik.pk, 'predpis_id': self.predpis.pk, 'delka': Decimal('100')}
+        self.assertEqual(CenikResolver().resolve(**kwargs).cena_za_kg, Decimal('2.00'))
+
+        self.cena.cena_za_kg = Decimal('3.50')
+        self.cena.save()
+
+        self.assertEqual(CenikResolver().resolve(**kwargs).cena_za_kg, Decimal('3.50'))
+        self.assertEqual(self.zakazka.cena_za_kg, Decimal('3.50'))
+
+
+class FakturaceKamionuTests(ModelsBase):
+    """Testy výpočtu fakturace kamionu výdej."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bedna_tryskana = Bedna.objects.create(
+            zakazka=cls.zakazka,
+            hmotnost=Decimal("3.3"),
+            tara=Decimal("1"),
+            mnozstvi=1,
+            tryskat=TryskaniChoice.OTRYSKANA,
+        )
+        cls.bedna_nefakturovana = Bedna.objects.create(
+            zakazka=cls.zakazka,
+            hmotnost=Decimal("5"),
+            tara=Decimal("1"),
+            mnozstvi=1,
+            fakturovat=False,
+        )
+
+    def test_fakturace_matches_model_properties(self):
+        """Výsledek služby odpovídá cenám počítaným property bedny a zakázky."""
+        fakturace = build_fakturace_kamionu(self.kamion_vydej)
+
+        self.assertEqual(len(fakturace.zakazky), 1)
+        radek = fakturace.zakazky[0]
+        self.assertEqual(radek.cena_za_kg, self.zakazka.cena_za_kg)
+        self.assertEqual(radek.cena_za_zakazku, self.zakazka.cena_za_zakazku)
+        self.assertEqual(radek.cena_tryskani_za_zakazku, self.zakazka.cena_tryskani_za_zakazku)
+        self.assertEqual(radek.pocet_beden_fakturovanych, self.zakazka.pocet_beden_fakturovanych)
+        self.assertEqual(radek.hmotnost_otryskanych_beden, self.zakazka.hmotnost_otryskanych_beden)
+
+        for radek_bedny in fakturace.bedny:
+            bedna = radek_bedny.bedna
+            self.assertEqual(radek_bedny.cena_za_bednu, bedna.cena_za_bednu)
+            self.assertEqual(radek_bedny.cena_tryskani_za_kg, bedna.cena_tryskani_za_kg)
+            self.assertEqual(radek_bedny.cena_tryskani_za_bednu, bedna.cena_tryskani_za_bednu)
+        self.assertEqual([r.pozice for r in fakturace.bedny], [1, 2, 3, 4])
+
+        self.assertEqual(fakturace.cena_za_kamion_vydej, Decimal("14.60"))
+        self.assertEqual(fakturace.cena_tryskani_za_kamion_vydej, Decimal("1.65"))
+        self.assertEqual(fakturace.cena_rovnani_za_kamion_vydej, Decimal("0.00"))
+
+    def test_fakturace_uses_constant_number_of_queries(self):
+        """Počet dotazů nezávisí na počtu zakázek a beden v kamionu."""
+        for i in range(5):
+            zakazka = Zakazka.objects.create(
+                kamion_prijem=self.kamion_prijem,
+                kamion_vydej=self.kamion_vydej,
+                artikl=f"A-{i}",
+                prumer=Decimal("10"),
+                delka=Decimal("60"),
+                predpis=self.predpis,
+                typ_hlavy=self.typ_hlavy,
+                popis="Test",
+            )
+            for _ in range(3):
+                Bedna.objects.create(zakazka=zakazka, hmotnost=Decimal("1"), tara=Decimal("1"), mnozstvi=1)
+
+        kamion = type(self.kamion_vydej).objects.get(pk=self.kamion_vydej.pk)
+        with self.assertNumQueries(2):
+            fakturace = build_fakturace_kamionu(kamion)
+        self.assertEqual(len(fakturace.zakazky), 6)
+        self.assertEqual(fakturace.cena_za_kamion_vydej, Decimal("44.60"))
+
+    def test_fakturace_multiple_prices_give_zero(self):
+        """Při více nalezených cenách je cena nulová a zakázka nese počet nalezených cen."""
+        cena = Cena.objects.create(
+            popis="Duplicita",
+            zakaznik=self.zakaznik,
+            delka_min=Decimal("90"),
+            delka_max=Decimal("110"),
+            cena_za_kg=Decimal("5.00"),
+        )
+        cena.predpis.add(self.predpis)
+
+        fakturace = build_fakturace_kamionu(self.kamion_vydej)
+        radek = fakturace.zakazky[0]
+        self.assertEqual(radek.pocet_cen, 2)
+        self.assertEqual(radek.cena_za_zakazku, Decimal("0.00"))
+        self.assertEqual(fakturace.cena_za_kamion_vydej, Decimal("0.00"))
+
+    def test_fakturace_prijem_is_empty(self):
+        """Kamion příjem nemá fakturaci a nevyvolá žádný dotaz."""
+        with self.assertNumQueries(0):
+            fakturace = build_fakturace_kamionu(self.kamion_prijem)
+        self.assertEqual(fakturace.zakazky, [])
+        self.assertEqual(fakturace.cena_za_kamion_vydej, Decimal("0.00"))
+
+
+class SouhrnyBedenTests(ModelsBase):
+    """Testy uložených souhrnů beden zakázek a kamionů."""
+
+    def souhrn_zakazky(self, zakazka):
+        return SouhrnZakazky.objects.get(pk=zakazka.pk)
+
+    def souhrn_kamionu(self, kamion):
+        return SouhrnKamionu.objects.get(pk=kamion.pk)
+
+    def test_souhrny_po_vytvoreni_beden(self):
+        """Nové bedny se promítnou do souhrnu zakázky, kamionu příjem i kamionu výdej."""
+        souhrn = self.souhrn_zakazky(self.zakazka)
+        self.assertEqual(souhrn.pocet_beden, 2)
+        self.assertEqual(souhrn.pocet_beden_neprijatych, 2)
+        self.assertEqual(souhrn.hmotnost, Decimal("4.0"))
+        self.assertEqual(souhrn.tara, Decimal("2.0"))
+        for kamion in (self.kamion_prijem, self.kamion_vydej):
+            self.assertEqual(self.souhrn_kamionu(kamion).pocet_beden, 2)
+        self.assertTrue(zkontroluj_souhrny().v_poradku)
+
+    def test_zmena_stavu_presun_a_smazani_bedny(self):
+        """Změna stavu, přesun do jiné zakázky i smazání bedny aktualizují všechny dotčené souhrny."""
+        self.bedna1.stav_bedny = StavBednyChoice.K_EXPEDICI
+        self.bedna1.save()
+        souhrn = self.souhrn_zakazky(self.zakazka)
+        self.assertEqual(souhrn.pocet_beden_k_expedici, 1)
+        self.assertEqual(souhrn.pocet_beden_skladem, 1)
+        self.assertEqual(souhrn.hmotnost_k_expedici_brutto, Decimal("3.0"))
+
+        kamion = Kamion.objects.create(zakaznik=self.zakaznik, datum=self.kamion_prijem.datum, prijem_vydej=KamionChoice.PRIJEM)
+        zakazka = Zakazka.objects.create(
+            kamion_prijem=kamion, artikl="A2", prumer=Decimal("10"), delka=Decimal("100"),
+            predpis=self.predpis, typ_hlavy=self.typ_hlavy, popis="Test",
+        )
+        bedna = Bedna.objects.get(pk=self.bedna2.pk)
+        bedna.zakazka = zakazka
+        bedna.save()
+        self.assertEqual(self.souhrn_zakazky(self.zakazka).pocet_beden, 1)
+        self.assertEqual(self.souhrn_zakazky(zakazka).pocet_beden, 1)
+        self.assertEqual(self.souhrn_kamionu(self.kamion_prijem).pocet_beden, 1)
+        self.assertEqual(self.souhrn_kamionu(kamion).hmotnost, Decimal("2.0"))
+
+        bedna.delete()
+        self.assertEqual(self.souhrn_zakazky(zakazka).pocet_beden, 0)
+        self.assertEqual(self.souhrn_kamionu(kamion).pocet_beden, 0)
+        self.assertTrue(zkontroluj_souhrny().v_poradku)
+
+    def test_zmena_bedny_upravi_souhrny_prirustkem(self):
+        """Uložení jedné bedny upraví souhrny zakázky a obou kamionů UPDATE s přírůstkem bez agregace beden."""
+        bedna = Bedna.objects.get(pk=self.bedna1.pk)
+        bedna.stav_bedny = StavBednyChoice.K_EXPEDICI
+        bedna.hmotnost = Decimal("7.5")
+        with CaptureQueriesContext(connection) as dotazy:
+            bedna.save()
+        souhrny = [dotaz['sql'] for dotaz in dotazy if 'orders_souhrnzakazky' in dotaz['sql'] or 'orders_souhrnkamionu' in dotaz['sql']]
+        self.assertEqual(len(souhrny), 3)
+        self.assertTrue(all(sql.startswith('UPDATE') for sql in souhrny))
+        souhrn = self.souhrn_zakazky(self.zakazka)
+        self.assertEqual((souhrn.pocet_beden_k_expedici, souhrn.hmotnost), (1, Decimal("9.5")))
+        self.assertEqual(souhrn.hmotnost_k_expedici_brutto, Decimal("8.5"))
+        self.assertEqual(self.souhrn_kamionu(self.kamion_vydej).hmotnost, Decimal("9.5"))
+        self.assertTrue(zkontroluj_souhrny().v_poradku)
+
+        # Chybějící souhrn se přepočítá z beden, bedna načtená bez polí souhrnu také.
+        SouhrnZakazky.objects.filter(pk=self.zakazka.pk).delete()
+        bedna.fakturovat = False
+        bedna.save()
+        bedna = Bedna.objects.only('pk', 'stav_bedny').get(pk=self.bedna2.pk)
+        bedna.stav_bedny = StavBednyChoice.K_EXPEDICI
+        bedna.save()
+        self.assertEqual(self.souhrn_zakazky(self.zakazka).pocet_beden_fakturovanych, 1)
+        self.assertTrue(zkontroluj_souhrny().v_poradku)
+
+    def test_zmena_kamionu_vydej_zakazky(self):
+        """Odebrání zakázky z kamionu výdej přepočítá souhrn kamionu."""
+        zakazka = Zakazka.objects.get(pk=self.zakazka.pk)
+        zakazka.kamion_vydej = None
+        zakazka.save()
+        self.assertEqual(self.souhrn_kamionu(self.kamion_vydej).pocet_beden, 0)
+        self.assertEqual(self.souhrn_kamionu(self.kamion_prijem).pocet_beden, 2)
+
+    def test_odlozene_souhrny_prepocitaji_na_konci_bloku(self):
+        """Uvnitř odlozene_souhrny() se souhrny nemění, přepočet proběhne jednou na konci bloku."""
+        with odlozene_souhrny():
+            for bedna in Bedna.objects.filter(zakazka=self.zakazka):
+                bedna.fakturovat = False
+                bedna.save()
+            self.assertEqual(self.souhrn_zakazky(self.zakazka).pocet_beden_fakturovanych, 2)
+        self.assertEqual(self.souhrn_zakazky(self.zakazka).pocet_beden_fakturovanych, 0)
+        self.assertEqual(self.souhrn_kamionu(self.kamion_vydej).hmotnost_fakturovanych, Decimal("0.0"))
+
+    def test_kontrola_a_prestavba_po_hromadne_zmene(self):
+        """Hromadný update mimo hooky kontrola odhalí a přestavba opraví."""
+        Bedna.objects.filter(zakazka=self.zakazka).update(stav_bedny=StavBednyChoice.PRIJATO)
+        SouhrnZakazky.objects.filter(pk=self.zakazka.pk).delete()
+
+        kontrola = zkontroluj_souhrny()
+        self.assertEqual(kontrola.zakazky, [self.zakazka.pk])
+        self.assertEqual(kontrola.kamiony, sorted([self.kamion_prijem.pk, self.kamion_vydej.pk]))
+
+        prestav_souhrny(zakazka_ids=kontrola.zakazky, kamion_ids=kontrola.kamiony)
+        self.assertTrue(zkontroluj_souhrny().v_poradku)
+        self.assertEqual(self.souhrn_zakazky(self.zakazka).pocet_beden_skladem, 2)
+
+
+class CislovaniTests(ModelsBase):
+    """Testy čítačů číselných řad."""
+
+    def test_rezervuj_vraci_souvisle_bloky(self):
+        rada = Rada(klic="test", posledni_v_datech=lambda: 10)
+        self.assertEqual(list(rezervuj(rada, 3)), [11, 12, 13])
+        self.assertEqual(list(rezervuj(rada)), [14])
+        self.assertEqual(CitacCisel.objects.get(pk="test").hodnota, 14)
+
+    def test_cisla_beden_navazuji_na_data(self):
+        """Nová bedna dostane číslo za nejvyšším číslem bedny zákazníka."""
+        posledni = Bedna.objects.filter(zakazka__kamion_prijem__zakaznik=self.zakaznik).order_by('-cislo_bedny').first()
+        bedna = Bedna.objects.create(zakazka=self.zakazka, hmotnost=Decimal("1"), tara=Decimal("1"), mnozstvi=1)
+        self.assertEqual(bedna.cislo_bedny, posledni.cislo_bedny + 1)
+        self.assertEqual(list(rezervuj(rada_beden(self.zakaznik), 2)), [bedna.cislo_bedny + 1, bedna.cislo_bedny + 2])
+
+    def test_kolize_po_rucnim_precislovani_srovna_citac(self):
+        """Ručně obsazené číslo se při ukládání přeskočí a čítač se srovná s daty."""
+        dalsi = CitacCisel.objects.get(pk=f"bedna:{self.zakaznik.pk}").hodnota + 1
+        Bedna.objects.filter(pk=self.bedna1.pk).update(cislo_bedny=dalsi)
+        bedna = Bedna.objects.create(zakazka=self.zakazka, hmotnost=Decimal("1"), tara=Decimal("1"), mnozstvi=1)
+        self.assertEqual(bedna.cislo_bedny, dalsi + 1)
+
+    def test_sarze_a_kroky_cisluji_z_citace(self):
+        sarze1 = Sarze.objects.create(datum_zalozeni=date.today())
+        sarze2 = Sarze.objects.create(datum_zalozeni=date.today())
+        self.assertEqual(sarze2.cislo_sarze, sarze1.cislo_sarze + 1)
+        self.assertEqual(CitacCisel.objects.get(pk="sarze").hodnota, sarze2.cislo_sarze)
+
+
+def eur_dataframe(pocet_radku, radku_na_zakazku=10, tara=Decimal("5.0")):
+    """Dataframe ve tvaru, který vrací EURImportStrategy.parse_excel."""
+    radky = []
+    for i in range(pocet_radku):
+        radky.append({
+            'sarze': f"S{i // radku_na_zakazku}",
+            'popis': "Vrut",
+            'prumer': Decimal("10"),
+            'delka': Decimal("100"),
+            'artikl': f"ART{i // radku_na_zakazku}",
+            'predpis': 1,
+            'typ_hlavy': "TH",
+            'material': "C10",
+            'behalter_nr': str(i + 1),
+            'hmotnost': Decimal("250.5"),
+            'tara': tara,
+            'mnozstvi': 1000,
+            'datum': date.today(),
+            'vrstva': None,
+            'povrch': None,
+            'odfosfatovat': False,
+        })
+    return pd.DataFrame(radky)
+
+
+def importuj_po_radcich(df, kamion, strategy, warnings):
+    """Původní uložení importu po jednotlivých řádcích – srovnávací základ pro benchmark."""
+    with transaction.atomic():
+        zakazky_cache = {}
+        for _, row in df.iterrows():
+            for field in strategy.get_required_fields():
+                if pd.isna(row[field]):
+                    raise ValueError(f"Chyba: Povinné pole '{field}' nesmí být prázdné.")
+            cache_key = strategy.get_cache_key(row)
+            if cache_key not in zakazky_cache:
+                zakazka_kwargs = strategy.map_row_to_zakazka_kwargs(row, kamion, warnings)
+                zakazky_cache[cache_key] = Zakazka.objects.create(**zakazka_kwargs)
+            Bedna.objects.create(zakazka=zakazky_cache[cache_key], **strategy.map_row_to_bedna_kwargs(row))
+
+
+class PrehledBedenTests(ModelsBase):
+    def setUp(self):
+        # Zakázka s bednami 1 a 2 je kompletní, druhá zakázka má jednu bednu ještě přijatou.
+        Bedna.objects.filter(pk__in=[self.bedna1.pk, self.bedna2.pk]).update(stav_bedny=StavBednyChoice.K_EXPEDICI)
+        self.zakazka2 = Zakazka.objects.create(
+            kamion_prijem=self.kamion_prijem, artikl="A2", prumer=Decimal("10"), delka=Decimal("100"),
+            predpis=self.predpis, typ_hlavy=self.typ_hlavy, popis="Test 2",
+        )
+        for stav, hmotnost in ((StavBednyChoice.K_EXPEDICI, "500"), (StavBednyChoice.PRIJATO, "1000")):
+            Bedna.objects.create(
+                zakazka=self.zakazka2, stav_bedny=stav, hmotnost=Decimal(hmotnost), tara=Decimal("1"), mnozstvi=1,
+            )
+
+    def test_vsechny_stavy_jednim_dotazem(self):
+        with self.assertNumQueries(1):
+            prehled = prehled_beden()
+
+        self.assertEqual(prehled.zakaznici, [self.zakaznik.zkraceny_nazev, self.zakaznik_rot.zkraceny_nazev, CELKEM])
+        radek = prehled.bunky[self.zakaznik.zkraceny_nazev]
+        self.assertEqual(radek['K expedici'].pocet, 3)
+        self.assertEqual(radek['K expedici'].pocet_kompletni, 2)
+        self.assertEqual(radek['K expedici'].hmotnost, Decimal("0.504"))
+        self.assertEqual(radek['K expedici po zakázkách'].pocet, 2)
+        self.assertEqual(radek['K expedici po zakázkách'].hmotnost, Decimal("0.004"))
+        self.assertEqual(radek['Surové'].pocet, 1)
+        self.assertEqual(radek['Surové'].pocet_nekompletni, 1)
+        self.assertEqual(radek['Přijaté'].hmotnost, Decimal("1"))
+        self.assertEqual(radek['Nepřijaté'].pocet, 0)
+        self.assertEqual(radek['K expedici'].barva, 'green')
+        for stav in prehled.stavy:
+            self.assertEqual(
+                prehled.bunky[CELKEM][stav.klic].pocet,
+                sum(prehled.bunky[zakaznik][stav.klic].pocet for zakaznik in prehled.zakaznici[:-1]),
+            )
+
+    def test_pocet_dotazu_nezavisi_na_poctu_zakazniku(self):
+        zakaznik = Zakaznik.objects.create(nazev="Druhý", zkraceny_nazev="DRU", zkratka="DRU", ciselna_rada=200000)
+        kamion = Kamion.objects.create(
+            zakaznik=zakaznik, datum=date.today() - timedelta(days=60), prijem_vydej=KamionChoice.PRIJEM,
+        )
+        zakazka = Zakazka.objects.create(
+            kamion_prijem=kamion, artikl="B1", prumer=Decimal("10"), delka=Decimal("100"),
+            predpis=self.predpis, typ_hlavy=self.typ_hlavy, popis="Test",
+        )
+        Bedna.objects.create(zakazka=zakazka, stav_bedny=StavBednyChoice.ZAKALENO, hmotnost=Decimal("2"), tara=Decimal("1"), mnozstvi=1)
+        Bedna.objects.create(zakazka=zakazka, stav_bedny=StavBednyChoice.EXPEDOVANO, hmotnost=Decimal("2"), tara=Decimal("1"), mnozstvi=1)
+
+        with self.assertNumQueries(1):
+            prehled = prehled_beden()
+
+        radek = prehled.bunky["DRU"]
+        self.assertEqual(radek['Zpracované'].pocet, 1)
+        self.assertEqual(radek['Po exspiraci'].pocet, 1)
+        self.assertEqual(radek['Nepřijaté'].pocet, 0)
+        self.assertIn("DRU", prehled.zakaznici)
+
+
+class StatistikyVyrobyTests(ModelsBase):
+    def setUp(self):
+        self.xl1 = Zarizeni.objects.create(
+            kod_zarizeni="TQF_XL1", nazev_zarizeni="XL1", zkraceny_nazev_zarizeni="XL1",
+            typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+        )
+        self.nakladani = Zarizeni.objects.create(
+            kod_zarizeni="NAK", nazev_zarizeni="Nakládání", zkraceny_nazev_zarizeni="NAK",
+            typ_zarizeni=TypZarizeniChoice.NAKLADANI,
+        )
+        self.den = date(2026, 3, 3)
+
+    def _krok(self, zarizeni, datum, zacatek, konec=None, bedny=(), patra=()):
+        krok = SarzeKrok.objects.create(
+            sarze=Sarze.objects.create(datum_zalozeni=datum), datum=datum, zarizeni=zarizeni,
+            zacatek=zacatek, konec=konec, operator="op",
+        )
+        for bedna in bedny:
+            SarzeKrokBedna.objects.create(krok=krok, bedna=bedna, patro=1)
+        for patro in patra:
+            SarzeKrokBedna.objects.create(krok=krok, patro=patro, popis_mimo_db=f"Patro {patro}")
+        return krok
+
+    def test_dny_smeny_a_zarizeni(self):
+        self._krok(self.xl1, self.den, cas(6, 0), konec=cas(7, 0), bedny=[self.bedna1])
+        druhy = self._krok(self.xl1, self.den, cas(7, 30), konec=cas(19, 0), bedny=[self.bedna1, self.bedna2])
+        treti = self._krok(self.xl1, self.den + timedelta(days=1), cas(1, 0), patra=[1])
+        self._krok(self.nakladani, self.den, cas(20, 0), patra=[1, 2, 2])
+
+        stat = statistiky_vyroby(self.den, self.den, ["TQF_XL1"])
+
+        den = stat.den(self.den)
+        self.assertEqual(den.kroku, 2)
+        self.assertEqual(den.kroku_vruty, 2)
+        # Bedna 1 se počítá jen při prvním použití na zařízení.
+        self.assertEqual(den.vykon_kg, Decimal("4"))
+        self.assertEqual(den.prostoj_minut, druhy.prodleva - 10)
+        denni = stat.smena(self.den, SMENA_DEN)
+        nocni = stat.smena(self.den, SMENA_NOC)
+        self.assertEqual((denni.kroku, nocni.kroku), (2, 1))
+        self.assertEqual(nocni.kroku_zelezo, 1)
+        self.assertEqual(nocni.prostoj_minut, treti.prodleva - 10)
+        self.assertEqual(stat.nakladani(self.den, SMENA_NOC).kroku, 1)
+        self.assertEqual(stat.nakladani(self.den, SMENA_NOC).pater, 2)
+        self.assertEqual(stat.zakaznici_dne(self.den), [(self.zakaznik.zkraceny_nazev, Decimal("4"))])
+
+    def test_pocet_dotazu_nezavisi_na_delce_obdobi(self):
+        for posun in range(20):
+            self._krok(self.xl1, self.den - timedelta(days=posun), cas(8, 0), konec=cas(9, 0), bedny=[self.bedna1])
+
+        with self.assertNumQueries(2):
+            kratke = statistiky_vyroby(self.den, self.den, ["TQF_XL1"])
+        with self.assertNumQueries(2):
+            dlouhe = statistiky_vyroby(self.den - timedelta(days=60), self.den, ["TQF_XL1"])
+
+        self.assertEqual(kratke.den(self.den).kroku, 1)
+        self.assertEqual(sum(dlouhe.den(den).kroku for den in dlouhe.dny_obdobi()), 20)
+        self.assertEqual(sum(dlouhe.den(den).vykon_kg for den in dlouhe.dny_obdobi()), Decimal("2"))
+
+
+class PrvniPouzitiTests(ModelsBase):
+    def setUp(self):
+        self.xl1 = Zarizeni.objects.create(
+            kod_zarizeni="TQF_XL1", nazev_zarizeni="XL1", zkraceny_nazev_zarizeni="XL1",
+            typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+        )
+        self.den = date(2026, 3, 3)
+
+    def _krok(self, datum, zacatek, bedny=()):
+        krok = SarzeKrok.objects.create(
+            sarze=Sarze.objects.create(datum_zalozeni=datum), datum=datum, zarizeni=self.xl1,
+            zacatek=zacatek, operator="op",
+        )
+        zaznamy = [SarzeKrokBedna.objects.create(krok=krok, bedna=bedna, patro=1) for bedna in bedny]
+        return krok, zaznamy
+
+    def _priznaky(self, *zaznamy):
+        return [SarzeKrokBedna.objects.get(pk=zaznam.pk).prvni_pouziti for zaznam in zaznamy]
+
+    def test_priznak_se_udrzuje_pri_zmenach_kroku_a_mazani(self):
+        _krok, (prvni,) = self._krok(self.den, cas(8, 0), bedny=[self.bedna1])
+        pozdejsi, (druhy,) = self._krok(self.den, cas(10, 0), bedny=[self.bedna1])
+        self.assertEqual(self._priznaky(prvni, druhy), [True, False])
+
+        # Přesunutí pozdějšího kroku na dřívější den přesune i první použití.
+        pozdejsi.datum = self.den - timedelta(days=1)
+        pozdejsi.save()
+        self.assertEqual(self._priznaky(prvni, druhy), [False, True])
+
+        SarzeKrokBedna.objects.filter(pk=druhy.pk).delete()
+        self.assertEqual(self._priznaky(prvni), [True])
+
+        prvni.delete()
+        _krok, (treti,) = self._krok(self.den + timedelta(days=1), cas(8, 0), bedny=[self.bedna1])
+        self.assertEqual(self._priznaky(treti), [True])
+
+    def test_kontrola_a_prikaz_opravi_neaktualni_priznaky(self):
+        _krok, (prvni, druha) = self._krok(self.den, cas(8, 0), bedny=[self.bedna1, self.bedna2])
+        self.assertEqual(zkontroluj_prvni_pouziti(), [])
+
+        SarzeKrokBedna.objects.filter(pk=prvni.pk).update(prvni_pouziti=False)
+        self.assertEqual(zkontroluj_prvni_pouziti(), [self.bedna1.pk])
+
+        vystup = io.StringIO()
+        call_command("prvni_pouziti", stdout=vystup)
+        self.assertIn("1 beden", vystup.getvalue())
+        self.assertEqual(zkontroluj_prvni_pouziti(), [self.bedna1.pk])
+
+        call_command("prvni_pouziti", "--opravit", stdout=io.StringIO())
+        self.assertEqual(zkontroluj_prvni_pouziti(), [])
+        self.assertEqual(self._priznaky(prvni, druha), [True, True])
+
+        SarzeKrokBedna.objects.update(prvni_pouziti=False)
+        self.assertEqual(prestav_prvni_pouziti(), 2)
+        self.assertEqual(self._priznaky(prvni, druha), [True, True])
+
+
+class SouhrnyVyrobyTests(ModelsBase):
+    def setUp(self):
+        self.xl1 = Zarizeni.objects.create(
+            kod_zarizeni="TQF_XL1", nazev_zarizeni="XL1", zkraceny_nazev_zarizeni="XL1",
+            typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+        )
+        self.den = date(2026, 3, 3)
+
+    def _krok(self, datum, zacatek, konec=None, bedny=()):
+        krok = SarzeKrok.objects.create(
+            sarze=Sarze.objects.create(datum_zalozeni=datum), datum=datum, zarizeni=self.xl1,
+            zacatek=zacatek, konec=konec, operator="op",
+        )
+        zaznamy = [SarzeKrokBedna.objects.create(krok=krok, bedna=bedna, patro=1, procent_z_patra=50) for bedna in bedny]
+        return krok, zaznamy
+
+    def _souhrn(self, datum):
+        return SouhrnVyrobyZarizeni.objects.filter(datum=datum).values(
+            'smena', 'pocet_kroku', 'pocet_kroku_vruty', 'pocet_beden', 'kg', 'kg_prvni_pouziti',
+            'doba_behu_minut', 'prostoj_minut',
+        ).first()
+
+    def test_souhrn_dne_se_prepocita_pri_zmenach_kroku_a_beden(self):
+        prvni, _ = self._krok(self.den, cas(6, 0), konec=cas(7, 0), bedny=[self.bedna1])
+        druhy, (zaznam,) = self._krok(self.den, cas(7, 30), konec=cas(8, 0), bedny=[self.bedna1])
+
+        souhrn = self._souhrn(self.den)
+        self.assertEqual(souhrn['smena'], SMENA_DEN)
+        self.assertEqual((souhrn['pocet_kroku'], souhrn['pocet_kroku_vruty'], souhrn['pocet_beden']), (2, 2, 2))
+        self.assertEqual((souhrn['kg'], souhrn['kg_prvni_pouziti']), (Decimal("4.0"), Decimal("2.0")))
+        self.assertEqual((souhrn['doba_behu_minut'], souhrn['prostoj_minut']), (90, 20))
+        zakaznik = SouhrnVyrobyZakaznika.objects.get(datum=self.den, zakaznik=self.zakaznik)
+        self.assertEqual(zakaznik.podil_rostu, Decimal("2.000000"))
+
+        # Přesun kroku na jiný den přepočítá původní i nový den a první použití bedny.
+        druhy.datum = self.den - timedelta(days=1)
+        druhy.save()
+        self.assertEqual(self._souhrn(self.den)['kg_prvni_pouziti'], Decimal("0.0"))
+        self.assertEqual(self._souhrn(druhy.datum)['kg_prvni_pouziti'], Decimal("2.0"))
+
+        zaznam.delete()
+        self.assertEqual(self._souhrn(druhy.datum)['pocet_beden'], 0)
+        self.assertEqual(self._souhrn(self.den)['kg_prvni_pouziti'], Decimal("2.0"))
+
+        self.bedna1.hmotnost = Decimal("5")
+        self.bedna1.save()
+        self.assertEqual(self._souhrn(self.den)['kg_prvni_pouziti'], Decimal("5.0"))
+
+        prvni.delete()
+        self.assertIsNone(self._souhrn(self.den))
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+    def test_zmena_ceniku_prepocita_cenu_prvniho_pouziti(self):
+        self._krok(self.den, cas(8, 0), bedny=[self.bedna1])
+        souhrn = SouhrnVyrobyZakaznika.objects.get(datum=self.den, zakaznik=self.zakaznik)
+        self.assertEqual(souhrn.cena_prvni_pouziti, Decimal("4.000"))
+
+        Cena.objects.filter(pk=self.cena.pk).update(cena_za_kg=Decimal("3.50"))
+        self.assertEqual(prepocitej_ceny_vyroby(self.zakaznik.pk), 1)
+        souhrn.refresh_from_db()
+        self.assertEqual(souhrn.cena_prvni_pouziti, Decimal("7.000"))
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+    def test_zmena_predpisu_delky_a_kamionu_zakazky_prepocita_souhrny_vyroby(self):
+        self._krok(self.den, cas(8, 0), bedny=[self.bedna1])
+        zakazka = Zakazka.objects.get(pk=self.zakazka.pk)
+
+        # Délka mimo ceník – cena prvního použití je nulová.
+        zakazka.delka = Decimal("200")
+        zakazka.save()
+        self.assertEqual(SouhrnVyrobyZakaznika.objects.get(datum=self.den).cena_prvni_pouziti, Decimal("0.000"))
+
+        zakazka.delka = Decimal("100")
+        zakazka.predpis = Predpis.objects.create(nazev="P2", skupina=1, zakaznik=self.zakaznik)
+        zakazka.save()
+        self.assertEqual(SouhrnVyrobyZakaznika.objects.get(datum=self.den).cena_prvni_pouziti, Decimal("0.000"))
+
+        # Kamion příjem jiného zákazníka přesune výrobu dne k tomuto zákazníkovi.
+        zakazka.predpis = self.predpis_rot
+        zakazka.kamion_prijem = self.kamion_prijem_rot
+        zakazka.save()
+        souhrn = SouhrnVyrobyZakaznika.objects.get(datum=self.den)
+        self.assertEqual((souhrn.zakaznik_id, souhrn.cena_prvni_pouziti), (self.zakaznik_rot.pk, Decimal("2.000")))
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+        # Změna jiných polí souhrny výroby nepřepočítává.
+        with patch("orders.services.souhrny_vyroby_service.prepocitej_souhrny_vyroby") as prepocet:
+            zakazka.popis = "Jiný popis"
+            zakazka.save()
+        prepocet.assert_not_called()
+
+    def test_kontrola_a_prikaz_rebuild_rollups(self):
+        self._krok(self.den, cas(8, 0), bedny=[self.bedna1, self.bedna2])
+        self._krok(self.den + timedelta(days=5), cas(8, 0), bedny=[self.bedna2])
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+        SouhrnVyrobyZarizeni.objects.filter(datum=self.den).update(kg=0)
+        SouhrnVyrobyZakaznika.objects.filter(datum=self.den + timedelta(days=5)).delete()
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [self.den, self.den + timedelta(days=5)])
+
+        vystup = io.StringIO()
+        call_command("rebuild_rollups", "--kontrola", stdout=vystup)
+        self.assertIn("2 dní", vystup.getvalue())
+        self.assertEqual(len(zkontroluj_souhrny_vyroby()), 2)
+
+        call_command("rebuild_rollups", "--kontrola", "--opravit", stdout=io.StringIO())
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+        SouhrnVyrobyZarizeni.objects.all().delete()
+        vystup = io.StringIO()
+        call_command("rebuild_rollups", "--od", self.den.isoformat(), "--do", self.den.isoformat(), stdout=vystup)
+        self.assertIn("za 1 dní", vystup.getvalue())
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [self.den + timedelta(days=5)])
+        self.assertEqual(prestav_souhrny_vyroby(), 2)
+        self.assertEqual(zkontroluj_souhrny_vyroby(), [])
+
+
+class StatistikyKamionuTests(ModelsBase):
+    def setUp(self):
+        self.dnes = date.today()
+        self.rok, self.mesic = self.dnes.year, self.dnes.month
+        # První den dalšího měsíce – měsíc kamionů z ModelsBase skončil, ale je ještě ve lhůtě na opravy.
+        self.konec_mesice = date(self.rok + 1, 1, 1) if self.mesic == 12 else date(self.rok, self.mesic + 1, 1)
+        # Po uplynutí lhůty je měsíc uzavřený.
+        self.pozdeji = self.konec_mesice + timedelta(days=ODKLAD_ULOZENI_DNU)
+
+    def test_nacteni_nic_neuklada_a_doplneni_uklada_az_po_lhute(self):
+        statistiky = statistiky_roku(self.rok, dnes=self.pozdeji)
+        self.assertNotIn(self.mesic, statistiky.ulozene)
+        eur = statistiky.mesic(self.mesic, self.zakaznik.pk)
+        self.assertEqual((eur.prijem, eur.vydej, eur.pocet_kamionu_prijem), (Decimal("4.0"), Decimal("4.0"), 1))
+        self.assertFalse(StatistikaKamionuMesice.objects.exists())
+
+        # Ve lhůtě po konci měsíce se měsíc ještě neukládá.
+        self.assertFalse(je_uzavreny(self.rok, self.mesic, dnes=self.konec_mesice))
+        self.assertEqual(dopln_statistiky_kamionu(dnes=self.konec_mesice), self.mesic - 1)
+        self.assertFalse(StatistikaKamionuMesice.objects.filter(rok=self.rok, mesic=self.mesic).exists())
+
+        self.assertEqual(dopln_statistiky_kamionu(dnes=self.pozdeji), 1)
+        self.assertEqual(dopln_statistiky_kamionu(dnes=self.pozdeji), 0)
+        ulozena = StatistikaKamionuMesice.objects.get(rok=self.rok, mesic=self.mesic, zakaznik=self.zakaznik)
+        self.assertEqual(ulozena.prijem, Decimal("4.0"))
+        # Uloží se i měsíce a zákazníci bez kamionů, aby se znovu nepočítali.
+        self.assertEqual(
+            StatistikaKamionuMesice.objects.filter(rok=self.rok).count(),
+            self.mesic * Zakaznik.objects.count(),
+        )
+
+        self.bedna1.hmotnost = Decimal("10")
+        self.bedna1.save()
+        # Uložený měsíc se jen čte, dotaz nad kamiony je jen pro neuzavřené měsíce roku.
+        with CaptureQueriesContext(connection) as dotazy:
+            statistiky = statistiky_roku(self.rok, dnes=self.pozdeji)
+        self.assertIn(self.mesic, statistiky.ulozene)
+        self.assertEqual(len(dotazy), 2 if self.pozdeji.year > self.rok else 3)
+        self.assertEqual(statistiky.mesic(self.mesic, self.zakaznik.pk).prijem, Decimal("4.0"))
+        # Aktuální měsíc se počítá vždy z kamionů.
+        self.assertEqual(statistiky_roku(self.rok, dnes=self.dnes).mesic(self.mesic, self.zakaznik.pk).prijem, Decimal("12.0"))
+
+        self.assertEqual(prestav_statistiky_kamionu(self.rok, dnes=self.pozdeji), len(statistiky.ulozene))
+        self.assertEqual(statistiky_roku(self.rok, dnes=self.pozdeji).mesic(self.mesic, self.zakaznik.pk).prijem, Decimal("12.0"))
+
+    def test_porovnani_roku_a_prikaz_statistiky_kamionu(self):
+        prijem_rot = Bedna.objects.filter(zakazka__kamion_prijem=self.kamion_prijem_rot, fakturovat=True).aggregate(s=Sum('hmotnost'))['s']
+        porovnani = porovnej_roky([self.rok - 1, self.rok], zakaznik_ids=[self.zakaznik_rot.pk], dnes=self.dnes)
+        self.assertEqual(porovnani[self.rok - 1]['celkem']['prijem'], Decimal("0"))
+        self.assertEqual(porovnani[self.rok]['mesice'][self.mesic]['prijem'], prijem_rot)
+        self.assertEqual(porovnani[self.rok]['celkem']['pocet_kamionu_prijem'], 1)
+        self.assertIsNone(porovnani[self.rok]['celkem']['procento_krivych'])
+        self.assertEqual(porovnej_roky([self.rok], dnes=self.dnes)[self.rok]['celkem']['prijem'], prijem_rot + Decimal("4.0"))
+
+        StatistikaKamionuMesice.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command("statistiky_kamionu", stdout=io.StringIO())
+        # Rok před prvním kamionem je mimo rozsah let.
+        with self.assertRaises(CommandError):
+            call_command("statistiky_kamionu", "--rok", str(self.rok - 1), stdout=io.StringIO())
+        Kamion.objects.create(zakaznik=self.zakaznik, datum=date(self.rok - 1, 6, 1), prijem_vydej=KamionChoice.PRIJEM)
+        vystup = io.StringIO()
+        call_command("statistiky_kamionu", "--rok", str(self.rok - 1), stdout=vystup)
+        self.assertIn("za 12 měsíců", vystup.getvalue())
+        self.assertEqual(StatistikaKamionuMesice.objects.filter(rok=self.rok - 1).count(), 12 * Zakaznik.objects.count())
+        uzavrene = sum(je_uzavreny(self.rok, mesic) for mesic in range(1, 13))
+        call_command("statistiky_kamionu", "--vse", stdout=io.StringIO())
+        self.assertEqual(StatistikaKamionuMesice.objects.filter(rok=self.rok).count(), uzavrene * Zakaznik.objects.count())
+
+        StatistikaKamionuMesice.objects.filter(rok=self.rok - 1).delete()
+        with self.assertRaises(CommandError):
+            call_command("statistiky_kamionu", "--doplnit", "--vse", stdout=io.StringIO())
+        vystup = io.StringIO()
+        call_command("statistiky_kamionu", "--doplnit", stdout=vystup)
+        self.assertIn("za 12 měsíců", vystup.getvalue())
+        self.assertEqual(StatistikaKamionuMesice.objects.filter(rok=self.rok - 1).count(), 12 * Zakaznik.objects.count())
+
+
+def sectni_po_dnech(denni, od, do):
+    """Původní sčítání rozsahu dní po jednotlivých dnech – srovnávací základ pro benchmark historie."""
+    soucet = Decimal('0')
+    den = od
+    while den <= do:
+        soucet += denni.get(den, Decimal('0'))
+        den += timedelta(days=1)
+    return soucet
+
+
+class HistorieVyrobyTests(ModelsBase):
+    def test_soucty_rozsahu_z_kumulativnich_rad(self):
+        rady = RocniRady(2026)
+        rady.pridej(KG, "XL1", date(2026, 1, 1), Decimal("0.1"))
+        rady.pridej(KG, "XL1", date(2026, 1, 1), Decimal("0.2"))
+        rady.pridej(KG, "XL1", date(2026, 12, 31), Decimal("10.5"))
+        rady.pridej(KG, "XL1", date(2027, 1, 1), Decimal("99"))
+        rady.pridej(PROSTOJ, "XL1", date(2026, 2, 1), 15)
+        rady.uzavri()
+
+        self.assertEqual(rady.soucet(KG, "XL1", date(2026, 1, 1), date(2026, 1, 1)), Decimal("0.3"))
+        self.assertEqual(rady.soucet(KG, "XL1", date(2025, 6, 1), date(2027, 6, 1)), Decimal("10.8"))
+        self.assertEqual(rady.soucet(KG, "XL1", date(2026, 1, 2), date(2026, 12, 30)), Decimal("0"))
+        self.assertEqual(rady.soucet(KG, "XL1", date(2026, 2, 1), None), Decimal("0"))
+        self.assertEqual(rady.soucet(KG, "XL2", date(2026, 1, 1), date(2026, 12, 31)), Decimal("0"))
+        self.assertEqual(rady.soucet(PROSTOJ, "XL1", date(2026, 1, 1), date(2026, 3, 1)), 15)
+        self.assertEqual(rady.klice(KG), ["XL1"])
+
+    def test_benchmark_rocniho_prehledu_proti_scitani_po_dnech(self):
+        """Celý rok na dvou pecích: rozsahy roku, měsíců, týdnů a dní z kumulativních součtů proti sčítání po dnech."""
+        pece = [
+            Zarizeni.objects.create(
+                kod_zarizeni=kod, nazev_zarizeni=kod, zkraceny_nazev_zarizeni=kod,
+                typ_zarizeni=TypZarizeniChoice.VICEUCELOVKA,
+            )
+            for kod in ("TQF_XL1", "TQF_XL2")
+        ]
+        od = date(2025, 1, 1)
+        sarze = Sarze.objects.create(datum_zalozeni=od)
+        kroky = SarzeKrok.objects.bulk_create([
+            SarzeKrok(
+                sarze=sarze, poradi=index + 1, datum=od + timedelta(days=index // 2), zarizeni=pece[index % 2],
+                zacatek=cas(8, 0), konec=cas(9, 0), datum_konce=od + timedelta(days=index // 2), operator="op",
+            )
+            for index in range(730)
+        ])
+        # Příznak prvního použití se nastaví přímo – benchmark potřebuje výkon v každém kroku.
+        SarzeKrokBedna.objects.bulk_create([
+            SarzeKrokBedna(krok=krok, bedna=self.bedna1, patro=1, prvni_pouziti=True) for krok in kroky
+        ])
+        # Hromadné založení obchází modely – souhrny výroby se naplní přestavbou jako po importu dat.
+        prestav_souhrny_vyroby()
+
+        rozsahy = [(od, date(2025, 12, 31))]
+        rozsahy += [(date(2025, mesic, 1), date(2025, mesic, 28)) for mesic in range(1, 13)]
+        rozsahy += [(od + timedelta(days=7 * tyden), od + timedelta(days=7 * tyden + 6)) for tyden in range(52)]
+        rozsahy += [(od + timedelta(days=den), od + timedelta(days=den)) for den in range(365)]
+
+        zacatek = time.perf_counter()
+        rady = historie_vyroby(2025, ["TQF_XL1", "TQF_XL2"])
+        cas_nacteni = time.perf_counter() - zacatek
+        zacatek = time.perf_counter()
+        nove = [rady.soucet(KG, HISTORIE_CELKEM, zac, kon) for zac, kon in rozsahy]
+        cas_rady = time.perf_counter() - zacatek
+
+        denni = {}
+        for radek in (
+            SarzeKrokBedna.objects.filter(prvni_pouziti=True, krok__datum__year=2025)
+            .values('krok__datum').annotate(kg=Sum('bedna__hmotnost')).order_by()
+        ):
+            denni[radek['krok__datum']] = radek['kg']
+        zacatek = time.perf_counter()
+        puvodni = [sectni_po_dnech(denni, zac, kon) for zac, kon in rozsahy]
+        cas_po_dnech = time.perf_counter() - zacatek
+
+        logger.info(
+            f"Benchmark roční historie ({len(rozsahy)} rozsahů): načtení řad {cas_nacteni:.3f} s, "
+            f"součty z kumulativních řad {cas_rady:.4f} s, sčítání po dnech {cas_po_dnech:.4f} s."
+        )
+        self.assertEqual(nove, puvodni)
+        self.assertEqual(nove[0], Decimal("1460"))
+        self.assertEqual(rady.soucet(ROSTY, HISTORIE_CELKEM, od, date(2025, 12, 31)), 730)
+
+
+class ImportZakazekTests(ModelsBase):
+    """Hromadný import zakázek a beden z dataframe strategie importu."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Predpis.objects.create(nazev="00001_Ø10", zakaznik=cls.zakaznik)
+        cls.kamion = Kamion.objects.create(zakaznik=cls.zakaznik, datum=date.today(), prijem_vydej=KamionChoice.PRIJEM)
+
+    def test_import_zalozi_zakazky_bedny_historii_a_souhrny(self):
+        self.zakaznik.vse_tryskat = True
+        self.zakaznik.save()
+        posledni_cislo = (
+            Bedna.objects.filter(zakazka__kamion_prijem__zakaznik=self.zakaznik)
+            .order_by('-cislo_bedny').values_list('cislo_bedny', flat=True).first()
+        )
+        warnings = []
+
+        vysledek = importuj_zakazky(eur_dataframe(12, radku_na_zakazku=5), self.kamion, EURImportStrategy(), warnings)
+
+        self.assertEqual((vysledek.pocet_zakazek, vysledek.pocet_beden), (3, 12))
+        self.assertEqual(warnings, [])
+        bedny = Bedna.objects.filter(zakazka__kamion_prijem=self.kamion).order_by('cislo_bedny')
+        self.assertEqual(
+            [b.cislo_bedny for b in bedny],
+            list(range(posledni_cislo + 1, posledni_cislo + 13)),
+        )
+        self.assertEqual([b.behalter_nr for b in bedny], [str(i) for i in range(1, 13)])
+        self.assertTrue(all(b.tryskat == TryskaniChoice.SPINAVA for b in bedny))
+        self.assertEqual(Bedna.history.filter(zakazka__kamion_prijem=self.kamion).count(), 12)
+        self.assertEqual(Zakazka.history.filter(kamion_prijem=self.kamion).count(), 3)
+        self.assertEqual(SouhrnKamionu.objects.get(kamion=self.kamion).pocet_beden, 12)
+        self.assertEqual(
+            sorted(SouhrnZakazky.objects.filter(zakazka__kamion_prijem=self.kamion).values_list('pocet_beden', flat=True)),
+            [2, 5, 5],
+        )
+        # Další bedna uložená po jednom pokračuje v řadě za importem.
+        bedna = Bedna.objects.create(zakazka=bedny[0].zakazka, hmotnost=Decimal("1"), tara=Decimal("1"), mnozstvi=1)
+        self.assertEqual(bedna.cislo_bedny, posledni_cislo + 13)
+
+    def test_chybejici_povinne_pole_nic_neulozi(self):
+        df = eur_dataframe(4)
+        df.loc[3, 'tara'] = None
+        with self.assertRaisesMessage(ValueError, "Povinné pole 'tara' nesmí být prázdné"):
+            importuj_zakazky(df, self.kamion, EURImportStrategy(), [])
+        self.assertFalse(Zakazka.objects.filter(kamion_prijem=self.kamion).exists())
+
+    def test_neznamy_predpis_je_varovani(self):
+        df = eur_dataframe(2)
+        df['predpis'] = 2
+        warnings = []
+        importuj_zakazky(df, self.kamion, EURImportStrategy(), warnings)
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(Zakazka.objects.get(kamion_prijem=self.kamion).predpis.nazev, 'Neznámý předpis')
+
+    def test_pocet_dotazu_neroste_s_poctem_zakazek(self):
+        pocty = []
+        for pocet_zakazek in (2, 12):
+            kamion = Kamion.objects.create(zakaznik=self.zakaznik, datum=date.today(), prijem_vydej=KamionChoice.PRIJEM)
+            with CaptureQueriesContext(connection) as dotazy:
+                importuj_zakazky(eur_dataframe(pocet_zakazek * 2, radku_na_zakazku=2), kamion, EURImportStrategy(), [])
+            pocty.append(len(dotazy))
+        self.assertEqual(pocty[0], pocty[1])
+
+    def test_mapovani_po_davkach_hlasi_prubeh(self):
+        prubeh = []
+        with patch('orders.services.import_service.DAVKA', 4):
+            vysledek = importuj_zakazky(
+                eur_dataframe(10, radku_na_zakazku=3), self.kamion, EURImportStrategy(), [], prubeh=prubeh.append,
+            )
+        self.assertEqual(prubeh, [4, 8, 10])
+        self.assertEqual((vysledek.pocet_zakazek, vysledek.pocet_beden), (4, 10))
+
+    def test_nevyresene_klice_hlasi_najednou(self):
+        df = eur_dataframe(6, radku_na_zakazku=1)
+        df.loc[[1, 2], 'predpis'] = 7
+        df.loc[[3, 4], 'predpis'] = 8
+        df.loc[5, 'typ_hlavy'] = "XX"
+        strategy = EURImportStrategy()
+        warnings = []
+        with self.assertNumQueries(2):
+            errors = strategy.check_reference_data(df, self.kamion, warnings)
+        self.assertEqual(errors, ["Chyba: Typy hlavy neexistují: XX."])
+        self.assertEqual(
+            warnings,
+            ["Varování: Předpisy neexistují, bude použit předpis 'Neznámý předpis': 00007_Ø10, 00008_Ø10."],
+        )
+
+        # Při uložení se už nahlášené předpisy znovu nevarují.
+        df = df.drop(index=5)
+        importuj_zakazky(df, self.kamion, strategy, warnings)
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(
+            Zakazka.objects.filter(kamion_prijem=self.kamion, predpis__nazev='Neznámý předpis').count(), 4,
+        )
+
+    def test_benchmark_proti_ukladani_po_radcich(self):
+        """200řádkový EUR manifest: hromadný import musí vystačit se zlomkem dotazů původní cesty."""
+        df = eur_dataframe(200)
+        kamion_po_radcich = Kamion.objects.create(zakaznik=self.zakaznik, datum=date.today(), prijem_vydej=KamionChoice.PRIJEM)
+
+        with CaptureQueriesContext(connection) as dotazy_po_radcich:
+            zacatek = time.perf_counter()
+            importuj_po_radcich(df, kamion_po_radcich, EURImportStrategy(), [])
+            cas_po_radcich = time.perf_counter() - zacatek
+
+        with CaptureQueriesContext(connection) as dotazy_hromadne:
+            zacatek = time.perf_counter()
+            importuj_zakazky(df, self.kamion, EURImportStrategy(), [])
+            cas_hromadne = time.perf_counter() - zacatek
+
+        logger.info(
+            f"Benchmark importu 200 řádků: po řádcích {len(dotazy_po_radcich)} dotazů / {cas_po_radcich:.3f} s, "
+            f"hromadně {len(dotazy_hromadne)} dotazů / {cas_hromadne:.3f} s."
+        )
+        self.assertEqual(
+            Bedna.objects.filter(zakazka__kamion_prijem=self.kamion).count(),
+            Bedna.objects.filter(zakazka__kamion_prijem=kamion_po_radcich).count(),
+        )
+        self.assertLess(len(dotazy_hromadne) * 10, len(dotazy_po_radcich))
+
+
+class ParsovanyImportTests(SimpleTestCase):
+    """Rozparsovaný náhled importu uložený mezi náhledem a potvrzením a úklid prošlých souborů."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        nastaveni = override_settings(MEDIA_ROOT=self.media.name)
+        nastaveni.enable()
+        self.addCleanup(nastaveni.disable)
+
+    def test_ulozeni_a_nacteni_podle_tokenu_a_hashe(self):
+        file_hash = hash_souboru(SimpleUploadedFile('f.xlsx', b'obsah'))
+        df = eur_dataframe(3)
+        uloz_parsovany_import(ParsovanyImport(
+            token='t1', file_hash=file_hash, df=df, preview=[{'artikl': 'ART0'}], warnings=['w'], required_fields=['tara'],
+        ))
+
+        parsovany = nacti_parsovany_import('t1', file_hash)
+        self.assertEqual(parsovany.preview, [{'artikl': 'ART0'}])
+        self.assertEqual(parsovany.warnings, ['w'])
+        self.assertTrue(parsovany.df.equals(df))
+        self.assertIsNone(nacti_parsovany_import('t1', hash_souboru(SimpleUploadedFile('f.xlsx', b'jiny'))))
+        self.assertIsNone(nacti_parsovany_import('t2', file_hash))
+
+    def test_prosle_importy_se_uklidi(self):
+        file_hash = hash_souboru(SimpleUploadedFile('f.xlsx', b'obsah'))
+        for token in ('stary', 'novy'):
+            default_storage.save(f"tmp/imports/{token}.xlsx", SimpleUploadedFile('f.xlsx', b'obsah'))
+            uloz_parsovany_import(ParsovanyImport(token=token, file_hash=file_hash, df=eur_dataframe(1)))
+        stare = time.time() - timedelta(days=1).total_seconds()
+        for cesta in ('tmp/imports/stary.xlsx', cesta_parsovaneho_importu('stary', file_hash)):
+            os.utime(default_storage.path(cesta), (stare, stare))
+
+        self.assertIsNone(nacti_parsovany_import('stary', file_hash))
+        self.assertEqual(uklid_importy(), 2)
+        self.assertFalse(default_storage.exists('tmp/imports/stary.xlsx'))
+        self.assertTrue(default_storage.exists('tmp/imports/novy.xlsx'))
+        self.assertIsNotNone(nacti_parsovany_import('novy', file_hash))
+
+        tmp_map = {
+            'stary': {'path': 'tmp/imports/stary.xlsx', 'hash': file_hash, 'vytvoreno': (timezone.now() - timedelta(days=1)).isoformat()},
+            'novy': {'path': 'tmp/imports/novy.xlsx', 'hash': file_hash, 'vytvoreno': timezone.now().isoformat()},
+        }
+        self.assertEqual(vyrad_prosle_importy(tmp_map), 1)
+        self.assertEqual(list(tmp_map), ['novy'])
+
+
+class UlohyTests(ModelsBase):
+    """Fronta úloh na pozadí – zařazení, převzetí workerem, výsledek, chyby a úklid."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        nastaveni = override_settings(MEDIA_ROOT=self.media.name)
+        nastaveni.enable()
+        self.addCleanup(nastaveni.disable)
+
+    def obsluhy(self, **obsluhy):
+        return patch.dict(ulohy_service._OBSLUHY, {TypUlohyChoice[typ]: obsluha for typ, obsluha in obsluhy.items()})
+
+    def test_worker_zpracuje_ulohu_a_ulozi_vysledek(self):
+        prubehy = []
+
+        def export(uloha):
+            for zpracovano in (100, 200):
+                nastav_prubeh(uloha, zpracovano)
+                prubehy.append(Uloha.objects.get(pk=uloha.pk).prubeh)
+            return VysledekUlohy(obsah='\ufeffa;b\n', nazev_souboru='bedny.csv', zprava='Vyexportováno 250 beden.')
+
+        uloha = zarad_ulohu(TypUlohyChoice.CSV_DL, {'bedny': [1, 2]}, popis='bedny.csv', celkem=250)
+        self.assertEqual(uloha.stav, StavUlohyChoice.CEKA)
+
+        with self.obsluhy(CSV_DL=export):
+            zpracovana = zpracuj_dalsi_ulohu('test-worker')
+            self.assertIsNone(zpracuj_dalsi_ulohu('test-worker'))
+
+        uloha.refresh_from_db()
+        self.assertEqual(zpracovana.pk, uloha.pk)
+        self.assertEqual(prubehy, [100, 200])
+        self.assertEqual(uloha.stav, StavUlohyChoice.HOTOVO)
+        self.assertEqual((uloha.prubeh, uloha.procenta), (250, 100))
+        self.assertEqual(uloha.worker, 'test-worker')
+        self.assertEqual(uloha.nazev_souboru, 'bedny.csv')
+        self.assertEqual(uloha.zprava, 'Vyexportováno 250 beden.')
+        self.assertIsNotNone(uloha.dokonceno)
+        with uloha.vysledek.open('rb') as soubor:
+            self.assertEqual(soubor.read().decode('utf-8'), '\ufeffa;b\n')
+
+    def test_ulohy_se_zpracuji_v_poradi_a_prevezmou_jen_jednou(self):
+        prvni = zarad_ulohu(TypUlohyChoice.CSV_DL)
+        druha = zarad_ulohu(TypUlohyChoice.CSV_ZAKAZNIK)
+
+        self.assertEqual(ulohy_service._prevezmi_ulohu('w1').pk, prvni.pk)
+        self.assertEqual(ulohy_service._prevezmi_ulohu('w2').pk, druha.pk)
+        self.assertIsNone(ulohy_service._prevezmi_ulohu('w3'))
+        self.assertEqual(
+            dict(Uloha.objects.values_list('pk', 'worker')),
+            {prvni.pk: 'w1', druha.pk: 'w2'},
+        )
+
+    def test_chyba_obsluhy_oznaci_ulohu(self):
+        def selze(uloha):
+            raise ValueError('Bedny nenalezeny.')
+
+        chybna = zarad_ulohu(TypUlohyChoice.ROZPRACOVANOST)
+        neznama = zarad_ulohu(TypUlohyChoice.KARTY_BEDEN)
+        with self.obsluhy(ROZPRACOVANOST=selze):
+            ulohy_service._OBSLUHY.pop(TypUlohyChoice.KARTY_BEDEN, None)
+            with self.assertLogs('orders', level='ERROR'):
+                zpracuj_dalsi_ulohu()
+                zpracuj_dalsi_ulohu()
+
+        chybna.refresh_from_db()
+        neznama.refresh_from_db()
+        self.assertEqual(chybna.stav, StavUlohyChoice.CHYBA)
+        self.assertIn('Bedny nenalezeny.', chybna.zprava)
+        self.assertFalse(chybna.vysledek)
+        self.assertEqual(neznama.stav, StavUlohyChoice.CHYBA)
+        self.assertIn('není registrovaná obsluha', neznama.zprava)
+
+    def test_prerusene_a_stare_ulohy(self):
+        ted = timezone.now()
+        bezici = zarad_ulohu(TypUlohyChoice.CSV_DL)
+        Uloha.objects.filter(pk=bezici.pk).update(stav=StavUlohyChoice.BEZI, zahajeno=ted - timedelta(hours=3))
+        cekajici = zarad_ulohu(TypUlohyChoice.CSV_DL)
+
+        self.assertEqual(oznac_prerusene_ulohy(ted=ted), 1)
+        bezici.refresh_from_db()
+        self.assertEqual(bezici.stav, StavUlohyChoice.CHYBA)
+
+        with self.obsluhy(CSV_DL=lambda uloha: VysledekUlohy(obsah=b'x', nazev_souboru='x.csv')):
+            hotova = zpracuj_dalsi_ulohu()
+        cesta = hotova.vysledek.name
+        self.assertEqual(hotova.pk, cekajici.pk)
+        self.assertTrue(default_storage.exists(cesta))
+
+        self.assertEqual(uklid_ulohy(ted=ted), 0)
+        self.assertEqual(uklid_ulohy(ted=ted + timedelta(days=8)), 2)
+        self.assertFalse(Uloha.objects.exists())
+        self.assertFalse(default_storage.exists(cesta))
+
+
+class PdfCacheTests(ModelsBase):
+    """Testy cache PDF dokladů kamionu."""
+
+    SABLONA = 'orders/proforma_faktura_po_zakazkach.html'
+
+    def setUp(self):
+        adresar = tempfile.TemporaryDirectory()
+        self.addCleanup(adresar.cleanup)
+        nastaveni = override_settings(PDF_CACHE_DIR=adresar.name, PDF_CACHE_MAX_MB=10)
+        nastaveni.enable()
+        self.addCleanup(nastaveni.disable)
+        self.vykresleni = 0
+
+    def vyrob(self):
+        self.vykresleni += 1
+        return f"%PDF-{self.vykresleni}".encode()
+
+    def tisk(self, varianta=('Novák',)):
+        return pdf_cache_service.pdf_kamionu(self.SABLONA, self.kamion_vydej, self.vyrob, varianta=varianta)
+
+    def test_opakovany_tisk_vrati_stejne_pdf_bez_vykresleni(self):
+        prvni = self.tisk()
+        # Jen dotazy na otisk kamionu, žádný výpočet cen.
+        with self.assertNumQueries(13):
+            druhy = self.tisk()
+        self.assertEqual(prvni, druhy)
+        self.assertEqual(self.vykresleni, 1)
+        self.assertNotEqual(self.tisk(varianta=('Dvořák',)), prvni)
+
+    def test_zmena_bedny_zakazky_nebo_ceniku_zneplatni_pdf(self):
+        self.tisk()
+        self.bedna1.hmotnost = Decimal('3')
+        self.bedna1.save()
+        self.tisk()
+        self.zakazka.popis = 'Nový popis'
+        self.zakazka.save()
+        self.tisk()
+        self.cena.cena_za_kg = Decimal('2.50')
+        self.cena.save()
+        self.tisk()
+        self.assertEqual(self.vykresleni, 4)
+        self.tisk()
+        self.assertEqual(self.vykresleni, 4)
+
+    def test_hromadna_zmena_beden_zneplatni_pdf(self):
+        self.tisk()
+        # QuerySet.update() nezapíše historii ani nepřepočítá souhrny (např. akce odeslání na zinkování).
+        Bedna.objects.filter(pk=self.bedna1.pk).update(zinkovat=ZinkovaniChoice.V_ZINKOVNE)
+        self.tisk()
+        self.assertEqual(self.vykresleni, 2)
+        self.tisk()
+        self.assertEqual(self.vykresleni, 2)
+
+    def test_odebrani_bedny_zneplatni_pdf(self):
+        self.tisk()
+        self.bedna2.delete()
+        self.tisk()
+        self.assertEqual(self.vykresleni, 2)
+
+    def test_limit_maze_nejdele_nepouzite_pdf(self):
+        for klic in ('aa01', 'bb02', 'cc03'):
+            pdf_cache_service.uloz_pdf(klic, b'x' * 1000)
+            cesta = pdf_cache_service._cesta(klic)
+            os.utime(cesta, ns=(cesta.stat().st_mtime_ns - 10**9 * (4 - int(klic[-1])),) * 2)
+        # Čtení posune 'aa01' na konec pořadí LRU.
+        self.assertEqual(pdf_cache_service.nacti_pdf('aa01'), b'x' * 1000)
+
+        self.assertEqual(pdf_cache_service.vynut_limit(limit=2000), 1)
+
+        self.assertIsNone(pdf_cache_service.nacti_pdf('bb02'))
+        self.assertIsNotNone(pdf_cache_service.nacti_pdf('aa01'))
+        self.assertIsNotNone(pdf_cache_service.nacti_pdf('cc03'))
+        self.assertEqual(pdf_cache_service.vycisti_pdf_cache(), 2)
+
+    @override_settings(PDF_CACHE_MAX_MB=0)
+    def test_nulovy_limit_cache_vypne(self):
+        self.tisk()
+        self.tisk()
+        self.assertEqual(self.vykresleni, 2)
+
+
+def _pdf_se_stranami(pocet):
+    writer = PdfWriter()
+    for _ in range(pocet):
+        writer.add_blank_page(width=595, height=842)
+    vystup = io.BytesIO()
+    writer.write(vystup)
+    return vystup.getvalue()
+
+
+def _weasyprint_k_dispozici():
+    """Zda lze v tomto prostředí skutečně vykreslit PDF (WeasyPrint potřebuje systémové knihovny)."""
+    try:
+        from weasyprint import HTML
+        PdfReader(io.BytesIO(HTML(string='<p>test</p>').write_pdf()))
+    except Exception:
+        return False
+    return True
+
+
+def _benchmark_pdf():
+    """Benchmarky PDF běží jen na vyžádání (proměnná prostředí PDF_BENCHMARK) se skutečným WeasyPrintem."""
+    return bool(os.environ.get('PDF_BENCHMARK')) and _weasyprint_k_dispozici()
+
+
+class KartyPoDavkachTests(ModelsBase):
+    """Tisk karet beden po dávkách a spojení PDF dávek."""
+
+    SABLONY = ['orders/karta_bedny/karta_bedny_eur.html']
+
+    def vytvor_bedny(self, pocet):
+        with odlozene_souhrny():
+            for _ in range(pocet):
+                Bedna.objects.create(zakazka=self.zakazka, hmotnost=Decimal('2'), tara=Decimal('1'), mnozstvi=1)
+        return Bedna.objects.filter(zakazka=self.zakazka)
+
+    @override_settings(PDF_KARTY_DAVKA=2)
+    def test_karty_se_vykresli_po_davkach_a_spoji(self):
+        bedny = self.vytvor_bedny(3)
+        prubeh = []
+        with (
+            patch('orders.services.pdf_cards_service.render_to_string', return_value='<div>karta</div>'),
+            patch(
+                'orders.services.pdf_cards_service.vyrendruj_pdf',
+                side_effect=lambda html, **kwargs: _pdf_se_stranami(html.count('karta')),
+            ) as pdf_mock,
+        ):
+            response = build_cards_pdf(
+                bedny_qs=bedny, template_paths=self.SABLONY * 2, filename='karty.pdf', prubeh=prubeh.append,
+            )
+
+        # Pět beden po dvou v dávce, dvě šablony na bednu.
+        self.assertEqual([c.args[0].count('karta') for c in pdf_mock.call_args_list], [4, 4, 2])
+        self.assertEqual(prubeh, [2, 4, 5])
+        self.assertEqual(len(PdfReader(io.BytesIO(response.content)).pages), 10)
+
+    def test_jedna_davka_vrati_pdf_beze_zmeny(self):
+        with (
+            patch('orders.services.pdf_cards_service.render_to_string', return_value='<div>karta</div>'),
+            patch('orders.services.pdf_cards_service.vyrendruj_pdf', return_value=b'%PDF-jedna') as pdf_mock,
+        ):
+            response = build_cards_pdf(bedny_qs=self.vytvor_bedny(0), template_paths=self.SABLONY, filename='karty.pdf')
+        pdf_mock.assert_called_once()
+        self.assertEqual(response.content, b'%PDF-jedna')
+
+    @skipUnless(_benchmark_pdf(), 'Benchmark PDF se spouští s PDF_BENCHMARK=1.')
+    @override_settings(PDF_RENDER_PROCESU=0)
+    def test_benchmark_karet_10_100_1000_beden(self):
+        """Doba a špička paměti tisku karet do logu – správnost dávek ověřují testy výše."""
+        zavri_pool()
+        self.addCleanup(zavri_pool)
+        bedny = self.vytvor_bedny(998)
+        for pocet in (10, 100, 1000):
+            vyber = Bedna.objects.filter(pk__in=list(bedny.values_list('pk', flat=True)[:pocet]))
+            tracemalloc.start()
+            zacatek = time.perf_counter()
+            response = build_cards_pdf(bedny_qs=vyber, template_paths=self.SABLONY, filename='karty.pdf')
+            trvani = time.perf_counter() - zacatek
+            _aktualni, spicka = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            logger.info(
+                f"Benchmark karet {pocet} beden: {trvani:.1f} s, špička paměti {spicka / 2**20:.1f} MB, "
+                f"PDF {len(response.content) / 2**20:.1f} MB."
+            )
+
+
+class RegistrStyluPdfTests(SimpleTestCase):
+    """Sdílené rozparsované styly a konfigurace písem v procesu vykreslování PDF."""
+
+    def setUp(self):
+        pdf_worker.vyprazdni_styly()
+        self.addCleanup(pdf_worker.vyprazdni_styly)
+        soubor = tempfile.NamedTemporaryFile('w', suffix='.css', delete=False)
+        soubor.write('body { margin: 0; }')
+        soubor.close()
+        self.addCleanup(os.unlink, soubor.name)
+        self.css = soubor.name
+
+        weasyprint = types.ModuleType('weasyprint')
+        weasyprint.CSS = MagicMock(side_effect=lambda **kwargs: object())
+        weasyprint.HTML = MagicMock()
+        weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF'
+        fonts = types.ModuleType('weasyprint.text.fonts')
+        fonts.FontConfiguration = MagicMock(side_effect=object)
+        moduly = patch.dict(sys.modules, {
+            'weasyprint': weasyprint,
+            'weasyprint.text': types.ModuleType('weasyprint.text'),
+            'weasyprint.text.fonts': fonts,
+        })
+        moduly.start()
+        self.addCleanup(moduly.stop)
+        self.weasyprint, self.fonts = weasyprint, fonts
+
+    def test_styl_se_nacte_jednou_a_po_uprave_souboru_znovu(self):
+        pdf_worker.vyrendruj('<p>1</p>', css_soubory=[self.css])
+        pdf_worker.vyrendruj('<p>2</p>', css_soubory=[self.css])
+
+        self.assertEqual(self.weasyprint.CSS.call_count, 1)
+        self.assertEqual(self.fonts.FontConfiguration.call_count, 1)
+        volani = self.weasyprint.HTML.return_value.write_pdf.call_args_list
+        self.assertIs(volani[0].kwargs['stylesheets'][0], volani[1].kwargs['stylesheets'][0])
+        self.assertIs(volani[0].kwargs['font_config'], volani[1].kwargs['font_config'])
+
+        cas = os.stat(self.css).st_mtime_ns + 10**9
+        os.utime(self.css, ns=(cas, cas))
+        pdf_worker.vyrendruj('<p>3</p>', css_soubory=[self.css])
+
+        self.assertEqual(self.weasyprint.CSS.call_count, 2)
+        self.assertEqual(self.fonts.FontConfiguration.call_count, 2)
+        self.assertIsNot(volani[0].kwargs['font_config'], self.weasyprint.HTML.return_value.write_pdf.call_args.kwargs['font_config'])
+
+
+@skipUnless(_benchmark_pdf(), 'Benchmark PDF se spouští s PDF_BENCHMARK=1.')
+class RegistrStyluPdfBenchmarkTests(SimpleTestCase):
+    """Benchmark vykreslení se sdíleným registrem stylů proti načítání stylů při každém tisku."""
+
+    def test_benchmark_sdilenych_stylu(self):
+        css = finders.find('orders/css/pdf_shared.css')
+        radky = ''.join(f'<tr><td class="fw-bold">{i}</td><td class="text-center">Bedna {i}</td></tr>' for i in range(50))
+        html = f'<div class="container-fluid"><table class="table table-bordered">{radky}</table></div>'
+        self.addCleanup(pdf_worker.vyprazdni_styly)
+        pdf_worker.vyrendruj(html, css_soubory=[css])
+
+        import weasyprint
+
+        casy, nacteni_stylu = {}, {}
+        for nazev, pred_tiskem in (('bez_registru', pdf_worker.vyprazdni_styly), ('s_registrem', lambda: None)):
+            celkem = 0.0
+            with patch('weasyprint.CSS', wraps=weasyprint.CSS) as css_mock:
+                for _ in range(20):
+                    pred_tiskem()
+                    zacatek = time.perf_counter()
+                    pdf_worker.vyrendruj(html, css_soubory=[css])
+                    celkem += time.perf_counter() - zacatek
+            casy[nazev] = celkem / 20
+            nacteni_stylu[nazev] = css_mock.call_count
+
+        logger.info(
+            f"Benchmark stylů PDF: bez registru {casy['bez_registru'] * 1000:.1f} ms, "
+            f"se sdíleným registrem {casy['s_registrem'] * 1000:.1f} ms na dokument."
+        )
+        # Časy jen do logu; sdílení stylů ověřuje počet parsování CSS.
+        self.assertEqual(nacteni_stylu, {'bez_registru': 20, 's_registrem': 0})
+
+
+def _testovaci_render(html, base_url=None, css_soubory=()):
+    """Náhrada WeasyPrintu pro testy poolu – HTML je počet sekund, po který "vykreslení" trvá."""
+    if html == 'chyba':
+        raise ValueError('vadné HTML')
+    time.sleep(float(html))
+    return html.encode(), float(html)
+
+
+class RenderPoolTests(SimpleTestCase):
+    """Testy poolu pracovních procesů pro vykreslování PDF."""
+
+    def pool(self, **kwargs):
+        pool = RenderPool(start_method='fork', funkce=_testovaci_render, **kwargs)
+        self.addCleanup(pool.zavri)
+        return pool
+
+    def spust_soubezne(self, pool, htmls, odstup=0.0):
+        vysledky = [None] * len(htmls)
+
+        def tisk(i, html):
+            try:
+                vysledky[i] = pool.spust(html)
+            except Exception as exc:
+                vysledky[i] = exc
+
+        vlakna = [threading.Thread(target=tisk, args=(i, html)) for i, html in enumerate(htmls)]
+        for vlakno in vlakna:
+            vlakno.start()
+            time.sleep(odstup)
+        for vlakno in vlakna:
+            vlakno.join()
+        return vysledky
+
+    def test_bez_procesu_vykresluje_ve_volajicim_vlakne(self):
+        pool = self.pool(procesu=0)
+        self.assertEqual(pool.spust('0'), (b'0', 0.0))
+        self.assertEqual(pool.snapshot()['pocet'], 1)
+
+    def test_soubeznost_omezena_poctem_procesu(self):
+        pool = self.pool(procesu=2, fronta=10, cekani=10)
+        zacatek = time.perf_counter()
+        vysledky = self.spust_soubezne(pool, ['0.3'] * 4)
+        trvani = time.perf_counter() - zacatek
+
+        self.assertEqual([obsah for obsah, _render in vysledky], [b'0.3'] * 4)
+        # Čtyři tisky po 0,3 s na dvou procesech – dvě vlny za sebou.
+        self.assertGreaterEqual(trvani, 0.6)
+        metriky = pool.snapshot()
+        self.assertEqual((metriky['pocet'], metriky['ve_fronte'], metriky['vykresluje_se']), (4, 0, 0))
+        self.assertGreaterEqual(metriky['cekani_max'], 0.2)
+        self.assertAlmostEqual(metriky['render_prumer'], 0.3)
+
+    def test_plna_fronta_odmitne_tisk(self):
+        pool = self.pool(procesu=1, fronta=1, cekani=10)
+        vysledky = self.spust_soubezne(pool, ['0.5', '0', '0'], odstup=0.1)
+
+        self.assertEqual(vysledky[0][0], b'0.5')
+        self.assertEqual(vysledky[1][0], b'0')
+        self.assertIsInstance(vysledky[2], ServiceOperationError)
+        self.assertEqual(pool.snapshot()['odmitnuto'], 1)
+
+    def test_dlouhe_cekani_ve_fronte_odmitne_tisk(self):
+        pool = self.pool(procesu=1, fronta=5, cekani=0.2)
+        vysledky = self.spust_soubezne(pool, ['0.6', '0'], odstup=0.1)
+
+        self.assertEqual(vysledky[0][0], b'0.6')
+        self.assertIsInstance(vysledky[1], ServiceOperationError)
+
+    def test_timeout_ukonci_proces_a_dalsi_tisk_pobezi_v_novem(self):
+        pool = self.pool(procesu=1, timeout=0.3)
+        with self.assertRaises(ServiceOperationError):
+            pool.spust('5')
+        self.assertEqual(pool.spust('0'), (b'0', 0.0))
+        metriky = pool.snapshot()
+        self.assertEqual((metriky['timeouty'], metriky['chyby'], metriky['pocet']), (1, 1, 1))
+
+    def test_chyba_vykresleni_se_propaguje_a_proces_zustane(self):
+        pool = self.pool(procesu=1)
+        with self.assertRaisesMessage(RuntimeError, 'vadné HTML'):
+            pool.spust('chyba')
+        proces = pool._volne.queue[-1]
+        self.assertEqual(pool.spust('0'), (b'0', 0.0))
+        self.assertIs(pool._volne.queue[-1], proces)
+
+    def test_po_max_uloh_se_proces_vymeni(self):
+        pool = self.pool(procesu=1, max_uloh=2)
+        pool.spust('0')
+        prvni = pool._volne.queue[-1]
+        pool.spust('0')
+        pool.spust('0')
+        self.assertFalse(prvni.proces.is_alive())
+        self.assertEqual(pool.snapshot()['pocet'], 3)
+
+    @override_settings(PDF_RENDER_PROCESU=0)
+    def test_vyrendruj_pdf_predava_html_base_url_a_css(self):
+        zavri_pool()
+        self.addCleanup(zavri_pool)
+        with patch('orders.pdf_worker.vyrendruj', return_value=(b'%PDF', 0.1)) as render_mock:
+            pdf = vyrendruj_pdf('<html></html>', base_url='file:///static/', css_soubory=['pdf_shared.css'])
+        self.assertEqual(pdf, b'%PDF')
+        render_mock.assert_called_once_with('<html></html>', 'file:///static/', ('pdf_shared.css',))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CislovaniSoubezneTests(TransactionTestCase):
+    """Souběžné rezervace z více vláken nesmí vydat stejné číslo dvakrát (vyžaduje databázi se zámky řádků)."""
+
+    VLAKEN = 8
+    REZERVACI = 25
+
+    def test_soubezne_rezervace_bez_duplicit(self):
+        rada = Rada(klic="soubeh", posledni_v_datech=lambda: 0)
+        vysledky = []
+        chyby = []
+        zamek = threading.Lock()
+
+        def zapisovac(index):
+            try:
+                cisla = []
+                for i in range(self.REZERVACI):
+                    cisla.extend(rezervuj(rada, 1 + (index + i) % 3))
+                with zamek:
+                    vysledky.extend(cisla)
+            except Exception as exc:
+                chyby.append(exc)
+            finally:
+                connection.close()
+
+        vlakna = [threading.Thread(target=zapisovac, args=(i,)) for i in range(self.VLAKEN)]
+        for vlakno in vlakna:
+            vlakno.start()
+        for vlakno in vlakna:
+            vlakno.join()
+
+        self.assertEqual(chyby, [])
+        self.assertEqual(len(vysledky), len(set(vysledky)))
+        self.assertEqual(sorted(vysledky), list(range(1, len(vysledky) + 1)))
@@ -133,7 +133,7 @@ class FormatSkupinaTZTests(UtilsBase):
 
 class UtilitaTiskDokumentaceTests(UtilsBase):
     @patch('orders.services.pdf_cards_service.render_to_string')
-    @patch('orders.services.pdf_cards_service.HTML.write_pdf')
+    @patch('orders.services.pdf_cards_service.vyrendruj_pdf')
     def test_tisk_dokumentace(self, mock_pdf, mock_render):
         qs = Bedna.objects.all()
         mock_render.side_effect = ['H'] * qs.count()
@@ -166,7 +166,7 @@ class UtilitaTiskDokumentaceTests(UtilsBase):
         self.assertIn('Není vybrána žádná bedna k tisku', msgs[0].message)
 
     @patch('orders.services.pdf_cards_service.render_to_string')
-    @patch('orders.services.pdf_cards_service.HTML.write_pdf')
+    @patch('orders.services.pdf_cards_service.vyrendruj_pdf')
     def test_tisk_dokumentace_sablony(self, mock_pdf, mock_render):
         qs = Bedna.objects.all()
         mock_render.side_effect = ['A', 'B'] * qs.count()
@@ -201,7 +201,7 @@ class UtilitaTiskDokumentaceTests(UtilsBase):
 
 class UtilitaTiskDLProformaTests(UtilsBase):
     @patch('orders.utils.render_to_string')
-    @patch('orders.utils.HTML.write_pdf')
+    @patch('orders.utils.vyrendruj_pdf')
     def test_tisk_dl_a_proforma(self, mock_pdf, mock_render):
         mock_render.return_value = 'HTML'
         mock_pdf.return_value = b'PDF2'
@@ -1,4 +1,7 @@
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import Sum
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
@@ -10,9 +13,10 @@ from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from unittest.mock import patch
 import json
+import tempfile
 
 from orders.models import (
-	Zakaznik, Odberatel, Kamion, Zakazka, Bedna, Predpis, TypHlavy, Pozice, PoziceZakazkaOrder, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Cena
+	Zakaznik, Odberatel, Kamion, Zakazka, Bedna, Predpis, TypHlavy, Pozice, PoziceZakazkaOrder, Zarizeni, Sarze, SarzeKrok, SarzeKrokBedna, Cena, StatistikaKamionuMesice
 )
 from orders.choices import StavBednyChoice, StavSarzeChoice, KamionChoice, TryskaniChoice, RovnaniChoice, PrioritaChoice, TypZarizeniChoice
 from orders.views import (
@@ -22,6 +26,7 @@ from orders.views import (
 	_build_vyroba_historie_context,
 	_build_vyroba_zakaznici_vyuziti_context,
 )
+from orders.services.navezeni_service import srovnej_poradi_navezeni
 
 
 class ViewsTestBase(TestCase):
@@ -2180,6 +2185,35 @@ class DashboardKamionyViewTests(ViewsTestBase):
 		self.assertEqual(resp.status_code, 200)
 		self.assertTemplateUsed(resp, "orders/partials/dashboard_kamiony_content.html")
 
+	def test_porovnani_roku_json(self):
+		year = timezone.now().year
+		# Předchozí rok je v rozsahu let jen s kamionem z toho roku.
+		Kamion.objects.create(zakaznik=self.z_eur, datum=date(year - 1, 6, 1), prijem_vydej=KamionChoice.PRIJEM)
+		resp = self.client.get(reverse("dashboard_kamiony_porovnani"), {"roky": f"{year - 1},{year}", "zakaznik": self.z_eur.zkratka})
+		self.assertEqual(resp.status_code, 200)
+		data = resp.json()
+		self.assertEqual(set(data["roky"]), {str(year - 1), str(year)})
+		self.assertEqual(Decimal(data["roky"][str(year - 1)]["celkem"]["prijem"]), Decimal("0"))
+		prijem_eur = Bedna.objects.filter(zakazka__kamion_prijem=self.k_prijem_eur, fakturovat=True).aggregate(s=Sum("hmotnost"))["s"]
+		self.assertEqual(Decimal(data["roky"][str(year)]["celkem"]["prijem"]), prijem_eur)
+		self.assertEqual(data["roky"][str(year)]["celkem"]["pocet_kamionu_prijem"], 1)
+
+		self.assertEqual(self.client.get(reverse("dashboard_kamiony_porovnani"), {"roky": "abc"}).status_code, 400)
+		self.assertEqual(self.client.get(reverse("dashboard_kamiony_porovnani"), {"zakaznik": "NEEXISTUJE"}).status_code, 400)
+
+	def test_rok_mimo_rozsah_kamionu(self):
+		year = timezone.localdate().year
+		prvni_rok = Kamion.objects.order_by("datum").first().datum.year
+		for rok in ["0", "-5", "10000", str(prvni_rok - 1), str(year + 1)]:
+			with self.subTest(rok=rok):
+				resp = self.client.get(reverse("dashboard_kamiony"), {"rok": rok})
+				self.assertEqual(resp.status_code, 200)
+				self.assertEqual(resp.context["rok"], year)
+				resp = self.client.get(reverse("dashboard_kamiony_porovnani"), {"roky": f"{year},{rok}"})
+				self.assertEqual(resp.status_code, 400)
+		# Načtení dashboardu statistiky neukládá.
+		self.assertFalse(StatistikaKamionuMesice.objects.exists())
+
 
 class KamionVydejPdfPermissionTests(ViewsTestBase):
 	def _pdf_urls(self):
@@ -2202,7 +2236,7 @@ class KamionVydejPdfPermissionTests(ViewsTestBase):
 
 		with (
 			patch("orders.views.render_to_string", return_value="<html></html>"),
-			patch("orders.views.HTML.write_pdf", return_value=b"%PDF"),
+			patch("orders.views.vyrendruj_pdf", return_value=b"%PDF"),
 			patch("orders.views.finders.find", return_value=None),
 			patch(
 				"orders.views.utilita_tisk_dl_a_proforma_faktury",
@@ -2213,6 +2247,71 @@ class KamionVydejPdfPermissionTests(ViewsTestBase):
 				with self.subTest(url=url):
 					self.assertEqual(self.client.get(url).status_code, 200)
 
+	def test_opakovany_tisk_dl_a_protokolu_pouzije_cache(self):
+		self.user.user_permissions.add(Permission.objects.get(
+			content_type__app_label="orders",
+			codename="view_kamion",
+		))
+		urls = [
+			reverse("dodaci_list_kamion_vydej_pdf", args=[self.k_vydej_eur.pk]),
+			reverse("protokol_kamion_vydej_pdf", args=[self.k_vydej_eur.pk]),
+		]
+
+		with (
+			tempfile.TemporaryDirectory() as adresar,
+			override_settings(PDF_CACHE_DIR=adresar),
+			patch("orders.utils.render_to_string", return_value="<html></html>"),
+			patch("orders.views.render_to_string", return_value="<html></html>"),
+			patch("orders.utils.vyrendruj_pdf", return_value=b"%PDF-dl") as dl_mock,
+			patch("orders.views.vyrendruj_pdf", return_value=b"%PDF-protokol") as protokol_mock,
+		):
+			for _ in range(2):
+				odpovedi = [self.client.get(url) for url in urls]
+				self.assertEqual([resp.content for resp in odpovedi], [b"%PDF-dl", b"%PDF-protokol"])
+
+			self.zak_vydej_eur.popis = "Změněno"
+			self.zak_vydej_eur.save()
+			self.client.get(urls[0])
+
+		self.assertEqual(dl_mock.call_count, 2)
+		protokol_mock.assert_called_once()
+
+	def test_protokol_vytisteny_v_jiny_den_se_vykresli_znovu(self):
+		self.user.user_permissions.add(Permission.objects.get(
+			content_type__app_label="orders",
+			codename="view_kamion",
+		))
+		url = reverse("protokol_kamion_vydej_pdf", args=[self.k_vydej_eur.pk])
+		dnes = timezone.now()
+
+		with (
+			tempfile.TemporaryDirectory() as adresar,
+			override_settings(PDF_CACHE_DIR=adresar),
+			patch("orders.views.render_to_string", return_value="<html></html>") as render_mock,
+			patch("orders.views.vyrendruj_pdf", return_value=b"%PDF-protokol") as protokol_mock,
+		):
+			for cas in (dnes, dnes, dnes + timedelta(days=1)):
+				with patch("orders.views.timezone.now", return_value=cas):
+					self.assertEqual(self.client.get(url).status_code, 200)
+
+		# Stejný den z cache, další den nové vykreslení s datem tisku.
+		self.assertEqual(protokol_mock.call_count, 2)
+		self.assertEqual(
+			[volani.args[1]["generated_at"].date() for volani in render_mock.call_args_list],
+			[dnes.date(), (dnes + timedelta(days=1)).date()],
+		)
+
+	def test_metriky_pdf_jen_pro_personal(self):
+		self.assertEqual(self.client.get(reverse("metriky_pdf")).status_code, 403)
+
+		self.user.is_staff = True
+		self.user.save(update_fields=["is_staff"])
+		resp = self.client.get(reverse("metriky_pdf"))
+
+		self.assertEqual(resp.status_code, 200)
+		self.assertIn("cekani_prumer", resp.json())
+		self.assertIn("render_max", resp.json())
+
 
 class BednyKNavezeniViewTests(ViewsTestBase):
 	def setUp(self):
@@ -2296,7 +2395,7 @@ class BednyKNavezeniViewTests(ViewsTestBase):
 			with self.subTest(url=url):
 				self.assertEqual(self.client.post(url, data).status_code, 403)
 
-	def test_unauthorized_note_post_does_not_create_order(self):
+	def test_unauthorized_note_post_does_not_change_order(self):
 		self.user.user_permissions.remove(Permission.objects.get(
 			content_type__app_label="orders",
 			codename="change_bedna",
@@ -2308,10 +2407,10 @@ class BednyKNavezeniViewTests(ViewsTestBase):
 		)
 
 		self.assertEqual(response.status_code, 403)
-		self.assertFalse(PoziceZakazkaOrder.objects.filter(
+		self.assertIsNone(PoziceZakazkaOrder.objects.get(
 			pozice=self.poz_a,
 			zakazka=self.zak_eur,
-		).exists())
+		).poznamka_k_navezeni)
 
 	def test_nasledne_endpoint_rejects_get(self):
 		response = self.client.get(reverse("dashboard_bedny_k_navezeni_nasledne"))
@@ -2354,36 +2453,84 @@ class BednyKNavezeniViewTests(ViewsTestBase):
 		self.assertEqual(pdf_resp["Content-Type"], "application/pdf")
 		self.assertIn("inline; filename=\"bedny_k_navezeni.pdf\"", pdf_resp["Content-Disposition"]) 
 
-	def test_get_groups_syncs_pozice_zakazka_order_table(self):
-		# vytvoř ruční pořadí: jedno platné s dírou, jedno zastaralé bez beden
-		PoziceZakazkaOrder.objects.create(
+	def _orders(self):
+		return list(
+			PoziceZakazkaOrder.objects.order_by("pozice__kod", "poradi").values_list("pozice__kod", "zakazka_id", "poradi")
+		)
+
+	def test_bedny_writes_sync_pozice_zakazka_order_table(self):
+		self.assertEqual(self._orders(), [("A", self.zak_eur.id, 1), ("B", self.zak_abc.id, 1)])
+
+		b_abc = Bedna.objects.create(
+			zakazka=self.zak_abc,
 			pozice=self.poz_a,
-			zakazka=self.zak_eur,
-			poradi=3,
+			stav_bedny=StavBednyChoice.K_NAVEZENI,
+			hmotnost=1,
+			tara=1,
+			mnozstvi=1,
 		)
-		PoziceZakazkaOrder.objects.create(
-			pozice=self.poz_b,
-			zakazka=self.zak_eur,
-			poradi=1,
+		self.assertEqual(
+			self._orders(),
+			[("A", self.zak_eur.id, 1), ("A", self.zak_abc.id, 2), ("B", self.zak_abc.id, 1)],
 		)
 
-		groups = _get_bedny_k_navezeni_groups()
+		# Zakázka bez beden k navezení z pozice zmizí a zbývající se přečíslují.
+		for bedna in Bedna.objects.filter(pk__in=[self.b_nav1.pk, self.b_nav2.pk]):
+			bedna.stav_bedny = StavBednyChoice.PRIJATO
+			bedna.save()
+		self.assertEqual(self._orders(), [("A", self.zak_abc.id, 1), ("B", self.zak_abc.id, 1)])
+
+		# Přesun bedny do jiné pozice srovná zdrojovou i cílovou pozici.
+		b_abc = Bedna.objects.get(pk=b_abc.pk)
+		b_abc.pozice = self.poz_b
+		b_abc.save()
+		self.assertEqual(self._orders(), [("B", self.zak_abc.id, 1)])
 
-		orders = list(
-			PoziceZakazkaOrder.objects.order_by("pozice__kod", "zakazka_id").values_list("pozice__kod", "zakazka_id", "poradi")
+		# Pořadí upravené mimo aplikaci srovná služba.
+		PoziceZakazkaOrder.objects.filter(pozice=self.poz_b).update(poradi=7)
+		PoziceZakazkaOrder.objects.create(pozice=self.poz_a, zakazka=self.zak_eur, poradi=1)
+		self.assertEqual(srovnej_poradi_navezeni([self.poz_a.id, self.poz_b.id]), 2)
+		self.assertEqual(self._orders(), [("B", self.zak_abc.id, 1)])
+
+	def test_get_does_not_write_and_orders_groups_read_only(self):
+		Bedna.objects.create(
+			zakazka=self.zak_abc,
+			pozice=self.poz_a,
+			stav_bedny=StavBednyChoice.K_NAVEZENI,
+			hmotnost=1,
+			tara=1,
+			mnozstvi=1,
 		)
-		expected = [
-			("A", self.zak_eur.id, 1),
-			("B", self.zak_abc.id, 1),
+		# Pořadí s dírou, zastaralé pořadí a zakázka bez pořadí – GET je jen zobrazí, nic neukládá.
+		PoziceZakazkaOrder.objects.filter(pozice=self.poz_a, zakazka=self.zak_eur).update(poradi=5)
+		PoziceZakazkaOrder.objects.filter(pozice=self.poz_a, zakazka=self.zak_abc).update(poradi=3)
+		PoziceZakazkaOrder.objects.filter(pozice=self.poz_b).delete()
+		PoziceZakazkaOrder.objects.create(pozice=self.poz_b, zakazka=self.zak_eur, poradi=1)
+		orders_before = self._orders()
+
+		# Test se týká zápisů do databáze, vykreslení PDF se nahradí.
+		with (
+			patch("orders.views.vyrendruj_pdf", return_value=b"%PDF") as pdf_mock,
+			CaptureQueriesContext(connection) as queries,
+		):
+			resp = self.client.get(reverse("dashboard_bedny_k_navezeni"))
+			pdf_resp = self.client.get(reverse("dashboard_bedny_k_navezeni_pdf"))
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(pdf_resp.status_code, 200)
+		pdf_mock.assert_called_once()
+		writes = [
+			q["sql"] for q in queries.captured_queries
+			if q["sql"].lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))
+			and "django_session" not in q["sql"]
 		]
-		self.assertEqual(orders, expected)
-		# a groups reflektují aktualizovaná pořadí
-		pozice_map = {group["pozice"]: group for group in groups}
+		self.assertEqual(writes, [])
+		self.assertEqual(self._orders(), orders_before)
+
+		pozice_map = {group["pozice"]: group for group in resp.context["groups"]}
 		a_zakazky = pozice_map["A"]["zakazky_group"]
-		self.assertEqual(a_zakazky[0]["poradi"], 1)
+		self.assertEqual([(z["zakazka"].id, z["poradi"]) for z in a_zakazky], [(self.zak_abc.id, 1), (self.zak_eur.id, 2)])
 		b_zakazky = pozice_map["B"]["zakazky_group"]
-		self.assertEqual(b_zakazky[0]["zakazka"].id, self.zak_abc.id)
-		self.assertEqual(b_zakazky[0]["poradi"], 1)
+		self.assertEqual([(z["zakazka"].id, z["poradi"]) for z in b_zakazky], [(self.zak_abc.id, 1)])
 
 	def test_dashboard_post_reorders_sequence(self):
 		# přidej druhou zakázku do stejné pozice, aby bylo co posouvat
@@ -4696,7 +4843,7 @@ class RychleZalozeniSarzeViewTests(ViewsTestBase):
 			procent_z_patra=100,
 		)
 
-		with patch("orders.services.sarze_print_service.HTML.write_pdf", return_value=b"%PDF-test"):
+		with patch("orders.services.sarze_print_service.vyrendruj_pdf", return_value=b"%PDF-test"):
 			response = self.client.get(
 				reverse("rychle_zalozeni_sarze_tisk", args=[krok.pk]),
 			)
@@ -4780,13 +4927,12 @@ class RychleZalozeniSarzeViewTests(ViewsTestBase):
 
 		self.assertLess(prehled_html.index("2. patro"), prehled_html.index("1. patro"))
 
-		with patch("orders.services.sarze_print_service.HTML") as html_mock:
-			html_mock.return_value.write_pdf.return_value = b"%PDF-test"
+		with patch("orders.services.sarze_print_service.vyrendruj_pdf", return_value=b"%PDF-test") as pdf_mock:
 			self.client.get(
 				reverse("rychle_zalozeni_sarze_tisk", args=[krok.pk]),
 			)
 
-		tisk_html = html_mock.call_args.kwargs["string"]
+		tisk_html = pdf_mock.call_args.args[0]
 		self.assertLess(tisk_html.index("2. patro"), tisk_html.index("1. patro"))
 
 	def test_prehled_rejects_non_nakladani_device(self):
@@ -5155,6 +5301,10 @@ class VyrobaDashboardContextTests(TestCase):
 		self.assertEqual(history[7]["weekly_avg_display"], "1 100")
 		self.assertEqual(history[0]["biweekly_avg_display"], "750")
 
+	@staticmethod
+	def _podle_kodu(hodnoty):
+		return {bunka["kod"]: bunka["display"] for bunka in hodnoty["zarizeni"]}
+
 	def test_vyroba_historie_yearly_average_uses_elapsed_days(self):
 		today_value = date(2026, 1, 10)
 
@@ -5228,13 +5378,13 @@ class VyrobaDashboardContextTests(TestCase):
 		weekly_rows = ctx["vyroba_historie"]["weekly_rows"]
 
 		self.assertEqual(yearly["elapsed_days"], 10)
-		self.assertEqual(yearly["avg"]["xl1_display"], "100")
-		self.assertEqual(yearly["avg"]["xl2_display"], "50")
+		self.assertEqual(self._podle_kodu(yearly["avg"])["TQF_XL1"], "100")
+		self.assertEqual(self._podle_kodu(yearly["avg"])["TQF_XL2"], "50")
 		self.assertEqual(yearly["avg"]["total_display"], "150")
 		self.assertEqual(yearly["vytizeni_rostu"]["display"], "750")
 		self.assertEqual(yearly["cena_za_rost"]["display"], "1 000")
-		self.assertEqual(yearly["prostoj_avg"]["xl1_display"], "0,8")
-		self.assertEqual(yearly["prostoj_avg"]["xl2_display"], "1,8")
+		self.assertEqual(self._podle_kodu(yearly["prostoj_avg"])["TQF_XL1"], "0,8")
+		self.assertEqual(self._podle_kodu(yearly["prostoj_avg"])["TQF_XL2"], "1,8")
 		self.assertEqual(yearly["prostoj_avg"]["total_display"], "2,6")
 		self.assertEqual(monthly_rows[0]["vytizeni_rostu"]["display"], "750")
 		self.assertEqual(monthly_rows[0]["cena_za_rost"]["display"], "1 000")
@@ -5294,7 +5444,7 @@ class VyrobaDashboardContextTests(TestCase):
 		row_by_label = {row["label"]: row for row in month_detail["rows"]}
 		self.assertEqual(row_by_label["05.01.2026"]["vytizeni_rostu"]["display"], "600")
 		self.assertEqual(row_by_label["05.01.2026"]["cena_za_rost"]["display"], "1 200")
-		self.assertEqual(row_by_label["05.01.2026"]["prostoj_avg"]["xl1_display"], "0,8")
+		self.assertEqual(self._podle_kodu(row_by_label["05.01.2026"]["prostoj_avg"])["TQF_XL1"], "0,8")
 		self.assertEqual(row_by_label["05.01.2026"]["prostoj_avg"]["total_display"], "0,8")
 
 	def test_vyroba_historie_weeks_start_on_monday_and_week_one_contains_jan_first(self):
@@ -5339,7 +5489,7 @@ class VyrobaDashboardContextTests(TestCase):
 		month_detail = ctx["vyroba_historie"]["month_detail"]
 		row_by_label = {row["label"]: row for row in month_detail["rows"]}
 
-		self.assertEqual(row_by_label["10.01.2026"]["prostoj_avg"]["xl1_display"], "0,0")
+		self.assertEqual(self._podle_kodu(row_by_label["10.01.2026"]["prostoj_avg"])["TQF_XL1"], "0,0")
 		self.assertEqual(row_by_label["10.01.2026"]["prostoj_avg"]["total_display"], "0,0")
 
 	def test_vyroba_zakaznici_vyuziti_splits_weekly_usage_by_customer(self):
@@ -5384,6 +5534,36 @@ class VyrobaDashboardContextTests(TestCase):
 		self.assertEqual(data["total_row"]["weeks"][0]["display"], "1 000")
 		self.assertEqual(data["total_row"]["total"]["display"], "1 000")
 
+	def test_vyroba_views_query_count_does_not_grow_with_history(self):
+		target_day = date(2026, 3, 3)
+
+		def create_days(first_day, days):
+			for offset in range(days):
+				day = first_day + timedelta(days=offset)
+				sarze = Sarze.objects.create(cislo_sarze=700 + day.toordinal() % 1000, datum_zalozeni=day)
+				krok = SarzeKrok.objects.create(
+					sarze=sarze, poradi=1, datum=day, zarizeni=self.dev_xl1,
+					zacatek=time(8, 0), konec=time(9, 0), operator="op", program="p",
+				)
+				SarzeKrokBedna.objects.create(krok=krok, bedna=self._create_bedna(self.z_eur, 500), patro=1, procent_z_patra=50)
+
+		def count_queries():
+			counts = []
+			for build in (
+				lambda: _build_vyroba_dashboard_context(date_value=target_day),
+				lambda: _build_vyroba_historie_context(year_value=2026, month_value=2, today_value=target_day),
+				lambda: _build_vyroba_zakaznici_vyuziti_context(year_value=2026, today_value=target_day),
+			):
+				with CaptureQueriesContext(connection) as queries:
+					build()
+				counts.append(len(queries))
+			return counts
+
+		create_days(target_day, 1)
+		short_history = count_queries()
+		create_days(date(2026, 1, 1), 45)
+		self.assertEqual(count_queries(), short_history)
+
 class VyrobaHistorieViewTests(ViewsTestBase):
 	def test_zakaznici_vyuziti_view_renders_page(self):
 		resp = self.client.get(reverse("dashboard_vyroba_zakaznici_vyuziti"), {"rok": timezone.localdate().year})
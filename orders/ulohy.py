@@ -0,0 +1,125 @@
+"""
+Obsluhy úloh na pozadí (viz services.ulohy_service).
+
+Modul registruje obsluhy pro jednotlivé typy úloh, načítá ho worker `manage.py run_jobs`.
+Parametry úlohy ukládá akce při zařazení, obsluha z nich sestaví stejný výstup
+jako synchronní varianta akce a vrátí ho jako VysledekUlohy.
+"""
+import io
+
+from .actions import (
+    vytvor_pdf_rozpracovanosti,
+    zapis_csv_beden_dl,
+    zapis_csv_beden_pro_zakaznika,
+)
+from .choices import TypUlohyChoice
+from .import_strategies import strategie_importu
+from .models import Bedna, Kamion, Rozpracovanost
+from .services.exceptions import ServiceValidationError
+from .services.import_service import importuj_zakazky, nacti_parsovany_import, smaz_import
+from .services.pdf_cards_service import build_cards_pdf
+from .services.ulohy_service import VysledekUlohy, nastav_prubeh, registruj_ulohu
+
+
+def _bedny(parametry):
+    return Bedna.objects.filter(pk__in=parametry['bedny'])
+
+
+def _hlaseni_prubehu(uloha):
+    return lambda zpracovano: nastav_prubeh(uloha, zpracovano)
+
+
+@registruj_ulohu(TypUlohyChoice.IMPORT_ZAKAZEK)
+def uloha_import_zakazek(uloha):
+    """Uloží zakázky a bedny z rozparsovaného náhledu importu a smaže dočasné soubory importu."""
+    parametry = uloha.parametry
+    kamion = Kamion.objects.select_related('zakaznik').get(pk=parametry['kamion'])
+    parsovany = nacti_parsovany_import(parametry['token'], parametry.get('hash'))
+    if parsovany is None:
+        raise ServiceValidationError("Náhled importu už není k dispozici, nahrajte prosím soubor znovu.")
+
+    warnings = []
+    vysledek = importuj_zakazky(
+        parsovany.df,
+        kamion,
+        strategie_importu(kamion),
+        warnings,
+        required_fields=parsovany.required_fields,
+        user=uloha.vytvoril,
+        prubeh=_hlaseni_prubehu(uloha),
+    )
+    smaz_import(parametry['token'], {'path': parametry.get('cesta'), 'hash': parametry.get('hash')})
+
+    zprava = [
+        f"Import proběhl úspěšně: uloženo {vysledek.pocet_zakazek} zakázek a {vysledek.pocet_beden} beden "
+        f"do kamionu {kamion}."
+    ]
+    zprava.extend(warnings)
+    return VysledekUlohy(zprava="\n".join(zprava))
+
+
+@registruj_ulohu(TypUlohyChoice.KARTY_BEDEN)
+def uloha_karty_beden(uloha):
+    """PDF karet beden (a karet kontroly kvality) pro uložený výběr beden."""
+    parametry = uloha.parametry
+    bedny = _bedny(parametry)
+    if parametry.get('razeni'):
+        bedny = bedny.order_by(*parametry['razeni'])
+    response = build_cards_pdf(
+        bedny_qs=bedny,
+        template_paths=parametry['sablony'],
+        filename=parametry['nazev_souboru'],
+        user_display_name=parametry.get('uzivatel', ''),
+        base_url=parametry.get('base_url'),
+        prubeh=_hlaseni_prubehu(uloha),
+    )
+    return VysledekUlohy(obsah=response.content, nazev_souboru=parametry['nazev_souboru'])
+
+
+@registruj_ulohu(TypUlohyChoice.ROZPRACOVANOST)
+def uloha_rozpracovanost(uloha):
+    """PDF rozpracovanosti pro uložený záznam rozpracovanosti."""
+    snapshot = Rozpracovanost.objects.get(pk=uloha.parametry['rozpracovanost'])
+    pdf_content, filename = vytvor_pdf_rozpracovanosti(
+        snapshot,
+        user=uloha.vytvoril,
+        base_url=uloha.parametry.get('base_url'),
+    )
+    return VysledekUlohy(obsah=pdf_content, nazev_souboru=filename)
+
+
+@registruj_ulohu(TypUlohyChoice.CSV_ZAKAZNIK)
+def uloha_csv_zakaznik(uloha):
+    """CSV beden pro zákazníka (schválení před expedicí nebo rovnání)."""
+    parametry = uloha.parametry
+    vystup = io.StringIO()
+    pocet = zapis_csv_beden_pro_zakaznika(
+        vystup,
+        _bedny(parametry),
+        parametry['zakaznik_zkratka'],
+        parametry['rovnani'],
+        prubeh=_hlaseni_prubehu(uloha),
+    )
+    return VysledekUlohy(
+        obsah=vystup.getvalue(),
+        nazev_souboru=parametry['nazev_souboru'],
+        zprava=f"Vyexportováno {pocet} beden.",
+    )
+
+
+@registruj_ulohu(TypUlohyChoice.CSV_DL)
+def uloha_csv_dl(uloha):
+    """CSV beden pro vložení do DL."""
+    parametry = uloha.parametry
+    vystup = io.StringIO()
+    pocet = zapis_csv_beden_dl(
+        vystup,
+        _bedny(parametry),
+        parametry['s_hpm'],
+        prubeh=_hlaseni_prubehu(uloha),
+    )
+    return VysledekUlohy(
+        obsah=vystup.getvalue(),
+        nazev_souboru=parametry['nazev_souboru'],
+        zprava=f"Vyexportováno {pocet} beden.",
+    )
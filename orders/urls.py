@@ -5,6 +5,7 @@ from .views import (
     provozni_prehledy_view,
     pracoviste_prehled_view,
     dashboard_kamiony_view,
+    dashboard_kamiony_porovnani_view,
     dashboard_vyroba_view,
     dashboard_vyroba_historie_view,
     dashboard_vyroba_historie_mesic_view,
@@ -37,6 +38,9 @@ from .views import (
     rychle_zalozeni_sarze_prehled_view,
     rychle_zalozeni_sarze_tisk_view,
     rychle_zalozeni_sarze_upravit_view,
+    uloha_detail_view,
+    uloha_stahnout_view,
+    metriky_pdf_view,
 )
 
 urlpatterns = [
@@ -44,6 +48,7 @@ urlpatterns = [
     path('prehled-pracovist/', pracoviste_prehled_view, name='pracoviste_prehled'),
     path('dashboard/bedny/', dashboard_bedny_view, name='dashboard_bedny'),
     path('dashboard/kamiony/', dashboard_kamiony_view, name='dashboard_kamiony'),    
+    path('dashboard/kamiony/porovnani/', dashboard_kamiony_porovnani_view, name='dashboard_kamiony_porovnani'),
     path('dashboard/vyroba/', dashboard_vyroba_view, name='dashboard_vyroba'),
     path(
         'dashboard/vyroba/historie/',
@@ -165,4 +170,7 @@ urlpatterns = [
         proforma_kamion_vydej_pdf_view,
         name='proforma_kamion_vydej_pdf'
     ),
+    path('ulohy/<int:pk>/', uloha_detail_view, name='uloha_detail'),
+    path('ulohy/<int:pk>/stahnout/', uloha_stahnout_view, name='uloha_stahnout'),
+    path('metriky/pdf/', metriky_pdf_view, name='metriky_pdf'),
 ]
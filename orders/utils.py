@@ -1,6 +1,6 @@
 from django.contrib import messages
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.forms.models import model_to_dict
 from django.db import transaction
@@ -11,13 +11,12 @@ from django.utils.html import format_html
 import csv
 import re
 
-from .choices import StavBednyChoice, RovnaniChoice, TryskaniChoice, ZinkovaniChoice, BARVA_SKUPINY_TZ
+from .choices import StavBednyChoice, RovnaniChoice, TryskaniChoice, ZinkovaniChoice, KamionChoice, TypUlohyChoice, BARVA_SKUPINY_TZ
 from django.db.models import Case, F, IntegerField, When, Value, Q
 from .models import Zakazka, Bedna
 
 import pandas as pd
 
-from weasyprint import HTML, CSS
 
 import gc
 import logging
@@ -29,6 +28,11 @@ from .services.expedice_service import (
     expedice_zakazek_do_existujiciho_kamionu,
 )
 from .services.exceptions import ServiceValidationError, ServiceOperationError
+from .services.cenik_service import cenik_scope
+from .services.ulohy_service import prekracuje_prah, zarad_ulohu
+from .services.pdf_render_service import vyrendruj_pdf
+from .services.pdf_cache_service import pdf_kamionu
+from .services.fakturace_service import build_fakturace_kamionu
 
 
 def truncate_with_title(text, max_len=15):
@@ -175,10 +179,50 @@ def utilita_tisk_dokumentace(modeladmin, request, queryset, html_path, filename)
     return utilita_tisk_dokumentace_sablony(modeladmin, request, queryset, [html_path], filename)
 
 
+def utilita_zarad_ulohu(modeladmin, request, typ, parametry, popis, celkem=0):
+    """
+    Zařadí úlohu na pozadí místo zpracování v requestu a přesměruje na stránku úlohy,
+    odkud si uživatel po dokončení stáhne výsledek.
+    """
+    uloha = zarad_ulohu(typ, parametry, user=getattr(request, 'user', None), popis=popis, celkem=celkem)
+    messages.info(request, format_html(
+        'Úloha „{}“ byla zařazena ke zpracování na pozadí. Průběh a výsledek: <a href="{}">úloha č. {}</a>.',
+        popis, uloha.get_absolute_url(), uloha.pk,
+    ))
+    return HttpResponseRedirect(uloha.get_absolute_url())
+
+
+def razeni_querysetu(queryset):
+    """Řazení querysetu jako seznam názvů polí (pro uložení do parametrů úlohy)."""
+    return [pole for pole in queryset.query.order_by if isinstance(pole, str)]
+
+
 def utilita_tisk_dokumentace_sablony(modeladmin, request, queryset, html_paths, filename):
     """
     Vytvoří PDF, které na každou bednu rendruje všechny dodané šablony za sebou.
+    Velké výběry (nad ULOHY_PRAH_BEDEN beden) se vytisknou úlohou na pozadí.
     """
+    pocet_beden = queryset.count()
+    if prekracuje_prah(pocet_beden):
+        user = getattr(request, 'user', None)
+        user_display_name = ''
+        if user is not None and user.is_authenticated:
+            user_display_name = user.last_name or user.get_full_name() or user.get_username()
+        return utilita_zarad_ulohu(
+            modeladmin,
+            request,
+            TypUlohyChoice.KARTY_BEDEN,
+            {
+                'bedny': list(queryset.values_list('pk', flat=True)),
+                'razeni': razeni_querysetu(queryset),
+                'sablony': list(html_paths),
+                'nazev_souboru': filename,
+                'uzivatel': user_display_name,
+                'base_url': request.build_absolute_uri('/'),
+            },
+            f"{filename} ({pocet_beden} beden)",
+            celkem=pocet_beden,
+        )
     try:
         return build_cards_pdf(
             bedny_qs=queryset,
@@ -197,9 +241,10 @@ def utilita_tisk_dokumentace_sablony(modeladmin, request, queryset, html_paths,
         messages.error(request, "Došlo k chybě při generování PDF dokumentace.")
         return None
 
-def utilita_tisk_dl_a_proforma_faktury(modeladmin, request, kamion, html_path, filename):
+def utilita_tisk_dl_a_proforma_faktury(modeladmin, request, kamion, html_path, filename, cache=False):
     """
     Tiskne dodací list, proforma fakturu a přehled zakázek pro vybraný kamion a daného zákazníka.
+    S `cache=True` se PDF bere z cache dokladů kamionu, dokud se kamion, jeho zakázky a bedny nezmění.
     """
     context = {"kamion": kamion}
     if request and hasattr(request, "user") and request.user.is_authenticated:
@@ -209,16 +254,27 @@ def utilita_tisk_dl_a_proforma_faktury(modeladmin, request, kamion, html_path, f
             or request.user.get_username()
         )
         context["user_last_name"] = user_last_name
-    html_string = render_to_string(html_path, context)
-    stylesheets = []
-    css_path = finders.find('orders/css/pdf_shared.css')
-    if css_path:
-        stylesheets.append(CSS(filename=css_path))
-    else:
-        logger.warning("Nepodařilo se najít CSS 'orders/css/pdf_shared.css' pro tisk DL/proforma faktury/přehled zakázek.")
-
     base_url = request.build_absolute_uri('/') if request else None
-    pdf_file = HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=stylesheets)
+
+    def vyrob_pdf():
+        if kamion.prijem_vydej == KamionChoice.VYDEJ:
+            # Ceny, počty a hmotnosti pro proformu se spočítají najednou pro celý kamion.
+            context["fakturace"] = build_fakturace_kamionu(kamion)
+        # Ceny v šabloně (proforma, DL) se počítají přes jeden sdílený resolver ceníku.
+        with cenik_scope():
+            html_string = render_to_string(html_path, context)
+        css_soubory = []
+        css_path = finders.find('orders/css/pdf_shared.css')
+        if css_path:
+            css_soubory.append(css_path)
+        else:
+            logger.warning("Nepodařilo se najít CSS 'orders/css/pdf_shared.css' pro tisk DL/proforma faktury/přehled zakázek.")
+        return vyrendruj_pdf(html_string, base_url=base_url, css_soubory=css_soubory)
+
+    if cache:
+        pdf_file = pdf_kamionu(html_path, kamion, vyrob_pdf, varianta=(context.get("user_last_name"), base_url))
+    else:
+        pdf_file = vyrob_pdf()
     response = HttpResponse(pdf_file, content_type="application/pdf")
     response['Content-Disposition'] = f'inline; filename="{filename}"'
     logger.info(f"Uživatel {request.user} vygeneroval PDF dokumentaci pro kamion {kamion}.")
@@ -10,18 +10,17 @@ from django.views.generic.detail import DetailView
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
-from django.db.models import Q, Max, Sum, Count, F, Exists, OuterRef, Subquery, DecimalField, ExpressionWrapper, Value, Prefetch
-from django.db.models.functions import Coalesce
+from django.db.models import Max, Count, F, Prefetch
 from django.core.exceptions import PermissionDenied
 from django.utils.translation import gettext_lazy as _
 import django.utils.timezone as timezone
-from datetime import datetime, timedelta, time, date
+from datetime import datetime, timedelta, date
 import calendar
 import uuid
 from django.db import transaction
 from django.contrib import messages
 from django.contrib.staticfiles import finders
-from django.http import Http404, HttpResponseBadRequest, HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponseBadRequest, HttpResponse, JsonResponse
 from django.conf import settings
 from django.utils.text import slugify
 from django.utils.http import url_has_allowed_host_and_scheme
@@ -30,8 +29,8 @@ from django_user_agents.utils import get_user_agent
 
 from .utils import get_verbose_name_for_column, utilita_tisk_dl_a_proforma_faktury, format_cislo_bedny, format_skupina_TZ, build_fake_skupina_TZ_annotation
 from .models import (
-    Bedna, Zakazka, Kamion, Zakaznik, TypHlavy, Predpis, Odberatel, Cena, Pozice, PoziceZakazkaOrder,
-    Sarze, SarzeKrok, SarzeKrokBedna, Zarizeni
+    Bedna, Kamion, Zakaznik, TypHlavy, Predpis, Odberatel, Pozice, PoziceZakazkaOrder,
+    Sarze, SarzeKrok, SarzeKrokBedna, SouhrnVyrobyZarizeni, Zarizeni, Uloha
 )
 from .forms import (
     BednaScanZkontrolovanoForm,
@@ -47,12 +46,40 @@ from .services.sarze_print_service import (
     build_tisk_pruvodky_vruty_response,
     get_tisk_pruvodky_vruty_krok,
 )
+from .services.cenik_service import cenik_scope
+from .services.souhrny_vyroby_service import odlozene_souhrny_vyroby
+from .services.pdf_render_service import metriky_pdf, vyrendruj_pdf
+from .services.pdf_cache_service import pdf_kamionu
+from .services.dashboard_service import prehled_beden
+from .services.statistiky_kamionu_service import (
+    PohybyKamionu,
+    porovnej_roky,
+    rozsah_let,
+    spocitej_pohyby,
+    statistiky_roku,
+)
+from .services.historie_service import (
+    CELKEM,
+    CENA,
+    KG,
+    PODIL_ROSTU,
+    PRACOVNI_DNY,
+    PROSTOJ,
+    ROSTY,
+    historie_vyroby,
+    vyrobni_zarizeni,
+    vyuziti_zakazniku,
+)
+from .services.vyroba_service import (
+    SMENA_DEN,
+    SMENA_NOC,
+    statistiky_vyroby,
+)
 from .choices import (
     StavBednyChoice, StavSarzeChoice, RovnaniChoice, TryskaniChoice, PrioritaChoice, KamionChoice, TypZarizeniChoice,
-    ZinkovaniChoice, STAV_BEDNY_ROZPRACOVANOST, STAV_BEDNY_SKLADEM,
+    ZinkovaniChoice, StavUlohyChoice, STAV_BEDNY_ROZPRACOVANOST, STAV_BEDNY_SKLADEM,
     STAV_BEDNY_PODMINKA_PRO_ZMENU_NA_ZAKALENO
 )
-from weasyprint import HTML, CSS
 
 import logging
 logger = logging.getLogger('orders')
@@ -406,19 +433,21 @@ def _bedna_scan_sections(bedna):
     ]
 
     if bedna.stav_bedny in STAV_BEDNY_SKLADEM:
-        sections.append(
-            (
-                'Prodejní cena',
-                [
-                    ('Cena kalení EUR/kg', bedna.cena_za_kg),
-                    ('Cena kalení EUR/bedna', bedna.cena_za_bednu),
-                    ('Cena rovnání EUR/kg', bedna.cena_rovnani_za_kg),
-                    ('Cena rovnání EUR/bedna', bedna.cena_rovnani_za_bednu),
-                    ('Cena tryskání EUR/kg', bedna.cena_tryskani_za_kg),
-                    ('Cena tryskání EUR/bedna', bedna.cena_tryskani_za_bednu),
-                ],
+        # Všech šest cen sdílí jeden resolver ceníku – otisk ceníku se ověří jen jednou.
+        with cenik_scope():
+            sections.append(
+                (
+                    'Prodejní cena',
+                    [
+                        ('Cena kalení EUR/kg', bedna.cena_za_kg),
+                        ('Cena kalení EUR/bedna', bedna.cena_za_bednu),
+                        ('Cena rovnání EUR/kg', bedna.cena_rovnani_za_kg),
+                        ('Cena rovnání EUR/bedna', bedna.cena_rovnani_za_bednu),
+                        ('Cena tryskání EUR/kg', bedna.cena_tryskani_za_kg),
+                        ('Cena tryskání EUR/bedna', bedna.cena_tryskani_za_bednu),
+                    ],
+                )
             )
-        )
 
     return [
         (
@@ -1492,7 +1521,7 @@ def rychle_zalozeni_sarze_patro_view(request, krok_id, patro):
 
         formset = PatroFormSet(request.POST, prefix='polozky', form_kwargs={'bedna_only': True})
         if formset.is_valid():
-            with transaction.atomic():
+            with transaction.atomic(), odlozene_souhrny_vyroby():
                 locked_krok = SarzeKrok.objects.select_for_update().get(pk=krok.pk)
                 locked_krok.krok_bedny.filter(patro=patro).delete()
 
@@ -1682,118 +1711,6 @@ def _format_price(value):
         return '0'
 
 
-def _calc_prostoj_minutes(kroky_list):
-    """
-    Vypočítá celkový prostoj v minutách pro seznam kroků.
-    Pro každou prodlevu se odečte 10 minut, pokud je prodleva větší než 10 minut.
-    """
-    total_minutes = 0
-    for krok in kroky_list:
-        prodleva = krok.prodleva
-        if isinstance(prodleva, int):
-            total_minutes += max(prodleva - 10, 0)
-    return total_minutes
-
-
-def _first_use_sarzekrokbedna_qs(target_date, device_codes):
-    """
-    Vrací queryset pro první použití bedny v daném dni a na daných zařízeních.
-    """
-    sarze_krok_bedny = (
-        SarzeKrokBedna.objects
-        .filter(
-            krok__datum=target_date,
-            krok__zarizeni__kod_zarizeni__in=device_codes,
-            bedna__isnull=False,
-            bedna__hmotnost__isnull=False,
-            bedna__hmotnost__gt=0,
-        )
-        .select_related('krok', 'krok__sarze', 'krok__zarizeni', 'bedna')
-    )
-
-    prior_exists = SarzeKrokBedna.objects.filter(
-        bedna_id=OuterRef('bedna_id'),
-        krok__zarizeni_id=OuterRef('krok__zarizeni_id'),
-    ).exclude(pk=OuterRef('pk')).filter(
-        Q(krok__datum__lt=OuterRef('krok__datum'))
-        | Q(
-            krok__datum=OuterRef('krok__datum'),
-            krok__zacatek__lt=OuterRef('krok__zacatek'),
-        )
-        | Q(
-            krok__datum=OuterRef('krok__datum'),
-            krok__zacatek=OuterRef('krok__zacatek'),
-            krok__poradi__lt=OuterRef('krok__poradi'),
-        )
-    )
-
-    same_krok_prior_exists = SarzeKrokBedna.objects.filter(
-        krok_id=OuterRef('krok_id'),
-        bedna_id=OuterRef('bedna_id'),
-    ).exclude(pk=OuterRef('pk')).filter(
-        Q(patro__lt=OuterRef('patro'))
-        | Q(patro=OuterRef('patro'), pk__lt=OuterRef('pk'))
-    )
-
-    return sarze_krok_bedny.annotate(
-        has_prior=Exists(prior_exists),
-        has_same_krok_prior=Exists(same_krok_prior_exists),
-    ).filter(
-        has_prior=False,
-        has_same_krok_prior=False,
-    )
-
-
-def _first_use_sarzekrokbedna_range_qs(start_date, end_date, device_codes):
-    """
-    Vrací queryset pro první použití bedny v daném rozsahu dat a na daných zařízeních.
-    """
-    sarze_krok_bedny = (
-        SarzeKrokBedna.objects
-        .filter(
-            krok__datum__gte=start_date,
-            krok__datum__lte=end_date,
-            krok__zarizeni__kod_zarizeni__in=device_codes,
-            bedna__isnull=False,
-            bedna__hmotnost__isnull=False,
-            bedna__hmotnost__gt=0,
-        )
-        .select_related('krok', 'krok__zarizeni', 'bedna')
-    )
-
-    prior_exists = SarzeKrokBedna.objects.filter(
-        bedna_id=OuterRef('bedna_id'),
-        krok__zarizeni_id=OuterRef('krok__zarizeni_id'),
-    ).exclude(pk=OuterRef('pk')).filter(
-        Q(krok__datum__lt=OuterRef('krok__datum'))
-        | Q(
-            krok__datum=OuterRef('krok__datum'),
-            krok__zacatek__lt=OuterRef('krok__zacatek'),
-        )
-        | Q(
-            krok__datum=OuterRef('krok__datum'),
-            krok__zacatek=OuterRef('krok__zacatek'),
-            krok__poradi__lt=OuterRef('krok__poradi'),
-        )
-    )
-
-    same_krok_prior_exists = SarzeKrokBedna.objects.filter(
-        krok_id=OuterRef('krok_id'),
-        bedna_id=OuterRef('bedna_id'),
-    ).exclude(pk=OuterRef('pk')).filter(
-        Q(patro__lt=OuterRef('patro'))
-        | Q(patro=OuterRef('patro'), pk__lt=OuterRef('pk'))
-    )
-
-    return sarze_krok_bedny.annotate(
-        has_prior=Exists(prior_exists),
-        has_same_krok_prior=Exists(same_krok_prior_exists),
-    ).filter(
-        has_prior=False,
-        has_same_krok_prior=False,
-    )
-
-
 def _avg_kg_per_day_int(total_kg, day_count):
     if day_count <= 0:
         return 0
@@ -1812,10 +1729,9 @@ def _get_vyroba_available_years(device_codes, today_value=None):
     years_with_data = sorted(
         {
             y.year
-            for y in SarzeKrok.objects.filter(
+            for y in SouhrnVyrobyZarizeni.objects.filter(
                 zarizeni__kod_zarizeni__in=device_codes,
-                krok_bedny__bedna__isnull=False,
-                krok_bedny__bedna__hmotnost__gt=0,
+                kg__gt=0,
             ).dates('datum', 'year')
         },
         reverse=True,
@@ -1838,15 +1754,11 @@ def _kg_per_rost_int(total_kg, step_count):
         return 0
 
 
-def _build_vyroba_historie_context(year_value=None, month_value=None, today_value=None):
+def _vyber_roku_vyroby(device_codes, year_value, today):
     """
-    Vytváří kontext pro historii výroby na základě zadaného roku, měsíce a dnešního data.
+    Vrací (dostupné roky, vybraný rok, začátek roku, konec roku, poslední uplynulý den nebo None).
     """
-    today = today_value or timezone.localdate()
-    device_codes = ["TQF_XL1", "TQF_XL2"]
-
     years_with_data = _get_vyroba_available_years(device_codes, today_value=today)
-
     try:
         selected_year = int(year_value) if year_value is not None else years_with_data[0]
     except (TypeError, ValueError):
@@ -1854,296 +1766,147 @@ def _build_vyroba_historie_context(year_value=None, month_value=None, today_valu
     if selected_year not in years_with_data:
         selected_year = years_with_data[0]
 
-    selected_month = None
-    try:
-        if month_value is not None and str(month_value).strip() != '':
-            month_int = int(month_value)
-            if 1 <= month_int <= 12:
-                selected_month = month_int
-    except (TypeError, ValueError):
-        selected_month = None
-
     year_start = date(selected_year, 1, 1)
     year_end = date(selected_year, 12, 31)
     elapsed_end = min(today, year_end) if selected_year == today.year else year_end
     if elapsed_end < year_start:
         elapsed_end = None
+    return years_with_data, selected_year, year_start, year_end, elapsed_end
 
-    first_use_year_qs = _first_use_sarzekrokbedna_range_qs(year_start, year_end, device_codes)
 
-    cena_za_kg_sq = Cena.objects.filter(
-        zakaznik=OuterRef('bedna__zakazka__kamion_prijem__zakaznik'),
-        delka_min__lte=OuterRef('bedna__zakazka__delka'),
-        delka_max__gt=OuterRef('bedna__zakazka__delka'),
-        predpis=OuterRef('bedna__zakazka__predpis'),
-    ).values('cena_za_kg')[:1]
+def _tydny_roku(year_start, year_end, elapsed_end):
+    """
+    Týdny roku od pondělí (první týden obsahuje 1. ledna) jako (číslo, začátek v roce, konec v roce,
+    konec uplynulé části nebo None).
+    """
+    week_start = year_start - timedelta(days=year_start.weekday())
+    week_no = 1
+    while week_start <= year_end:
+        in_year_start = max(week_start, year_start)
+        in_year_end = min(week_start + timedelta(days=6), year_end)
+        if elapsed_end is None or in_year_start > elapsed_end:
+            week_elapsed_end = None
+        else:
+            week_elapsed_end = min(in_year_end, elapsed_end)
+        yield week_no, in_year_start, in_year_end, week_elapsed_end
+        week_no += 1
+        week_start += timedelta(days=7)
 
-    first_use_year_qs = first_use_year_qs.annotate(
-        cena_za_kg_ann=Coalesce(
-            Subquery(cena_za_kg_sq, output_field=DecimalField(max_digits=10, decimal_places=2)),
-            Value(Decimal('0.00')), output_field=DecimalField(max_digits=10, decimal_places=2),
-        ),
-    ).annotate(
-        cena_bedny_ann=ExpressionWrapper(
-            F('bedna__hmotnost') * F('cena_za_kg_ann'),
-            output_field=DecimalField(max_digits=14, decimal_places=2),
-        ),
-    )
 
-    grouped = (
-        first_use_year_qs
-        .values('krok__datum', 'krok__zarizeni__kod_zarizeni')
-        .annotate(
-            total_kg=Sum('bedna__hmotnost'),
-            total_price=Sum('cena_bedny_ann'),
-        )
-    )
+def _avg_prostoj_hours_display(total_minutes, work_day_count):
+    """
+    Vrací průměrný počet hodin prostoje na pracovní den.
+    """
+    if work_day_count <= 0:
+        return '0,0'
+    return _format_hours((total_minutes / 60) / work_day_count)
 
-    day_data = {}
-    price_day_data = {}
-    for row in grouped:
-        row_date = row['krok__datum']
-        code = row['krok__zarizeni__kod_zarizeni']
-        total_kg = row['total_kg'] or Decimal('0')
-        total_price = row['total_price'] or Decimal('0')
-        bucket = day_data.setdefault(
-            row_date,
-            {
-                'xl1': Decimal('0'),
-                'xl2': Decimal('0'),
-                'total': Decimal('0'),
-            },
-        )
-        if code == 'TQF_XL1':
-            bucket['xl1'] += total_kg
-        elif code == 'TQF_XL2':
-            bucket['xl2'] += total_kg
-        bucket['total'] += total_kg
-
-        price_bucket = price_day_data.setdefault(
-            row_date,
-            {
-                'xl1': Decimal('0'),
-                'xl2': Decimal('0'),
-                'total': Decimal('0'),
-            },
-        )
-        if code == 'TQF_XL1':
-            price_bucket['xl1'] += total_price
-        elif code == 'TQF_XL2':
-            price_bucket['xl2'] += total_price
-        price_bucket['total'] += total_price
 
-    krok_grouped = (
-        SarzeKrok.objects
-        .filter(
-            datum__gte=year_start,
-            datum__lte=year_end,
-            zarizeni__kod_zarizeni__in=device_codes,
-            krok_bedny__bedna__isnull=False,
-        )
-        .values('datum')
-        .annotate(step_count=Count('id', distinct=True))
-    )
-    krok_data = {row['datum']: (row['step_count'] or 0) for row in krok_grouped}
+def _sum_hours_display(displays):
+    """
+    Sčítá zobrazené hodnoty hodin (průměrný prostoj jednotlivých zařízení).
+    """
+    try:
+        return _format_hours(sum(float((display or '0').replace(',', '.')) for display in displays))
+    except Exception:
+        logger.warning("Nepodařilo se sečíst hodnoty prostoje zařízení.", exc_info=True)
+        return '0,0'
 
-    prostoj_day_data = {}
-    work_day_data = {}
-    prostoj_kroky = (
-        SarzeKrok.objects
-        .filter(
-            datum__gte=year_start,
-            datum__lte=year_end,
-            zarizeni__kod_zarizeni__in=device_codes,
-        )
-        .select_related('zarizeni')
+
+def _price_per_rost(total_price, step_count):
+    """
+    Vypočítá cenu za rošt na základě celkové ceny a počtu kroků.
+    """
+    if step_count <= 0:
+        return Decimal('0.00')
+    try:
+        return (Decimal(total_price) / Decimal(step_count)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except Exception:
+        logger.warning("Nepodařilo se spočítat cenu za rošt.", exc_info=True)
+        return Decimal('0.00')
+
+
+def _vyroba_historie_hodnoty(rady, zarizeni, start_day, end_day, day_count):
+    """
+    Průměrný denní výkon po zařízeních a celkem, vytížení a cena roštu a průměrný prostoj
+    po zařízeních za dny `start_day`–`end_day` (bez uplynulých dní je `end_day` None).
+    Součty se berou z kumulativních řad (historie_service.RocniRady).
+    """
+    avg_cells = []
+    prostoj_cells = []
+    for device in zarizeni:
+        kod = device.kod_zarizeni
+        avg = _avg_kg_per_day_int(rady.soucet(KG, kod, start_day, end_day), day_count)
+        avg_cells.append({'kod': kod, 'nazev': device.zkraceny_nazev_zarizeni, 'value': avg, 'display': _format_kg(avg)})
+        prostoj_cells.append({
+            'kod': kod,
+            'nazev': device.zkraceny_nazev_zarizeni,
+            'display': _avg_prostoj_hours_display(
+                rady.soucet(PROSTOJ, kod, start_day, end_day),
+                rady.soucet(PRACOVNI_DNY, kod, start_day, end_day),
+            ),
+        })
+
+    total_kg = rady.soucet(KG, CELKEM, start_day, end_day)
+    step_count = rady.soucet(ROSTY, CELKEM, start_day, end_day)
+    avg_total = _avg_kg_per_day_int(total_kg, day_count)
+    rost_utilization = _kg_per_rost_int(total_kg, step_count)
+    price_per_rost = _price_per_rost(rady.soucet(CENA, CELKEM, start_day, end_day), step_count)
+    return {
+        'avg': {
+            'zarizeni': avg_cells,
+            'total': avg_total,
+            'total_display': _format_kg(avg_total),
+        },
+        'vytizeni_rostu': {
+            'value': rost_utilization,
+            'display': _format_kg(rost_utilization),
+        },
+        'cena_za_rost': {
+            'value': price_per_rost,
+            'display': _format_price(price_per_rost),
+        },
+        'prostoj_avg': {
+            'zarizeni': prostoj_cells,
+            'total_display': _sum_hours_display(cell['display'] for cell in prostoj_cells),
+        },
+    }
+
+
+def _build_vyroba_historie_context(year_value=None, month_value=None, today_value=None):
+    """
+    Vytváří kontext pro historii výroby na základě zadaného roku, měsíce a dnešního data.
+    Sloupce zařízení odpovídají všem víceúčelovým pecím, součty za rok, měsíce, týdny a dny
+    se počítají z kumulativních řad načtených jednou za rok (historie_service.historie_vyroby).
+    """
+    today = today_value or timezone.localdate()
+    zarizeni = vyrobni_zarizeni()
+    device_codes = [device.kod_zarizeni for device in zarizeni]
+
+    years_with_data, selected_year, year_start, year_end, elapsed_end = _vyber_roku_vyroby(
+        device_codes, year_value, today,
     )
-    for krok in prostoj_kroky:
-        row_date = krok.datum
-        code = krok.zarizeni.kod_zarizeni
-        prodleva = krok.prodleva
-        prostoj_minutes = max(prodleva - 10, 0) if isinstance(prodleva, int) else 0
-
-        work_bucket = work_day_data.setdefault(
-            row_date,
-            {
-                'xl1': False,
-                'xl2': False,
-                'total': False,
-            },
-        )
-        if code == 'TQF_XL1':
-            work_bucket['xl1'] = True
-        elif code == 'TQF_XL2':
-            work_bucket['xl2'] = True
-        work_bucket['total'] = True
-
-        bucket = prostoj_day_data.setdefault(
-            row_date,
-            {
-                'xl1': 0,
-                'xl2': 0,
-                'total': 0,
-            },
-        )
-        if code == 'TQF_XL1':
-            bucket['xl1'] += prostoj_minutes
-        elif code == 'TQF_XL2':
-            bucket['xl2'] += prostoj_minutes
-        bucket['total'] += prostoj_minutes
+
+    selected_month = None
+    try:
+        if month_value is not None and str(month_value).strip() != '':
+            month_int = int(month_value)
+            if 1 <= month_int <= 12:
+                selected_month = month_int
+    except (TypeError, ValueError):
+        selected_month = None
+
+    rady = historie_vyroby(selected_year, device_codes)
 
     month_labels = [
         '01 Leden', '02 Únor', '03 Březen', '04 Duben', '05 Květen', '06 Červen',
         '07 Červenec', '08 Srpen', '09 Září', '10 Říjen', '11 Listopad', '12 Prosinec',
     ]
 
-    def _sum_day_range(start_day, end_day):
-        """
-        Sčítá hodnoty pro zadaný rozsah dní.
-        """
-        out = {
-            'xl1': Decimal('0'),
-            'xl2': Decimal('0'),
-            'total': Decimal('0'),
-        }
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                row = day_data.get(day)
-                if row:
-                    out['xl1'] += row['xl1']
-                    out['xl2'] += row['xl2']
-                    out['total'] += row['total']
-                day += timedelta(days=1)
-        return out
-
-    def _sum_price_day_range(start_day, end_day):
-        """
-        Sčítá hodnoty cen pro zadaný rozsah dní.
-        """
-        out = {
-            'xl1': Decimal('0'),
-            'xl2': Decimal('0'),
-            'total': Decimal('0'),
-        }
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                row = price_day_data.get(day)
-                if row:
-                    out['xl1'] += row['xl1']
-                    out['xl2'] += row['xl2']
-                    out['total'] += row['total']
-                day += timedelta(days=1)
-        return out
-
-    def _sum_step_range(start_day, end_day):
-        """
-        Sčítá počet kroků pro zadaný rozsah dní.
-        """
-        total_steps = 0
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                total_steps += krok_data.get(day, 0)
-                day += timedelta(days=1)
-        return total_steps
-
-    def _sum_prostoj_minutes_range(start_day, end_day):
-        """
-        Sčítá hodnoty prostoje pro zadaný rozsah dní.
-        """
-        out = {'xl1': 0, 'xl2': 0, 'total': 0}
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                row = prostoj_day_data.get(day)
-                if row:
-                    out['xl1'] += row['xl1']
-                    out['xl2'] += row['xl2']
-                    out['total'] += row['total']
-                day += timedelta(days=1)
-        return out
-
-    def _sum_work_days_range(start_day, end_day):
-        """
-        Sčítá počet pracovních dní pro zadaný rozsah dní.
-        """
-        out = {'xl1': 0, 'xl2': 0, 'total': 0}
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                row = work_day_data.get(day)
-                if row:
-                    if row['xl1']:
-                        out['xl1'] += 1
-                    if row['xl2']:
-                        out['xl2'] += 1
-                    if row['total']:
-                        out['total'] += 1
-                day += timedelta(days=1)
-        return out
-
-    def _avg_prostoj_hours_display(total_minutes, work_day_count):
-        """
-        Vrací průměrný počet hodin prostoje na pracovní den.
-        """
-        if work_day_count <= 0:
-            return '0,0'
-        return _format_hours((total_minutes / 60) / work_day_count)
-
-    def _sum_hours_display(left_display, right_display):
-        """
-        Sčítá hodnoty hodin pro zadané zobrazení.
-        """
-        try:
-            left = float((left_display or '0').replace(',', '.'))
-            right = float((right_display or '0').replace(',', '.'))
-            return _format_hours(left + right)
-        except Exception:
-            logger.warning("Nepodařilo se sečíst hodnoty prostoje XL1 a XL2.", exc_info=True)
-            return '0,0'
-
-    def _price_per_rost(total_price, step_count):
-        """
-        Vypočítá cenu za rošt na základě celkové ceny a počtu kroků.
-        """
-        if step_count <= 0:
-            return Decimal('0.00')
-        try:
-            return (Decimal(total_price) / Decimal(step_count)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        except Exception:
-            logger.warning("Nepodařilo se spočítat cenu za rošt.", exc_info=True)
-            return Decimal('0.00')
-
-    if elapsed_end is None:
-        elapsed_days_year = 0
-        year_totals = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-        year_prices = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-        year_step_count = 0
-        year_prostoj_minutes = {'xl1': 0, 'xl2': 0, 'total': 0}
-        year_work_days = {'xl1': 0, 'xl2': 0, 'total': 0}
-    else:
-        elapsed_days_year = (elapsed_end - year_start).days + 1
-        year_totals = _sum_day_range(year_start, elapsed_end)
-        year_prices = _sum_price_day_range(year_start, elapsed_end)
-        year_step_count = _sum_step_range(year_start, elapsed_end)
-        year_prostoj_minutes = _sum_prostoj_minutes_range(year_start, elapsed_end)
-        year_work_days = _sum_work_days_range(year_start, elapsed_end)
-
-    yearly_avg = {
-        'xl1': _avg_kg_per_day_int(year_totals['xl1'], elapsed_days_year),
-        'xl2': _avg_kg_per_day_int(year_totals['xl2'], elapsed_days_year),
-        'total': _avg_kg_per_day_int(year_totals['total'], elapsed_days_year),
-    }
-    yearly_rost_utilization = _kg_per_rost_int(year_totals['total'], year_step_count)
-    yearly_price_per_rost = _price_per_rost(year_prices['total'], year_step_count)
-    yearly_xl1_prostoj = _avg_prostoj_hours_display(year_prostoj_minutes['xl1'], year_work_days['xl1'])
-    yearly_xl2_prostoj = _avg_prostoj_hours_display(year_prostoj_minutes['xl2'], year_work_days['xl2'])
-    yearly_prostoj_avg = {
-        'xl1_display': yearly_xl1_prostoj,
-        'xl2_display': yearly_xl2_prostoj,
-        'total_display': _sum_hours_display(yearly_xl1_prostoj, yearly_xl2_prostoj),
+    elapsed_days_year = 0 if elapsed_end is None else (elapsed_end - year_start).days + 1
+    yearly = {
+        'elapsed_days': elapsed_days_year,
+        **_vyroba_historie_hodnoty(rady, zarizeni, year_start, elapsed_end, elapsed_days_year),
     }
 
     monthly_rows = []
@@ -2151,185 +1914,50 @@ def _build_vyroba_historie_context(year_value=None, month_value=None, today_valu
         month_start = date(selected_year, month_no, 1)
         month_end = date(selected_year, month_no, calendar.monthrange(selected_year, month_no)[1])
         if elapsed_end is None or month_start > elapsed_end:
+            month_elapsed_end = None
             elapsed_days = 0
-            totals = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-            prices = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-            step_count = 0
-            prostoj_minutes = {'xl1': 0, 'xl2': 0, 'total': 0}
-            work_days = {'xl1': 0, 'xl2': 0, 'total': 0}
         else:
             month_elapsed_end = min(month_end, elapsed_end)
             elapsed_days = (month_elapsed_end - month_start).days + 1
-            totals = _sum_day_range(month_start, month_elapsed_end)
-            prices = _sum_price_day_range(month_start, month_elapsed_end)
-            step_count = _sum_step_range(month_start, month_elapsed_end)
-            prostoj_minutes = _sum_prostoj_minutes_range(month_start, month_elapsed_end)
-            work_days = _sum_work_days_range(month_start, month_elapsed_end)
-
-        avg_xl1 = _avg_kg_per_day_int(totals['xl1'], elapsed_days)
-        avg_xl2 = _avg_kg_per_day_int(totals['xl2'], elapsed_days)
-        avg_total = _avg_kg_per_day_int(totals['total'], elapsed_days)
-        rost_utilization = _kg_per_rost_int(totals['total'], step_count)
-        price_per_rost = _price_per_rost(prices['total'], step_count)
-
-        month_xl1_prostoj = _avg_prostoj_hours_display(prostoj_minutes['xl1'], work_days['xl1'])
-        month_xl2_prostoj = _avg_prostoj_hours_display(prostoj_minutes['xl2'], work_days['xl2'])
-
-        monthly_rows.append(
-            {
-                'month': month_no,
-                'label': month_labels[month_no - 1],
-                'elapsed_days': elapsed_days,
-                'avg': {
-                    'xl1': avg_xl1,
-                    'xl2': avg_xl2,
-                    'total': avg_total,
-                    'xl1_display': _format_kg(avg_xl1),
-                    'xl2_display': _format_kg(avg_xl2),
-                    'total_display': _format_kg(avg_total),
-                },
-                'vytizeni_rostu': {
-                    'value': rost_utilization,
-                    'display': _format_kg(rost_utilization),
-                },
-                'cena_za_rost': {
-                    'value': price_per_rost,
-                    'display': _format_price(price_per_rost),
-                },
-                'prostoj_avg': {
-                    'xl1_display': month_xl1_prostoj,
-                    'xl2_display': month_xl2_prostoj,
-                    'total_display': _sum_hours_display(month_xl1_prostoj, month_xl2_prostoj),
-                },
-            }
-        )
+        monthly_rows.append({
+            'month': month_no,
+            'label': month_labels[month_no - 1],
+            'elapsed_days': elapsed_days,
+            **_vyroba_historie_hodnoty(rady, zarizeni, month_start, month_elapsed_end, elapsed_days),
+        })
 
     weekly_rows = []
-    week_start = year_start - timedelta(days=year_start.weekday())
-    week_no = 1
-    while week_start <= year_end:
-        week_end = week_start + timedelta(days=6)
-        in_year_start = max(week_start, year_start)
-        in_year_end = min(week_end, year_end)
-
-        if elapsed_end is None or in_year_start > elapsed_end:
-            elapsed_days = 0
-            totals = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-            prices = {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')}
-            step_count = 0
-            prostoj_minutes = {'xl1': 0, 'xl2': 0, 'total': 0}
-            work_days = {'xl1': 0, 'xl2': 0, 'total': 0}
-        else:
-            week_elapsed_end = min(in_year_end, elapsed_end)
-            elapsed_days = (week_elapsed_end - in_year_start).days + 1
-            totals = _sum_day_range(in_year_start, week_elapsed_end)
-            prices = _sum_price_day_range(in_year_start, week_elapsed_end)
-            step_count = _sum_step_range(in_year_start, week_elapsed_end)
-            prostoj_minutes = _sum_prostoj_minutes_range(in_year_start, week_elapsed_end)
-            work_days = _sum_work_days_range(in_year_start, week_elapsed_end)
-
-        avg_xl1 = _avg_kg_per_day_int(totals['xl1'], elapsed_days)
-        avg_xl2 = _avg_kg_per_day_int(totals['xl2'], elapsed_days)
-        avg_total = _avg_kg_per_day_int(totals['total'], elapsed_days)
-        rost_utilization = _kg_per_rost_int(totals['total'], step_count)
-        price_per_rost = _price_per_rost(prices['total'], step_count)
-
-        week_xl1_prostoj = _avg_prostoj_hours_display(prostoj_minutes['xl1'], work_days['xl1'])
-        week_xl2_prostoj = _avg_prostoj_hours_display(prostoj_minutes['xl2'], work_days['xl2'])
-
-        weekly_rows.append(
-            {
-                'week_no': week_no,
-                'label': f'{week_no:02d}',
-                'date_range': f"{in_year_start.strftime('%d.%m.')} - {in_year_end.strftime('%d.%m.')}",
-                'elapsed_days': elapsed_days,
-                'avg': {
-                    'xl1': avg_xl1,
-                    'xl2': avg_xl2,
-                    'total': avg_total,
-                    'xl1_display': _format_kg(avg_xl1),
-                    'xl2_display': _format_kg(avg_xl2),
-                    'total_display': _format_kg(avg_total),
-                },
-                'vytizeni_rostu': {
-                    'value': rost_utilization,
-                    'display': _format_kg(rost_utilization),
-                },
-                'cena_za_rost': {
-                    'value': price_per_rost,
-                    'display': _format_price(price_per_rost),
-                },
-                'prostoj_avg': {
-                    'xl1_display': week_xl1_prostoj,
-                    'xl2_display': week_xl2_prostoj,
-                    'total_display': _sum_hours_display(week_xl1_prostoj, week_xl2_prostoj),
-                },
-            }
-        )
-        week_no += 1
-        week_start += timedelta(days=7)
+    for week_no, in_year_start, in_year_end, week_elapsed_end in _tydny_roku(year_start, year_end, elapsed_end):
+        elapsed_days = 0 if week_elapsed_end is None else (week_elapsed_end - in_year_start).days + 1
+        weekly_rows.append({
+            'week_no': week_no,
+            'label': f'{week_no:02d}',
+            'date_range': f"{in_year_start.strftime('%d.%m.')} - {in_year_end.strftime('%d.%m.')}",
+            'elapsed_days': elapsed_days,
+            **_vyroba_historie_hodnoty(rady, zarizeni, in_year_start, week_elapsed_end, elapsed_days),
+        })
 
     month_detail = None
     if selected_month is not None:
         month_start = date(selected_year, selected_month, 1)
         month_end = date(selected_year, selected_month, calendar.monthrange(selected_year, selected_month)[1])
-        detail_end = None
-        if elapsed_end is not None and month_start <= elapsed_end:
-            detail_end = min(month_end, elapsed_end)
-
         day_rows = []
-        if detail_end is not None:
+        if elapsed_end is not None and month_start <= elapsed_end:
             d = month_start
-            while d <= detail_end:
-                totals = day_data.get(
-                    d,
-                    {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')},
-                )
-                prices = price_day_data.get(
-                    d,
-                    {'xl1': Decimal('0'), 'xl2': Decimal('0'), 'total': Decimal('0')},
-                )
-                xl1_int = _kg_to_int(totals['xl1'])
-                xl2_int = _kg_to_int(totals['xl2'])
-                total_int = _kg_to_int(totals['total'])
-                step_count = krok_data.get(d, 0)
-                rost_utilization = _kg_per_rost_int(totals['total'], step_count)
-                price_per_rost = _price_per_rost(prices['total'], step_count)
-                day_prostoj = prostoj_day_data.get(d, {'xl1': 0, 'xl2': 0, 'total': 0})
-                day_rows.append(
-                    {
-                        'date': d,
-                        'label': d.strftime('%d.%m.%Y'),
-                        'xl1': xl1_int,
-                        'xl2': xl2_int,
-                        'total': total_int,
-                        'xl1_display': _format_kg(xl1_int),
-                        'xl2_display': _format_kg(xl2_int),
-                        'total_display': _format_kg(total_int),
-                        'vytizeni_rostu': {
-                            'value': rost_utilization,
-                            'display': _format_kg(rost_utilization),
-                        },
-                        'cena_za_rost': {
-                            'value': price_per_rost,
-                            'display': _format_price(price_per_rost),
-                        },
-                        'prostoj_avg': {
-                            'xl1_display': _avg_prostoj_hours_display(day_prostoj['xl1'], 1),
-                            'xl2_display': _avg_prostoj_hours_display(day_prostoj['xl2'], 1),
-                            'total_display': _sum_hours_display(
-                                _avg_prostoj_hours_display(day_prostoj['xl1'], 1),
-                                _avg_prostoj_hours_display(day_prostoj['xl2'], 1),
-                            ),
-                        },
-                    }
-                )
+            while d <= min(month_end, elapsed_end):
+                day_rows.append({
+                    'date': d,
+                    'label': d.strftime('%d.%m.%Y'),
+                    **_vyroba_historie_hodnoty(rady, zarizeni, d, d, 1),
+                })
                 d += timedelta(days=1)
 
         month_detail = {
             'month': selected_month,
             'label': month_labels[selected_month - 1],
             'rows': day_rows,
+            # Den, výkon a prostoj po zařízeních, celkem, vytížení a cena roštu, prostoj celkem.
+            'colspan': 5 + 2 * len(zarizeni),
         }
 
     return {
@@ -2338,26 +1966,8 @@ def _build_vyroba_historie_context(year_value=None, month_value=None, today_valu
             'selected_year': selected_year,
             'available_years': years_with_data,
             'selected_month': selected_month,
-            'yearly': {
-                'elapsed_days': elapsed_days_year,
-                'avg': {
-                    'xl1': yearly_avg['xl1'],
-                    'xl2': yearly_avg['xl2'],
-                    'total': yearly_avg['total'],
-                    'xl1_display': _format_kg(yearly_avg['xl1']),
-                    'xl2_display': _format_kg(yearly_avg['xl2']),
-                    'total_display': _format_kg(yearly_avg['total']),
-                },
-                'vytizeni_rostu': {
-                    'value': yearly_rost_utilization,
-                    'display': _format_kg(yearly_rost_utilization),
-                },
-                'cena_za_rost': {
-                    'value': yearly_price_per_rost,
-                    'display': _format_price(yearly_price_per_rost),
-                },
-                'prostoj_avg': yearly_prostoj_avg,
-            },
+            'zarizeni': zarizeni,
+            'yearly': yearly,
             'monthly_rows': monthly_rows,
             'weekly_rows': weekly_rows,
             'month_detail': month_detail,
@@ -2370,146 +1980,15 @@ def _build_vyroba_historie_context(year_value=None, month_value=None, today_valu
 def _build_vyroba_zakaznici_vyuziti_context(year_value=None, today_value=None):
     """
     Vytváří kontext pro využití zákazníků výroby na základě zadaného roku a dnešního data.
+    Součty za týdny a rok se počítají z kumulativních řad (historie_service.vyuziti_zakazniku).
     """
-    device_codes = ["TQF_XL1", "TQF_XL2"]
+    device_codes = [device.kod_zarizeni for device in vyrobni_zarizeni()]
     today = today_value or timezone.localdate()
-    years_with_data = _get_vyroba_available_years(device_codes, today_value=today)
-
-    try:
-        selected_year = int(year_value) if year_value is not None else years_with_data[0]
-    except (TypeError, ValueError):
-        selected_year = years_with_data[0]
-    if selected_year not in years_with_data:
-        selected_year = years_with_data[0]
-
-    year_start = date(selected_year, 1, 1)
-    year_end = date(selected_year, 12, 31)
-    elapsed_end = min(today, year_end) if selected_year == today.year else year_end
-    if elapsed_end < year_start:
-        elapsed_end = None
-
-    first_use_rows = list(
-        _first_use_sarzekrokbedna_range_qs(year_start, year_end, device_codes)
-        .values(
-            'krok__datum',
-            'bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev',
-        )
-        .annotate(total_kg=Sum('bedna__hmotnost'))
-    )
-
-    customer_day_data = {}
-    for row in first_use_rows:
-        row_date = row['krok__datum']
-        customer = row['bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev'] or '-'
-        total_kg = row['total_kg'] or Decimal('0')
-        bucket = customer_day_data.setdefault(row_date, {})
-        customer_bucket = bucket.setdefault(
-            customer,
-            {
-                'kg': Decimal('0'),
-                'step_share': Decimal('0'),
-            },
-        )
-        customer_bucket['kg'] += total_kg
-
-    step_share_qs = SarzeKrokBedna.objects.filter(
-        krok__datum__gte=year_start,
-        krok__datum__lte=year_end,
-        krok__zarizeni__kod_zarizeni__in=device_codes,
-        bedna__isnull=False,
-    )
-    step_total_percents = {
-        row['krok_id']: row['total_percent'] or Decimal('0')
-        for row in (
-            step_share_qs
-            .values('krok_id')
-            .annotate(total_percent=Sum('procent_z_patra'))
-        )
-    }
-    step_share_rows = (
-        step_share_qs
-        .values(
-            'krok_id',
-            'krok__datum',
-            'bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev',
-        )
-        .annotate(percent_sum=Sum('procent_z_patra'))
+    years_with_data, selected_year, year_start, year_end, elapsed_end = _vyber_roku_vyroby(
+        device_codes, year_value, today,
     )
-    for row in step_share_rows:
-        step_total_percent = step_total_percents.get(row['krok_id'], Decimal('0'))
-        percent_sum = row['percent_sum'] or Decimal('0')
-        if step_total_percent <= 0 or percent_sum <= 0:
-            continue
-        row_date = row['krok__datum']
-        customer = row['bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev'] or '-'
-        step_share = Decimal(percent_sum) / Decimal(step_total_percent)
-        bucket = customer_day_data.setdefault(row_date, {})
-        customer_bucket = bucket.setdefault(
-            customer,
-            {
-                'kg': Decimal('0'),
-                'step_share': Decimal('0'),
-            },
-        )
-        customer_bucket['step_share'] += step_share
-
-    krok_data = {
-        row['datum']: (row['step_count'] or 0)
-        for row in (
-            SarzeKrok.objects
-            .filter(
-                datum__gte=year_start,
-                datum__lte=year_end,
-                zarizeni__kod_zarizeni__in=device_codes,
-                krok_bedny__bedna__isnull=False,
-            )
-            .values('datum')
-            .annotate(step_count=Count('id', distinct=True))
-        )
-    }
 
-    def _sum_customer_range(customer, start_day, end_day):
-        """
-        Sčítá hodnoty pro zadaný rozsah dní pro konkrétního zákazníka.
-        """
-        total_kg = Decimal('0')
-        total_step_share = Decimal('0')
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                row = customer_day_data.get(day, {}).get(customer)
-                if row:
-                    total_kg += row['kg']
-                    total_step_share += row['step_share']
-                day += timedelta(days=1)
-        return {
-            'kg': total_kg,
-            'step_share': total_step_share,
-        }
-
-    def _sum_all_customer_kg_range(start_day, end_day):
-        total = Decimal('0')
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                total += sum(
-                    (row['kg'] for row in customer_day_data.get(day, {}).values()),
-                    Decimal('0'),
-                )
-                day += timedelta(days=1)
-        return total
-
-    def _sum_step_range(start_day, end_day):
-        """
-        Sčítá počet kroků pro zadaný rozsah dní.
-        """
-        total_steps = 0
-        if start_day and end_day and end_day >= start_day:
-            day = start_day
-            while day <= end_day:
-                total_steps += krok_data.get(day, 0)
-                day += timedelta(days=1)
-        return total_steps
+    rady = vyuziti_zakazniku(selected_year, device_codes)
 
     def _kg_per_customer_rost(total_kg, step_share):
         """
@@ -2523,55 +2002,22 @@ def _build_vyroba_zakaznici_vyuziti_context(year_value=None, today_value=None):
             logger.warning("Nepodařilo se spočítat využití roštu podle zákazníků.", exc_info=True)
             return 0
 
-    def _kg_per_rost(total_kg, step_count):
-        """
-        Vypočítá celkové využití roštu na základě celkové hmotnosti a počtu kroků.
-        """
-        if step_count <= 0:
-            return 0
-        try:
-            return _kg_to_int(Decimal(total_kg) / Decimal(step_count))
-        except Exception:
-            logger.warning("Nepodařilo se spočítat celkové využití roštu.", exc_info=True)
-            return 0
-
     def _format_usage(value):
         return _format_kg(value) if value else '-'
 
+    def _usage(value):
+        return {'value': value, 'display': _format_usage(value)}
+
     customers = sorted(
-        {
-            customer
-            for day_data in customer_day_data.values()
-            for customer in day_data.keys()
-        }
+        (set(rady.klice(KG)) | set(rady.klice(PODIL_ROSTU))) - {CELKEM}
     )
 
-    if elapsed_end is None:
-        year_step_count = 0
-        year_total_kg = Decimal('0')
-    else:
-        year_step_count = _sum_step_range(year_start, elapsed_end)
-        year_total_kg = _sum_all_customer_kg_range(year_start, elapsed_end)
-
     weeks = []
     customer_week_values = {customer: [] for customer in customers}
     total_week_values = []
-    week_start = year_start - timedelta(days=year_start.weekday())
-    week_no = 1
-    while week_start <= year_end:
-        week_end = week_start + timedelta(days=6)
-        in_year_start = max(week_start, year_start)
-        in_year_end = min(week_end, year_end)
-
-        if elapsed_end is None or in_year_start > elapsed_end:
-            elapsed_days = 0
-            step_count = 0
-            week_elapsed_end = None
-        else:
-            week_elapsed_end = min(in_year_end, elapsed_end)
-            elapsed_days = (week_elapsed_end - in_year_start).days + 1
-            step_count = _sum_step_range(in_year_start, week_elapsed_end)
-
+    for week_no, in_year_start, in_year_end, week_elapsed_end in _tydny_roku(year_start, year_end, elapsed_end):
+        elapsed_days = 0 if week_elapsed_end is None else (week_elapsed_end - in_year_start).days + 1
+        step_count = rady.soucet(ROSTY, CELKEM, in_year_start, week_elapsed_end)
         weeks.append({
             'week_no': week_no,
             'label': f'{week_no:02d}',
@@ -2579,48 +2025,29 @@ def _build_vyroba_zakaznici_vyuziti_context(year_value=None, today_value=None):
             'elapsed_days': elapsed_days,
             'step_count': step_count,
         })
-
-        week_total_kg = Decimal('0')
         for customer in customers:
-            customer_data = {'kg': Decimal('0'), 'step_share': Decimal('0')} if week_elapsed_end is None else _sum_customer_range(
-                customer,
-                in_year_start,
-                week_elapsed_end,
-            )
-            week_total_kg += customer_data['kg']
-            usage = _kg_per_customer_rost(customer_data['kg'], customer_data['step_share'])
-            customer_week_values[customer].append({
-                'value': usage,
-                'display': _format_usage(usage),
-            })
-
-        total_usage = _kg_per_rost(week_total_kg, step_count)
-        total_week_values.append({
-            'value': total_usage,
-            'display': _format_usage(total_usage),
-        })
-
-        week_no += 1
-        week_start += timedelta(days=7)
-
-    customer_rows = []
-    for customer in customers:
-        customer_year_data = {'kg': Decimal('0'), 'step_share': Decimal('0')} if elapsed_end is None else _sum_customer_range(
-            customer,
-            year_start,
-            elapsed_end,
-        )
-        total_usage = _kg_per_customer_rost(customer_year_data['kg'], customer_year_data['step_share'])
-        customer_rows.append({
+            customer_week_values[customer].append(_usage(_kg_per_customer_rost(
+                rady.soucet(KG, customer, in_year_start, week_elapsed_end),
+                rady.soucet(PODIL_ROSTU, customer, in_year_start, week_elapsed_end),
+            )))
+        total_week_values.append(_usage(_kg_per_rost_int(
+            rady.soucet(KG, CELKEM, in_year_start, week_elapsed_end), step_count,
+        )))
+
+    customer_rows = [
+        {
             'customer': customer,
             'weeks': customer_week_values[customer],
-            'total': {
-                'value': total_usage,
-                'display': _format_usage(total_usage),
-            },
-        })
+            'total': _usage(_kg_per_customer_rost(
+                rady.soucet(KG, customer, year_start, elapsed_end),
+                rady.soucet(PODIL_ROSTU, customer, year_start, elapsed_end),
+            )),
+        }
+        for customer in customers
+    ]
 
-    yearly_usage = _kg_per_rost(year_total_kg, year_step_count)
+    year_step_count = rady.soucet(ROSTY, CELKEM, year_start, elapsed_end)
+    yearly_usage = _kg_per_rost_int(rady.soucet(KG, CELKEM, year_start, elapsed_end), year_step_count)
 
     return {
         'vyroba_zakaznici_vyuziti': {
@@ -2629,20 +2056,14 @@ def _build_vyroba_zakaznici_vyuziti_context(year_value=None, today_value=None):
             'available_years': years_with_data,
             'yearly': {
                 'step_count': year_step_count,
-                'vytizeni_rostu': {
-                    'value': yearly_usage,
-                    'display': _format_usage(yearly_usage),
-                },
+                'vytizeni_rostu': _usage(yearly_usage),
             },
             'weeks': weeks,
             'customer_rows': customer_rows,
             'total_row': {
                 'label': 'CELKEM',
                 'weeks': total_week_values,
-                'total': {
-                    'value': yearly_usage,
-                    'display': _format_usage(yearly_usage),
-                },
+                'total': _usage(yearly_usage),
             },
         },
         'db_table': 'dashboard_vyroba_zakaznici_vyuziti',
@@ -2653,120 +2074,53 @@ def _build_vyroba_zakaznici_vyuziti_context(year_value=None, today_value=None):
 def _build_vyroba_dashboard_context(date_value=None):
     """
     Vytváří kontext pro dashboard výroby na základě zadaného data.
+    Statistiky dne, směn i 14denní historie se načtou najednou (services.vyroba_service).
     """
     date_value = date_value or (timezone.localdate() - timedelta(days=1))
-    today = date_value + timedelta(days=1)
     device_codes = ["TQF_XL1", "TQF_XL2"]
-    shift_times = (time(6, 0), time(18, 0))
-
-    base_qs = SarzeKrok.objects.filter(
-        datum=date_value,
-        zarizeni__kod_zarizeni__in=device_codes,
-    ).select_related('sarze', 'zarizeni')
-
-    bedna_exists = SarzeKrokBedna.objects.filter(
-        krok=OuterRef('pk'),
-        bedna__isnull=False,
-    )
-    manual_exists = SarzeKrokBedna.objects.filter(
-        krok=OuterRef('pk'),
-        bedna__isnull=True,
-    ).filter(
-        popis_mimo_db__isnull=False,
-    )
-
-    qs = base_qs.annotate(
-        has_vruty=Exists(bedna_exists),
-        has_zelezo=Exists(manual_exists),
-    )
-
-    def _calc_vykon_vruty_kg(code: list[str]):
-        first_use_qs = _first_use_sarzekrokbedna_qs(date_value, code)
+    statistiky = statistiky_vyroby(date_value - timedelta(days=13), date_value, device_codes)
 
-        return first_use_qs.aggregate(total=Sum('bedna__hmotnost')).get('total') or 0
-
-    def _calc_daily_total_kg(target_day):
-        return _first_use_sarzekrokbedna_qs(target_day, device_codes).aggregate(total=Sum('bedna__hmotnost')).get('total') or 0
+    def _prostoj_hours(minutes):
+        return _format_hours(minutes / 60) if minutes else '0,0'
 
     def _device_stats(code: list[str]):
-        dqs = qs.filter(zarizeni__kod_zarizeni__in=code)
-        total = dqs.count()
-        vruty = dqs.filter(has_vruty=True).count()
-        zelezo = dqs.filter(has_zelezo=True).count()
-        prostoj_minutes = _calc_prostoj_minutes(list(dqs))
-        prostoj_hours = _format_hours(prostoj_minutes / 60) if prostoj_minutes else '0,0'
-        vykon_vruty_tuny = _format_tuny(_calc_vykon_vruty_kg(code))
+        den = statistiky.den(date_value, code)
         return {
-            'total': total,
-            'vruty': vruty,
-            'zelezo': zelezo,
-            'prostoj_hours': prostoj_hours,
-            'vykon_vruty_tuny': vykon_vruty_tuny,
+            'total': den.kroku,
+            'vruty': den.kroku_vruty,
+            'zelezo': den.kroku_zelezo,
+            'prostoj_hours': _prostoj_hours(den.prostoj_minut),
+            'vykon_vruty_tuny': _format_tuny(den.vykon_kg),
         }
 
     xl1 = _device_stats([device_codes[0]])
     xl2 = _device_stats([device_codes[1]])
     summary = _device_stats(device_codes)
 
-    def _shift_stats(shift_qs, nakladani_qs):
+    def _shift_stats(smena):
         """
-        Vypočítá statistiky pro zadaný queryset směny.
+        Vypočítá statistiky pro zadanou směnu.
         """
-        xl1_qs = shift_qs.filter(zarizeni__kod_zarizeni=device_codes[0])
-        xl2_qs = shift_qs.filter(zarizeni__kod_zarizeni=device_codes[1])
-
-        xl1_count = xl1_qs.count()
-        xl2_count = xl2_qs.count()
-        total_count = xl1_count + xl2_count
-
-        xl1_minutes = _calc_prostoj_minutes(list(xl1_qs))
-        xl2_minutes = _calc_prostoj_minutes(list(xl2_qs))
-        total_minutes = xl1_minutes + xl2_minutes
-
-        sarze_count = nakladani_qs.count()
-        patra_count = (
-            nakladani_qs
-            .annotate(pocet_pater=Count('krok_bedny__patro', distinct=True))
-            .aggregate(total_patra=Sum('pocet_pater'))
-            .get('total_patra')
-            or 0
-        )
+        xl1_stats = statistiky.smena(date_value, smena, [device_codes[0]])
+        xl2_stats = statistiky.smena(date_value, smena, [device_codes[1]])
+        nakladani = statistiky.nakladani(date_value, smena)
+        total_minutes = xl1_stats.prostoj_minut + xl2_stats.prostoj_minut
 
         return {
             'counts': {
-                'xl1': xl1_count,
-                'xl2': xl2_count,
-                'total': total_count,
-                'sarze': sarze_count,
-                'patra': patra_count,
+                'xl1': xl1_stats.kroku,
+                'xl2': xl2_stats.kroku,
+                'total': xl1_stats.kroku + xl2_stats.kroku,
+                'sarze': nakladani.kroku,
+                'patra': nakladani.pater,
             },
             'prostoje': {
-                'xl1': _format_hours(xl1_minutes / 60) if xl1_minutes else '0,0',
-                'xl2': _format_hours(xl2_minutes / 60) if xl2_minutes else '0,0',
-                'total': _format_hours(total_minutes / 60) if total_minutes else '0,0',
+                'xl1': _prostoj_hours(xl1_stats.prostoj_minut),
+                'xl2': _prostoj_hours(xl2_stats.prostoj_minut),
+                'total': _prostoj_hours(total_minutes),
             },
         }
 
-    day_qs = base_qs.filter(zacatek__gte=shift_times[0], zacatek__lt=shift_times[1])
-    night_qs = SarzeKrok.objects.filter(
-        zarizeni__kod_zarizeni__in=device_codes,
-    ).filter(
-        Q(datum=date_value, zacatek__gte=shift_times[1])
-        | Q(datum=today, zacatek__lt=shift_times[0])
-    ).select_related('sarze', 'zarizeni')
-    day_nakladani_qs = SarzeKrok.objects.filter(
-        zarizeni__typ_zarizeni=TypZarizeniChoice.NAKLADANI,
-        datum=date_value,
-        zacatek__gte=shift_times[0],
-        zacatek__lt=shift_times[1],
-    ).select_related('sarze', 'zarizeni')
-    night_nakladani_qs = SarzeKrok.objects.filter(
-        zarizeni__typ_zarizeni=TypZarizeniChoice.NAKLADANI,
-    ).filter(
-        Q(datum=date_value, zacatek__gte=shift_times[1])
-        | Q(datum=today, zacatek__lt=shift_times[0])
-    ).select_related('sarze', 'zarizeni')
-
     dashboard = {
         'date_label': date_value.strftime('%d.%m.%Y'),
         'devices': {
@@ -2775,26 +2129,19 @@ def _build_vyroba_dashboard_context(date_value=None):
             'celkem': summary,
         },
         'shifts': {
-            'day': _shift_stats(day_qs, day_nakladani_qs),
-            'night': _shift_stats(night_qs, night_nakladani_qs),
+            'day': _shift_stats(SMENA_DEN),
+            'night': _shift_stats(SMENA_NOC),
         },
     }
 
     # Včerejší produkce vrutů (zakalené) 0:00-24:00 - pouze první použití bedny
-    yesterday_first_use = _first_use_sarzekrokbedna_qs(date_value, device_codes)
-    customer_totals = list(
-        yesterday_first_use
-        .values('bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev')
-        .annotate(total_kg=Sum('bedna__hmotnost'))
-        .order_by('bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev')
-    )
     customer_items = [
         {
-            'name': item['bedna__zakazka__kamion_prijem__zakaznik__zkraceny_nazev'] or '-',
-            'kg': _kg_to_int(item['total_kg']),
-            'kg_display': _format_kg(item['total_kg']),
+            'name': name or '-',
+            'kg': _kg_to_int(total_kg),
+            'kg_display': _format_kg(total_kg),
         }
-        for item in customer_totals
+        for name, total_kg in statistiky.zakaznici_dne(date_value)
     ]
     customer_rows = []
     for idx in range(0, len(customer_items), 3):
@@ -2803,9 +2150,10 @@ def _build_vyroba_dashboard_context(date_value=None):
             row.append(None)
         customer_rows.append(row)
 
+    daily_total_kg = statistiky.den(date_value).vykon_kg
     dashboard['vcerejsi_produkce_vrutu'] = {
-        'total_kg': _kg_to_int(_calc_daily_total_kg(date_value)),
-        'total_kg_display': _format_kg(_calc_daily_total_kg(date_value)),
+        'total_kg': _kg_to_int(daily_total_kg),
+        'total_kg_display': _format_kg(daily_total_kg),
         'customer_rows': customer_rows,
     }
 
@@ -2814,7 +2162,7 @@ def _build_vyroba_dashboard_context(date_value=None):
     history_rows = []
     for back in range(13, -1, -1):
         day = date_value - timedelta(days=back)
-        daily_kg_int = _kg_to_int(_calc_daily_total_kg(day))
+        daily_kg_int = _kg_to_int(statistiky.den(day).vykon_kg)
         history_rows.append({
             'date': day,
             'den_label': f"{day_labels[day.weekday()]} {day.strftime('%d.%m.%Y')}",
@@ -2847,142 +2195,18 @@ def _build_vyroba_dashboard_context(date_value=None):
 @login_required
 def dashboard_bedny_view(request):
     """
-    Přehled stavu beden dle zákazníků.
+    Přehled stavu beden dle zákazníků (všechny stavy jedním dotazem, viz services.dashboard_service).
     """
-    def get_stav_data(filter_kwargs):
-        """
-        Získává data o stavech beden pro dané filtry.
-        """
-        data = Bedna.objects.filter(**filter_kwargs).values(
-            'zakazka__kamion_prijem__zakaznik__zkraceny_nazev'
-        ).annotate(
-            pocet=Count('id'),
-            hmotnost=Sum('hmotnost')/1000 # převod na tuny (z kg)
-        )
-        data_dict = {
-            item['zakazka__kamion_prijem__zakaznik__zkraceny_nazev']: (item['pocet'], item['hmotnost']) for item in data
-        }
-        total = Bedna.objects.filter(**filter_kwargs).aggregate(
-            pocet=Count('id'),
-            hmotnost=Sum('hmotnost')/1000  # také převod na tuny pro řádek CELKEM
-        )
-        data_dict['CELKEM'] = (
-            total['pocet'] or 0,
-            (total['hmotnost'] or 0)  # už v tunách
-        )
-        return data_dict
-
-    kompletni_zakazky = (
-        Zakazka.objects
-        .annotate(
-            pocet_beden_celkem=Count('bedny'),
-            pocet_beden_k_expedici=Count(
-                'bedny',
-                filter=Q(bedny__stav_bedny=StavBednyChoice.K_EXPEDICI),
-            ),
-        )
-        .filter(
-            pocet_beden_celkem__gt=0,
-            pocet_beden_celkem=F('pocet_beden_k_expedici'),
-        )
-    )
-
-    stavy = {
-        'Nepřijaté': {
-            'filters': {'stav_bedny': StavBednyChoice.NEPRIJATO},
-            'color': 'gray', 'level': 0, 'is_group': True,
-        },
-        'Surové': {
-            'filters': {'stav_bedny__in': [StavBednyChoice.PRIJATO, StavBednyChoice.K_NAVEZENI, StavBednyChoice.NAVEZENO, StavBednyChoice.DO_ZPRACOVANI]},
-            'color': 'red', 'level': 0, 'is_group': True,
-        },
-        'Přijaté': {
-            'filters': {'stav_bedny': StavBednyChoice.PRIJATO},
-            'color': 'red', 'level': 1,
-        },
-        'K navezení': {
-            'filters': {'stav_bedny': StavBednyChoice.K_NAVEZENI},
-            'color': 'red', 'level': 1,
-        },
-        'Navezené': {
-            'filters': {'stav_bedny': StavBednyChoice.NAVEZENO},
-            'color': 'red', 'level': 1,
-        },
-        'Ve zpracování': {
-            'filters': {'stav_bedny': StavBednyChoice.DO_ZPRACOVANI},
-            'color': 'red', 'level': 1,
-        },
-        'Zpracované': {
-            'filters': {'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO, StavBednyChoice.K_EXPEDICI]},
-            'color': 'orange', 'level': 0, 'is_group': True,
-        },
-        'Zakalené ke kontrole': {
-            'filters': {'stav_bedny': StavBednyChoice.ZAKALENO},
-            'color': 'orange', 'level': 1,
-        },
-        'K tryskání': {
-            'filters': {'tryskat': TryskaniChoice.SPINAVA, 'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO]},
-            'color': 'yellowgreen', 'level': 1,
-        },
-        'K rovnání': {
-            'filters': {'rovnat__in': [RovnaniChoice.KRIVA, RovnaniChoice.KOULENI, RovnaniChoice.ROVNA_SE], 'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO]},
-            'color': 'blue', 'level': 1,
-        },
-
-        'Křivé': {
-            'filters': {'rovnat': RovnaniChoice.KRIVA, 'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO]},
-            'color': 'blue', 'level': 2,
-        },
-        'Koulení': {
-            'filters': {'rovnat': RovnaniChoice.KOULENI, 'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO]},
-            'color': 'blue', 'level': 2,
-        },
-        'Rovná se': {
-            'filters': {'rovnat': RovnaniChoice.ROVNA_SE, 'stav_bedny__in': [StavBednyChoice.ZAKALENO, StavBednyChoice.ZKONTROLOVANO]},
-            'color': 'blue', 'level': 2,
-        },
-        'K expedici': {
-            'filters': {'stav_bedny': StavBednyChoice.K_EXPEDICI},
-            'color': 'green', 'level': 1,
-        },
-        'K expedici po zakázkách': {
-            'filters': {'stav_bedny': StavBednyChoice.K_EXPEDICI, 'zakazka__in': kompletni_zakazky},
-            'color': 'green', 'level': 2,
-        },
-        'Po exspiraci': {
-            'filters': {'stav_bedny__in': STAV_BEDNY_SKLADEM, 'zakazka__kamion_prijem__datum__lt': timezone.now().date() - timezone.timedelta(days=28)},
-            'color': '#ff66b3', 'level': 0,
-        },
-    }
-
-    zakaznici_s_neexpedovanou_bednou = (
-        Bedna.objects.exclude(stav_bedny=StavBednyChoice.EXPEDOVANO)
-        .filter(zakazka__kamion_prijem__zakaznik__isnull=False)
-        .values_list(
-            'zakazka__kamion_prijem__zakaznik__zkraceny_nazev',
-            flat=True,
-        )
-        .distinct()
-        .order_by('zakazka__kamion_prijem__zakaznik__zkraceny_nazev')
-    )
-    zakaznici = list(zakaznici_s_neexpedovanou_bednou) + ['CELKEM']
-    prehled_beden_zakaznika = {zak: {stav: (0, 0, '') for stav in stavy} for zak in zakaznici}
-
-    for stav, definition in stavy.items():
-        stav_data = get_stav_data(definition['filters'])
-        for zak in zakaznici:
-            prehled_beden_zakaznika[zak][stav] = (
-                stav_data.get(zak, (0, 0)) + (definition['color'],)
-            )
-
+    prehled = prehled_beden()
+    prehled_beden_zakaznika = prehled.bunky
     stavy_bedny_list = [
         {
-            'key': stav,
-            'label': stav,
-            'level': definition['level'],
-            'is_group': definition.get('is_group', False),
+            'key': stav.klic,
+            'label': stav.label,
+            'level': stav.uroven,
+            'is_group': stav.skupina,
         }
-        for stav, definition in stavy.items()
+        for stav in prehled.stavy
     ]
 
     context = {
@@ -3004,131 +2228,42 @@ def dashboard_kamiony_view(request):
     V případě HTMX požadavku vrací pouze část obsahu pro aktualizaci.
     """
     zakaznici = Zakaznik.objects.all().order_by('zkratka')
-    rok = request.GET.get('rok', timezone.now().year)
-    kamiony_prijem_rok = Kamion.objects.filter(prijem_vydej='P', datum__year=rok)
-    kamiony_vydej_rok = Kamion.objects.filter(prijem_vydej='V', datum__year=rok)
-
-    kamiony_prijem = kamiony_prijem_rok.values(
-        'datum__month', 'zakaznik__zkratka'
-    ).annotate(
-        celkova_hmotnost=Sum(
-            'zakazky_prijem__bedny__hmotnost',
-            filter=Q(zakazky_prijem__bedny__fakturovat=True),
-        )
-    )
-
-    kamiony_vydej = kamiony_vydej_rok.values(
-        'datum__month', 'zakaznik__zkratka'
-    ).annotate(
-        celkova_hmotnost=Sum(
-            'zakazky_vydej__bedny__hmotnost',
-            filter=Q(zakazky_vydej__bedny__fakturovat=True),
-        ),
-        hmotnost_krivych=Sum(
-            'zakazky_vydej__bedny__hmotnost',
-            filter=Q(
-                zakazky_vydej__bedny__fakturovat=True,
-                zakazky_vydej__bedny__rovnat=RovnaniChoice.VYROVNANA,
-            ),
-        ),
-    )
-
-    # Inicializace slovníku pro měsíční pohyby
+    aktualni_rok = timezone.localdate().year
+    try:
+        rok = int(request.GET.get('rok', aktualni_rok))
+    except (TypeError, ValueError):
+        rok = aktualni_rok
+    # Rok mimo rozsah kamionů (od roku prvního kamionu po aktuální rok) se nahradí aktuálním rokem.
+    if rok not in rozsah_let():
+        rok = aktualni_rok
+    # Uložené uzavřené měsíce se jen čtou, ostatní se počítají z kamionů; GET nic neukládá.
+    statistiky = statistiky_roku(rok)
+
+    # Měsíční pohyby po zákaznících (i bez pohybu v daném měsíci) se součtem CELKEM, na konci roční součty.
     mesicni_pohyby = {}
-    # Přidání všech měsíců do slovníku, aby se zajistilo, že budou zobrazeny i prázdné měsíce
-    mesice = ('leden / január', 'únor / február', 'březen / marec',
-              'duben / apríl', 'květen / máj', 'červen / jún',
-              'červenec / júl', 'srpen / august', 'září / september',
-              'říjen / október', 'listopad / november', 'prosinec / december')
     for mesic in range(1, 13):
-        # Inicializace prázdného slovníku pro každý měsíc
-        mesicni_pohyby[mesic] = {}
-        # Přidání všech zákazníků do každého měsíce, aby se zajistilo, že budou zobrazeny i zákazníci bez pohybu v daném měsíci
-        for zakaznik in zakaznici:
-            mesicni_pohyby[mesic][zakaznik.zkratka] = {
-                'prijem': 0,
-                'vydej': 0,
-                'hmotnost_krivych': 0,
-            }
-
-    # Sčítání příjmů a výdejů pro jednotlivé měsíce a zákazníky
-    for kamion_prijem in kamiony_prijem:
-        mesic = kamion_prijem['datum__month']
-        zakaznik = kamion_prijem['zakaznik__zkratka']
-        mesicni_pohyby[mesic][zakaznik]['prijem'] += kamion_prijem['celkova_hmotnost'] or 0
-
-    for kamion_vydej in kamiony_vydej:
-        mesic = kamion_vydej['datum__month']
-        zakaznik = kamion_vydej['zakaznik__zkratka']
-        mesicni_pohyby[mesic][zakaznik]['vydej'] += kamion_vydej['celkova_hmotnost'] or 0
-        mesicni_pohyby[mesic][zakaznik]['hmotnost_krivych'] += kamion_vydej['hmotnost_krivych'] or 0
-
-    # Přidání celkových součtů pro každý měsíc
-    for mesic, zakaznici_pohyby in mesicni_pohyby.items():
-        celkovy_prijem = sum(pohyby['prijem'] for pohyby in zakaznici_pohyby.values())
-        celkovy_vydej = sum(pohyby['vydej'] for pohyby in zakaznici_pohyby.values())
-        celkova_hmotnost_krivych = sum(pohyby['hmotnost_krivych'] for pohyby in zakaznici_pohyby.values())
-        mesicni_pohyby[mesic]['CELKEM'] = {
-            'prijem': celkovy_prijem,
-            'vydej': celkovy_vydej,
-            'hmotnost_krivych': celkova_hmotnost_krivych,
+        mesicni_pohyby[mesic] = {
+            zakaznik.zkratka: statistiky.mesic(mesic, zakaznik.pk).jako_slovnik() for zakaznik in zakaznici
         }
+        mesicni_pohyby[mesic]['CELKEM'] = statistiky.mesic(mesic).jako_slovnik()
+    mesicni_pohyby['CELKEM'] = {
+        zakaznik.zkratka: statistiky.rocni(zakaznik.pk).jako_slovnik() for zakaznik in zakaznici
+    }
+    mesicni_pohyby['CELKEM']['CELKEM'] = statistiky.rocni().jako_slovnik()
 
-    # Přidání celkových součtů dle zákazníků za celý rok
-    rocni_pohyby = {}
-    for mesic, zakaznici_pohyby in mesicni_pohyby.items():
-        for zakaznik, pohyby in zakaznici_pohyby.items():
-            if zakaznik not in rocni_pohyby:
-                rocni_pohyby[zakaznik] = {'prijem': 0, 'vydej': 0, 'hmotnost_krivych': 0}
-            rocni_pohyby[zakaznik]['prijem'] += pohyby['prijem']
-            rocni_pohyby[zakaznik]['vydej'] += pohyby['vydej']
-            rocni_pohyby[zakaznik]['hmotnost_krivych'] += pohyby['hmotnost_krivych']
-
-    mesicni_pohyby['CELKEM'] = rocni_pohyby
-
-    # Přidání rozdílu mezi příjmy a výdeji pro každý měsíc pro každého zákazníka
-    for mesic, zakaznici_pohyby in mesicni_pohyby.items():
-        for zakaznik, pohyby in zakaznici_pohyby.items():
-            mesicni_pohyby[mesic][zakaznik]['rozdil'] = pohyby['prijem'] - pohyby['vydej']
-            if pohyby['vydej']:
-                mesicni_pohyby[mesic][zakaznik]['procento_krivych'] = (
-                    Decimal(pohyby['hmotnost_krivych']) / Decimal(pohyby['vydej'])
-                ) * Decimal('100')
-            else:
-                mesicni_pohyby[mesic][zakaznik]['procento_krivych'] = None
+    # Porovnání s předchozím rokem po měsících (součet všech zákazníků).
+    porovnani = porovnej_roky([rok - 1, rok], nactene={rok: statistiky})
 
     # Přehled průměrného denního importu/exportu za posledních 14 dní
     end_date = timezone.localdate() - timedelta(days=1)
     start_date = end_date - timedelta(days=13)
     period_days = 14
 
-    import_qs_14 = Kamion.objects.filter(
-        prijem_vydej=KamionChoice.PRIJEM,
-        datum__range=(start_date, end_date),
-    )
-    export_qs_14 = Kamion.objects.filter(
-        prijem_vydej=KamionChoice.VYDEJ,
-        datum__range=(start_date, end_date),
-    )
-
-    total_import_kg = (
-        import_qs_14.aggregate(
-            total=Sum(
-                'zakazky_prijem__bedny__hmotnost',
-                filter=Q(zakazky_prijem__bedny__fakturovat=True),
-            )
-        ).get('total')
-        or Decimal('0')
-    )
-    total_export_kg = (
-        export_qs_14.aggregate(
-            total=Sum(
-                'zakazky_vydej__bedny__hmotnost',
-                filter=Q(zakazky_vydej__bedny__fakturovat=True),
-            )
-        ).get('total')
-        or Decimal('0')
-    )
+    pohyby_14 = PohybyKamionu()
+    for pohyby in spocitej_pohyby(start_date, end_date).values():
+        pohyby_14.pricti(pohyby)
+    total_import_kg = pohyby_14.prijem
+    total_export_kg = pohyby_14.vydej
 
     avg_import_t = Decimal(total_import_kg) / Decimal(period_days * 1000)
     avg_export_t = Decimal(total_export_kg) / Decimal(period_days * 1000)
@@ -3138,6 +2273,15 @@ def dashboard_kamiony_view(request):
     context = {
         'mesicni_pohyby': mesicni_pohyby,
         'rok': rok,
+        'porovnani_roku': [
+            {
+                'mesic': mesic,
+                'predchozi': porovnani[rok - 1]['mesice'][mesic],
+                'aktualni': porovnani[rok]['mesice'][mesic],
+            }
+            for mesic in range(1, 13)
+        ],
+        'porovnani_celkem': {'predchozi': porovnani[rok - 1]['celkem'], 'aktualni': porovnani[rok]['celkem']},
         'prumery_14_dni': {
             'start_date': start_date,
             'end_date': end_date,
@@ -3155,6 +2299,38 @@ def dashboard_kamiony_view(request):
     return render(request, 'orders/dashboard_kamiony.html', context)
 
 
+@login_required
+def dashboard_kamiony_porovnani_view(request):
+    """
+    Porovnání měsíčních pohybů kamionů vybraných let jako JSON. Roky se zadávají parametrem `roky`
+    (opakovaně nebo oddělené čárkou, výchozí aktuální a předchozí rok), parametrem `zakaznik`
+    (zkratka, lze opakovat) se součty omezí na vybrané zákazníky.
+    """
+    try:
+        roky = [int(rok) for hodnota in request.GET.getlist('roky') for rok in hodnota.split(',') if rok.strip()]
+    except ValueError:
+        return HttpResponseBadRequest("Neplatný rok.")
+    povolene_roky = rozsah_let()
+    if not roky:
+        roky = [rok for rok in (povolene_roky[-1] - 1, povolene_roky[-1]) if rok in povolene_roky]
+    if any(rok not in povolene_roky for rok in roky):
+        return HttpResponseBadRequest(f"Rok musí být v rozsahu {povolene_roky[0]}–{povolene_roky[-1]}.")
+    if len(set(roky)) > 10:
+        return HttpResponseBadRequest("Lze porovnat nejvýše 10 let.")
+
+    zakaznik_ids = None
+    zkratky = request.GET.getlist('zakaznik')
+    if zkratky:
+        zakaznik_ids = list(Zakaznik.objects.filter(zkratka__in=zkratky).values_list('pk', flat=True))
+        if len(zakaznik_ids) != len(set(zkratky)):
+            return HttpResponseBadRequest("Neznámý zákazník.")
+
+    porovnani = porovnej_roky(roky, zakaznik_ids=zakaznik_ids)
+    return JsonResponse({
+        'zakaznici': zkratky,
+        'roky': {str(rok): data for rok, data in porovnani.items()},
+    })
+
 @login_required
 def dashboard_vyroba_view(request):
     """
@@ -3214,7 +2390,11 @@ def dashboard_vyroba_historie_mesic_view(request):
 
 
 def _get_bedny_k_navezeni_groups():
-    """Sestaví seskupená data beden k navezení podle pozice a zakázky."""
+    """
+    Sestaví seskupená data beden k navezení podle pozice a zakázky. Jen čte – pořadí zakázek
+    v pozicích (PoziceZakazkaOrder) srovnávají zápisy beden (services.navezeni_service).
+    Zakázka bez uloženého pořadí (např. po úpravě dat mimo aplikaci) se zařadí na konec pozice.
+    """
     pozice_list = list(Pozice.objects.order_by('kod'))
 
     qs = (
@@ -3225,70 +2405,12 @@ def _get_bedny_k_navezeni_groups():
     )
     bedny = list(qs)
 
-    active_pairs = {
-        (bedna.pozice_id, bedna.zakazka_id)
-        for bedna in bedny
-        if bedna.pozice_id is not None and bedna.zakazka_id is not None
-    }
-    orders_by_position = {}
-    # Keep PoziceZakazkaOrder synced with current bedny state.
-    with transaction.atomic():
-        existing_orders = list(
-            PoziceZakazkaOrder.objects.order_by('pozice_id', 'poradi', 'pk')
+    orders = {
+        (order.pozice_id, order.zakazka_id): order
+        for order in PoziceZakazkaOrder.objects.filter(
+            pozice_id__in={bedna.pozice_id for bedna in bedny if bedna.pozice_id is not None}
         )
-
-        stale_ids = {
-            order.pk for order in existing_orders
-            if (order.pozice_id, order.zakazka_id) not in active_pairs
-        }
-        if stale_ids:
-            PoziceZakazkaOrder.objects.filter(pk__in=stale_ids).delete()
-            existing_orders = [order for order in existing_orders if order.pk not in stale_ids]
-
-        for order in existing_orders:
-            if order.pozice_id is None:
-                continue
-            orders_by_position.setdefault(order.pozice_id, []).append(order)
-
-        for pozice_id, order_list in orders_by_position.items():
-            for idx, order in enumerate(order_list, start=1):
-                if order.poradi != idx:
-                    PoziceZakazkaOrder.objects.filter(pk=order.pk).update(poradi=idx)
-                    order.poradi = idx
-
-        seen_pairs = set()
-        for bedna in bedny:
-            pozice_id = bedna.pozice_id
-            zakazka_id = bedna.zakazka_id
-            if pozice_id is None or zakazka_id is None:
-                continue
-            pair = (pozice_id, zakazka_id)
-            if pair in seen_pairs:
-                continue
-            seen_pairs.add(pair)
-
-            order_list = orders_by_position.setdefault(pozice_id, [])
-            if not any(order.zakazka_id == zakazka_id for order in order_list):
-                poradi = len(order_list) + 1
-                new_order = PoziceZakazkaOrder.objects.create(
-                    pozice_id=pozice_id,
-                    zakazka_id=zakazka_id,
-                    poradi=poradi,
-                    poznamka_k_navezeni=None,
-                )
-                order_list.append(new_order)
-
-    order_map = {}
-    note_map = {}
-    nasledne_map = {}
-    for order_list in orders_by_position.values():
-        for order in order_list:
-            order_map[(order.pozice_id, order.zakazka_id)] = order.poradi
-            note_text = order.poznamka_k_navezeni
-            if isinstance(note_text, str):
-                note_text = note_text.strip()
-            note_map[(order.pozice_id, order.zakazka_id)] = note_text or None
-            nasledne_map[(order.pozice_id, order.zakazka_id)] = order.nasledne
+    }
 
     groups = []
     pozice_map = {}
@@ -3305,6 +2427,8 @@ def _get_bedny_k_navezeni_groups():
         groups.append(pozice_group)
         pozice_map[pozice.kod] = pozice_group
 
+    # Index skupin zakázek podle (kód pozice, id zakázky) – bez procházení seznamu zakázek pozice.
+    zakazky_map = {}
     for bedna in bedny:
         pozice_kod = bedna.pozice.kod if bedna.pozice else None
         pozice_id = bedna.pozice_id
@@ -3323,28 +2447,33 @@ def _get_bedny_k_navezeni_groups():
         pozice_group = pozice_map[pozice_kod]
 
         # Najde nebo vytvoří podskupinu pro zakázku
-        zakazka_group = next((z for z in pozice_group['zakazky_group'] if z['zakazka'].id == zakazka_id), None)
+        zakazka_group = zakazky_map.get((pozice_kod, zakazka_id))
         if not zakazka_group:
-            # Získání pořadí z mapy, případně default 0
-            poradi = order_map.get((bedna.pozice_id, zakazka_id), 0)
+            order = orders.get((pozice_id, zakazka_id))
+            note_text = order.poznamka_k_navezeni if order else None
+            if isinstance(note_text, str):
+                note_text = note_text.strip()
             zakazka_group = {
                 'zakazka': bedna.zakazka,
                 'bedny': [],
-                'poradi': poradi,
+                'poradi': order.poradi if order else None,
                 'pozice_id': bedna.pozice_id,
-                'poznamka_k_navezeni': note_map.get((bedna.pozice_id, zakazka_id)),
-                'nasledne': nasledne_map.get((bedna.pozice_id, zakazka_id), False),
+                'poznamka_k_navezeni': note_text or None,
+                'nasledne': order.nasledne if order else False,
             }
+            zakazky_map[(pozice_kod, zakazka_id)] = zakazka_group
             pozice_group['zakazky_group'].append(zakazka_group)
 
         # Přidá bednu do správné zakázky
         zakazka_group['bedny'].append(bedna)
 
-    # Seřadí zakázky v rámci každé pozice dle pořadí
+    # Seřadí zakázky v rámci každé pozice dle pořadí a očísluje je od 1 (zakázky bez pořadí na konci).
     for pozice_group in groups:
         pozice_group['zakazky_group'].sort(
-            key=lambda z: (z.get('poradi', 0), z['zakazka'].id)
+            key=lambda z: (z['poradi'] is None, z['poradi'] or 0, z['zakazka'].id)
         )
+        for idx, zakazka_group in enumerate(pozice_group['zakazky_group'], start=1):
+            zakazka_group['poradi'] = idx
 
     return groups
 
@@ -3764,7 +2893,7 @@ def dashboard_bedny_k_navezeni_pdf_view(request):
     from django.http import HttpResponse
 
     html_string = render_to_string('orders/print/bedny_k_navezeni_print.html', context)
-    pdf_bytes = HTML(string=html_string).write_pdf()
+    pdf_bytes = vyrendruj_pdf(html_string)
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
     response['Content-Disposition'] = 'inline; filename="bedny_k_navezeni.pdf"'
     return response
@@ -3774,7 +2903,7 @@ def dashboard_bedny_k_navezeni_pdf_view(request):
 @permission_required('orders.view_kamion', raise_exception=True)
 def protokol_kamion_vydej_pdf_view(request, pk: int):
     """GET endpoint pro PDF protokol kamionu (výdej)."""
-    kamion = get_object_or_404(Kamion, pk=pk, prijem_vydej=KamionChoice.VYDEJ)
+    kamion = get_object_or_404(Kamion.objects.with_totals(), pk=pk, prijem_vydej=KamionChoice.VYDEJ)
 
     zakazky = kamion.zakazky_vydej.all().order_by('id')
     base_url = getattr(settings, 'WEASYPRINT_BASEURL', None)
@@ -3786,24 +2915,34 @@ def protokol_kamion_vydej_pdf_view(request, pk: int):
         if not static_url.startswith('http://') and not static_url.startswith('https://'):
             static_url = base_url.rstrip('/') + '/'
 
-    context = {
-        "kamion": kamion,
-        "zakazky": zakazky,
-        "generated_at": timezone.now(),
-        "issued_by": request.user.get_full_name() if request.user.is_authenticated else "",
-        "pdf_static_url": static_url,
-    }
+    issued_by = request.user.get_full_name() if request.user.is_authenticated else ""
+    html_path = f"orders/protokol_kamion_vydej_{kamion.zakaznik.zkratka.lower()}.html"
 
-    html_string = render_to_string(f"orders/protokol_kamion_vydej_{kamion.zakaznik.zkratka.lower()}.html", context)
+    generated_at = timezone.now()
 
-    stylesheets = []
-    css_path = finders.find('orders/css/pdf_shared.css')
-    if css_path:
-        stylesheets.append(CSS(filename=css_path))
-    else:
-        logger.warning("Nepodařilo se najít CSS 'orders/css/pdf_shared.css' pro tisk protokolu kamionu výdej.")
+    def vyrob_pdf():
+        context = {
+            "kamion": kamion,
+            "zakazky": zakazky,
+            "generated_at": generated_at,
+            "issued_by": issued_by,
+            "pdf_static_url": static_url,
+        }
+        html_string = render_to_string(html_path, context)
 
-    pdf_bytes = HTML(string=html_string, base_url=base_url).write_pdf(stylesheets=stylesheets)
+        css_soubory = []
+        css_path = finders.find('orders/css/pdf_shared.css')
+        if css_path:
+            css_soubory.append(css_path)
+        else:
+            logger.warning("Nepodařilo se najít CSS 'orders/css/pdf_shared.css' pro tisk protokolu kamionu výdej.")
+        return vyrendruj_pdf(html_string, base_url=base_url, css_soubory=css_soubory)
+
+    # Opakovaný tisk nezměněného kamionu vrátí stejné PDF z cache. Protokol tiskne datum vygenerování,
+    # proto je den tisku součástí varianty – tisk v jiný den vytvoří nové PDF s aktuálním datem.
+    pdf_bytes = pdf_kamionu(
+        html_path, kamion, vyrob_pdf, varianta=(issued_by, base_url, static_url, timezone.localdate(generated_at)),
+    )
 
     cislo_dl_raw = kamion.cislo_dl or f"kamion_{kamion}"
     cislo_dl = slugify(cislo_dl_raw, allow_unicode=False) or "kamion"
@@ -3821,7 +2960,7 @@ def protokol_kamion_vydej_pdf_view(request, pk: int):
 @permission_required('orders.view_kamion', raise_exception=True)
 def dodaci_list_kamion_vydej_pdf_view(request, pk: int):
     """GET endpoint pro dodací list kamionu výdej."""
-    kamion = get_object_or_404(Kamion, pk=pk, prijem_vydej=KamionChoice.VYDEJ)
+    kamion = get_object_or_404(Kamion.objects.with_totals(), pk=pk, prijem_vydej=KamionChoice.VYDEJ)
     zakaznik_zkratka = getattr(kamion.zakaznik, 'zkratka', None)
     if not zakaznik_zkratka:
         return HttpResponse("Kamion nemá zkratku zákazníka", status=400)
@@ -3831,7 +2970,7 @@ def dodaci_list_kamion_vydej_pdf_view(request, pk: int):
     cislo_dl = slugify(cislo_dl_raw, allow_unicode=False) or "kamion"
     filename = f"dodaci_list_{cislo_dl}.pdf"
 
-    response = utilita_tisk_dl_a_proforma_faktury(None, request, kamion, html_path, filename)
+    response = utilita_tisk_dl_a_proforma_faktury(None, request, kamion, html_path, filename, cache=True)
     return response
 
 
@@ -3839,7 +2978,7 @@ def dodaci_list_kamion_vydej_pdf_view(request, pk: int):
 @permission_required('orders.view_kamion', raise_exception=True)
 def proforma_kamion_vydej_pdf_view(request, pk: int):
     """GET endpoint pro proforma fakturu kamionu výdej."""
-    kamion = get_object_or_404(Kamion, pk=pk, prijem_vydej=KamionChoice.VYDEJ)
+    kamion = get_object_or_404(Kamion.objects.with_totals(), pk=pk, prijem_vydej=KamionChoice.VYDEJ)
     zakaznik_zkratka = getattr(kamion.zakaznik, 'zkratka', None)
     if not zakaznik_zkratka:
         return HttpResponse("Kamion nemá zkratku zákazníka", status=400)
@@ -3853,7 +2992,7 @@ def proforma_kamion_vydej_pdf_view(request, pk: int):
     cislo_dl = slugify(cislo_dl_raw, allow_unicode=False) or "kamion"
     filename = f"proforma_faktura_{cislo_dl}.pdf"
 
-    response = utilita_tisk_dl_a_proforma_faktury(None, request, kamion, html_path, filename)
+    response = utilita_tisk_dl_a_proforma_faktury(None, request, kamion, html_path, filename, cache=True)
     return response
 
 
@@ -4118,3 +3257,50 @@ class BednyListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
             return render(self.request, "orders/partials/bedny_list_content.html", context)
         else:
             return super().render_to_response(context, **response_kwargs)
+
+
+def _uloha_pro_uzivatele(request, pk):
+    """Úlohu vidí její zadavatel a uživatelé s přístupem do administrace."""
+    uloha = get_object_or_404(Uloha.objects.select_related('vytvoril'), pk=pk)
+    if not request.user.is_staff and uloha.vytvoril_id != request.user.pk:
+        raise PermissionDenied
+    return uloha
+
+
+@login_required
+@never_cache
+def uloha_detail_view(request, pk: int):
+    """
+    Stránka úlohy na pozadí – stav a průběh úlohy, po dokončení odkaz ke stažení výsledku.
+    Při HTMX požadavku vrací jen blok se stavem, stránka ho dotazuje, dokud úloha neskončí.
+    """
+    uloha = _uloha_pro_uzivatele(request, pk)
+    context = {'uloha': uloha}
+    if request.htmx:
+        return render(request, 'orders/partials/uloha_stav.html', context)
+    return render(request, 'orders/uloha_detail.html', context)
+
+
+@login_required
+def uloha_stahnout_view(request, pk: int):
+    """Stažení výsledku dokončené úlohy."""
+    uloha = _uloha_pro_uzivatele(request, pk)
+    if uloha.stav != StavUlohyChoice.HOTOVO or not uloha.vysledek:
+        raise Http404("Úloha nemá výsledek ke stažení.")
+    return FileResponse(
+        uloha.vysledek.open('rb'),
+        as_attachment=True,
+        filename=uloha.nazev_souboru or uloha.vysledek.name.rsplit('/', 1)[-1],
+    )
+
+
+@login_required
+@never_cache
+def metriky_pdf_view(request):
+    """
+    Metriky tisků PDF tohoto procesu aplikace (počty, odmítnuté tisky, fronta, doby čekání a vykreslení v s).
+    Jen pro personál.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(metriky_pdf())